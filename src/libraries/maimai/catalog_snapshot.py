@@ -0,0 +1,211 @@
+"""
+冷启动快照：把曲库、谱面统计与别名表序列化为一个带版本号的二进制文件
+
+重新部署后，MusicList.load_catalog 先读取快照，不再查询 music / chart / chart_stats
+并重新计算 MusicCatalog 的派生列。快照记录了生成时的曲库代数、数据库结构版本和别名文件的
+修改时间与大小，三者任一与当前不一致即视为过期，回退到从数据库重建并重新写入快照。
+
+文件格式（小端）：
+    MAGIC(8) | FORMAT_VERSION(u32) | 元数据长度(u64) | 行数据长度(u64) | 元数据 JSON | 行数据 | 填充到 64 字节对齐 | 数组数据
+- 元数据 JSON：代数与版本信息，以及每个数组的 dtype、shape 和相对数据区起点的偏移
+- 行数据：music / chart 行（dict）与别名表，用 marshal 序列化，解码比 JSON 快数倍；
+  marshal 格式随 Python 版本变化，Python 版本不同时快照视为不可用
+- 数组数据：读取时整个文件一次读入内存，用 np.frombuffer 直接引用，不复制也不解析，均为只读
+
+在项目根目录运行以下命令可以离线构建快照：
+    python -m src.libraries.maimai.catalog_snapshot [数据库路径]
+"""
+
+import asyncio
+import json
+import marshal
+import os
+import struct
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from src.libraries.maimai.database import database_path
+from src.libraries.maimai.maimai_catalog import MusicCatalog, MUSIC_COLUMNS, CHART_COLUMNS, COLUMN_NAMES
+
+MAGIC = b"MAICATSN"
+# 格式变化（增删数组、改动元数据结构）时加一，旧快照会被视为过期
+FORMAT_VERSION = 2
+_HEADER = struct.Struct("<8sIQQ")
+_ALIGN = 64
+
+snapshot_path = database_path.with_name("catalog_snapshot.bin")
+ALIAS_FILE = Path("src/static/all_alias_temp.json")
+
+
+def _aligned(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def alias_source(path: Path = ALIAS_FILE) -> Optional[List[int]]:
+    """
+    别名文件的 [修改时间(ns), 大小]，文件不存在时为 None
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def load_alias_table(path: Path = ALIAS_FILE) -> Dict[int, List[str]]:
+    """
+    读取别名文件，返回 {music_id: [别名, ...]}；文件不存在时返回空表
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as aliasfile:
+            alias_data_raw = json.load(aliasfile)
+    except FileNotFoundError:
+        return {}
+    return {int(music_id): music_alias.get("Alias", []) for music_id, music_alias in alias_data_raw.items()}
+
+
+@dataclass
+class CatalogSnapshot:
+    generation: int
+    schema_version: int
+    alias_source: Optional[List[int]]
+    music_rows: List[Dict[str, Any]]        # 键为 MUSIC_COLUMNS
+    chart_rows: List[Dict[str, Any]]        # 键为 CHART_COLUMNS
+    aliases: Dict[int, List[str]]
+    arrays: Dict[str, np.ndarray] = field(default_factory=dict)
+
+    @classmethod
+    def from_catalog(
+        cls,
+        catalog: MusicCatalog,
+        stats_columns: Dict[str, np.ndarray],
+        schema_version: int,
+        source: Optional[List[int]],
+        aliases: Dict[int, List[str]]
+    ) -> "CatalogSnapshot":
+        arrays = {"catalog." + name: column for name, column in catalog.columns().items()}
+        arrays.update({"stats." + name: column for name, column in stats_columns.items()})
+        return cls(
+            generation=catalog.generation,
+            schema_version=schema_version,
+            alias_source=source,
+            music_rows=[{c: row[c] for c in MUSIC_COLUMNS} for row in catalog.music_rows],
+            chart_rows=[{c: row[c] for c in CHART_COLUMNS} for row in catalog.chart_rows],
+            aliases=aliases,
+            arrays=arrays,
+        )
+
+    def to_catalog(self) -> MusicCatalog:
+        """
+        还原 MusicCatalog（行为 dict，派生列直接引用快照中的数组）；stats 由调用方用 stats_columns() 填充
+        """
+        catalog = MusicCatalog(self.music_rows, self.chart_rows, {name: self.arrays["catalog." + name] for name in COLUMN_NAMES})
+        catalog.generation = self.generation
+        return catalog
+
+    def stats_columns(self) -> Dict[str, np.ndarray]:
+        return {name[len("stats."):]: a for name, a in self.arrays.items() if name.startswith("stats.")}
+
+    def is_current(self, generation: int, schema_version: int, source: Optional[List[int]]) -> bool:
+        return (self.generation == generation
+                and self.schema_version == schema_version
+                and self.alias_source == source)
+
+    def save(self, path: Path = snapshot_path) -> int:
+        """
+        写入快照，先写临时文件再替换，读者不会读到写了一半的文件；返回文件大小（字节）
+        """
+        arrays = {name: np.ascontiguousarray(a) for name, a in self.arrays.items()}
+        layout, offset = {}, 0
+        for name, a in arrays.items():
+            layout[name] = {"dtype": a.dtype.str, "shape": list(a.shape), "offset": offset}
+            offset = _aligned(offset + a.nbytes)
+        meta = json.dumps({
+            "generation": self.generation,
+            "schema_version": self.schema_version,
+            "alias_source": self.alias_source,
+            "python": list(sys.version_info[:2]),
+            "arrays": layout,
+        }).encode("utf-8")
+        rows = marshal.dumps((self.music_rows, self.chart_rows, self.aliases))
+
+        data_start = _aligned(_HEADER.size + len(meta) + len(rows))
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(meta), len(rows)))
+            f.write(meta)
+            f.write(rows)
+            for name, a in arrays.items():
+                f.seek(data_start + layout[name]["offset"])
+                f.write(a.tobytes())
+            # 末尾的空数组不会写入任何字节，按布局补齐文件长度，读取时偏移量才不会越界
+            size = data_start + offset
+            f.truncate(size)
+        os.replace(tmp, path)
+        return size
+
+    @classmethod
+    def load(cls, path: Path = snapshot_path) -> Optional["CatalogSnapshot"]:
+        """
+        读取快照；文件不存在、格式版本不同或已损坏时返回 None
+        """
+        try:
+            buf = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        try:
+            magic, version, meta_len, rows_len = _HEADER.unpack_from(buf)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                return None
+            meta = json.loads(buf[_HEADER.size:_HEADER.size + meta_len])
+            if meta["python"] != list(sys.version_info[:2]):
+                return None
+            rows_start = _HEADER.size + meta_len
+            music_rows, chart_rows, aliases = marshal.loads(buf[rows_start:rows_start + rows_len])
+            data_start = _aligned(rows_start + rows_len)
+            arrays = {}
+            for name, spec in meta["arrays"].items():
+                dtype, shape = np.dtype(spec["dtype"]), tuple(spec["shape"])
+                count = int(np.prod(shape, dtype=np.int64))
+                arrays[name] = np.frombuffer(buf, dtype=dtype, count=count,
+                                             offset=data_start + spec["offset"]).reshape(shape)
+            return cls(
+                generation=meta["generation"],
+                schema_version=meta["schema_version"],
+                alias_source=meta["alias_source"],
+                music_rows=music_rows,
+                chart_rows=chart_rows,
+                aliases=aliases,
+                arrays=arrays,
+            )
+        except (struct.error, ValueError, EOFError, KeyError, TypeError) as e:
+            print(f"[Warning] 冷启动快照 {path} 已损坏，忽略：{e!r}")
+            return None
+
+
+async def main(args: List[str]) -> None:
+    from src.libraries.maimai.database import DatabaseAPI
+    from src.libraries.maimai.migrations import migrate
+    from src.libraries.maimai.maimai_type import MusicList
+
+    path = Path(args[0]) if args else database_path
+    api = DatabaseAPI(path=path)
+    await api.start()
+    try:
+        # 快照记录的是迁移后的结构版本，与 bot 启动时一致
+        await migrate(api)
+        music_list = MusicList(snapshot_file=path.with_name(snapshot_path.name), api=api)
+        start = time.perf_counter()
+        await music_list.load_catalog(use_snapshot=False)
+        print(f"[Info] 冷启动快照构建完成，用时 {time.perf_counter() - start:.3f}s")
+    finally:
+        await api.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
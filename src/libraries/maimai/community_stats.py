@@ -0,0 +1,110 @@
+"""
+社区统计：由本地玩家的最佳成绩得到的谱面统计与拟合定数
+
+community_stats 表按谱面保存达成率的计数、均值、M2 与评级分布，
+每次 sync_user_records 只按变更集增量更新（见 DatabaseAPI._update_community_stats），不会重新扫描 best_record。
+
+拟合定数的计算方式：
+- 按定数把所有谱面的统计合并，得到每个定数下本地玩家的平均达成率，曲线随定数单调不增
+  （样本不足时可能出现逆序，按从低到高取累计最小值修正）
+- 某张谱面的拟合定数是曲线上平均达成率等于该谱面平均达成率的位置（线性插值）
+曲线只依赖汇总后的几百个定数，缓存 CURVE_TTL 秒；单张谱面的查询是一次主键查找加一次插值。
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import aiosqlite
+import numpy as np
+
+from src.libraries.maimai.database import DatabaseAPI, database_api, chart_keys_param, running_stats_from_row, \
+    COMMUNITY_STATS_BY_KEYS_SQL
+
+# 样本数少于此值的谱面不计算拟合定数，也不参与定数曲线
+MIN_COUNT = 5
+# 定数曲线的缓存时间（秒）
+CURVE_TTL = 600.0
+
+CURVE_SQL = """
+SELECT c.ds, SUM(cs.cnt) AS cnt, SUM(cs.cnt * cs.mean) / SUM(cs.cnt) AS mean
+FROM community_stats AS cs
+JOIN chart AS c ON c.music_id = cs.music_id AND c.diff_index = cs.diff_index
+WHERE cs.cnt >= ?
+GROUP BY c.ds
+ORDER BY c.ds
+"""
+
+
+@dataclass
+class CommunityStats:
+    cnt: int
+    avg: float
+    std_dev: float
+    rank_dist: np.ndarray = field(compare=False)
+    fit_diff: Optional[float] = None
+
+
+class CommunityStatsEngine:
+    """
+    community_stats 的读取端：by_keys / get 返回谱面的社区统计与社区拟合定数
+    """
+
+    def __init__(self, api: DatabaseAPI = database_api, min_count: int = MIN_COUNT, curve_ttl: float = CURVE_TTL):
+        self.api = api
+        self.min_count = min_count
+        self.curve_ttl = curve_ttl
+        self._curve: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._curve_at = 0.0
+
+    async def curve(self, db: aiosqlite.Connection) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (定数, 平均达成率) 两个数组，按定数升序，平均达成率单调不增
+        """
+        if self._curve is None or time.monotonic() - self._curve_at >= self.curve_ttl:
+            cursor = await db.execute(CURVE_SQL, (self.min_count,))
+            rows = await cursor.fetchall()
+            ds = np.array([row[0] for row in rows], dtype=np.float64)
+            mean = np.minimum.accumulate(np.array([row[2] for row in rows], dtype=np.float64))
+            self._curve, self._curve_at = (ds, mean), time.monotonic()
+        return self._curve
+
+    @staticmethod
+    def fit(curve: Tuple[np.ndarray, np.ndarray], avg: float) -> Optional[float]:
+        ds, mean = curve
+        if len(ds) < 2:
+            return None
+        # np.interp 要求横坐标递增，平均达成率取负
+        return float(np.interp(-avg, -mean, ds))
+
+    async def by_keys(self, keys: List[Tuple[int, int]]) -> Dict[Tuple[int, int], CommunityStats]:
+        """
+        根据 (music_id, diff_index) 列表获取社区统计，没有本地成绩的谱面不在结果中
+        """
+        keys = list(dict.fromkeys((int(m), int(d)) for m, d in keys))
+        if not keys:
+            return {}
+        async with self.api.connection() as db:
+            cursor = await db.execute(COMMUNITY_STATS_BY_KEYS_SQL, (chart_keys_param(keys),))
+            rows = await cursor.fetchall()
+            curve = await self.curve(db)
+        result = {}
+        for row in rows:
+            stats = running_stats_from_row(row)
+            if stats.cnt == 0:
+                continue
+            stats.rank_dist.flags.writeable = False
+            result[(row[0], row[1])] = CommunityStats(
+                cnt=stats.cnt,
+                avg=stats.mean,
+                std_dev=stats.std_dev,
+                rank_dist=stats.rank_dist,
+                fit_diff=self.fit(curve, stats.mean) if stats.cnt >= self.min_count else None,
+            )
+        return result
+
+    async def get(self, music_id: int, diff_index: int) -> Optional[CommunityStats]:
+        return (await self.by_keys([(music_id, diff_index)])).get((int(music_id), int(diff_index)))
+
+
+community_stats = CommunityStatsEngine()
@@ -1,9 +1,19 @@
 import aiosqlite
+import asyncio
+import math
+import struct
+import time
+import zlib
+from contextlib import asynccontextmanager
 from pathlib import Path
 import json
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Dict, Any
+import numpy as np
+from typing import List, Dict, Any, Optional, Set, Tuple, AsyncIterator, Callable, Awaitable, TypeVar
 from src.libraries.maimai.static_lists_and_dicts import version_list, rank_list_lower, fc_list_lower, fs_list_lower
+from src.libraries.maimai.profiler import profiled
+from src.libraries.text_normalize import search_key
 
 databasePath = Path(".") / "src" / "db" / "maimai.db"
 database_path = databasePath.resolve()
@@ -19,204 +29,1035 @@ def get_fs_id(fs_str: str) -> int:
     # Similar lookup in fs_status table
     return fs_list_lower.index(fs_str) if fs_str in fs_list_lower else 0
 
+# 达成率区间：(下限, 系数, 固定达成率)
+RA_RANGES = [
+    (100.5000, 14.0, 100.5000),
+    (100.4999, 13.9, None),
+    (100.0000, 13.5, None),
+    (99.9999, 13.4, None),
+    (99.5000, 13.2, None),
+    (99.0000, 13.0, None),
+    (98.9999, 12.9, None),
+    (98.0000, 12.7, None),
+    (97.0000, 12.5, None),
+    (96.9999, 11.0, None),
+    (94.0000, 10.5, None),
+    (93.9999, 10.0, None), # ?
+    (90.0000, 9.5, None),
+    (89.9999, 9.0, None), # ?
+    (80.0000, 8.5, None),
+    (79.9999, 7.6, None),
+    (75.0000, 7.5, None),
+    (70.0000, 7.0, None),
+    (60.0000, 6.0, None),
+    (50.0000, 5.0, None),
+    (40.0000, 4.0, None),
+    (30.0000, 3.0, None),
+    (20.0000, 2.0, None),
+    (10.0000, 1.0, None)
+]
+
+def calc_ra(ds: float, achievements: float, b50: bool) -> int:
+    """
+    计算 RA 值
+    """
+    if ds is None or achievements is None:
+        return 0.0
+    # 优化：用区间和系数列表简化分支
+
+    ds = round(ds, 1)  # 保留一位小数
+
+    for threshold, coeff, fixed_ach in RA_RANGES:
+        if achievements >= threshold:
+            achv = fixed_ach if fixed_ach is not None else achievements
+            adj_coeff = math.floor(coeff * 1.6 * 10) / 10 if b50 else coeff
+            return int(adj_coeff * ds * achv * 0.01)
+    return 0
+
+
+async def register_functions(conn: aiosqlite.Connection) -> None:
+    """
+    注册自定义 SQL 函数，每条连接建立时调用一次
+    """
+    await conn.create_function("calc_ra", 3, calc_ra, deterministic=True)
+
+
+# 按 chart.ds / chart_stats.fit_diff 重新计算 best_record 的 ra_b50 / ra_b40 / ra_stats，
+# 调用方在末尾追加 AND 条件限定范围
+RATING_UPDATE_SQL = """
+UPDATE best_record
+SET ra_b50 = calc_ra(c.ds, best_record.achievements, 1),
+    ra_b40 = calc_ra(c.ds, best_record.achievements, 0),
+    ra_stats = calc_ra(COALESCE(cs.fit_diff, c.ds), best_record.achievements, 1)
+FROM chart AS c
+LEFT JOIN chart_stats AS cs ON cs.music_id = c.music_id AND cs.diff_index = c.diff_index
+WHERE c.music_id = best_record.music_id AND c.diff_index = best_record.diff_index
+"""
+
+# 任意数量的 (music_id, diff_index) 只占一个参数：以 JSON 数组传入，由 json_each 展开，
+# 不受 SQLite 变量个数上限影响，且不同数量的谱面共用同一条 SQL
+CHART_KEYS_SQL = "SELECT json_extract(value, '$[0]') AS music_id, json_extract(value, '$[1]') AS diff_index FROM json_each(?)"
+
+def chart_keys_param(keys) -> str:
+    """
+    把 (music_id, diff_index) 列表编码为 CHART_KEYS_SQL 的参数
+    """
+    return json.dumps([[int(m), int(d)] for m, d in keys], separators=(",", ":"))
+
+
+# 曲库 / 统计同步的 upsert 语句
+MUSIC_UPSERT_SQL = """
+INSERT INTO music(
+    id, title, type, artist, genre,
+    bpm, release_date, version, is_new, version_id,
+    title_norm, artist_norm
+) VALUES(
+    :id, :title, :type, :artist, :genre,
+    :bpm, :release_date, :version, :is_new, :version_id,
+    :title_norm, :artist_norm
+)
+ON CONFLICT(id) DO UPDATE SET
+    title = excluded.title,
+    type = excluded.type,
+    artist = excluded.artist,
+    genre = excluded.genre,
+    bpm = excluded.bpm,
+    release_date = excluded.release_date,
+    version = excluded.version,
+    is_new = excluded.is_new,
+    version_id = excluded.version_id,
+    title_norm = excluded.title_norm,
+    artist_norm = excluded.artist_norm;
+"""
+
+CHART_UPSERT_SQL = """
+INSERT INTO chart(
+    music_id, diff_index, ds, level,
+    notes, tap, hold, slide, touch, "break", charter, charter_norm
+) VALUES(
+    :music_id, :diff_index, :ds, :level,
+    :notes, :tap, :hold, :slide, :touch, :brk, :charter, :charter_norm
+)
+ON CONFLICT(music_id, diff_index) DO UPDATE SET
+    ds = excluded.ds,
+    level = excluded.level,
+    notes = excluded.notes,
+    tap = excluded.tap,
+    hold = excluded.hold,
+    slide = excluded.slide,
+    touch = excluded.touch,
+    "break" = excluded."break",
+    charter = excluded.charter,
+    charter_norm = excluded.charter_norm;
+"""
+
+STATS_UPSERT_SQL = """
+INSERT INTO chart_stats(
+    music_id, diff_index, level, cnt,
+    fit_diff, avg, avg_dx, std_dev,
+    rank_dist, fc_dist
+) VALUES(
+    :music_id, :diff_index, :level, :cnt,
+    :fit_diff, :avg, :avg_dx, :std_dev,
+    :rank_dist, :fc_dist
+)
+ON CONFLICT(music_id, diff_index) DO UPDATE SET
+    level = excluded.level,
+    cnt = excluded.cnt,
+    fit_diff = excluded.fit_diff,
+    avg = excluded.avg,
+    avg_dx = excluded.avg_dx,
+    std_dev = excluded.std_dev,
+    rank_dist = excluded.rank_dist,
+    fc_dist = excluded.fc_dist;
+"""
+
+
+# 评级分布（d ~ sssp）与 FC 分布（无 ~ app）的桶数
+RANK_DIST_SIZE = 14
+FC_DIST_SIZE = 5
+
+# 分布以定长小端 int32 数组存成 chart_stats 的一个 BLOB 列
+DIST_DTYPE = np.dtype("<i4")
+
+def pack_dist(counts, size: int) -> bytes:
+    """
+    把分布（列表或 NumPy 数组）编码为定长 BLOB，不足 size 的部分补 0，超出的部分截断
+    """
+    counts = list(counts)[:size] if counts is not None else []
+    return struct.pack(f"<{size}i", *counts, *[0] * (size - len(counts)))
+
+def unpack_dist(blob: Optional[bytes], size: int) -> np.ndarray:
+    """
+    把 BLOB 解码为 int32 数组：直接引用 blob 的内存，不复制（结果只读）；blob 为空时返回全 0
+    """
+    if not blob:
+        dist = np.zeros(size, dtype=DIST_DTYPE)
+        dist.flags.writeable = False
+        return dist
+    return np.frombuffer(blob, dtype=DIST_DTYPE, count=size)
+
+
+async def bump_catalog_generation(db: aiosqlite.Connection) -> int:
+    """
+    在当前写事务中把曲库代数加一并返回新值，随事务一起提交
+    """
+    await db.execute(
+        "INSERT INTO catalog_generation(id, generation) VALUES (0, 1) "
+        "ON CONFLICT(id) DO UPDATE SET generation = generation + 1, updated_at = CURRENT_TIMESTAMP"
+    )
+    return await catalog_generation(db)
+
+async def catalog_generation(db: aiosqlite.Connection) -> int:
+    """
+    读取当前曲库代数（未同步过时为 0）
+    """
+    cursor = await db.execute("SELECT generation FROM catalog_generation WHERE id = 0")
+    row = await cursor.fetchone()
+    return row[0] if row else 0
+
+@asynccontextmanager
+async def read_snapshot(db: aiosqlite.Connection) -> AsyncIterator[aiosqlite.Connection]:
+    """
+    在一个读事务中执行多条查询，所有查询看到同一个数据库快照（WAL 模式下不阻塞写入）
+
+    用法：
+        async with database_api.connection() as db, read_snapshot(db):
+            ...
+    """
+    await db.execute("BEGIN")
+    try:
+        yield db
+    finally:
+        await db.rollback()
+
+
+T = TypeVar("T")
+
+# 玩家成绩同步模式：开启时只写入新增或变化的记录，并返回变更集
+INCREMENTAL_RECORD_SYNC = True
+
+# 冷存储：超过 ARCHIVE_AFTER_DAYS 天没有刷新过成绩（user.ts）的玩家，其成绩压缩后移入 best_record_archive，
+# 再次查询时自动恢复；每个写事务归档 ARCHIVE_BATCH_USERS 名玩家
+ARCHIVE_AFTER_DAYS = 90
+ARCHIVE_BATCH_USERS = 10
+# 归档的列，rating 列可由 chart / chart_stats 重新计算，不归档
+ARCHIVE_COLUMNS = ["music_id", "diff_index", "achievements", "ra", "dxscore", "rank_id", "fc_id", "fs_id", "ts"]
+
+def pack_records(rows: List[tuple]) -> bytes:
+    """
+    把 ARCHIVE_COLUMNS 顺序的成绩行编码为 zlib 压缩的 JSON
+    """
+    return zlib.compress(json.dumps([list(row) for row in rows], separators=(",", ":")).encode("utf-8"))
+
+def unpack_records(blob: bytes) -> List[list]:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+# 成绩历史：每次同步追加一行，保存本次变化的成绩（首次同步为全部成绩）与同步后的 rating，只追加不修改。
+# 变化的成绩按谱面排序后逐列存为 int32：谱面键 music_id * 8 + diff_index 取差分，
+# 达成率乘以 HISTORY_ACHIEVEMENT_SCALE 取整，rank / fc / fs 合为一列，再整体 zlib 压缩
+HISTORY_COLUMNS = ["music_id", "diff_index", "achievements", "dxscore", "rank_id", "fc_id", "fs_id"]
+HISTORY_ACHIEVEMENT_SCALE = 10000
+HISTORY_DTYPE = np.dtype("<i4")
+
+def pack_history(rows: List[tuple]) -> bytes:
+    """
+    把 HISTORY_COLUMNS 顺序的成绩行差分编码并压缩，同一谱面出现多次时以最后一条为准
+    """
+    latest = {(row[0], row[1]): row for row in rows}
+    rows = [latest[key] for key in sorted(latest)]
+    keys = np.array([music_id * 8 + diff_index for music_id, diff_index, *_ in rows], dtype=np.int64)
+    columns = np.array([
+        np.diff(keys, prepend=0),
+        [round((row[2] or 0) * HISTORY_ACHIEVEMENT_SCALE) for row in rows],
+        [row[3] or 0 for row in rows],
+        [(row[4] or 0) | (row[5] or 0) << 4 | (row[6] or 0) << 8 for row in rows],
+    ], dtype=HISTORY_DTYPE).reshape(4, len(rows))
+    return zlib.compress(columns.tobytes(), 9)
+
+def unpack_history(blob: bytes) -> List[tuple]:
+    columns = np.frombuffer(zlib.decompress(blob), dtype=HISTORY_DTYPE).reshape(4, -1)
+    keys = np.cumsum(columns[0], dtype=np.int64).tolist()
+    return [
+        (key >> 3, key & 7, achievements / HISTORY_ACHIEVEMENT_SCALE, dxscore, flags & 15, flags >> 4 & 15, flags >> 8 & 15)
+        for key, achievements, dxscore, flags in zip(keys, *(c.tolist() for c in columns[1:]))
+    ]
+
+
+@dataclass
+class HistoryEntry:
+    """
+    一次成绩同步的历史记录
+    """
+    ts: datetime
+    rating: Optional[int]
+    records: List[tuple]    # 本次变化的成绩，HISTORY_COLUMNS 顺序
+
+
+@dataclass
+class RecordDiff:
+    """
+    一次玩家成绩同步的变更集，元素均为 (music_id, diff_index)
+    """
+    user_id: str
+    inserted: List[Tuple[int, int]] = field(default_factory=list)  # 首次出现的谱面
+    updated: List[Tuple[int, int]] = field(default_factory=list)   # 已有谱面，成绩有变化
+    removed: List[Tuple[int, int]] = field(default_factory=list)   # 本地存在、远端已不存在的谱面（不会删除）
+    new_pbs: List[Tuple[int, int]] = field(default_factory=list)   # 达成率提升的谱面（含首次游玩）
+    unchanged: int = 0
+
+    @property
+    def changed(self) -> List[Tuple[int, int]]:
+        return self.inserted + self.updated
+
+
+@dataclass
+class RunningStats:
+    """
+    一张谱面上本地玩家最佳成绩的在线统计：达成率的计数、均值与 M2（Welford 算法），以及评级分布
+
+    add / remove 都是 O(1)；成绩变化时先 remove 旧成绩再 add 新成绩，不需要重新扫描 best_record
+    """
+    cnt: int = 0
+    mean: float = 0.0
+    m2: float = 0.0    # 与均值之差的平方和
+    rank_dist: np.ndarray = field(default_factory=lambda: np.zeros(RANK_DIST_SIZE, dtype=DIST_DTYPE))
+
+    def add(self, achievements: float, rank_id: int) -> None:
+        self.cnt += 1
+        delta = achievements - self.mean
+        self.mean += delta / self.cnt
+        self.m2 += delta * (achievements - self.mean)
+        if 0 <= rank_id < RANK_DIST_SIZE:
+            self.rank_dist[rank_id] += 1
+
+    def remove(self, achievements: float, rank_id: int) -> None:
+        if self.cnt <= 1:
+            self.cnt, self.mean, self.m2 = 0, 0.0, 0.0
+        else:
+            delta = achievements - self.mean
+            self.cnt -= 1
+            self.mean -= delta / self.cnt
+            # 浮点误差可能让 M2 略小于 0
+            self.m2 = max(self.m2 - delta * (achievements - self.mean), 0.0)
+        if 0 <= rank_id < RANK_DIST_SIZE and self.rank_dist[rank_id] > 0:
+            self.rank_dist[rank_id] -= 1
+
+    @property
+    def std_dev(self) -> float:
+        return math.sqrt(self.m2 / self.cnt) if self.cnt else 0.0
+
+
+# 一条成绩变化：((music_id, diff_index), 旧的 (达成率, rank_id) 或 None, 新的 (达成率, rank_id))
+ScoreChange = Tuple[Tuple[int, int], Optional[Tuple[float, int]], Tuple[float, int]]
+
+COMMUNITY_STATS_UPSERT_SQL = """
+INSERT INTO community_stats(music_id, diff_index, cnt, mean, m2, rank_dist)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(music_id, diff_index) DO UPDATE SET
+    cnt = excluded.cnt,
+    mean = excluded.mean,
+    m2 = excluded.m2,
+    rank_dist = excluded.rank_dist;
+"""
+
+COMMUNITY_STATS_BY_KEYS_SQL = f"""
+WITH keys AS MATERIALIZED ({CHART_KEYS_SQL})
+SELECT cs.music_id, cs.diff_index, cs.cnt, cs.mean, cs.m2, cs.rank_dist
+FROM keys JOIN community_stats AS cs
+  ON cs.music_id = keys.music_id AND cs.diff_index = keys.diff_index
+"""
+
+# 玩家在给定谱面上的成绩，按 best_record 主键逐个查找（等级完成表）
+BEST_RECORD_BY_KEYS_SQL = f"""
+WITH keys AS MATERIALIZED ({CHART_KEYS_SQL})
+SELECT br.music_id, br.diff_index, br.achievements, br.rank_id, br.fc_id, br.fs_id
+FROM keys JOIN best_record AS br
+  ON br.user_id = ? AND br.music_id = keys.music_id AND br.diff_index = keys.diff_index
+"""
+
+def running_stats_from_row(row) -> RunningStats:
+    # 分布复制一份，BLOB 上的数组是只读的
+    return RunningStats(row[2], row[3], row[4], unpack_dist(row[5], RANK_DIST_SIZE).copy())
+
+def community_stats_params(aggregates: Dict[Tuple[int, int], RunningStats]) -> List[tuple]:
+    return [
+        (music_id, diff_index, stats.cnt, stats.mean, stats.m2, pack_dist(stats.rank_dist.tolist(), RANK_DIST_SIZE))
+        for (music_id, diff_index), stats in aggregates.items()
+    ]
+
+# 每条连接建立时执行一次的 pragma
+CONNECTION_PRAGMAS = [
+    "PRAGMA foreign_keys = ON;",
+]
+
+# 存储模式：开启后数据库使用 WAL 日志，所有写入经由单一写入任务串行执行，
+# 读连接在同步期间不会被阻塞；关闭则沿用回滚日志模式，写入直接走连接池
+WAL_MODE = True
+WAL_CONNECTION_PRAGMAS = CONNECTION_PRAGMAS + [
+    "PRAGMA synchronous = NORMAL;",
+]
+
+# 连接池大小，以及空闲多久之后取出连接时需要做健康检查（秒）
+POOL_SIZE = 8
+POOL_ACQUIRE_TIMEOUT = 30.0
+POOL_HEALTH_CHECK_INTERVAL = 60.0
+
+
+class ConnectionPool:
+    """
+    aiosqlite 长连接池
+
+    - 最多维护 size 条连接，按需创建，pragma 与 row_factory 只在建连时设置一次
+    - 通过 async with pool.acquire() as db 使用，退出时自动归还（未提交的事务会被回滚）
+    - 空闲超过 health_check_interval 的连接在取出前会执行 SELECT 1，失效则重建
+    - 损坏的连接被丢弃后，空位以 None 放回空闲队列，唤醒正在等待的调用方，由它新建连接
+    """
+
+    def __init__(self, path: Path, size: int = POOL_SIZE,
+                 acquire_timeout: float = POOL_ACQUIRE_TIMEOUT,
+                 health_check_interval: float = POOL_HEALTH_CHECK_INTERVAL,
+                 pragmas: Optional[List[str]] = None):
+        self.path = path
+        self.size = size
+        self.pragmas = pragmas if pragmas is not None else CONNECTION_PRAGMAS
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle: Optional[asyncio.LifoQueue] = None
+        self._last_used: Dict[int, float] = {}
+        self._opened = 0
+        # 空闲队列中的空位（None）个数
+        self._free = 0
+        self._closed = False
+
+        self.metrics: Dict[str, float] = {
+            "acquired": 0,          # 累计借出次数
+            "created": 0,           # 累计新建连接数
+            "recycled": 0,          # 健康检查失败后被替换的连接数
+            "waits": 0,             # 因池满而等待的次数
+            "wait_time_total": 0.0, # 累计等待时间（秒）
+            "wait_time_max": 0.0,   # 最长等待时间（秒）
+        }
+
+    def _queue(self) -> asyncio.LifoQueue:
+        # 延迟创建，保证队列绑定在运行中的事件循环上
+        if self._idle is None:
+            self._idle = asyncio.LifoQueue()
+        return self._idle
+
+    async def _open(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.path)
+        conn.row_factory = aiosqlite.Row
+        for pragma in self.pragmas:
+            await conn.execute(pragma)
+        await register_functions(conn)
+        self.metrics["created"] += 1
+        return profiled(conn)
+
+    async def _discard(self, conn: aiosqlite.Connection) -> None:
+        self._last_used.pop(id(conn), None)
+        self._opened -= 1
+        try:
+            await conn.close()
+        except Exception:
+            pass
+
+    def _free_slot(self) -> None:
+        # 名额已经还回（_opened 已减一）：放一个空位到队列里，等待中的调用方拿到后自己建连
+        if self._closed:
+            return
+        self._free += 1
+        self._queue().put_nowait(None)
+
+    async def _open_in_slot(self) -> aiosqlite.Connection:
+        # 调用方已经占好名额（_opened 已加一）；建连失败时把名额交还给下一个调用方
+        try:
+            return await self._open()
+        except Exception:
+            self._opened -= 1
+            self._free_slot()
+            raise
+
+    @staticmethod
+    async def is_healthy(conn: aiosqlite.Connection) -> bool:
+        """
+        检查连接是否可用
+        """
+        try:
+            cursor = await conn.execute("SELECT 1")
+            await cursor.fetchone()
+            await cursor.close()
+            return True
+        except Exception:
+            return False
+
+    async def _checkout(self) -> aiosqlite.Connection:
+        if self._closed:
+            raise RuntimeError("connection pool is closed")
+        queue = self._queue()
+
+        if queue.empty() and self._opened < self.size:
+            # 先占位再建连，避免并发时超出上限
+            self._opened += 1
+            try:
+                return await self._open()
+            except Exception:
+                self._opened -= 1
+                raise
+
+        if queue.empty():
+            self.metrics["waits"] += 1
+            start = time.perf_counter()
+            conn = await asyncio.wait_for(queue.get(), timeout=self.acquire_timeout)
+            waited = time.perf_counter() - start
+            self.metrics["wait_time_total"] += waited
+            self.metrics["wait_time_max"] = max(self.metrics["wait_time_max"], waited)
+        else:
+            conn = queue.get_nowait()
+
+        if conn is None:
+            self._free -= 1
+            self._opened += 1
+            return await self._open_in_slot()
+
+        idle_for = time.monotonic() - self._last_used.get(id(conn), 0.0)
+        if idle_for > self.health_check_interval and not await self.is_healthy(conn):
+            await self._discard(conn)
+            self.metrics["recycled"] += 1
+            self._opened += 1
+            conn = await self._open_in_slot()
+        return conn
+
+    async def _checkin(self, conn: aiosqlite.Connection) -> None:
+        if self._closed:
+            await self._discard(conn)
+            return
+        try:
+            if conn.in_transaction:
+                await conn.rollback()
+        except Exception:
+            await self._discard(conn)
+            self._free_slot()
+            return
+        self._last_used[id(conn)] = time.monotonic()
+        self._queue().put_nowait(conn)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiosqlite.Connection]:
+        """
+        从池中借出一条连接
+
+        用法：
+            async with pool.acquire() as db:
+                cursor = await db.execute(...)
+        """
+        conn = await self._checkout()
+        self.metrics["acquired"] += 1
+        try:
+            yield conn
+        finally:
+            await self._checkin(conn)
+
+    async def close(self) -> None:
+        """
+        关闭池中所有空闲连接；之后归还的连接会被直接关闭
+        """
+        self._closed = True
+        queue = self._queue()
+        while not queue.empty():
+            conn = queue.get_nowait()
+            if conn is not None:
+                await self._discard(conn)
+        self._free = 0
+
+    def stats(self) -> Dict[str, float]:
+        """
+        返回连接池指标
+        """
+        idle = self._idle.qsize() - self._free if self._idle is not None else 0
+        return {
+            **self.metrics,
+            "size": self.size,
+            "opened": self._opened,
+            "idle": idle,
+            "in_use": self._opened - idle,
+        }
+
+
+class DatabaseWriter:
+    """
+    单写者：独占一条连接，所有写入请求进入队列，由一个后台任务按顺序执行
+
+    每个请求是一个 async 函数 func(db)，在 BEGIN IMMEDIATE ... COMMIT 中运行，
+    出错时回滚并把异常抛回给调用方。
+    """
+
+    def __init__(self, path: Path, pragmas: Optional[List[str]] = None):
+        self.path = path
+        self.pragmas = pragmas if pragmas is not None else WAL_CONNECTION_PRAGMAS
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+
+        self.metrics: Dict[str, float] = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "busy_time_total": 0.0,  # 写任务累计执行时间（秒）
+        }
+
+    async def start(self) -> None:
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._task is not None and not self._task.done():
+                return
+            if self._conn is not None:
+                # 写任务异常退出后重新启动：先关闭原来的写连接
+                await self._conn.close()
+            conn = await aiosqlite.connect(self.path, isolation_level=None)
+            conn.row_factory = aiosqlite.Row
+            # journal_mode 会持久化到数据库文件中
+            await conn.execute("PRAGMA journal_mode = WAL;")
+            for pragma in self.pragmas:
+                await conn.execute(pragma)
+            await register_functions(conn)
+            self._conn = profiled(conn)
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            func, future = await self._queue.get()
+            if func is None:
+                future.set_result(None)
+                break
+            start = time.perf_counter()
+            try:
+                await self._conn.execute("BEGIN IMMEDIATE;")
+                result = await func(self._conn)
+                await self._conn.execute("COMMIT;")
+            except Exception as e:
+                await self._rollback()
+                self.metrics["failed"] += 1
+                if not future.cancelled():
+                    future.set_exception(e)
+            except BaseException as e:
+                # 写任务被取消（或进程退出）：回滚并让调用方结束等待，然后照常向外抛出
+                await self._rollback()
+                self.metrics["failed"] += 1
+                if not future.done():
+                    if isinstance(e, asyncio.CancelledError):
+                        future.cancel()
+                    else:
+                        future.set_exception(e)
+                # 队列中剩下的请求不会再被执行
+                while not self._queue.empty():
+                    _, waiting = self._queue.get_nowait()
+                    if not waiting.done():
+                        waiting.cancel()
+                raise
+            else:
+                self.metrics["completed"] += 1
+                if not future.cancelled():
+                    future.set_result(result)
+            finally:
+                self.metrics["busy_time_total"] += time.perf_counter() - start
+
+    async def _rollback(self) -> None:
+        try:
+            if self._conn.in_transaction:
+                await self._conn.execute("ROLLBACK;")
+        except Exception:
+            pass
+
+    async def submit(self, func: Callable[[aiosqlite.Connection], Awaitable[T]]) -> T:
+        """
+        提交一个写入任务并等待其完成
+
+        Args:
+            func: async 函数，接收写连接作为唯一参数，返回值会原样返回给调用方
+        """
+        if self._task is None or self._task.done():
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.metrics["submitted"] += 1
+        await self._queue.put((func, future))
+        return await future
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def close(self) -> None:
+        """
+        等待队列中已有的写入完成后关闭写连接
+        """
+        if self._task is not None and not self._task.done():
+            future = asyncio.get_running_loop().create_future()
+            await self._queue.put((None, future))
+            await future
+            await self._task
+        self._task = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
 
 class DatabaseAPI:
 
+    def __init__(self, path: Path = database_path, pool_size: int = POOL_SIZE, wal: bool = WAL_MODE):
+        self.wal = wal
+        pragmas = WAL_CONNECTION_PRAGMAS if wal else CONNECTION_PRAGMAS
+        self.pool = ConnectionPool(path, size=pool_size, pragmas=pragmas)
+        self.writer = DatabaseWriter(path, pragmas=pragmas) if wal else None
+        # 已归档的玩家，首次用到时从 best_record_archive 读取；只用于快速判断，是否真的需要恢复以表中为准
+        self._archived_users: Optional[Set[str]] = None
+        # 每位玩家成绩的版本号，每次 sync_user_records 写入后加一；按玩家缓存的查询结果以此判断是否过期
+        self._user_versions: Dict[str, int] = {}
+
+        self.archive_metrics: Dict[str, float] = {
+            "archived_users": 0,       # 累计归档的玩家数
+            "archived_records": 0,     # 累计归档的成绩数
+            "rehydrated_users": 0,     # 累计恢复的玩家数
+            "rehydrated_records": 0,   # 累计恢复的成绩数
+            "rehydrate_time_total": 0.0,  # 查询路径上恢复的累计用时（秒）
+        }
+
+    def connection(self):
+        """
+        从连接池借出一条连接（async context manager）
+
+        Returns:
+            AsyncContextManager[aiosqlite.Connection]
+        """
+        return self.pool.acquire()
+
     async def get_database_connection(self) -> aiosqlite.Connection:
         """
-        Get a connection to the SQLite database.
+        Get a standalone connection to the SQLite database.
+        Prefer `connection()`, which reuses pooled connections.
 
         Returns:
             aiosqlite.Connection: An asynchronous connection to the database.
         """
-        return await aiosqlite.connect(database_path)
+        return await aiosqlite.connect(self.pool.path)
+
+    async def write(self, func: Callable[[aiosqlite.Connection], Awaitable[T]]) -> T:
+        """
+        Run a write job inside a single transaction.
+
+        In WAL mode the job is queued to the dedicated writer task, so
+        writes are serialized and never block readers. Otherwise it runs
+        on a pooled connection.
+
+        Args:
+            func: async callable taking the connection to write with.
+        """
+        if self.writer is not None:
+            return await self.writer.submit(func)
+        async with self.connection() as db:
+            await db.execute("BEGIN;")
+            result = await func(db)
+            await db.commit()
+            return result
+
+    async def start(self) -> None:
+        """
+        Start the writer task (switches the database to WAL mode).
+        """
+        if self.writer is not None:
+            await self.writer.start()
+
+    async def close(self) -> None:
+        """
+        Drain the writer queue and close every connection.
+        """
+        if self.writer is not None:
+            await self.writer.close()
+        await self.pool.close()
+
+
+    @staticmethod
+    def _musiclist_params(music_list: List[Dict]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        在内存中构造 music / chart 两张表的全部参数
+        """
+        music_params: List[Dict[str, Any]] = []
+        chart_params: List[Dict[str, Any]] = []
+        for music in music_list:
+            # 忽略宴谱
+            if int(music['id']) >= 100000:
+                continue
+            basic_info = music['basic_info']
+            music_params.append({
+                'id': int(music['id']),
+                'title': music['title'],
+                'type': music['type'],
+                'artist': basic_info['artist'],
+                'genre': basic_info['genre'],
+                'bpm': int(basic_info['bpm']),
+                'release_date': basic_info['release_date'],
+                'version': basic_info['from'],
+                'is_new': 1 if basic_info['is_new'] else 0,
+                'version_id': version_list.index(basic_info['from']) if basic_info['from'] in version_list else -1,
+                # 搜索用的规范化列（见 search_key），music_fts / chart_fts 由触发器同步
+                'title_norm': search_key(music['title']),
+                'artist_norm': search_key(basic_info['artist'])
+            })
+
+            for diff_index, ds_val in enumerate(music['ds'] or []):
+                # Decompose note counts
+                charts_info = music['charts'][diff_index]['notes']
+                if len(charts_info) == 4:
+                    tap, hold, slide, brk = charts_info
+                    touch = 0
+                elif len(charts_info) == 5:
+                    tap, hold, slide, touch, brk = charts_info
+                else:
+                    tap, hold, slide, touch, brk = [0,0,0,0,0]
+                chart_params.append({
+                    'music_id': int(music['id']),
+                    'diff_index': diff_index,
+                    'ds': float(ds_val),
+                    'level': music['level'][diff_index],
+                    'notes': tap + hold + slide + touch + brk,
+                    'tap': tap,
+                    'hold': hold,
+                    'slide': slide,
+                    'touch': touch,
+                    'brk': brk,
+                    'charter': music['charts'][diff_index]['charter'],
+                    'charter_norm': search_key(music['charts'][diff_index]['charter'])
+                })
+        return music_params, chart_params
+
+    @classmethod
+    async def _write_musiclist(cls, db: aiosqlite.Connection, music_params: List[Dict[str, Any]], chart_params: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """
+        在当前写事务中写入曲库，返回 (定数变化的谱面数, 重算的成绩数)
+        """
+        cursor = await db.execute("SELECT music_id, diff_index, ds FROM chart")
+        old_ds = {(r[0], r[1]): r[2] for r in await cursor.fetchall()}
+        await db.executemany(MUSIC_UPSERT_SQL, music_params)
+        await db.executemany(CHART_UPSERT_SQL, chart_params)
+        # 定数有变化的谱面，重新计算已有成绩的 rating 列
+        changed = [
+            (p['music_id'], p['diff_index']) for p in chart_params
+            if (p['music_id'], p['diff_index']) in old_ds and old_ds[(p['music_id'], p['diff_index'])] != p['ds']
+        ]
+        recomputed = await cls._recompute_ratings(db, changed)
+        return len(changed), recomputed
+
+    @staticmethod
+    def _stats_params(stats: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        由 stats 构造 chart_stats 的参数，两种分布编码为定长 BLOB
+        """
+        stats_params: List[Dict[str, Any]] = []
+        for music_id, chart_stats in stats.items():
+            music_id = int(music_id)
+            # 忽略宴谱
+            if music_id >= 100000:
+                continue
+            for diff_index, stat in enumerate(chart_stats):
+                # Skip if no stats available
+                if not stat or not isinstance(stat, dict):
+                    continue
+                stats_params.append({
+                    'music_id': music_id,
+                    'diff_index': diff_index,
+                    'level': stat.get('diff', ''),
+                    'cnt': stat.get('cnt', 0),
+                    'fit_diff': stat.get('fit_diff', 0.0),
+                    'avg': stat.get('avg', 0.0),
+                    'avg_dx': stat.get('avg_dx', 0.0),
+                    'std_dev': stat.get('std_dev', 0.0),
+                    'rank_dist': pack_dist(stat.get('dist'), RANK_DIST_SIZE),
+                    'fc_dist': pack_dist(stat.get('fc_dist'), FC_DIST_SIZE)
+                })
+        return stats_params
 
+    @classmethod
+    async def _write_stats(cls, db: aiosqlite.Connection, stats_params: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """
+        在当前写事务中写入谱面统计，返回 (拟合定数变化的谱面数, 重算的成绩数)
+        """
+        cursor = await db.execute("SELECT music_id, diff_index, fit_diff FROM chart_stats")
+        old_fit = {(r[0], r[1]): r[2] for r in await cursor.fetchall()}
+        await db.executemany(STATS_UPSERT_SQL, stats_params)
+        # 拟合定数有变化（含首次出现）的谱面，重新计算已有成绩的 ra_stats
+        changed = [
+            (p['music_id'], p['diff_index']) for p in stats_params
+            if old_fit.get((p['music_id'], p['diff_index'])) != p['fit_diff']
+        ]
+        recomputed = await cls._recompute_ratings(db, changed)
+        return len(changed), recomputed
 
-    async def sync_musiclist(self, music_list: List[Dict]) -> None:
+    async def sync_musiclist(self, music_list: List[Dict]) -> int:
         """
         Synchronize the given MusicList object to the SQLite database.
 
         Args:
             music_list: MusicList instance containing Music dicts to upsert.
+
+        Returns:
+            The catalog generation committed with this write.
         """
-        # Open connection
-        async with aiosqlite.connect(database_path) as db:
-            # Ensure foreign keys are enforced
-            await db.execute("PRAGMA foreign_keys = ON;")
-            # Begin transaction for bulk upsert
-            await db.execute("BEGIN;")
+        start = time.perf_counter()
+        music_params, chart_params = self._musiclist_params(music_list)
+        prepared = time.perf_counter()
 
-            # Upsert music entries
-            music_sql = '''
-            INSERT OR REPLACE INTO music(
-                id, title, type, artist, genre,
-                bpm, release_date, version, is_new, version_id
-            ) VALUES(
-                :id, :title, :type, :artist, :genre,
-                :bpm, :release_date, :version, :is_new, :version_id
-            );
-            '''
-
-            chart_sql = '''
-            INSERT OR REPLACE INTO chart(
-                music_id, diff_index, ds, level,
-                notes, tap, hold, slide, touch, "break", charter
-            ) VALUES(
-                :music_id, :diff_index, :ds, :level,
-                :notes, :tap, :hold, :slide, :touch, :brk, :charter
-            );
-            '''
-
-            for music in music_list:
-                # 忽略宴谱
-                if int(music['id']) >= 100000:
-                    continue
-                # Prepare music parameters
-                music_params = {
-                    'id': int(music['id']),
-                    'title': music['title'],
-                    'type': music['type'],
-                    'artist': music['basic_info']['artist'],
-                    'genre': music['basic_info']['genre'],
-                    'bpm': int(music['basic_info']['bpm']),
-                    'release_date': music['basic_info']['release_date'],
-                    'version': music['basic_info']['from'],
-                    'is_new': 1 if music['basic_info']['is_new'] else 0,
-                    'version_id': version_list.index(music['basic_info']['from']) if music['basic_info']['from'] in version_list else -1
-                }
-                await db.execute(music_sql, music_params)
-
-                # Upsert related charts
-                for diff_index, ds_val in enumerate(music['ds'] or []):
-                    level_val = music['level'][diff_index]
-                    # Decompose note counts
-                    charts_info = music['charts'][diff_index]['notes']
-                    if len(charts_info) == 4:
-                        tap, hold, slide, brk = charts_info
-                        touch = 0
-                    elif len(charts_info) == 5:
-                        tap, hold, slide, touch, brk = charts_info
-                    else:
-                        tap, hold, slide, touch, brk = [0,0,0,0,0]
-                    notes = tap + hold + slide + touch + brk 
-                    charter = music['charts'][diff_index]['charter']
-
-                    chart_params = {
-                        'music_id': int(music['id']),
-                        'diff_index': diff_index,
-                        'ds': float(ds_val),
-                        'level': level_val,
-                        'notes': notes,
-                        'tap': tap,
-                        'hold': hold,
-                        'slide': slide,
-                        'touch': touch,
-                        'brk': brk,
-                        'charter': charter
-                    }
-                    await db.execute(chart_sql, chart_params)
-
-            # Commit transaction
-            await db.commit()
+        # 写入在 self.write 提供的事务中执行（WAL 模式下由单一写入任务串行执行）
+        async def _write(db: aiosqlite.Connection) -> Tuple[float, int, int, int]:
+            write_start = time.perf_counter()
+            changed, recomputed = await self._write_musiclist(db, music_params, chart_params)
+            generation = await bump_catalog_generation(db)
+            return time.perf_counter() - write_start, changed, recomputed, generation
 
-    async def sync_stats(self, stats: Dict[str, Any]) -> None:
+        write_time, changed, recomputed, generation = await self.write(_write)
+        print(f"[Info] sync_musiclist: {len(music_params)} music, {len(chart_params)} charts, "
+              f"{changed} ds changed ({recomputed} records recomputed), generation {generation}; "
+              f"prepare {prepared - start:.3f}s, write {write_time:.3f}s, total {time.perf_counter() - start:.3f}s")
+        return generation
+
+    async def sync_stats(self, stats: Dict[str, Any]) -> int:
         """
         Synchronize the given Stats object to the SQLite database.
 
         Args:
             stats: Stats instance containing statistics to upsert.
+
+        Returns:
+            The catalog generation committed with this write.
         """
-        async with aiosqlite.connect(database_path) as db:
-            await db.execute("PRAGMA foreign_keys = ON;")
-            # Begin transaction
+        start = time.perf_counter()
+        stats_params = self._stats_params(stats)
+        prepared = time.perf_counter()
 
-            await db.execute("BEGIN;")
+        async def _write(db: aiosqlite.Connection) -> Tuple[float, int, int, int]:
+            write_start = time.perf_counter()
+            changed, recomputed = await self._write_stats(db, stats_params)
+            generation = await bump_catalog_generation(db)
+            return time.perf_counter() - write_start, changed, recomputed, generation
 
-            # Upsert stats
-            stats_sql = '''
-            INSERT OR REPLACE INTO chart_stats(
-                music_id, diff_index, level, cnt,
-                fit_diff, avg, avg_dx, std_dev
-            ) VALUES(
-                :music_id, :diff_index, :level, :cnt,
-                :fit_diff, :avg, :avg_dx, :std_dev
-            );
-            '''
-            
-            for music_id, chart_stats in stats.items():
-                # 忽略宴谱
-                if int(music_id) >= 100000:
-                    continue
-                for diff_index, stat in enumerate(chart_stats):
-                    # Skip if no stats available
-                    if not stat or not isinstance(stat, dict):
-                        continue
-                    # Prepare parameters
-                    params = {
-                        'music_id': int(music_id),
-                        'diff_index': diff_index,
-                        'level': stat.get('diff', ''),
-                        'cnt': stat.get('cnt', 0),
-                        'fit_diff': stat.get('fit_diff', 0.0),
-                        'avg': stat.get('avg', 0.0),
-                        'avg_dx': stat.get('avg_dx', 0.0),
-                        'std_dev': stat.get('std_dev', 0.0)
-                    }
-                    await db.execute(stats_sql, params)
-
-            stats_sql_rank = '''
-            INSERT OR REPLACE INTO chart_rating_dist(
-                music_id, diff_index, rating_index, count
-            ) VALUES(
-                :music_id, :diff_index, :rating_index, :count
-            );
-            '''
-
-            # Upsert rank distribution
-            for music_id, chart_stats in stats.items():
-                # 忽略宴谱
-                if int(music_id) >= 100000:
-                    continue
-                for diff_index, stat in enumerate(chart_stats):
-                    if 'dist' in stat:
-                        for rating_index, count in enumerate(stat['dist']):
-                            params = {
-                                'music_id': int(music_id),
-                                'diff_index': diff_index,
-                                'rating_index': rating_index,
-                                'count': count
-                            }
-                            await db.execute(stats_sql_rank, params)
-
-            stats_sql_fc = '''
-            INSERT OR REPLACE INTO chart_fc_dist(
-                music_id, diff_index, fc_index, count
-            ) VALUES(
-                :music_id, :diff_index, :fc_index, :count
-            );
-            '''
-
-            # Upsert full combo distribution
-            for music_id, chart_stats in stats.items():
-                # 忽略宴谱
-                if int(music_id) >= 100000:
-                    continue
-                for diff_index, stat in enumerate(chart_stats):
-                    if 'fc_dist' in stat:
-                        for fc_index, count in enumerate(stat['fc_dist']):
-                            params = {
-                                'music_id': int(music_id),
-                                'diff_index': diff_index,
-                                'fc_index': fc_index,
-                                'count': count
-                            }
-                            await db.execute(stats_sql_fc, params)
-
-            # Commit transaction
-            await db.commit()
+        write_time, changed, recomputed, generation = await self.write(_write)
+        print(f"[Info] sync_stats: {len(stats_params)} charts, "
+              f"{changed} fit_diff changed ({recomputed} records recomputed), generation {generation}; "
+              f"prepare {prepared - start:.3f}s, write {write_time:.3f}s, total {time.perf_counter() - start:.3f}s")
+        return generation
+
+    async def sync_catalog(self, music_list: List[Dict], stats: Dict[str, Any]) -> int:
+        """
+        Synchronize music, charts and chart stats in ONE transaction.
+
+        Readers never observe new charts paired with old stats: the whole
+        refresh becomes visible at once, together with a new catalog
+        generation.
+
+        Args:
+            music_list: Music dicts, as accepted by sync_musiclist.
+            stats: chart stats, as accepted by sync_stats.
+
+        Returns:
+            The catalog generation committed with this write.
+        """
+        start = time.perf_counter()
+        music_params, chart_params = self._musiclist_params(music_list)
+        stats_params = self._stats_params(stats)
+        prepared = time.perf_counter()
+
+        async def _write(db: aiosqlite.Connection) -> Tuple[float, int, int, int, int]:
+            write_start = time.perf_counter()
+            ds_changed, ds_recomputed = await self._write_musiclist(db, music_params, chart_params)
+            fit_changed, fit_recomputed = await self._write_stats(db, stats_params)
+            generation = await bump_catalog_generation(db)
+            return time.perf_counter() - write_start, ds_changed, fit_changed, ds_recomputed + fit_recomputed, generation
+
+        write_time, ds_changed, fit_changed, recomputed, generation = await self.write(_write)
+        print(f"[Info] sync_catalog: {len(music_params)} music, {len(chart_params)} charts, {len(stats_params)} stats, "
+              f"{ds_changed} ds / {fit_changed} fit_diff changed ({recomputed} records recomputed), generation {generation}; "
+              f"prepare {prepared - start:.3f}s, write {write_time:.3f}s, total {time.perf_counter() - start:.3f}s")
+        return generation
+
+    @staticmethod
+    async def _recompute_ratings(db: aiosqlite.Connection, keys: Optional[List[Tuple[int, int]]] = None) -> int:
+        """
+        在当前写事务中重新计算 rating 列，keys 为 None 时重算全部成绩，返回更新的行数
+        """
+        if keys is None:
+            cursor = await db.execute(RATING_UPDATE_SQL)
+        elif keys:
+            cursor = await db.executemany(
+                RATING_UPDATE_SQL + " AND best_record.music_id = ? AND best_record.diff_index = ?",
+                keys
+            )
+        else:
+            return 0
+        return max(cursor.rowcount, 0)
+
+    async def recompute_ratings(self, keys: Optional[List[Tuple[int, int]]] = None) -> int:
+        """
+        Recompute the stored ra_b50 / ra_b40 / ra_stats columns.
 
+        Args:
+            keys: (music_id, diff_index) charts to recompute, or None for
+                every record.
 
-    async def sync_user_records(self, user_json: Dict[str, Any]) -> None:
+        Returns:
+            Number of best_record rows updated.
+        """
+        start = time.perf_counter()
+        updated = await self.write(lambda db: self._recompute_ratings(db, keys))
+        print(f"[Info] recompute_ratings: {updated} records in {time.perf_counter() - start:.3f}s")
+        return updated
+
+
+    @staticmethod
+    def _score_changes(old_scores: Dict[Tuple[int, int], Tuple[float, int]], record_params: List[tuple]) -> List[ScoreChange]:
+        # 同一谱面出现多次时以最后一条为准，与 upsert 的结果一致；只保留达成率或评级有变化的谱面
+        new_scores = {(params[1], params[2]): (params[3], params[6]) for params in record_params}
+        return [(key, old_scores.get(key), new) for key, new in new_scores.items() if old_scores.get(key) != new]
+
+    @staticmethod
+    async def _update_community_stats(db: aiosqlite.Connection, changes: List[ScoreChange]) -> int:
+        """
+        在当前写事务中把成绩变化合并进 community_stats，只读写涉及的谱面，返回更新的谱面数
+        """
+        if not changes:
+            return 0
+        keys = list(dict.fromkeys(key for key, _, _ in changes))
+        cursor = await db.execute(COMMUNITY_STATS_BY_KEYS_SQL, (chart_keys_param(keys),))
+        aggregates = {(row[0], row[1]): running_stats_from_row(row) for row in await cursor.fetchall()}
+        for key, old, new in changes:
+            stats = aggregates.setdefault(key, RunningStats())
+            if old is not None and old[0] is not None:
+                stats.remove(*old)
+            if new[0] is not None:
+                stats.add(*new)
+        await db.executemany(COMMUNITY_STATS_UPSERT_SQL, community_stats_params(aggregates))
+        return len(aggregates)
+
+    @staticmethod
+    async def _append_history(db: aiosqlite.Connection, user_id: str, rating: Optional[int], changed_params: List[tuple]) -> bool:
+        """
+        在当前写事务中追加一条成绩历史；成绩与 rating 都没有变化时不写入，返回是否写入
+        """
+        if not changed_params:
+            cursor = await db.execute("SELECT rating FROM score_history WHERE user_id = ? ORDER BY ts DESC LIMIT 1", (user_id,))
+            row = await cursor.fetchone()
+            if row is not None and row[0] == rating:
+                return False
+        rows = [(p[1], p[2], p[3], p[5], p[6], p[7], p[8]) for p in changed_params]
+        # 同一毫秒内的两次同步（几乎不会发生）只保留先写入的一条
+        await db.execute(
+            "INSERT OR IGNORE INTO score_history(user_id, ts, rating, record_count, payload) VALUES (?, ?, ?, ?, ?)",
+            (user_id, time.time_ns() // 1_000_000, rating, len(rows), pack_history(rows))
+        )
+        return True
+
+    async def sync_user_records(self, user_json: Dict[str, Any], incremental: bool = INCREMENTAL_RECORD_SYNC) -> Optional[RecordDiff]:
         """
         Synchronize user profile and best records into SQLite database.
 
@@ -225,65 +1066,213 @@ class DatabaseAPI:
                 - username (user_id)
                 - additional_rating, nickname, plate, rating
                 - records: list of record dicts
+            incremental: compare against the stored records and only write
+                rows that are new or changed; otherwise rewrite every row.
+
+        Both modes fold the score changes into community_stats and append the
+        changed records and the new rating to score_history in the same
+        transaction, without rescanning best_record.
+
+        Returns:
+            RecordDiff in incremental mode, None for a full rewrite.
         """
-        async with aiosqlite.connect(database_path) as db:
-            await db.execute("PRAGMA foreign_keys = ON;")
-            # Begin transaction
-            await db.execute("BEGIN;")
+        start = time.perf_counter()
+        user_id = user_json.get('username').lower()  # Ensure user_id is lowercase
+
+        user_sql = '''
+        INSERT INTO user(
+            id, additional_rating, nickname, plate, rating, ts
+        ) VALUES(
+            :id, :additional_rating, :nickname, :plate, :rating, CURRENT_TIMESTAMP
+        )
+        ON CONFLICT(id) DO UPDATE SET
+            additional_rating = excluded.additional_rating,
+            nickname = excluded.nickname,
+            plate = excluded.plate,
+            rating = excluded.rating,
+            ts = excluded.ts;
+        '''
+        user_params = {
+            'id': user_id,
+            'additional_rating': user_json.get('additional_rating'),
+            'nickname': user_json.get('nickname'),
+            'plate': user_json.get('plate'),
+            'rating': user_json.get('rating')
+        }
 
-            # Upsert user profile
-            user_sql = '''
-            INSERT OR REPLACE INTO user(
-                id, additional_rating, nickname, plate, rating, ts
-            ) VALUES(
-                :id, :additional_rating, :nickname, :plate, :rating, CURRENT_TIMESTAMP
-            );
-            '''
-            user_params = {
-                'id': user_json.get('username').lower(),  # Ensure username is lowercase
-                'additional_rating': user_json.get('additional_rating'),
-                'nickname': user_json.get('nickname'),
-                'plate': user_json.get('plate'),
-                'rating': user_json.get('rating')
-            }
+        record_sql = '''
+        INSERT INTO best_record(
+            user_id, music_id, diff_index,
+            achievements, ra, dxscore, rank_id, fc_id, fs_id, ts
+        ) VALUES(
+            ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP
+        )
+        ON CONFLICT(user_id, music_id, diff_index) DO UPDATE SET
+            achievements = excluded.achievements,
+            ra = excluded.ra,
+            dxscore = excluded.dxscore,
+            rank_id = excluded.rank_id,
+            fc_id = excluded.fc_id,
+            fs_id = excluded.fs_id,
+            ts = excluded.ts,
+            ra_b50 = NULL,
+            ra_b40 = NULL,
+            ra_stats = NULL;
+        '''
+        # 新写入或被更新的行 rating 列为 NULL，写完后统一计算
+        rating_sql = RATING_UPDATE_SQL + " AND best_record.user_id = ? AND best_record.ra_b50 IS NULL"
+        record_params = [
+            (
+                user_id,
+                rec.get('song_id'),
+                rec.get('level_index'),
+                rec.get('achievements'),
+                rec.get('ra'),
+                rec.get('dxScore'),
+                get_rank_id(rec.get('rate', 'd')),  # Default to 'd' if not present
+                get_fc_id(rec.get('fc', '')),
+                get_fs_id(rec.get('fs', ''))
+            )
+            for rec in user_json.get('records', [])
+        ]
+
+        async def _write_full(db: aiosqlite.Connection) -> None:
+            await self._rehydrate(db, user_id)
+            cursor = await db.execute(
+                "SELECT music_id, diff_index, achievements, dxscore, rank_id, fc_id, fs_id FROM best_record WHERE user_id = ?", (user_id,)
+            )
+            rows = await cursor.fetchall()
+            await cursor.close()
+            old_scores = {(r[0], r[1]): (r[2], r[4]) for r in rows}
+            old_records = {(r[0], r[1]): (r[2], r[3], r[4], r[5], r[6]) for r in rows}
             await db.execute(user_sql, user_params)
+            await db.executemany(record_sql, record_params)
+            await db.execute(rating_sql, (user_id,))
+            await self._update_community_stats(db, self._score_changes(old_scores, record_params))
+            changed_params = [p for p in record_params if old_records.get((p[1], p[2])) != (p[3], p[5], p[6], p[7], p[8])]
+            await self._append_history(db, user_id, user_params['rating'], changed_params)
+
+        async def _write_incremental(db: aiosqlite.Connection) -> RecordDiff:
+            # 已归档的玩家先恢复，变更集照常与其原有成绩比较
+            await self._rehydrate(db, user_id)
+            # 现有成绩：(music_id, diff_index) -> (achievements, dxscore, fc_id, fs_id, ra)
+            cursor = await db.execute(
+                "SELECT music_id, diff_index, achievements, dxscore, fc_id, fs_id, ra, rank_id FROM best_record WHERE user_id = ?",
+                (user_id,)
+            )
+            rows = await cursor.fetchall()
+            await cursor.close()
+            existing = {(r[0], r[1]): (r[2], r[3], r[4], r[5], r[6]) for r in rows}
+            old_scores = {(r[0], r[1]): (r[2], r[7]) for r in rows}
+
+            diff = RecordDiff(user_id=user_id)
+            changed_params = []
+            seen = set()
+            for params in record_params:
+                key = (params[1], params[2])
+                seen.add(key)
+                old = existing.get(key)
+                new = (params[3], params[5], params[7], params[8], params[4])
+                if old is None:
+                    diff.inserted.append(key)
+                    diff.new_pbs.append(key)
+                elif old != new:
+                    diff.updated.append(key)
+                    if old[0] is None or (new[0] is not None and new[0] > old[0]):
+                        diff.new_pbs.append(key)
+                else:
+                    diff.unchanged += 1
+                    continue
+                changed_params.append(params)
+            diff.removed = [key for key in existing if key not in seen]
+
+            # 用户信息（含 ts）始终刷新；成绩只写变化的行
+            await db.execute(user_sql, user_params)
+            if changed_params:
+                await db.executemany(record_sql, changed_params)
+                await db.execute(rating_sql, (user_id,))
+                await self._update_community_stats(db, self._score_changes(old_scores, changed_params))
+            await self._append_history(db, user_id, user_params['rating'], changed_params)
+            return diff
+
+        if not incremental:
+            await self.write(_write_full)
+            self._user_versions[user_id] = self._user_versions.get(user_id, 0) + 1
+            if self._archived_users is not None:
+                self._archived_users.discard(user_id)
+            print(f"[Info] sync_user_records: {user_id} {len(record_params)} records (full) in {time.perf_counter() - start:.3f}s")
+            return None
+
+        diff = await self.write(_write_incremental)
+        self._user_versions[user_id] = self._user_versions.get(user_id, 0) + 1
+        if self._archived_users is not None:
+            self._archived_users.discard(user_id)
+        print(f"[Info] sync_user_records: {user_id} {len(diff.inserted)} inserted, {len(diff.updated)} updated, "
+              f"{diff.unchanged} unchanged, {len(diff.removed)} removed in {time.perf_counter() - start:.3f}s")
+        return diff
+
+    def user_version(self, user_id: str) -> int:
+        """
+        Version of a user's records in this process.
+
+        Incremented after every sync_user_records write, so results cached
+        under (user, version) go stale as soon as the user syncs again.
+        Archiving and rehydrating move records without changing them and
+        leave the version alone.
+        """
+        return self._user_versions.get(user_id.lower(), 0)
+
+    async def rating_history(self, user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Tuple[datetime, int]]:
+        """
+        Rating snapshots of a user, oldest first.
+
+        Only reads the (user_id, ts) index range and the rating column; the
+        record payloads are not decoded.
+
+        Args:
+            user_id: The user ID.
+            since / until: Optional inclusive time range.
+
+        Returns:
+            List of (sync time, rating) tuples.
+        """
+        sql, params = self._history_range("SELECT ts, rating FROM score_history", user_id, since, until)
+        async with self.connection() as db:
+            cursor = await db.execute(sql, params)
+            rows = await cursor.fetchall()
+        return [(datetime.fromtimestamp(ts / 1000), rating) for ts, rating in rows if rating is not None]
+
+    async def score_history(self, user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[HistoryEntry]:
+        """
+        Score history of a user, oldest first.
+
+        The first entry holds every record of the first sync; each later entry
+        holds only the records that changed in that sync.
+
+        Args:
+            user_id: The user ID.
+            since / until: Optional inclusive time range.
+
+        Returns:
+            List of HistoryEntry.
+        """
+        sql, params = self._history_range("SELECT ts, rating, payload FROM score_history", user_id, since, until)
+        async with self.connection() as db:
+            cursor = await db.execute(sql, params)
+            rows = await cursor.fetchall()
+        return [HistoryEntry(datetime.fromtimestamp(ts / 1000), rating, unpack_history(payload)) for ts, rating, payload in rows]
+
+    @staticmethod
+    def _history_range(select: str, user_id: str, since: Optional[datetime], until: Optional[datetime]) -> Tuple[str, List[Any]]:
+        sql, params = select + " WHERE user_id = ?", [user_id.lower()]
+        if since is not None:
+            sql += " AND ts >= ?"
+            params.append(int(since.timestamp() * 1000))
+        if until is not None:
+            sql += " AND ts <= ?"
+            params.append(int(until.timestamp() * 1000))
+        return sql + " ORDER BY ts", params
 
-            # Upsert each best record
-            record_sql = '''
-            INSERT OR REPLACE INTO best_record(
-                user_id, music_id, diff_index,
-                achievements, ra, dxscore, rank_id, fc_id, fs_id, ts
-            ) VALUES(
-                :user_id, :music_id, :diff_index,
-                :achievements, :ra, :dxscore, :rank_id, :fc_id, :fs_id, CURRENT_TIMESTAMP 
-            );
-            '''
-            user_id = user_json.get('username').lower()  # Ensure user_id is lowercase
-            for rec in user_json.get('records', []):
-                # Resolve fc_id and fs_id if mapping tables exist
-                fc_str = rec.get('fc', '')
-                fs_str = rec.get('fs', '')
-                fc_id = get_fc_id(fc_str)
-                fs_id = get_fs_id(fs_str)
-
-                params = {
-                    'user_id': user_id,
-                    'music_id': rec.get('song_id'),
-                    'diff_index': rec.get('level_index'),
-                    'achievements': rec.get('achievements'),
-                    'ra': rec.get('ra'),
-                    'dxscore': rec.get('dxScore'),
-                    'rank_id': get_rank_id(rec.get('rate', 'd')),  # Default to 'd' if not present
-                    'fc_id': fc_id,
-                    'fs_id': fs_id
-                }
-
-                # print(f"Upserting record for user {user_id}, music {params['music_id']}, diff {params['diff_index']}")
-                await db.execute(record_sql, params)
-
-            # Commit transaction
-            await db.commit()
-    
     async def check_user_exists(self, username: str) -> bool:
         """
         Check if a user exists in the database.
@@ -294,7 +1283,7 @@ class DatabaseAPI:
         Returns:
             bool: True if the user exists, False otherwise.
         """
-        async with aiosqlite.connect(database_path) as db:
+        async with self.connection() as db:
             cursor = await db.execute("SELECT COUNT(*) FROM user WHERE id = ?", (username,))
             count = await cursor.fetchone()
             return count[0] > 0
@@ -309,7 +1298,7 @@ class DatabaseAPI:
         Returns:
             bool: True if the user's data is outdated, False otherwise.
         """
-        async with aiosqlite.connect(database_path) as db:
+        async with self.connection() as db:
             cursor = await db.execute("SELECT ts FROM user WHERE id = ?", (username,))
             row = await cursor.fetchone()
             if row:
@@ -321,4 +1310,146 @@ class DatabaseAPI:
                 return (current_time - last_update_dt).total_seconds() > 86400  # 24 hours
             return True
 
+    @staticmethod
+    async def _rehydrate(db: aiosqlite.Connection, user_id: str) -> int:
+        """
+        在当前写事务中把玩家的归档成绩放回 best_record 并重算 rating 列，返回恢复的成绩数
+        """
+        cursor = await db.execute("SELECT payload FROM best_record_archive WHERE user_id = ?", (user_id,))
+        row = await cursor.fetchone()
+        if row is None:
+            return 0
+        rows = unpack_records(row[0])
+        # 已有的（归档之后又同步进来的）成绩更新，以其为准
+        await db.executemany(
+            f"INSERT OR IGNORE INTO best_record(user_id, {', '.join(ARCHIVE_COLUMNS)}) "
+            f"VALUES (?, {', '.join('?' * len(ARCHIVE_COLUMNS))})",
+            [(user_id, *r) for r in rows]
+        )
+        await db.execute(RATING_UPDATE_SQL + " AND best_record.user_id = ? AND best_record.ra_b50 IS NULL", (user_id,))
+        await db.execute("DELETE FROM best_record_archive WHERE user_id = ?", (user_id,))
+        return len(rows)
+
+    async def archived_users(self) -> Set[str]:
+        if self._archived_users is None:
+            async with self.connection() as db:
+                cursor = await db.execute("SELECT user_id FROM best_record_archive")
+                self._archived_users = {row[0] for row in await cursor.fetchall()}
+        return self._archived_users
+
+    async def ensure_hot(self, user_id: str) -> int:
+        """
+        Move an archived user's records back into best_record.
+
+        Called before every best_record read of a single user. For users
+        that are not archived this is a set lookup, with no query.
+
+        Returns:
+            Number of records restored (0 if the user was not archived).
+        """
+        if user_id not in await self.archived_users():
+            return 0
+        start = time.perf_counter()
+        restored = await self.write(lambda db: self._rehydrate(db, user_id))
+        self._archived_users.discard(user_id)
+        elapsed = time.perf_counter() - start
+        self.archive_metrics["rehydrated_users"] += 1
+        self.archive_metrics["rehydrated_records"] += restored
+        self.archive_metrics["rehydrate_time_total"] += elapsed
+        print(f"[Info] 冷存储：已恢复 {user_id} 的 {restored} 条成绩，用时 {elapsed:.3f}s")
+        return restored
+
+    async def archive_inactive_users(self, max_age_days: int = ARCHIVE_AFTER_DAYS, batch_users: int = ARCHIVE_BATCH_USERS) -> int:
+        """
+        Move the records of users inactive for max_age_days into best_record_archive.
+
+        Each batch of users is archived in its own write transaction, so
+        other writes run in between. A user who synced after being picked
+        as a candidate is skipped.
+
+        Returns:
+            Number of users archived.
+        """
+        start = time.perf_counter()
+        age = f"-{int(max_age_days)} days"
+        async with self.connection() as db:
+            before = await self.hot_table_stats(db)
+            cursor = await db.execute(
+                "SELECT u.id FROM user AS u WHERE u.ts < datetime('now', ?) "
+                "AND EXISTS (SELECT 1 FROM best_record AS br WHERE br.user_id = u.id)",
+                (age,)
+            )
+            candidates = [row[0] for row in await cursor.fetchall()]
+
+        async def _archive(db: aiosqlite.Connection, user_ids: List[str]) -> Tuple[List[str], int, int, int]:
+            archived, records, raw_size, packed_size = [], 0, 0, 0
+            for user_id in user_ids:
+                cursor = await db.execute("SELECT ts < datetime('now', ?) FROM user WHERE id = ?", (age, user_id))
+                row = await cursor.fetchone()
+                if not row or not row[0]:
+                    continue
+                # 归档之后又有成绩写入时，与旧归档合并
+                await self._rehydrate(db, user_id)
+                cursor = await db.execute(
+                    f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM best_record WHERE user_id = ? ORDER BY music_id, diff_index",
+                    (user_id,)
+                )
+                rows = [tuple(r) for r in await cursor.fetchall()]
+                payload = pack_records(rows)
+                await db.execute(
+                    "INSERT INTO best_record_archive(user_id, record_count, payload) VALUES (?, ?, ?)",
+                    (user_id, len(rows), payload)
+                )
+                await db.execute("DELETE FROM best_record WHERE user_id = ?", (user_id,))
+                archived.append(user_id)
+                records += len(rows)
+                raw_size += len(json.dumps(rows, separators=(",", ":")))
+                packed_size += len(payload)
+            return archived, records, raw_size, packed_size
+
+        archived_users = await self.archived_users()
+        users, records, raw_size, packed_size = 0, 0, 0, 0
+        for i in range(0, len(candidates), batch_users):
+            batch = candidates[i:i + batch_users]
+            # 先登记再写入：归档提交后到登记前的查询也会走恢复流程，不会读到空成绩
+            archived_users.update(batch)
+            try:
+                archived, n, raw, packed = await self.write(lambda db: _archive(db, batch))
+            except BaseException:
+                archived_users.difference_update(batch)
+                raise
+            archived_users.difference_update(set(batch) - set(archived))
+            users += len(archived)
+            records += n
+            raw_size += raw
+            packed_size += packed
+
+        async with self.connection() as db:
+            after = await self.hot_table_stats(db)
+        self.archive_metrics["archived_users"] += users
+        self.archive_metrics["archived_records"] += records
+        print(f"[Info] 冷存储：归档 {users} 名玩家的 {records} 条成绩（{raw_size / 1024:.0f}KiB -> 压缩后 {packed_size / 1024:.0f}KiB），"
+              f"best_record {before['hot_records']} -> {after['hot_records']} 行，用时 {time.perf_counter() - start:.3f}s")
+        return users
+
+    async def hot_table_stats(self, db: Optional[aiosqlite.Connection] = None) -> Dict[str, int]:
+        """
+        Row counts of the hot best_record table and of the archive.
+        """
+        if db is None:
+            async with self.connection() as db:
+                return await self.hot_table_stats(db)
+        cursor = await db.execute(
+            "SELECT (SELECT COUNT(*) FROM best_record), (SELECT COUNT(DISTINCT user_id) FROM best_record), "
+            "COUNT(*), COALESCE(SUM(record_count), 0), COALESCE(SUM(LENGTH(payload)), 0) FROM best_record_archive"
+        )
+        row = await cursor.fetchone()
+        return {
+            "hot_records": row[0],
+            "hot_users": row[1],
+            "archived_users": row[2],
+            "archived_records": row[3],
+            "archive_bytes": row[4],
+        }
+
 database_api = DatabaseAPI()
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""
+按事件循环轮次合并点查询
+
+同一轮事件循环中（例如 asyncio.gather 起的多个协程，或同时处理的多个事件）
+对同一个 DataLoader 的 load(key) 会被收集起来，由 batch_fn 一次性查询。
+在 request_scope() 内，查询结果还会缓存到本次请求结束。
+"""
+
+import asyncio
+import copy
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Iterator, List, Optional, Set, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+# 当前请求的结果缓存：{(loader id, 代数, key): value}，None 表示不在 request_scope 内
+_request_cache: ContextVar[Optional[Dict[Any, Any]]] = ContextVar("maimai_request_cache", default=None)
+
+
+@contextmanager
+def request_scope() -> Iterator[Dict[Any, Any]]:
+    """
+    在一次请求（一次命令处理）内缓存 DataLoader 的结果
+
+    用法：
+        with request_scope():
+            ...
+    """
+    cache: Dict[Any, Any] = {}
+    token = _request_cache.set(cache)
+    try:
+        yield cache
+    finally:
+        _request_cache.reset(token)
+
+
+class DataLoader(Generic[K, V]):
+    """
+    点查询合并器
+
+    - batch_fn(keys) 返回 {key: value}，缺失的 key 视为 None
+    - 每个调用方拿到的是结果的深拷贝，修改字段（包括嵌套的 charts 等列表）不会影响其他调用方
+    - generation(key) 返回 key 所在数据的当前代数（如曲库代数、玩家成绩版本），
+      请求缓存按代数区分，代数变化后不会命中旧结果
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[K]], Awaitable[Dict[K, V]]],
+        name: str = "",
+        generation: Optional[Callable[[K], Any]] = None
+    ):
+        self.batch_fn = batch_fn
+        self.name = name
+        self.generation = generation
+        self._pending: Dict[K, asyncio.Future] = {}
+        self._scheduled = False
+        # 正在执行的批次，保留引用直到完成，避免任务在执行中被回收
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.metrics: Dict[str, int] = {
+            "loads": 0,      # load 调用次数
+            "batches": 0,    # batch_fn 调用次数
+            "keys": 0,       # batch_fn 查询的 key 总数（去重后）
+            "cache_hits": 0, # 命中请求缓存的次数
+        }
+
+    async def load(self, key: K) -> Optional[V]:
+        self.metrics["loads"] += 1
+        cache = _request_cache.get()
+        cache_key = (id(self), self.generation(key) if self.generation is not None else None, key)
+        if cache is not None and cache_key in cache:
+            self.metrics["cache_hits"] += 1
+            return copy.deepcopy(cache[cache_key])
+
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[key] = future
+            if not self._scheduled:
+                # 本轮已就绪的回调执行完之后再派发，期间到达的 key 都会并入这一批
+                self._scheduled = True
+                loop.call_soon(self._dispatch)
+
+        # shield：单个调用方被取消时不影响同一批次的其他调用方
+        value = await asyncio.shield(future)
+        if cache is not None:
+            cache[cache_key] = value
+        return copy.deepcopy(value)
+
+    async def load_many(self, keys: List[K]) -> List[Optional[V]]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def _dispatch(self) -> None:
+        batch, self._pending = self._pending, {}
+        self._scheduled = False
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: Dict[K, asyncio.Future]) -> None:
+        self.metrics["batches"] += 1
+        self.metrics["keys"] += len(batch)
+        try:
+            results = await self.batch_fn(list(batch))
+        except BaseException as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(results.get(key))
@@ -0,0 +1,688 @@
+"""
+maimai.db 性能测试
+
+在项目根目录运行：
+    python -m src.libraries.maimai.db_benchmark [用例名 ...]
+
+所有用例都在 maimai.db 的临时副本上执行，不会修改正式数据库。
+"""
+
+import asyncio
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, List, Any, AsyncIterator, Callable, Awaitable, Tuple
+
+from src.libraries.maimai.database import DatabaseAPI, database_path, WAL_MODE, pack_dist, unpack_dist, RANK_DIST_SIZE, FC_DIST_SIZE
+from src.libraries.maimai.migrations import migrate
+from src.libraries.maimai import profiler
+from src.libraries.maimai.profiler import percentile
+from src.libraries.maimai.static_lists_and_dicts import rank_list_lower, fc_list_lower, fs_list_lower
+
+
+def summarize(name: str, latencies: List[float]) -> str:
+    ms = [x * 1000 for x in latencies]
+    return (f"{name}: n={len(ms)} "
+            f"p50={percentile(ms, 50):.2f}ms p95={percentile(ms, 95):.2f}ms "
+            f"p99={percentile(ms, 99):.2f}ms max={max(ms, default=0):.2f}ms")
+
+
+def copy_database(src: Path = database_path) -> Path:
+    """
+    把数据库（及 WAL 文件）复制到临时目录
+    """
+    tmp_dir = Path(tempfile.mkdtemp(prefix="maimai_bench_"))
+    dst = tmp_dir / "maimai.db"
+    with sqlite3.connect(src) as s, sqlite3.connect(dst) as d:
+        s.backup(d)
+    return dst
+
+
+@asynccontextmanager
+async def bench_database(wal: bool = WAL_MODE) -> AsyncIterator[DatabaseAPI]:
+    """
+    在 maimai.db 的临时副本上启动 DatabaseAPI 并执行迁移
+
+    期间 MusicList / MusicChartList / BestRecordList / UserList 的连接与冷存储恢复都指向这份副本
+    （在类上替换 _connect / _ensure_hot / _user_version），用例中新建的实例无需逐个改写；
+    退出时恢复这些方法、关闭连接池并删除副本。副本路径为 api.pool.path。
+    """
+    from src.libraries.maimai.maimai_type import MusicList, MusicChartList, BestRecordList, UserList
+
+    path = copy_database()
+    api = DatabaseAPI(path=path, wal=wal)
+    patched = {cls: cls._connect for cls in (MusicList, MusicChartList, BestRecordList, UserList)}
+    ensure_hot, user_version = BestRecordList._ensure_hot, BestRecordList._user_version
+    try:
+        await api.start()
+        await migrate(api)
+        for cls in patched:
+            cls._connect = lambda self: api.connection()
+        BestRecordList._ensure_hot = lambda self, user_id: api.ensure_hot(user_id)
+        BestRecordList._user_version = lambda self, user_id: api.user_version(user_id)
+        yield api
+    finally:
+        for cls, connect in patched.items():
+            cls._connect = connect
+        BestRecordList._ensure_hot, BestRecordList._user_version = ensure_hot, user_version
+        await api.close()
+        shutil.rmtree(path.parent, ignore_errors=True)
+
+
+def fake_user_json(db_path: Path, username: str, n_records: int = 2000, seed: int = 0) -> Dict[str, Any]:
+    """
+    用 chart 表随机生成一份 diving-fish 格式的玩家成绩
+    """
+    rnd = random.Random(seed)
+    with sqlite3.connect(db_path) as conn:
+        charts = conn.execute("SELECT music_id, diff_index FROM chart").fetchall()
+    charts = rnd.sample(charts, min(n_records, len(charts)))
+    records = []
+    for music_id, diff_index in charts:
+        records.append({
+            "song_id": music_id,
+            "level_index": diff_index,
+            "achievements": round(rnd.uniform(80.0, 101.0), 4),
+            "ra": rnd.randint(0, 330),
+            "dxScore": rnd.randint(0, 3000),
+            "rate": rnd.choice(rank_list_lower),
+            "fc": rnd.choice(fc_list_lower),
+            "fs": rnd.choice(fs_list_lower),
+        })
+    return {
+        "username": username,
+        "additional_rating": 0,
+        "nickname": username,
+        "plate": "",
+        "rating": 0,
+        "records": records,
+    }
+
+
+B50_SQL = """
+SELECT br.music_id, br.diff_index, br.achievements, c.ds
+FROM best_record AS br
+JOIN music AS m ON br.music_id = m.id
+JOIN chart AS c ON br.music_id = c.music_id AND br.diff_index = c.diff_index
+WHERE br.user_id = ? AND m.is_new = 0
+ORDER BY br.ra_b50 DESC LIMIT 35
+"""
+
+
+async def bench_read_during_sync(wal: bool, syncs: int = 5, n_records: int = 2000) -> str:
+    """
+    在后台反复同步一名玩家的全部成绩（与 refresh_player_full_data 相同的写入路径），
+    同时不断执行 b50 查询，统计读延迟
+    """
+    async with bench_database(wal=wal) as api:
+        reader_json = fake_user_json(api.pool.path, "bench_reader", n_records, seed=1)
+        writer_json = fake_user_json(api.pool.path, "bench_writer", n_records, seed=2)
+        await api.sync_user_records(reader_json)
+
+        latencies: List[float] = []
+        done = asyncio.Event()
+
+        async def writer():
+            for i in range(syncs):
+                writer_json["records"] = fake_user_json(api.pool.path, "bench_writer", n_records, seed=i)["records"]
+                await api.sync_user_records(writer_json)
+            done.set()
+
+        async def reader():
+            while not done.is_set():
+                start = time.perf_counter()
+                async with api.connection() as db:
+                    cursor = await db.execute(B50_SQL, ("bench_reader",))
+                    await cursor.fetchall()
+                latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0)
+
+        start = time.perf_counter()
+        await asyncio.gather(writer(), reader(), reader(), reader())
+        total = time.perf_counter() - start
+        mode = "wal" if wal else "rollback"
+        return summarize(f"[{mode}] b50 read during {syncs} syncs ({total:.2f}s)", latencies)
+
+
+async def bench_sync_read() -> List[str]:
+    return [await bench_read_during_sync(wal=False), await bench_read_during_sync(wal=True)]
+
+
+def catalog_payload_from_db(db_path: Path) -> Tuple[List[Dict[str, Any]], Dict[str, List[Dict[str, Any]]]]:
+    """
+    从数据库还原 music_data / chart_stats 接口格式的数据，用于重放全量同步
+    """
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    music_data: Dict[int, Dict[str, Any]] = {}
+    for row in conn.execute("SELECT * FROM music ORDER BY id"):
+        music_data[row["id"]] = {
+            "id": str(row["id"]), "title": row["title"], "type": row["type"],
+            "ds": [], "level": [], "charts": [],
+            "basic_info": {
+                "artist": row["artist"], "genre": row["genre"], "bpm": row["bpm"],
+                "release_date": row["release_date"], "from": row["version"], "is_new": bool(row["is_new"]),
+            },
+        }
+    for row in conn.execute("SELECT * FROM chart ORDER BY music_id, diff_index"):
+        music = music_data[row["music_id"]]
+        music["ds"].append(row["ds"])
+        music["level"].append(row["level"])
+        music["charts"].append({
+            "notes": [row["tap"], row["hold"], row["slide"], row["touch"], row["break"]],
+            "charter": row["charter"],
+        })
+
+    stats: Dict[str, List[Dict[str, Any]]] = {}
+    for row in conn.execute("SELECT * FROM chart_stats ORDER BY music_id, diff_index"):
+        charts = stats.setdefault(str(row["music_id"]), [])
+        while len(charts) < row["diff_index"]:
+            charts.append({})
+        charts.append({
+            "cnt": row["cnt"], "diff": row["level"], "fit_diff": row["fit_diff"], "avg": row["avg"],
+            "avg_dx": row["avg_dx"], "std_dev": row["std_dev"],
+            "dist": unpack_dist(row["rank_dist"], RANK_DIST_SIZE).tolist(),
+            "fc_dist": unpack_dist(row["fc_dist"], FC_DIST_SIZE).tolist(),
+        })
+    conn.close()
+    return list(music_data.values()), stats
+
+
+async def per_row_sync_stats(api: DatabaseAPI, stats: Dict[str, Any]) -> None:
+    """
+    逐行 INSERT OR REPLACE 的旧实现，作为对照
+    """
+    async def _write(db):
+        for music_id, chart_stats in stats.items():
+            for diff_index, stat in enumerate(chart_stats):
+                if not stat:
+                    continue
+                await db.execute(
+                    "INSERT OR REPLACE INTO chart_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (int(music_id), diff_index, stat["diff"], stat["cnt"], stat["fit_diff"], stat["avg"], stat["avg_dx"], stat["std_dev"],
+                     pack_dist(stat["dist"], RANK_DIST_SIZE), pack_dist(stat["fc_dist"], FC_DIST_SIZE))
+                )
+    await api.write(_write)
+
+
+async def bench_sync_bulk(rounds: int = 3) -> List[str]:
+    """
+    全量曲库 / 全量统计同步耗时：逐行写入 vs 批量 UPSERT
+    """
+    async with bench_database() as api:
+        music_data, stats = catalog_payload_from_db(api.pool.path)
+
+        results: Dict[str, List[float]] = {"per-row sync_stats": [], "bulk sync_stats": [], "bulk sync_musiclist": [], "single-transaction sync_catalog": []}
+        for _ in range(rounds):
+            start = time.perf_counter()
+            await per_row_sync_stats(api, stats)
+            results["per-row sync_stats"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            await api.sync_stats(stats)
+            results["bulk sync_stats"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            await api.sync_musiclist(music_data)
+            results["bulk sync_musiclist"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            await api.sync_catalog(music_data, stats)
+            results["single-transaction sync_catalog"].append(time.perf_counter() - start)
+
+        return [summarize(name, values) for name, values in results.items()]
+
+
+async def per_chart_stats(db, keys: List[Tuple[int, int]]) -> int:
+    """
+    每个谱面分别查询 chart_stats 的旧实现，作为对照
+    """
+    queries = 0
+    for music_id, diff_index in keys:
+        cursor = await db.execute("SELECT * FROM chart_stats WHERE music_id = ? AND diff_index = ?", (music_id, diff_index))
+        await cursor.fetchall()
+        queries += 1
+    return queries
+
+
+async def bench_stats_load(rounds: int = 3) -> List[str]:
+    """
+    加载全曲库谱面的统计信息：逐谱面查询 vs Stats.by_keys
+    """
+    from src.libraries.maimai.maimai_type import Stats
+
+    async with bench_database() as api:
+        async with api.connection() as db:
+            cursor = await db.execute("SELECT music_id, diff_index FROM chart")
+            keys = [(r[0], r[1]) for r in await cursor.fetchall()]
+
+        results: Dict[str, List[float]] = {"per-chart": [], "by_keys": []}
+        for _ in range(rounds):
+            async with api.connection() as db:
+                start = time.perf_counter()
+                await per_chart_stats(db, keys)
+                results["per-chart"].append(time.perf_counter() - start)
+                start = time.perf_counter()
+                await Stats.by_keys(db, keys)
+                results["by_keys"].append(time.perf_counter() - start)
+
+        return [summarize(f"stats for {len(keys)} charts, {name}", values) for name, values in results.items()]
+
+
+CATALOG_FILTER_CASES: Dict[str, Dict[str, Any]] = {
+    "ds_range+order+page": {"ds_range": (13.0, 13.5), "order": ["-ds", "title"], "pagination": (0, 30)},
+    "title_search": {"title_search": "a"},
+    "level+diff": {"levels": ["13+"], "diff_indices": [3]},
+    "version+is_new": {"version_indices": [0, 1, 2, 3], "is_new": False},
+    "all charts": {},
+}
+
+
+async def bench_catalog_filter(rounds: int = 20) -> List[str]:
+    """
+    MusicList 查询：数据库路径 vs 曲库快照路径
+    """
+    from src.libraries.maimai.maimai_type import MusicList
+
+    async with bench_database() as api:
+        sql_list, mem_list = MusicList(), MusicList()
+        start = time.perf_counter()
+        catalog = await mem_list.load_catalog()
+        lines = [f"catalog load: {(time.perf_counter() - start) * 1000:.2f}ms"]
+
+        for name, kwargs in CATALOG_FILTER_CASES.items():
+            results: Dict[str, List[float]] = {"sql": [], "catalog": []}
+            for _ in range(rounds):
+                for label, music_list in (("sql", sql_list), ("catalog", mem_list)):
+                    start = time.perf_counter()
+                    res = await music_list.filter(**kwargs)
+                    results[label].append(time.perf_counter() - start)
+            lines += [summarize(f"filter[{name}] {label} ({res['chart_count']} charts)", values) for label, values in results.items()]
+
+        ids = [int(i) for i in random.Random(0).choices(catalog.music_ids, k=200)]
+        for label, music_list in (("sql", sql_list), ("catalog", mem_list)):
+            latencies = []
+            for music_id in ids:
+                start = time.perf_counter()
+                await music_list.by_id(music_id)
+                latencies.append(time.perf_counter() - start)
+            lines.append(summarize(f"by_id {label}", latencies))
+
+        return lines
+
+
+async def bench_point_lookup(rounds: int = 20, n_charts: int = 50) -> List[str]:
+    """
+    b50 式的 50 次谱面点查：逐个 from_db vs DataLoader 合并
+    """
+    from src.libraries.maimai.maimai_type import MusicChart, MusicChartList
+
+    async with bench_database() as api:
+        chart_list = MusicChartList()
+        async with api.connection() as db:
+            cursor = await db.execute("SELECT music_id, diff_index FROM chart")
+            all_keys = [(row["music_id"], row["diff_index"]) for row in await cursor.fetchall()]
+        rng = random.Random(0)
+
+        results: Dict[str, List[float]] = {"sequential": [], "dataloader": []}
+        for _ in range(rounds):
+            keys = rng.sample(all_keys, min(n_charts, len(all_keys)))
+            start = time.perf_counter()
+            async with api.connection() as db:
+                for music_id, diff_index in keys:
+                    await MusicChart.from_db(db, music_id, diff_index)
+            results["sequential"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await chart_list.by_ids(keys)
+            results["dataloader"].append(time.perf_counter() - start)
+
+        lines = [summarize(f"{n_charts} charts {label}", values) for label, values in results.items()]
+        lines.append(f"dataloader metrics: {chart_list.loader.metrics}")
+        return lines
+
+
+async def bench_filter_projection(rounds: int = 10) -> List[str]:
+    """
+    随机牛逼用到的「全部紫谱 / 白谱」查询：完整构造对象 vs 只读计数 vs fields 投影，
+    记录耗时与 tracemalloc 统计的峰值内存分配
+    """
+    from src.libraries.maimai.maimai_type import MusicList
+
+    async with bench_database() as api:
+        music_list = MusicList()
+        await music_list.load_catalog()
+
+        async def materialize():
+            res = await music_list.filter(diff_indices=[3, 4])
+            return [(music.id, diff) for music in res["music_list"] for diff in music.diff]
+
+        async def count_only():
+            res = await music_list.filter(diff_indices=[3, 4])
+            return res["chart_count"]
+
+        async def projection():
+            res = await music_list.filter(diff_indices=[3, 4], fields=["music_id", "diff_index"])
+            return res["rows"]
+
+        lines = []
+        for label, func in (("music_list", materialize), ("count only", count_only), ("fields", projection)):
+            latencies, peaks = [], []
+            for _ in range(rounds):
+                tracemalloc.start()
+                start = time.perf_counter()
+                await func()
+                latencies.append(time.perf_counter() - start)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            lines.append(summarize(f"master/re:master {label}", latencies) + f" peak={max(peaks) / 1024:.0f}KiB")
+
+        return lines
+
+
+async def bench_pagination(page_size: int = 100) -> List[str]:
+    """
+    定数查歌式的逐页遍历（数据库路径）：OFFSET 分页 vs 游标（keyset）分页，以及 count() vs 完整 filter 计数
+    """
+    from src.libraries.maimai.maimai_type import MusicList
+
+    async with bench_database() as api:
+        music_list = MusicList()
+        kwargs = {"order": ["+ds", "+music_id"], "fields": ["music_id", "diff_index"]}
+
+        results: Dict[str, List[float]] = {"offset": [], "cursor": []}
+        total = (await music_list.count())["chart_count"]
+        for offset in range(0, total, page_size):
+            start = time.perf_counter()
+            await music_list.filter(pagination=(offset, page_size), **kwargs)
+            results["offset"].append(time.perf_counter() - start)
+        cursor, pages = None, 0
+        while pages == 0 or cursor:
+            start = time.perf_counter()
+            res = await music_list.filter(pagination=(0, page_size), cursor=cursor, **kwargs)
+            results["cursor"].append(time.perf_counter() - start)
+            cursor, pages = res["next_cursor"], pages + 1
+
+        lines = [summarize(f"page {label} ({len(values)} pages)", values) + f" last={values[-1] * 1000:.2f}ms" for label, values in results.items()]
+        for label, func in (("count()", lambda: music_list.count()), ("filter()", lambda: music_list.filter())):
+            start = time.perf_counter()
+            await func()
+            lines.append(f"{label} all charts: {(time.perf_counter() - start) * 1000:.2f}ms")
+
+        return lines
+
+
+async def bench_streaming(rounds: int = 10, n_records: int = 5000) -> List[str]:
+    """
+    随机牛逼式的「从全部成绩中随机取 n 条」：filter 读入全部记录后 random.sample vs iter_filter 流式蓄水池抽样，
+    记录耗时与 tracemalloc 统计的峰值内存分配
+    """
+    from src.libraries.maimai import streaming
+    from src.libraries.maimai.maimai_type import BestRecordList
+
+    async with bench_database() as api:
+        await api.sync_user_records(fake_user_json(api.pool.path, "bench_stream", n_records))
+        record_list = BestRecordList()
+
+        async def materialize():
+            res = await record_list.filter(user_id="bench_stream")
+            return random.sample(res["record_list"], min(10, res["record_count"]))
+
+        async def stream():
+            records, _ = await streaming.sample(record_list.iter_filter("bench_stream"), 10)
+            return records
+
+        lines = []
+        for label, func in (("filter + random.sample", materialize), ("iter_filter + streaming.sample", stream)):
+            latencies, peaks = [], []
+            for _ in range(rounds):
+                tracemalloc.start()
+                start = time.perf_counter()
+                await func()
+                latencies.append(time.perf_counter() - start)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            lines.append(summarize(f"{n_records} records {label}", latencies) + f" peak={max(peaks) / 1024:.0f}KiB")
+
+        return lines
+
+
+async def bench_archive(rounds: int = 20, n_inactive: int = 200, n_records: int = 1000) -> List[str]:
+    """
+    冷存储：n_inactive 名不活跃玩家归档前后，活跃玩家的 b50 / 定数表查询耗时与 best_record 行数，
+    以及不活跃玩家再次查询时恢复成绩的耗时
+    """
+    from src.libraries.maimai.maimai_type import BestRecordList
+
+    async with bench_database() as api:
+        for i in range(n_inactive):
+            await api.sync_user_records(fake_user_json(api.pool.path, f"bench_inactive_{i}", n_records, seed=i))
+        await api.write(lambda db: db.execute("UPDATE user SET ts = datetime('now', '-1 year') WHERE id LIKE 'bench_inactive_%'"))
+        await api.sync_user_records(fake_user_json(api.pool.path, "bench_active", n_records, seed=-1))
+
+        record_list = BestRecordList()
+        queries = {
+            "b50": {"is_new": False, "order": "-ra_b50", "pagination": (0, 35)},
+            "level 13+": {"levels": ["13+"], "order": "-ds"},
+        }
+
+        async def measure(label: str) -> List[str]:
+            stats = await api.hot_table_stats()
+            lines = [f"{label}: best_record {stats['hot_records']} rows / {stats['hot_users']} users, "
+                     f"archive {stats['archived_records']} records in {stats['archive_bytes'] / 1024:.0f}KiB"]
+            for name, kwargs in queries.items():
+                latencies = []
+                for _ in range(rounds):
+                    start = time.perf_counter()
+                    await record_list.filter(user_id="bench_active", **kwargs)
+                    latencies.append(time.perf_counter() - start)
+                lines.append(summarize(f"  {label} {name}", latencies))
+            return lines
+
+        lines = await measure("before archive")
+        await api.archive_inactive_users()
+        lines += await measure("after archive")
+
+        latencies = []
+        for i in range(min(rounds, n_inactive)):
+            start = time.perf_counter()
+            await record_list.filter(user_id=f"bench_inactive_{i}", order="-ra_b50", pagination=(0, 35))
+            latencies.append(time.perf_counter() - start)
+        lines.append(summarize("first query of an archived user (rehydrate)", latencies))
+        lines.append(f"archive metrics: {api.archive_metrics}")
+
+        return lines
+
+
+async def bench_profiler(rounds: int = 20, n_charts: int = 50) -> List[str]:
+    """
+    SQL 统计的额外开销：关闭 / 开启 PROFILE_QUERIES 时的逐个谱面点查
+    """
+    from src.libraries.maimai.maimai_type import MusicChart
+
+    enabled = profiler.PROFILE_QUERIES
+    lines = []
+    for flag in (False, True):
+        profiler.PROFILE_QUERIES = flag
+        profiler.query_profiler.reset()
+        # 每轮新建连接池，连接在建立时按 PROFILE_QUERIES 决定是否包装
+        async with bench_database() as api:
+            async with api.connection() as db:
+                cursor = await db.execute("SELECT music_id, diff_index FROM chart")
+                all_keys = [(row["music_id"], row["diff_index"]) for row in await cursor.fetchall()]
+            rng = random.Random(0)
+            latencies = []
+            for _ in range(rounds):
+                keys = rng.sample(all_keys, min(n_charts, len(all_keys)))
+                start = time.perf_counter()
+                async with api.connection() as db:
+                    for music_id, diff_index in keys:
+                        await MusicChart.from_db(db, music_id, diff_index)
+                latencies.append(time.perf_counter() - start)
+            lines.append(summarize(f"{n_charts} charts profile={'on' if flag else 'off'}", latencies))
+    lines.extend(profiler.query_profiler.report(top=3))
+    profiler.PROFILE_QUERIES = enabled
+    return lines
+
+
+async def bench_cold_start(rounds: int = 10) -> List[str]:
+    """
+    启动时加载曲库：从数据库构建 vs 读取冷启动快照
+    """
+    from src.libraries.maimai.maimai_type import MusicList
+
+    async with bench_database() as api:
+        snapshot_file = api.pool.path.with_name("catalog_snapshot.bin")
+
+        results: Dict[str, List[float]] = {"database": [], "snapshot": []}
+        for label in results:
+            for _ in range(rounds):
+                music_list = MusicList(snapshot_file=snapshot_file)
+                start = time.perf_counter()
+                await music_list.load_catalog(use_snapshot=label == "snapshot")
+                results[label].append(time.perf_counter() - start)
+
+        lines = [summarize(f"load_catalog {label}", values) for label, values in results.items()]
+        lines.append(f"snapshot size: {snapshot_file.stat().st_size / 1024:.0f}KiB")
+        return lines
+
+
+SEARCH_SQL = {
+    "like": "SELECT m.id FROM music AS m WHERE LOWER(m.title) LIKE '%' || ? || '%'",
+    "fts": "SELECT m.id FROM music AS m WHERE m.id IN (SELECT rowid FROM music_fts WHERE title_norm LIKE '%' || ? || '%')",
+}
+
+
+async def bench_search(rounds: int = 200) -> List[str]:
+    """
+    曲名子串搜索：LOWER(title) LIKE 全表扫描 vs 规范化列上的 trigram FTS
+    """
+    from src.libraries.text_normalize import search_key
+
+    async with bench_database() as api:
+        async with api.connection() as db:
+            cursor = await db.execute("SELECT title FROM music")
+            titles = [row[0] for row in await cursor.fetchall()]
+        # 从曲名中随机截取 3~6 个字符作为搜索词
+        rnd = random.Random(0)
+        patterns = []
+        for title in rnd.choices(titles, k=rounds):
+            size = min(len(title), rnd.randint(3, 6))
+            start = rnd.randint(0, len(title) - size)
+            patterns.append(title[start:start + size])
+
+        lines = []
+        async with api.connection() as db:
+            for label, sql in SEARCH_SQL.items():
+                latencies, hits = [], 0
+                for pattern in patterns:
+                    start = time.perf_counter()
+                    cursor = await db.execute(sql, (pattern.lower() if label == "like" else search_key(pattern),))
+                    hits += len(await cursor.fetchall())
+                    latencies.append(time.perf_counter() - start)
+                lines.append(summarize(f"title search {label} ({hits} hits)", latencies))
+        return lines
+
+
+# 插件中反复出现的查询：随机牛逼、随个、版本查歌、谱师查歌（首页）
+RESULT_CACHE_CASES: Dict[str, Dict[str, Any]] = {
+    "diff_indices": dict(diff_indices=[3, 4], fields=["music_id", "diff_index"]),
+    "level_type": dict(levels=["13+"], types=["DX"]),
+    "versions": dict(version_indices=list(range(10)), fields=["music_id", "title", "type", "ds"]),
+    "charter_page": dict(charter="ロシェ", diff_indices=[2, 3, 4], pagination=(0, 50), order=["+music_id"]),
+}
+
+
+async def bench_result_cache(rounds: int = 50) -> List[str]:
+    """
+    曲库快照上的 filter：每次重新筛选 vs 命中结果缓存
+    """
+    from src.libraries.maimai.maimai_type import MusicList
+
+    async with bench_database() as api:
+        music_list = MusicList()
+        await music_list.load_catalog()
+
+        lines = []
+        for name, kwargs in RESULT_CACHE_CASES.items():
+            results: Dict[str, List[float]] = {"uncached": [], "cached": []}
+            for label, values in results.items():
+                for _ in range(rounds):
+                    if label == "uncached":
+                        music_list.result_cache.clear()
+                    start = time.perf_counter()
+                    res = await music_list.filter(**kwargs)
+                    # 不指定 fields 时调用方总会读取 music_list，一并计入
+                    res.get("rows") if "fields" in kwargs else res["music_list"]
+                    values.append(time.perf_counter() - start)
+            lines += [summarize(f"filter[{name}] {label} ({res['chart_count']} charts)", values) for label, values in results.items()]
+        lines.append(f"result cache: {music_list.result_cache.metrics}")
+        return lines
+
+
+# 新歌列表、版本查歌与按难度的定数统计
+CUBE_CASES: Dict[str, Dict[str, Any]] = {
+    "is_new": dict(is_new=True),
+    "versions": dict(version_indices=list(range(10))),
+    "master_13+": dict(levels=["13+"], diff_indices=[3]),
+}
+
+
+async def bench_cube(rounds: int = 200) -> List[str]:
+    """
+    统计：对曲库快照计算掩码（MusicCatalog.count）vs 查询统计立方体
+    """
+    from src.libraries.maimai.maimai_type import MusicList
+
+    async with bench_database() as api:
+        music_list = MusicList()
+        catalog = await music_list.load_catalog()
+
+        catalog._cube = None
+        start = time.perf_counter()
+        cube = catalog.cube()
+        lines = [f"cube build: {(time.perf_counter() - start) * 1000:.2f}ms, shape={cube.shape}"]
+        for name, kwargs in CUBE_CASES.items():
+            filters = music_list._normalize_filters(**kwargs)
+            results: Dict[str, List[float]] = {"mask": [], "cube": []}
+            for _ in range(rounds):
+                start = time.perf_counter()
+                _, chart_count = catalog.count(filters)
+                results["mask"].append(time.perf_counter() - start)
+                start = time.perf_counter()
+                stats = cube.stats(**kwargs)
+                results["cube"].append(time.perf_counter() - start)
+            assert stats.chart_count == chart_count
+            lines += [summarize(f"stats[{name}] {label} ({chart_count} charts)", values) for label, values in results.items()]
+        return lines
+
+
+BENCHMARKS: Dict[str, Callable[[], Awaitable[List[str]]]] = {
+    "sync_read": bench_sync_read,
+    "sync_bulk": bench_sync_bulk,
+    "stats_load": bench_stats_load,
+    "catalog_filter": bench_catalog_filter,
+    "point_lookup": bench_point_lookup,
+    "filter_projection": bench_filter_projection,
+    "pagination": bench_pagination,
+    "streaming": bench_streaming,
+    "archive": bench_archive,
+    "profiler": bench_profiler,
+    "cold_start": bench_cold_start,
+    "search": bench_search,
+    "result_cache": bench_result_cache,
+    "cube": bench_cube,
+}
+
+
+async def main(names: List[str]) -> None:
+    for name in names or list(BENCHMARKS):
+        for line in await BENCHMARKS[name]():
+            print(line)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,199 @@
+"""
+等级完成表 / 定数表
+
+某个等级（或定数范围）的全部谱面，以及玩家在每张谱面上的达成率、评级、FC、FS：
+- 谱面来自当前曲库快照（MusicList.filter 的投影，按定数降序），不访问数据库
+- 玩家成绩是一次查询，按 best_record 主键逐张谱面查找（BEST_RECORD_BY_KEYS_SQL），不扫描玩家的全部成绩
+- 各评级 / FC / FS 的数量由 np.bincount 一次算出
+结果按 (玩家, 条件, 曲库代数, 玩家成绩版本) 缓存：曲库更新或玩家同步成绩后自然失效，
+同一玩家反复查询同一等级时不再访问数据库。
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from src.libraries.maimai.database import DatabaseAPI, database_api, chart_keys_param, BEST_RECORD_BY_KEYS_SQL
+from src.libraries.maimai.maimai_type import MusicList
+from src.libraries.maimai.maimaidx_music import total_list
+from src.libraries.maimai.result_cache import ResultCache, freeze
+from src.libraries.maimai.static_lists_and_dicts import rank_list_lower, fc_list_lower, fs_list_lower
+
+# 最多缓存的完成表个数
+LEVEL_PROGRESS_CACHE_SIZE = 256
+# 所有缓存的完成表的谱面数之和上限
+LEVEL_PROGRESS_CACHE_WEIGHT = 100_000
+# 宴会场谱面的曲目 id 从此开始，不计入完成表
+UTAGE_MUSIC_ID = 100000
+
+
+@dataclass
+class LevelProgress:
+    """
+    每张谱面一行的列数组（均为只读），按定数降序、曲目 id 升序排列；未游玩的谱面 rank_id / fc_id / fs_id 为 -1
+    """
+    user_id: Optional[str]
+    music_id: np.ndarray
+    diff_index: np.ndarray
+    ds: np.ndarray
+    achievements: np.ndarray    # 未游玩为 nan
+    rank_id: np.ndarray
+    fc_id: np.ndarray
+    fs_id: np.ndarray
+    rank_counts: np.ndarray     # 下标为 rank_id，只统计已游玩的谱面
+    fc_counts: np.ndarray
+    fs_counts: np.ndarray
+
+    @property
+    def total(self) -> int:
+        return len(self.music_id)
+
+    @property
+    def played(self) -> int:
+        return int(self.rank_counts.sum())
+
+    def _column(self, mtype: str) -> Tuple[np.ndarray, np.ndarray, int]:
+        # 与 Plate.single_achieved 相同的类型名：rank_list_lower / fc_list_lower / fs_list_lower 中的一项
+        if mtype in rank_list_lower:
+            return self.rank_id, self.rank_counts, rank_list_lower.index(mtype)
+        if mtype in fc_list_lower[1:]:
+            return self.fc_id, self.fc_counts, fc_list_lower.index(mtype)
+        if mtype in fs_list_lower[1:]:
+            return self.fs_id, self.fs_counts, fs_list_lower.index(mtype)
+        raise ValueError(f"Invalid type: {mtype}. Must be one of {rank_list_lower + fc_list_lower[1:] + fs_list_lower[1:]}")
+
+    def achieved(self, mtype: str) -> np.ndarray:
+        """
+        每张谱面是否达成 mtype 及以上（如 "sss"、"ap"、"fsd"）
+        """
+        column, _, value = self._column(mtype)
+        return column >= value
+
+    def achieved_count(self, mtype: str) -> int:
+        """
+        达成 mtype 及以上的谱面数，由计数数组直接求和
+        """
+        _, counts, value = self._column(mtype)
+        return int(counts[value:].sum())
+
+    def by_ds(self) -> Dict[float, np.ndarray]:
+        """
+        按定数分组的行号，定数从高到低
+        """
+        ds_values, starts = np.unique(-self.ds, return_index=True)
+        bounds = list(starts[1:]) + [len(self.ds)]
+        return {float(-d): np.arange(start, end) for d, start, end in zip(ds_values, starts, bounds)}
+
+
+def level_ds_range(level: int, plus: bool) -> Tuple[float, float]:
+    """
+    等级对应的定数范围：x 为 x.0 ~ x.5，x+ 为 x.6 ~ x.9
+    """
+    return (level + 0.6, level + 0.9) if plus else (level + 0.0, level + 0.5)
+
+
+def level_records(progress: LevelProgress, level: int, plus: bool) -> Dict[str, List[Dict]]:
+    """
+    draw_final_rank_list 所需的 records：{"13.6": [谱面, ...], ...}
+    键为该等级的每个定数，没有谱面的定数也保留空列表；每张谱面为 {id, level_index, ds, cover, finished}，
+    cover 为 AP/AP+ 或评级（未游玩为空），finished 为达成率是否到 100%
+    """
+    suffixes = [".6", ".7", ".8", ".9"] if plus else [".0", ".1", ".2", ".3", ".4", ".5"]
+    records = {str(level) + suffix: [] for suffix in suffixes}
+    for ds, rows in progress.by_ds().items():
+        if str(ds) not in records:
+            continue
+        for i in rows:
+            if progress.fc_id[i] >= fc_list_lower.index("ap"):
+                cover = fc_list_lower[progress.fc_id[i]]
+            elif progress.rank_id[i] >= 0:
+                cover = rank_list_lower[progress.rank_id[i]]
+            else:
+                cover = ""
+            records[str(ds)].append({
+                "id": int(progress.music_id[i]),
+                "level_index": int(progress.diff_index[i]),
+                "ds": ds,
+                "cover": cover,
+                "finished": bool(progress.achievements[i] >= 100)
+            })
+    return records
+
+
+class LevelProgressEngine:
+    """
+    progress(user_id, levels=..., ds_range=...) 返回 LevelProgress；user_id 为 None 时只有谱面（定数表）
+    """
+
+    def __init__(self, music_list: MusicList = total_list, api: DatabaseAPI = database_api):
+        self.music_list = music_list
+        self.api = api
+        self.cache = ResultCache(max_size=LEVEL_PROGRESS_CACHE_SIZE, max_weight=LEVEL_PROGRESS_CACHE_WEIGHT)
+
+    async def progress(
+        self,
+        user_id: Optional[str],
+        levels: Optional[Union[str, List[str]]] = None,
+        ds_range: Optional[Tuple[float, float]] = None
+    ) -> LevelProgress:
+        if levels is None and ds_range is None:
+            raise ValueError("levels or ds_range is required.")
+        if isinstance(levels, str):
+            levels = [levels]
+        user_id = user_id.lower() if user_id else None
+
+        with self.music_list.pinned() as catalog:
+            # 未加载曲库快照时走 SQL，没有曲库代数可用，不缓存
+            key = None
+            if catalog is not None:
+                version = self.api.user_version(user_id) if user_id else 0
+                key = (user_id, freeze(sorted({str(level) for level in levels or []})), freeze(ds_range), catalog.generation, version)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return cached
+
+            charts = await self.music_list.filter(
+                levels=levels, ds_range=ds_range, order=["-ds", "+music_id", "+diff_index"], fields=["music_id", "diff_index", "ds"]
+            )
+        rows = [row for row in charts["rows"] if row[0] < UTAGE_MUSIC_ID]
+        music_id = np.array([row[0] for row in rows], dtype=np.int64)
+        diff_index = np.array([row[1] for row in rows], dtype=np.int64)
+        ds = np.array([row[2] for row in rows], dtype=np.float64)
+
+        achievements = np.full(len(rows), np.nan)
+        rank_id, fc_id, fs_id = (np.full(len(rows), -1, dtype=np.int64) for _ in range(3))
+        if user_id and rows:
+            await self.api.ensure_hot(user_id)
+            async with self.api.connection() as db:
+                cursor = await db.execute(BEST_RECORD_BY_KEYS_SQL, (chart_keys_param(zip(music_id, diff_index)), user_id))
+                records = await cursor.fetchall()
+            position = {(m, d): i for i, (m, d) in enumerate(zip(music_id.tolist(), diff_index.tolist()))}
+            for m, d, ach, rank, fc, fs in records:
+                i = position[(m, d)]
+                achievements[i] = ach
+                rank_id[i], fc_id[i], fs_id[i] = rank or 0, fc or 0, fs or 0
+
+        played = rank_id >= 0
+        progress = LevelProgress(
+            user_id=user_id,
+            music_id=music_id,
+            diff_index=diff_index,
+            ds=ds,
+            achievements=achievements,
+            rank_id=rank_id,
+            fc_id=fc_id,
+            fs_id=fs_id,
+            rank_counts=np.bincount(rank_id[played], minlength=len(rank_list_lower)),
+            fc_counts=np.bincount(fc_id[played], minlength=len(fc_list_lower)),
+            fs_counts=np.bincount(fs_id[played], minlength=len(fs_list_lower)),
+        )
+        for column in (progress.music_id, progress.diff_index, progress.ds, progress.achievements, progress.rank_id,
+                       progress.fc_id, progress.fs_id, progress.rank_counts, progress.fc_counts, progress.fs_counts):
+            column.flags.writeable = False
+        if key is not None:
+            self.cache.put(key, progress, max(len(rows), 1))
+        return progress
+
+
+level_progress = LevelProgressEngine()
@@ -36,14 +36,14 @@ class BestTableGenerator(object):
         old_records = await best_record_list.filter(user_id=user_id,
                                                     is_new=False,
                                                     pagination=(0, 35), 
-                                                    order=['-ra', '+music_id'],
+                                                    order=['-ra_b50', '+music_id'],
                                                     fc_indices=fc_indices,
                                                     fs_indices=fs_indices,
                                                     levels=levels)
 
-        for record in old_records["record_list"]:
+        music_charts = await music_chart_list.by_ids([(record.music_id, record.diff_index) for record in old_records["record_list"]])
+        for record, music_chart in zip(old_records["record_list"], music_charts):
             record.ra = record.ra_b50  # 确保 ra 字段被正确赋值
-            music_chart = await music_chart_list.by_id(record.music_id, record.diff_index)
             old_best.append((music_chart, record))
             old_rating += record.ra
 
@@ -54,14 +54,14 @@ class BestTableGenerator(object):
         new_records = await best_record_list.filter(user_id=user_id,
                                                     is_new=True,
                                                     pagination=(0, 15), 
-                                                    order=['-ra', '+music_id'],
+                                                    order=['-ra_b50', '+music_id'],
                                                     fc_indices=fc_indices,
                                                     fs_indices=fs_indices,
                                                     levels=levels)
 
-        for record in new_records["record_list"]:
+        music_charts = await music_chart_list.by_ids([(record.music_id, record.diff_index) for record in new_records["record_list"]])
+        for record, music_chart in zip(new_records["record_list"], music_charts):
             record.ra = record.ra_b50
-            music_chart = await music_chart_list.by_id(record.music_id, record.diff_index)
             new_best.append((music_chart, record))
             new_rating += record.ra
 
@@ -93,12 +93,13 @@ class BestTableGenerator(object):
         old_rating = 0
         old_records = await best_record_list.filter(user_id=user_id,
                                                     is_new=False,
-                                                    order=['+music_id'])
-        old_records_list = sorted(old_records["record_list"], key=lambda x: x.ra_b40, reverse=True)[:25]
+                                                    pagination=(0, 25),
+                                                    order=['-ra_b40', '+music_id'])
+        old_records_list = old_records["record_list"]
         
-        for record in old_records_list:
+        music_charts = await music_chart_list.by_ids([(record.music_id, record.diff_index) for record in old_records_list])
+        for record, music_chart in zip(old_records_list, music_charts):
             record.ra = record.ra_b40
-            music_chart = await music_chart_list.by_id(record.music_id, record.diff_index)
             old_best.append((music_chart, record))
             old_rating += record.ra
 
@@ -107,12 +108,13 @@ class BestTableGenerator(object):
         new_rating = 0
         new_records = await best_record_list.filter(user_id=user_id,
                                                     is_new=True,
-                                                    order=['+music_id'])
-        new_records_list = sorted(new_records["record_list"], key=lambda x: x.ra_b40, reverse=True)[:15]
+                                                    pagination=(0, 15),
+                                                    order=['-ra_b40', '+music_id'])
+        new_records_list = new_records["record_list"]
 
-        for record in new_records_list:
+        music_charts = await music_chart_list.by_ids([(record.music_id, record.diff_index) for record in new_records_list])
+        for record, music_chart in zip(new_records_list, music_charts):
             record.ra = record.ra_b40
-            music_chart = await music_chart_list.by_id(record.music_id, record.diff_index)
             new_best.append((music_chart, record))
             new_rating += record.ra
 
@@ -144,12 +146,13 @@ class BestTableGenerator(object):
         old_rating = 0
         old_records = await best_record_list.filter(user_id=user_id,
                                                     is_new=False,
-                                                    order=['+music_id'])
-        old_records_list = sorted(old_records["record_list"], key=lambda x: x.ra_stats, reverse=True)[:35]
+                                                    pagination=(0, 35),
+                                                    order=['-ra_stats', '+music_id'])
+        old_records_list = old_records["record_list"]
 
-        for record in old_records_list:
+        music_charts = await music_chart_list.by_ids([(record.music_id, record.diff_index) for record in old_records_list])
+        for record, music_chart in zip(old_records_list, music_charts):
             record.ra = record.ra_stats
-            music_chart = await music_chart_list.by_id(record.music_id, record.diff_index)
             if music_chart.stats is not None:
                 if music_chart.stats.fit_diff is not None:
                     music_chart.ds = round(music_chart.stats.fit_diff, 1)
@@ -161,12 +164,13 @@ class BestTableGenerator(object):
         new_rating = 0
         new_records = await best_record_list.filter(user_id=user_id,
                                                     is_new=True,
-                                                    order=['+music_id'])
-        new_records_list = sorted(new_records["record_list"], key=lambda x: x.ra_stats, reverse=True)[:15]
+                                                    pagination=(0, 15),
+                                                    order=['-ra_stats', '+music_id'])
+        new_records_list = new_records["record_list"]
 
-        for record in new_records_list:
+        music_charts = await music_chart_list.by_ids([(record.music_id, record.diff_index) for record in new_records_list])
+        for record, music_chart in zip(new_records_list, music_charts):
             record.ra = record.ra_stats
-            music_chart = await music_chart_list.by_id(record.music_id, record.diff_index)
             if music_chart.stats is not None:
                 if music_chart.stats.fit_diff is not None:
                     music_chart.ds = round(music_chart.stats.fit_diff, 1)
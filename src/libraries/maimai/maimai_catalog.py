@@ -0,0 +1,402 @@
+"""
+曲库快照：把 music / chart 表按列载入内存，供 MusicList 的只读查询使用
+
+曲库只会在 refresh_music_data 时变化，所以启动时和每次同步后整体加载一次，
+之后的筛选、排序、分页全部用 NumPy 向量化完成，不再访问数据库。
+"""
+
+import aiosqlite
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Any
+
+
+MUSIC_COLUMNS = ["id", "title", "type", "artist", "genre", "bpm", "release_date", "version", "is_new", "version_id"]
+CHART_COLUMNS = ["music_id", "diff_index", "ds", "level", "notes", "tap", "hold", "slide", "touch", "break", "charter"]
+
+# MusicList.filter 投影（fields）可用的字段，与 MUSIC_CHART_SELECT 的列名一致，曲目 id 记作 music_id
+MUSIC_FIELDS = ["music_id"] + MUSIC_COLUMNS[1:]
+CHART_FIELDS = CHART_COLUMNS[1:]
+
+# MusicCatalog 由行计算出的 NumPy 列
+COLUMN_NAMES = ["music_ids", "title_norm", "artist_norm", "genre", "type", "bpm", "is_new", "version_id",
+                "title_sorted", "title_rank", "chart_music", "diff_index", "ds", "level", "charter_norm"]
+# 搜索用的规范化列（见 tool_range.search_key），只在构建快照时读取，不作为行字段对外提供
+MUSIC_SEARCH_COLUMNS = ["title_norm", "artist_norm"]
+CHART_SEARCH_COLUMNS = ["charter_norm"]
+
+
+# 统计立方体的维度（与 MusicList.filter 的参数同名）与物量列
+CUBE_DIMS = ["version_indices", "levels", "diff_indices", "types", "is_new"]
+MUSIC_CUBE_DIMS = ["version_indices", "types", "is_new"]
+NOTE_COLUMNS = ["notes", "tap", "hold", "slide", "touch", "break"]
+
+
+def _norm(row: Any, column: str, source: str) -> str:
+    # 规范化列尚未回填时退回原列的小写
+    value = row[column]
+    if value is None:
+        value = row[source].lower() if row[source] else ""
+    return value
+
+
+class MusicCatalog:
+    """
+    只读的列式曲库快照
+
+    music_rows / chart_rows 保留原始行，用于构造 Music / MusicChart；
+    其余属性均为按行对齐的 NumPy 数组，chart 级数组中的曲目属性已按 chart_music 展开。
+    generation 为加载时数据库中的曲库代数，快照一经发布不再修改。
+    """
+
+    def __init__(self, music_rows: List[aiosqlite.Row], chart_rows: List[aiosqlite.Row],
+                 columns: Optional[Dict[str, np.ndarray]] = None):
+        # music 按 id 升序，chart 按 (music_id, diff_index) 升序；行可以是 aiosqlite.Row 或 dict
+        self.music_rows = music_rows
+        self.chart_rows = chart_rows
+        self.stats: Dict[Tuple[int, int], Any] = {}
+        self.generation = 0
+
+        # columns 为冷启动快照中保存的派生列，给出时不再从行重新计算
+        columns = columns if columns is not None else self._build_columns()
+        for name in COLUMN_NAMES:
+            setattr(self, name, columns[name])
+
+        # id → 行号索引，由数值列生成
+        music_ids = self.music_ids.tolist()
+        chart_music_ids = self.music_ids[self.chart_music].tolist()
+        self.music_index: Dict[int, int] = dict(zip(music_ids, range(len(music_ids))))
+        self.chart_index: Dict[Tuple[int, int], int] = dict(zip(zip(chart_music_ids, self.diff_index.tolist()), range(len(chart_music_ids))))
+        self.charts_of: Dict[int, List[int]] = {}
+        for i, music_id in enumerate(chart_music_ids):
+            self.charts_of.setdefault(music_id, []).append(i)
+
+        self._cube: Optional["CatalogCube"] = None
+
+        # 排序键（均为 chart 级数值数组，降序时取负）
+        self.order_keys: Dict[str, np.ndarray] = {
+            "title": self.title_rank[self.chart_music],
+            "music_id": self.music_ids[self.chart_music],
+            "version_id": self.version_id[self.chart_music],
+            "ds": self.ds,
+            "diff_index": self.diff_index,
+        }
+
+    def _build_columns(self) -> Dict[str, np.ndarray]:
+        music_rows, chart_rows = self.music_rows, self.chart_rows
+        music_ids = np.array([row["id"] for row in music_rows], dtype=np.int64)
+        columns = {
+            # music 级列
+            "music_ids": music_ids,
+            "title_norm": np.array([_norm(row, "title_norm", "title") for row in music_rows], dtype=str),
+            "artist_norm": np.array([_norm(row, "artist_norm", "artist") for row in music_rows], dtype=str),
+            "genre": np.array([row["genre"] or "" for row in music_rows], dtype=str),
+            "type": np.array([row["type"] or "" for row in music_rows], dtype=str),
+            "bpm": np.array([row["bpm"] if row["bpm"] is not None else np.nan for row in music_rows], dtype=np.float64),
+            "is_new": np.array([bool(row["is_new"]) for row in music_rows], dtype=bool),
+            "version_id": np.array([row["version_id"] if row["version_id"] is not None else -1 for row in music_rows], dtype=np.int64),
+            # chart 级列（music 按 id 升序，二分查找即得曲目行号）
+            "chart_music": np.searchsorted(music_ids, [row["music_id"] for row in chart_rows]).astype(np.int64),
+            "diff_index": np.array([row["diff_index"] for row in chart_rows], dtype=np.int64),
+            "ds": np.array([row["ds"] for row in chart_rows], dtype=np.float64),
+            "level": np.array([row["level"] or "" for row in chart_rows], dtype=str),
+            "charter_norm": np.array([_norm(row, "charter_norm", "charter") for row in chart_rows], dtype=str),
+        }
+        # 标题按码位排序后的名次，与 SQLite 默认的 BINARY 排序规则一致；title_sorted 用于把游标中的标题换算为名次
+        columns["title_sorted"], columns["title_rank"] = np.unique(
+            np.array([row["title"] for row in music_rows], dtype=str), return_inverse=True
+        )
+        return columns
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """
+        由行计算出的全部派生列，写入冷启动快照
+        """
+        return {name: getattr(self, name) for name in COLUMN_NAMES}
+
+    @classmethod
+    async def load(cls, db: aiosqlite.Connection) -> "MusicCatalog":
+        """
+        从数据库读取整个曲库；stats 与 generation 由调用方另行填充（应在同一个读事务中读取）
+        """
+        cursor = await db.execute(f"SELECT {', '.join(MUSIC_COLUMNS + MUSIC_SEARCH_COLUMNS)} FROM music ORDER BY id")
+        music_rows = await cursor.fetchall()
+        cursor = await db.execute(
+            f"SELECT {', '.join('c.' + c for c in CHART_COLUMNS + CHART_SEARCH_COLUMNS)} FROM chart AS c "
+            "JOIN music AS m ON m.id = c.music_id ORDER BY c.music_id, c.diff_index"
+        )
+        chart_rows = await cursor.fetchall()
+        return cls(list(music_rows), list(chart_rows))
+
+    def cube(self) -> "CatalogCube":
+        """
+        本快照的统计立方体，第一次访问时计算（快照不可变，之后一直复用）
+        """
+        if self._cube is None:
+            self._cube = CatalogCube(self)
+        return self._cube
+
+    def chart_keys(self) -> List[Tuple[int, int]]:
+        return list(self.chart_index)
+
+    def __len__(self) -> int:
+        return len(self.chart_rows)
+
+    def mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        """
+        把 MusicList 规范化后的筛选条件转成 chart 级布尔掩码
+        """
+        music_mask = np.ones(len(self.music_rows), dtype=bool)
+        chart_mask = np.ones(len(self.chart_rows), dtype=bool)
+
+        if "levels" in filters:
+            chart_mask &= np.isin(self.level, [str(level) for level in filters["levels"]])
+        if "ds_range" in filters:
+            low, high = filters["ds_range"]
+            chart_mask &= (self.ds >= low) & (self.ds <= high)
+        if "title_search" in filters:
+            music_mask &= np.char.find(self.title_norm, filters["title_search"]) >= 0
+        if "genres" in filters:
+            music_mask &= np.isin(self.genre, filters["genres"])
+        if "bpm_range" in filters:
+            low, high = filters["bpm_range"]
+            music_mask &= (self.bpm >= low) & (self.bpm <= high)
+        if "types" in filters:
+            music_mask &= np.isin(self.type, filters["types"])
+        if "diff_indices" in filters:
+            chart_mask &= np.isin(self.diff_index, np.asarray(filters["diff_indices"], dtype=np.int64))
+        if "charter" in filters:
+            chart_mask &= np.char.find(self.charter_norm, filters["charter"]) >= 0
+        if "artist" in filters:
+            music_mask &= np.char.find(self.artist_norm, filters["artist"]) >= 0
+        if "is_new" in filters:
+            music_mask &= self.is_new == filters["is_new"]
+        if "version_indices" in filters:
+            music_mask &= np.isin(self.version_id, np.asarray(filters["version_indices"], dtype=np.int64))
+
+        return chart_mask & music_mask[self.chart_music]
+
+    def count(self, filters: Dict[str, Any]) -> Tuple[int, int]:
+        """
+        返回 (曲目数, 谱面数)，只计算掩码，不排序也不构造任何对象
+        """
+        mask = self.mask(filters)
+        return len(np.unique(self.chart_music[mask])), int(mask.sum())
+
+    def order_values(self, i: int, order: List[Tuple[str, bool]]) -> List[Any]:
+        """
+        第 i 张谱面在各排序列上的原始值（标题为字符串），用于生成分页游标
+        """
+        values = []
+        for column, _ in order:
+            if column == "title":
+                values.append(self.music_rows[self.chart_music[i]]["title"])
+            else:
+                values.append(self.order_keys[column][i].item())
+        return values
+
+    def _after_mask(self, idx: np.ndarray, order: List[Tuple[str, bool]], after: List[Any]) -> np.ndarray:
+        """
+        keyset 分页：idx 中严格排在游标 after 之后的行
+        (c1 > v1) OR (c1 = v1 AND c2 > v2) OR ...，降序列的比较方向相反
+        """
+        result = np.zeros(len(idx), dtype=bool)
+        equal = np.ones(len(idx), dtype=bool)
+        for (column, descending), value in zip(order, after):
+            key = self.order_keys[column][idx]
+            if column == "title":
+                # 标题在名次空间中比较：名次区间 [low, high) 内的标题等于 value
+                low = np.searchsorted(self.title_sorted, value, side="left")
+                high = np.searchsorted(self.title_sorted, value, side="right")
+                greater, less, same = key >= high, key < low, (key >= low) & (key < high)
+            else:
+                greater, less, same = key > value, key < value, key == value
+            result |= equal & (less if descending else greater)
+            equal &= same
+        return result
+
+    def music_count(self, idx: np.ndarray) -> int:
+        """
+        chart 行号对应的不同曲目数
+        """
+        return len(np.unique(self.chart_music[idx]))
+
+    def rows(self, idx: np.ndarray, fields: List[str]) -> List[tuple]:
+        """
+        把 chart 行号投影为只含 fields 的元组，不构造 Music / MusicChart，也不读取 stats；
+        fields 只含曲目级字段时每首曲目一行（按首次出现的顺序）
+        """
+        if all(f in MUSIC_FIELDS for f in fields):
+            keys = ["id" if f == "music_id" else f for f in fields]
+            music_idx = dict.fromkeys(self.chart_music[idx].tolist())
+            return [tuple(self.music_rows[m][k] for k in keys) for m in music_idx]
+
+        # 逐列取值再 zip：数值列直接由 NumPy 数组切片，其余列按行取
+        chart_idx = idx.tolist()
+        music_idx = self.chart_music[idx].tolist()
+        columns = []
+        for f in fields:
+            if f == "music_id":
+                columns.append(self.music_ids[self.chart_music[idx]].tolist())
+            elif f in ("diff_index", "ds"):
+                columns.append(getattr(self, f)[idx].tolist())
+            elif f in CHART_COLUMNS:
+                columns.append([self.chart_rows[i][f] for i in chart_idx])
+            else:
+                columns.append([self.music_rows[m][f] for m in music_idx])
+        return list(zip(*columns))
+
+    def select(
+        self,
+        filters: Dict[str, Any],
+        order: Optional[List[Tuple[str, bool]]] = None,
+        pagination: Optional[Tuple[int, int]] = None,
+        after: Optional[List[Any]] = None
+    ) -> np.ndarray:
+        """
+        返回符合条件的 chart 行号：
+          - order: [(列名, 是否降序), ...]，未指定时按 (music_id, diff_index) 升序
+          - pagination: (offset, limit)，语义与 SQLite 的 LIMIT/OFFSET 相同（limit < 0 表示不限）
+          - after: keyset 分页游标，与 order 一一对应的值，只返回排在其后的行
+        """
+        idx = np.flatnonzero(self.mask(filters))
+        if after is not None:
+            idx = idx[self._after_mask(idx, order, after)]
+
+        if order:
+            # lexsort 以最后一个键为主键，且是稳定排序，并列时保持默认顺序
+            keys = []
+            for column, descending in reversed(order):
+                key = self.order_keys[column][idx]
+                keys.append(-key if descending else key)
+            idx = idx[np.lexsort(keys)]
+
+        if pagination:
+            offset, limit = pagination
+            offset = max(offset, 0)
+            idx = idx[offset:] if limit < 0 else idx[offset:offset + limit]
+
+        return idx
+
+
+@dataclass
+class CubeStats:
+    chart_count: int
+    ds_min: Optional[float]
+    ds_max: Optional[float]
+    ds_mean: Optional[float]
+    notes: Dict[str, int]    # NOTE_COLUMNS 各列的总和
+
+
+class CatalogCube:
+    """
+    按 版本 × 等级 × 难度 × 类型 × 是否新曲 预先聚合的谱面统计
+
+    每个格子保存谱面数、定数的总和与最小 / 最大值、各物量列的总和，均为稠密的 NumPy 数组；
+    查询只在指定了条件的维度上取子数组再求和，与谱面总数无关。曲目数另有一个 版本 × 类型 × 是否新曲
+    的立方体，因为一首曲目的多张谱面可能落在不同格子中，按等级或难度筛选时无法由格子相加得到曲目数。
+    """
+
+    def __init__(self, catalog: MusicCatalog):
+        chart_values = {
+            "version_indices": catalog.version_id[catalog.chart_music],
+            "levels": catalog.level,
+            "diff_indices": catalog.diff_index,
+            "types": catalog.type[catalog.chart_music],
+            "is_new": catalog.is_new[catalog.chart_music],
+        }
+        music_values = {
+            "version_indices": catalog.version_id,
+            "types": catalog.type,
+            "is_new": catalog.is_new,
+        }
+        self.axes: Dict[str, np.ndarray] = {dim: np.unique(values) for dim, values in chart_values.items()}
+        # 曲目级维度的坐标轴取曲目与谱面取值的并集，没有谱面的曲目也能落在自己的格子里
+        for dim in MUSIC_CUBE_DIMS:
+            self.axes[dim] = np.union1d(self.axes[dim], music_values[dim])
+        # 取值 -> 坐标轴下标，查询时不必在坐标轴上搜索
+        self._positions: Dict[str, Dict[Any, int]] = {dim: {v: i for i, v in enumerate(axis.tolist())} for dim, axis in self.axes.items()}
+        self.shape = tuple(len(self.axes[dim]) for dim in CUBE_DIMS)
+        size = int(np.prod(self.shape))
+        flat = self._flat_index(chart_values, CUBE_DIMS)
+
+        # 最后一维依次为：谱面数、定数总和、NOTE_COLUMNS 各列总和
+        weights = [np.ones(len(catalog.chart_rows)), catalog.ds]
+        weights += [np.array([row[column] or 0 for row in catalog.chart_rows], dtype=np.float64) for column in NOTE_COLUMNS]
+        self.sums = np.stack([np.bincount(flat, weights=w, minlength=size) for w in weights], axis=-1).reshape(self.shape + (len(weights),))
+        ds_min, ds_max = np.full(size, np.inf), np.full(size, -np.inf)
+        np.minimum.at(ds_min, flat, catalog.ds)
+        np.maximum.at(ds_max, flat, catalog.ds)
+        self.ds_min, self.ds_max = ds_min.reshape(self.shape), ds_max.reshape(self.shape)
+
+        # 与 MusicCatalog.count 一致，只统计至少有一张谱面的曲目
+        music_shape = tuple(len(self.axes[dim]) for dim in MUSIC_CUBE_DIMS)
+        music_flat = self._flat_index(music_values, MUSIC_CUBE_DIMS, music_shape)
+        has_charts = np.bincount(catalog.chart_music, minlength=len(catalog.music_rows)) > 0
+        self.music_counts = np.bincount(
+            music_flat, weights=has_charts, minlength=int(np.prod(music_shape))
+        ).astype(np.int64).reshape(music_shape)
+
+    def _flat_index(self, values: Dict[str, np.ndarray], dims: List[str], shape: Optional[Tuple[int, ...]] = None) -> np.ndarray:
+        codes = [np.searchsorted(self.axes[dim], values[dim]) for dim in dims]
+        return np.ravel_multi_index(codes, shape or self.shape)
+
+    def _selection(self, dims: List[str], filters: Dict[str, Any]) -> List[Tuple[int, List[int]]]:
+        # 指定了条件的维度及其选中的下标，不存在的取值被忽略
+        selection = []
+        for axis, dim in enumerate(dims):
+            value = filters.get(dim)
+            if value is None:
+                continue
+            if dim == "is_new":
+                value = [bool(value)]
+            elif not isinstance(value, (list, tuple)):
+                value = [value]
+            if dim == "levels":
+                value = [str(v) for v in value]
+            positions = self._positions[dim]
+            selection.append((axis, sorted({positions[v] for v in value if v in positions})))
+        return selection
+
+    @staticmethod
+    def _select(array: np.ndarray, selection: List[Tuple[int, List[int]]]) -> np.ndarray:
+        for axis, indices in selection:
+            array = array.take(indices, axis=axis)
+        return array
+
+    def stats(self, **filters) -> CubeStats:
+        """
+        选中格子的合计；参数与 MusicList.filter 同名：version_indices、levels、diff_indices、types、is_new
+        """
+        selection = self._selection(CUBE_DIMS, filters)
+        sums = self._select(self.sums, selection).reshape(-1, self.sums.shape[-1]).sum(axis=0)
+        count = int(sums[0])
+        if count == 0:
+            return CubeStats(0, None, None, None, {column: 0 for column in NOTE_COLUMNS})
+        return CubeStats(
+            chart_count=count,
+            ds_min=float(self._select(self.ds_min, selection).min()),
+            ds_max=float(self._select(self.ds_max, selection).max()),
+            ds_mean=float(sums[1] / count),
+            notes={column: int(total) for column, total in zip(NOTE_COLUMNS, sums[2:])},
+        )
+
+    def group_by(self, dim: str, **filters) -> Dict[Any, CubeStats]:
+        """
+        按一个维度分组的合计（只含谱面数不为 0 的分组），如各等级的谱面数：group_by("levels", diff_indices=[4])
+        """
+        result = {}
+        for value in self.axes[dim].tolist():
+            stats = self.stats(**{**filters, dim: value})
+            if stats.chart_count:
+                result[value] = stats
+        return result
+
+    def music_count(self, **filters) -> int:
+        """
+        曲目数；只支持曲目级的维度：version_indices、types、is_new
+        """
+        unsupported = set(filters) - set(MUSIC_CUBE_DIMS)
+        if unsupported:
+            raise ValueError(f"music_count only supports {MUSIC_CUBE_DIMS}, got {sorted(unsupported)}.")
+        return int(self._select(self.music_counts, self._selection(MUSIC_CUBE_DIMS, filters)).sum())
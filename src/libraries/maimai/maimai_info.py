@@ -256,8 +256,8 @@ async def draw_new_info(record: BestRecord, music: Music)->Image.Image:
 async def draw_new_infos(records: list[BestRecord]) -> Image.Image:
     # asyncio 同时绘制多个记录
     tasks = []
-    for record in records:
-        music = await total_list.by_id(record.music_id)
+    musics = await asyncio.gather(*(total_list.by_id(record.music_id) for record in records))
+    for record, music in zip(records, musics):
         if music is None:
             raise ValueError(f"Music with ID {record.music_id} not found in total_list.")
         tasks.append(draw_new_info(record, music))
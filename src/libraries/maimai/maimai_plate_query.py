@@ -12,6 +12,7 @@ from src.libraries.maimai.maimai_network import mai_api
 from src.libraries.maimai.maimai_type import Music, MusicList, Chart, BestRecord, BestRecordList, MusicChart, Plate
 from src.libraries.maimai.maimaidx_music import total_list, best_record_list, music_chart_list, user_list
 from src.libraries.maimai.database import database_api
+from src.libraries.maimai.dataloader import request_scope
 
 class PlateGenerator(object):
     """
@@ -92,15 +93,15 @@ class PlateGenerator(object):
 
         # 遍历列表获取用户的最佳记录
 
-        plate = []
-        for chart in charts:
-            best_record = await best_record_list.by_user_and_music(user_id, chart.music_id, chart.diff_index)
-            plate.append((chart, best_record))
-
-        plate_all = []
-        for chart in charts_all:
-            best_record = await best_record_list.by_user_and_music(user_id, chart.music_id, chart.diff_index)
-            plate_all.append((chart, best_record))
+        # 两个列表的查询在同一轮事件循环内发出，由 best_record_list 合并为一次查询；
+        # 两个列表重叠的谱面只查一次，结果在本次请求内缓存
+        with request_scope():
+            records, records_all = await asyncio.gather(
+                best_record_list.by_user_and_musics(user_id, [(chart.music_id, chart.diff_index) for chart in charts]),
+                best_record_list.by_user_and_musics(user_id, [(chart.music_id, chart.diff_index) for chart in charts_all])
+            )
+        plate = list(zip(charts, records))
+        plate_all = list(zip(charts_all, records_all))
 
         plate_obj = Plate(user=user, plate=plate, plate_all=plate_all, type=type)
 
@@ -1,16 +1,81 @@
-import json, random, nltk, math
-from typing import Dict, List, Optional, Union, Tuple, Any
+import json, random, nltk, math, time, asyncio, base64
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Union, Tuple, Any, Iterator, AsyncIterator, Mapping
+from pathlib import Path
 import aiosqlite
-from dataclasses import dataclass
-
-from src.libraries.tool_range import opencc_converter
-from src.libraries.maimai.database import database_api
+from dataclasses import dataclass, field
+import numpy as np
+
+from src.libraries.text_normalize import get_opencc_converter, search_key
+from src.libraries.maimai.database import DatabaseAPI, database_api, calc_ra, CHART_KEYS_SQL, chart_keys_param, catalog_generation, read_snapshot, \
+    unpack_dist, RANK_DIST_SIZE, FC_DIST_SIZE, DIST_DTYPE
+from src.libraries.maimai.maimai_catalog import MusicCatalog, CatalogCube, MUSIC_FIELDS, CHART_FIELDS
+from src.libraries.maimai.catalog_snapshot import CatalogSnapshot, alias_source, load_alias_table
+from src.libraries.maimai.migrations import current_version
+from src.libraries.maimai.dataloader import DataLoader
+from src.libraries.maimai.result_cache import ResultCache, freeze
 from src.libraries.maimai.static_lists_and_dicts import version_list, cn_version_list, level_list, rank_list_lower, fc_list_lower, fs_list_lower
 from src.libraries.alias import HybridStringMatcher
 
 
 # —— 数据模型层 —— #
 
+# music JOIN chart 的公共 SELECT，每行对应一张谱面，MusicChart.from_row 按此列名读取
+MUSIC_CHART_SELECT = """
+        SELECT
+          m.id      AS music_id,
+          m.title   AS title,
+          m.type    AS type,
+          m.artist  AS artist,
+          m.genre   AS genre,
+          m.bpm     AS bpm,
+          m.release_date AS release_date,
+          m.version AS version,
+          m.is_new AS is_new,
+          m.version_id AS version_id,
+          c.diff_index,
+          c.ds,
+          c.level,
+          c.notes,
+          c.tap,
+          c.hold,
+          c.slide,
+          c.touch,
+          c.break,
+          c.charter
+        FROM music     AS m
+        JOIN chart     AS c
+          ON m.id = c.music_id
+        """
+
+# iter_filter 每批从数据库 / 快照取出的行数
+ITER_CHUNK_SIZE = 256
+
+# filter 可排序的列及其在 MUSIC_CHART_SELECT 中对应的表达式（用于 keyset 分页条件）
+ORDER_COLUMN_SQL = {
+    "title": "m.title",
+    "music_id": "c.music_id",
+    "version_id": "m.version_id",
+    "ds": "c.ds",
+    "diff_index": "c.diff_index",
+}
+
+# 筛选条件中按集合匹配的参数，顺序与重复不影响结果，生成缓存键时排序去重
+SET_FILTERS = ("levels", "genres", "types", "diff_indices", "version_indices")
+
+# trigram 索引能匹配的最短子串；更短的 key（如单个汉字）在 SQLite 3.40 上查不到任何行
+TRIGRAM_MIN_LENGTH = 3
+
+
+def substring_condition(alias: str, fts_table: str, column: str, key: str) -> str:
+    """
+    规范化列包含子串 key 的 SQL 条件（一个 ? 参数）：足够长的 key 走 trigram 索引，否则直接扫描规范化列
+    """
+    if len(key) >= TRIGRAM_MIN_LENGTH:
+        return f"{alias}.id IN (SELECT rowid FROM {fts_table} WHERE {column} LIKE '%' || ? || '%')"
+    return f"{alias}.{column} LIKE '%' || ? || '%'"
+
 @dataclass
 class Stats(Dict):
     cnt: Optional[int] = None
@@ -18,110 +83,126 @@ class Stats(Dict):
     avg: Optional[float] = None
     avg_dx: Optional[float] = None
     std_dev: Optional[float] = None
-    rank_dist: Optional[List[int]] = None 
-    fc_dist: Optional[List[int]] = None
+    # 分布为只读的 int32 数组（直接引用数据库返回的 BLOB），数组不能逐元素比较相等，不参与 ==
+    rank_dist: Optional[np.ndarray] = field(default=None, compare=False)
+    fc_dist: Optional[np.ndarray] = field(default=None, compare=False)
+
+    # 一次查询取回一组谱面的统计信息，分布为 chart_stats 上的定长 BLOB 列
+    _BY_KEYS_SQL = f"""
+    WITH keys AS MATERIALIZED ({CHART_KEYS_SQL})
+    SELECT cs.music_id, cs.diff_index,
+           cs.cnt, cs.fit_diff, cs.avg, cs.avg_dx, cs.std_dev,
+           cs.rank_dist, cs.fc_dist
+    FROM keys JOIN chart_stats AS cs
+      ON cs.music_id = keys.music_id AND cs.diff_index = keys.diff_index
+    """
 
     @classmethod
-    async def from_db(cls, db: aiosqlite.Connection, music_id: int, diff_index: int) -> Optional["Stats"]:
-        """
-        从数据库中获取指定曲目和难度的统计信息
-        """
-        cursor = await db.execute(
-            "SELECT * FROM chart_stats WHERE music_id = ? AND diff_index = ?",
-            (music_id, diff_index)
-        )
-        row = await cursor.fetchone()
-        if not row:
-            return None
-        # 获取 rank_dist
-        cursor = await db.execute(
-            "SELECT * FROM chart_rating_dist WHERE music_id = ? AND diff_index = ?",
-            (music_id, diff_index)
-        )
-        rating_rows = await cursor.fetchall()
-        rank_dist = [0] * 14
-        for r in rating_rows:
-            if 0 <= r["rating_index"] < len(rank_dist):
-                rank_dist[r["rating_index"]] = r["count"]
-        # 获取 fc_dist
-        cursor = await db.execute(
-            "SELECT * FROM chart_fc_dist WHERE music_id = ? AND diff_index = ?",
-            (music_id, diff_index)
-        )
-        fc_rows = await cursor.fetchall()
-        fc_dist = [0] * 5
-        for f in fc_rows:
-            if 0 <= f["fc_index"] < len(fc_dist):
-                fc_dist[f["fc_index"]] = f["count"]
-        # 返回 Stats 对象
-        print(f"Stats.from_db: music_id={music_id}, diff_index={diff_index}, cnt={row['cnt']}, fit_diff={row['fit_diff']}, avg={row['avg']}, avg_dx={row['avg_dx']}, std_dev={row['std_dev']}")
-        return cls(
-            cnt=row["cnt"],
-            fit_diff=row["fit_diff"],
-            avg=row["avg"],
-            avg_dx=row["avg_dx"],
-            std_dev=row["std_dev"],
-            rank_dist=rank_dist,
-            fc_dist=fc_dist
-        )
-    
-    @classmethod
-    async def by_charts(cls, db: aiosqlite.Connection, charts: List[Optional[Union["Chart", "MusicChart"]]]) -> Dict[Tuple[int, int], "Stats"]:
+    async def by_keys(cls, db: aiosqlite.Connection, keys: List[Tuple[int, int]]) -> Dict[Tuple[int, int], "Stats"]:
         """
-        根据 Chart/MusicChart 列表获取对应的 Stats
+        根据 (music_id, diff_index) 列表获取对应的 Stats，查询次数与列表长度无关
         返回一个字典，键为 (music_id, diff_index)，值为 Stats 对象
         """
-        if not charts:
+        keys = list(dict.fromkeys((int(m), int(d)) for m, d in keys))
+        if not keys:
             return {}
 
-        # 构造查询语句
-        placeholders = ",".join("(?, ?)" for _ in charts)
-        sql = f"""
-        SELECT * FROM chart_stats
-        WHERE (music_id, diff_index) IN ({placeholders})
-        """
-        params = [(c.music_id, c.diff_index) for c in charts]
-        params = [item for sublist in params for item in sublist]  # 扁平化参数列表
-        cursor = await db.execute(sql, params)
+        cursor = await db.execute(cls._BY_KEYS_SQL, (chart_keys_param(keys),))
         rows = await cursor.fetchall()
 
-        # 构造结果字典
-        stats_map: Dict[Tuple[int, int], Stats] = {}
-        for row in rows:
-            stats_map[(row["music_id"], row["diff_index"])] = Stats(
+        return {
+            (row["music_id"], row["diff_index"]): cls(
                 cnt=row["cnt"],
                 fit_diff=row["fit_diff"],
                 avg=row["avg"],
                 avg_dx=row["avg_dx"],
                 std_dev=row["std_dev"],
-                rank_dist=[],
-                fc_dist=[]
+                rank_dist=unpack_dist(row["rank_dist"], RANK_DIST_SIZE),
+                fc_dist=unpack_dist(row["fc_dist"], FC_DIST_SIZE)
             )
+            for row in rows
+        }
 
-        # 获取 rank_dist
-        for (music_id, diff_index), stats in stats_map.items():
-            cursor = await db.execute(
-                "SELECT * FROM chart_rating_dist WHERE music_id = ? AND diff_index = ?",
-                (music_id, diff_index)
-            )
-            rating_rows = await cursor.fetchall()
-            stats.rank_dist = [0] * 14
-            for r in rating_rows:
-                if 0 <= r["rating_index"] < len(stats.rank_dist):
-                    stats.rank_dist[r["rating_index"]] = r["count"]
-        # 获取 fc_dist
-        for (music_id, diff_index), stats in stats_map.items():
-            cursor = await db.execute(
-                "SELECT * FROM chart_fc_dist WHERE music_id = ? AND diff_index = ?",
-                (music_id, diff_index)
+    @staticmethod
+    def to_columns(stats_map: Dict[Tuple[int, int], "Stats"]) -> Dict[str, np.ndarray]:
+        """
+        把 by_keys 的结果按列打包为 NumPy 数组，写入冷启动快照
+        """
+        if isinstance(stats_map, StatsColumns):
+            return stats_map.columns
+        items = list(stats_map.items())
+
+        def dist_matrix(attr: str, size: int) -> np.ndarray:
+            matrix = np.zeros((len(items), size), dtype=DIST_DTYPE)
+            for i, (_, stats) in enumerate(items):
+                dist = getattr(stats, attr)
+                if dist is not None:
+                    matrix[i] = dist
+            return matrix
+
+        return {
+            "music_id": np.array([key[0] for key, _ in items], dtype=np.int64),
+            "diff_index": np.array([key[1] for key, _ in items], dtype=np.int64),
+            "cnt": np.array([stats.cnt for _, stats in items], dtype=np.int64),
+            "fit_diff": np.array([stats.fit_diff for _, stats in items], dtype=np.float64),
+            "avg": np.array([stats.avg for _, stats in items], dtype=np.float64),
+            "avg_dx": np.array([stats.avg_dx for _, stats in items], dtype=np.float64),
+            "std_dev": np.array([stats.std_dev for _, stats in items], dtype=np.float64),
+            "rank_dist": dist_matrix("rank_dist", RANK_DIST_SIZE),
+            "fc_dist": dist_matrix("fc_dist", FC_DIST_SIZE),
+        }
+
+    @classmethod
+    async def from_db(cls, db: aiosqlite.Connection, music_id: int, diff_index: int) -> Optional["Stats"]:
+        """
+        从数据库中获取指定曲目和难度的统计信息
+        """
+        stats_map = await cls.by_keys(db, [(music_id, diff_index)])
+        return stats_map.get((int(music_id), int(diff_index)))
+    
+    @classmethod
+    async def by_charts(cls, db: aiosqlite.Connection, charts: List[Optional[Union["Chart", "MusicChart"]]]) -> Dict[Tuple[int, int], "Stats"]:
+        """
+        根据 Chart/MusicChart 列表获取对应的 Stats
+        返回一个字典，键为 (music_id, diff_index)，值为 Stats 对象
+        """
+        return await cls.by_keys(db, [(c.music_id, c.diff_index) for c in charts if c is not None])
+
+class StatsColumns(Mapping):
+    """
+    冷启动快照中按列保存的谱面统计，接口与 Stats.by_keys 返回的字典相同
+
+    按 (music_id, diff_index) 取用时才构造 Stats 并缓存，同一谱面始终返回同一个对象；
+    分布为快照中分布矩阵的只读行视图
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.columns = columns
+        keys = zip(columns["music_id"].tolist(), columns["diff_index"].tolist())
+        self._index: Dict[Tuple[int, int], int] = dict(zip(keys, range(len(columns["music_id"]))))
+        self._cache: Dict[Tuple[int, int], Stats] = {}
+
+    def __getitem__(self, key: Tuple[int, int]) -> Stats:
+        stats = self._cache.get(key)
+        if stats is None:
+            i = self._index[key]
+            c = self.columns
+            stats = self._cache[key] = Stats(
+                cnt=int(c["cnt"][i]),
+                fit_diff=float(c["fit_diff"][i]),
+                avg=float(c["avg"][i]),
+                avg_dx=float(c["avg_dx"][i]),
+                std_dev=float(c["std_dev"][i]),
+                rank_dist=c["rank_dist"][i],
+                fc_dist=c["fc_dist"][i]
             )
-            fc_rows = await cursor.fetchall()
-            stats.fc_dist = [0] * 5
-            for f in fc_rows:
-                if 0 <= f["fc_index"] < len(stats.fc_dist):
-                    stats.fc_dist[f["fc_index"]] = f["count"]
-        # 返回结果
-        return stats_map
+        return stats
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
 
 @dataclass
 class Chart:
@@ -180,61 +261,63 @@ class Music(Dict):
 
     @classmethod
     async def from_db(cls, db: aiosqlite.Connection, music_id: int) -> Optional["Music"]:
+        music_map = await cls.by_ids(db, [music_id])
+        return music_map.get(int(music_id))
+
+    @classmethod
+    async def by_ids(cls, db: aiosqlite.Connection, music_ids: List[int]) -> Dict[int, "Music"]:
+        """
+        根据 music_id 列表批量获取 Music，查询次数与列表长度无关
+        返回一个字典，键为 music_id，值为 Music 对象
+        """
+        ids_param = json.dumps(list(dict.fromkeys(int(i) for i in music_ids)))
+
         # 获取 music 元信息
         cursor = await db.execute(
-            "SELECT * FROM music WHERE id = ?",
-            (music_id,)
+            "SELECT * FROM music WHERE id IN (SELECT value FROM json_each(?))",
+            (ids_param,)
         )
-        row = await cursor.fetchone()
-        if not row:
-            return None
+        rows = await cursor.fetchall()
+        if not rows:
+            return {}
 
         # 获取所有 chart
         cursor = await db.execute(
-            "SELECT * FROM chart WHERE music_id = ? ORDER BY diff_index",
-            (music_id,)
+            "SELECT * FROM chart WHERE music_id IN (SELECT value FROM json_each(?)) ORDER BY music_id, diff_index",
+            (ids_param,)
         )
-        chart_rows = await cursor.fetchall()
-        charts_tmp = [Chart.from_row(row) for row in chart_rows]
-        cn_version = cn_version_list[row["version_id"]] if 0 <= row["version_id"] < len(cn_version_list) else "未知版本"
-        diff = [int(c.diff_index) for c in charts_tmp]
-        dss = [c.ds for c in charts_tmp]
-        levels = [c.level for c in charts_tmp]
-
-        # 获取所有 stats
-        statss: List[Stats] = []
-        charts: List[Chart] = []
-        for chart in charts_tmp:
-            stat = await Stats.from_db(db, music_id, chart.diff_index)
-            if stat is not None:
-                statss.append(stat)
-                chart.stats = stat
-                charts.append(chart)
-            else:
-                # 如果没有 stats，仍然添加 chart，stats 为空数据
-                stat = None
-                statss.append(stat)
-                chart.stats = stat
-                charts.append(chart)
+        charts_of: Dict[int, List[Chart]] = {}
+        for chart_row in await cursor.fetchall():
+            charts_of.setdefault(chart_row["music_id"], []).append(Chart.from_row(chart_row))
 
-        return cls(
-            id=row["id"],
-            title=row["title"],
-            type=row["type"],
-            artist=row["artist"],
-            genre=row["genre"],
-            bpm=row["bpm"],
-            release_date=row["release_date"],
-            version=row["version"],
-            is_new=bool(row["is_new"]),
-            version_id=row["version_id"],
-            charts=charts,
-            statss=statss,
-            diff=diff,
-            dss=dss,
-            levels=levels,
-            cn_version=cn_version
-        )
+        # 获取所有 stats（没有 stats 的 chart 仍然保留，stats 为 None）
+        stats_map = await Stats.by_charts(db, [c for charts in charts_of.values() for c in charts])
+
+        result: Dict[int, Music] = {}
+        for row in rows:
+            charts = charts_of.get(row["id"], [])
+            for chart in charts:
+                chart.stats = stats_map.get((chart.music_id, chart.diff_index))
+            cn_version = cn_version_list[row["version_id"]] if 0 <= row["version_id"] < len(cn_version_list) else "未知版本"
+            result[row["id"]] = cls(
+                id=row["id"],
+                title=row["title"],
+                type=row["type"],
+                artist=row["artist"],
+                genre=row["genre"],
+                bpm=row["bpm"],
+                release_date=row["release_date"],
+                version=row["version"],
+                is_new=bool(row["is_new"]),
+                version_id=row["version_id"],
+                charts=charts,
+                statss=[c.stats for c in charts],
+                diff=[int(c.diff_index) for c in charts],
+                dss=[c.ds for c in charts],
+                levels=[c.level for c in charts],
+                cn_version=cn_version
+            )
+        return result
     
 @dataclass
 class MusicChart(Music, Chart):
@@ -243,32 +326,21 @@ class MusicChart(Music, Chart):
     """
     
     @classmethod
-    async def from_db(cls, db: aiosqlite.Connection, music_id: int, diff_index: int) -> Optional["MusicChart"]:
-        """
-        从数据库中获取指定曲目和难度的 MusicChart
-        """
-        cursor = await db.execute(
-            "SELECT * FROM music WHERE id = ?",
-            (music_id,)
-        )
-        row = await cursor.fetchone()
-        if not row:
-            return None
-        
-        # 获取 chart 信息
-        cursor = await db.execute(
-            "SELECT * FROM chart WHERE music_id = ? AND diff_index = ?",
-            (music_id, diff_index)
-        )
-        chart_row = await cursor.fetchone()
-        if not chart_row:
-            return None
-        
-        # 获取 stats 信息
-        stats = await Stats.from_db(db, music_id, diff_index)
-
+    def from_row(cls, row: aiosqlite.Row, stats: Optional[Stats] = None) -> "MusicChart":
+        # row 为 MUSIC_CHART_SELECT 选出的 music JOIN chart 行
         return cls(
-            id=row["id"],
+            music_id=row["music_id"],
+            diff_index=row["diff_index"],
+            ds=row["ds"],
+            level=row["level"],
+            notes=row["notes"],
+            tap=row["tap"],
+            hold=row["hold"],
+            slide=row["slide"],
+            touch=row["touch"],
+            brk=row["break"],
+            charter=row["charter"],
+            id=row["music_id"],
             title=row["title"],
             type=row["type"],
             artist=row["artist"],
@@ -279,20 +351,35 @@ class MusicChart(Music, Chart):
             is_new=bool(row["is_new"]),
             version_id=row["version_id"],
             cn_version=cn_version_list[row["version_id"]] if 0 <= row["version_id"] < len(cn_version_list) else "未知版本",
-            
-            music_id=chart_row["music_id"],
-            diff_index=chart_row["diff_index"],
-            ds=chart_row["ds"],
-            level=chart_row["level"],
-            notes=chart_row["notes"],
-            tap=chart_row["tap"],
-            hold=chart_row["hold"],
-            slide=chart_row["slide"],
-            touch=chart_row["touch"],
-            brk=chart_row["break"],
-            charter=chart_row["charter"],
             stats=stats
         )
+
+    @classmethod
+    async def from_db(cls, db: aiosqlite.Connection, music_id: int, diff_index: int) -> Optional["MusicChart"]:
+        """
+        从数据库中获取指定曲目和难度的 MusicChart
+        """
+        chart_map = await cls.by_keys(db, [(music_id, diff_index)])
+        return chart_map.get((int(music_id), int(diff_index)))
+
+    @classmethod
+    async def by_keys(cls, db: aiosqlite.Connection, keys: List[Tuple[int, int]]) -> Dict[Tuple[int, int], "MusicChart"]:
+        """
+        根据 (music_id, diff_index) 列表批量获取 MusicChart，查询次数与列表长度无关
+        返回一个字典，键为 (music_id, diff_index)，值为 MusicChart 对象
+        """
+        if not keys:
+            return {}
+        cursor = await db.execute(
+            f"{MUSIC_CHART_SELECT} WHERE (c.music_id, c.diff_index) IN ({CHART_KEYS_SQL})",
+            (chart_keys_param(keys),)
+        )
+        rows = await cursor.fetchall()
+        stats_map = await Stats.by_keys(db, [(row["music_id"], row["diff_index"]) for row in rows])
+        return {
+            (row["music_id"], row["diff_index"]): cls.from_row(row, stats_map.get((row["music_id"], row["diff_index"])))
+            for row in rows
+        }
        
     @classmethod
     async def from_music(cls, musics: Union[Music, List[Music]]) -> List["MusicChart"]:
@@ -355,77 +442,12 @@ class BestRecord(Dict):
     @classmethod
     def calc_ra(cls, ds: float, achievements: float, b50: bool) -> int:
         """
-        计算 RA 值
-        """
-        ranges = [
-            (100.5000, 14.0, 100.5000),
-            (100.4999, 13.9, None),
-            (100.0000, 13.5, None),
-            (99.9999, 13.4, None),
-            (99.5000, 13.2, None),
-            (99.0000, 13.0, None),
-            (98.9999, 12.9, None),
-            (98.0000, 12.7, None),
-            (97.0000, 12.5, None),
-            (96.9999, 11.0, None),
-            (94.0000, 10.5, None),
-            (93.9999, 10.0, None), # ?
-            (90.0000, 9.5, None),
-            (89.9999, 9.0, None), # ?
-            (80.0000, 8.5, None),
-            (79.9999, 7.6, None),
-            (75.0000, 7.5, None),
-            (70.0000, 7.0, None),
-            (60.0000, 6.0, None),
-            (50.0000, 5.0, None),
-            (40.0000, 4.0, None),
-            (30.0000, 3.0, None),
-            (20.0000, 2.0, None),
-            (10.0000, 1.0, None)
-        ]
-
-        if ds is None or achievements is None:
-            return 0.0
-        # 优化：用区间和系数列表简化分支
-
-        ds = round(ds, 1)  # 保留一位小数
-
-        for threshold, coeff, fixed_ach in ranges:
-            if achievements >= threshold:
-                achv = fixed_ach if fixed_ach is not None else achievements
-                adj_coeff = math.floor(coeff * 1.6 * 10) / 10 if b50 else coeff
-                return int(adj_coeff * ds * achv * 0.01)
-        return 0
-
-    @classmethod
-    async def from_db(cls, db: aiosqlite.Connection, user_id: str, music_id: int, diff_index: int) -> Optional["BestRecord"]:
-        """
-        从数据库中获取指定用户、曲目和难度的最佳记录
+        计算 RA 值（同一函数也注册为 SQL 函数 calc_ra，用于维护 best_record 的 rating 列）
         """
-        cursor = await db.execute(
-            "SELECT * FROM best_record WHERE user_id = ? AND music_id = ? AND diff_index = ?",
-            (user_id, music_id, diff_index)
-        )
-        row = await cursor.fetchone()
-        if not row:
-            return None
-        
-        cursor = await db.execute(
-            "SELECT ds FROM chart WHERE music_id = ? AND diff_index = ?",
-            (music_id, diff_index)
-        )
-        chart_row = await cursor.fetchone()
-        if not chart_row:
-            return None
-        
-        cursor = await db.execute(
-            "SELECT * FROM chart_stats WHERE music_id = ? AND diff_index = ?",
-            (music_id, diff_index)
-        )
-        stats_row = await cursor.fetchone()
-        if not stats_row:
-            return None
+        return calc_ra(ds, achievements, b50)
 
+    @classmethod
+    def from_row(cls, row: aiosqlite.Row) -> "BestRecord":
         return cls(
             user_id=row["user_id"],
             music_id=row["music_id"],
@@ -436,10 +458,37 @@ class BestRecord(Dict):
             fc_id=row["fc_id"],
             fs_id=row["fs_id"],
             dxscore=row["dxscore"],
-            ra_b50=BestRecord.calc_ra(chart_row["ds"], row["achievements"], b50=True),
-            ra_b40=BestRecord.calc_ra(chart_row["ds"], row["achievements"], b50=False),
-            ra_stats=BestRecord.calc_ra(stats_row["fit_diff"] if row["fit_diff"] is not None else row["ds"], row["achievements"], b50=True)
+            ra_b50=row["ra_b50"],
+            ra_b40=row["ra_b40"],
+            ra_stats=row["ra_stats"]
+        )
+
+    @classmethod
+    async def from_db(cls, db: aiosqlite.Connection, user_id: str, music_id: int, diff_index: int) -> Optional["BestRecord"]:
+        """
+        从数据库中获取指定用户、曲目和难度的最佳记录
+        """
+        record_map = await cls.by_keys(db, user_id, [(music_id, diff_index)])
+        return record_map.get((int(music_id), int(diff_index)))
+
+    @classmethod
+    async def by_keys(cls, db: aiosqlite.Connection, user_id: str, keys: List[Tuple[int, int]]) -> Dict[Tuple[int, int], "BestRecord"]:
+        """
+        批量获取指定用户在 (music_id, diff_index) 列表上的最佳记录，查询次数与列表长度无关
+        返回一个字典，键为 (music_id, diff_index)，值为 BestRecord 对象
+        """
+        if not keys:
+            return {}
+        cursor = await db.execute(
+            f"""
+            SELECT br.* FROM best_record AS br
+            JOIN chart AS c ON br.music_id = c.music_id AND br.diff_index = c.diff_index
+            WHERE br.user_id = ? AND (br.music_id, br.diff_index) IN ({CHART_KEYS_SQL})
+            """,
+            (user_id, chart_keys_param(keys))
         )
+        rows = await cursor.fetchall()
+        return {(row["music_id"], row["diff_index"]): cls.from_row(row) for row in rows}
     
 @dataclass
 class User(Dict):
@@ -582,58 +631,81 @@ class Plate(Dict):
 
 # —— DAO / 接口层 —— #
 
+# 当前上下文固定使用的曲库快照：(MusicList id, 快照)，见 MusicList.pinned
+_pinned_catalog: ContextVar[Optional[Tuple[int, MusicCatalog]]] = ContextVar("maimai_pinned_catalog", default=None)
+
+
+class FilterResult(dict):
+    """
+    MusicList.filter 的返回值
+
+    music_count / chart_count（以及指定 fields 时的 rows）直接给出；
+    music_list / music_charts 在第一次访问时才构造，只读计数或 rows 的调用方不会创建任何 Music 对象。
+    """
+
+    def __init__(self, music_count: int, chart_count: int, build_charts=None, **items):
+        super().__init__(music_count=music_count, chart_count=chart_count, **items)
+        self._build_charts = build_charts
+
+    def __missing__(self, key):
+        if key in ("music_list", "music_charts") and self._build_charts is not None:
+            music_charts = self._build_charts()
+            self._build_charts = None
+            self["music_charts"] = music_charts
+            self["music_list"] = MusicList._group_music(music_charts)
+            return self[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
 class MusicList:
-    async def _connect(self):
-        conn = await database_api.get_database_connection()
-        conn.row_factory = aiosqlite.Row
-        await conn.execute("PRAGMA foreign_keys = ON;")
-        return conn
+    def __init__(self, snapshot_file: Optional[Path] = None, api: DatabaseAPI = database_api):
+        # 读取曲库使用的数据库（测试、性能测试、命令行工具可传入其他数据库）
+        self.api = api
+        # 曲库快照，未加载时所有查询回退到数据库；只通过 load_catalog 整体替换
+        self.catalog: Optional[MusicCatalog] = None
+        # 与曲库快照一同加载的别名表 {music_id: [别名, ...]}，供 maiAliasMatcher.alias_build_index 使用
+        self.aliases: Optional[Dict[int, List[str]]] = None
+        # 冷启动快照文件，为 None 时不读也不写（测试、性能测试用的实例）
+        self.snapshot_file = snapshot_file
+        self._snapshot_lock: Optional[asyncio.Lock] = None
+        # 快照未加载时，同一轮事件循环内的 by_id 合并为一次查询
+        self.loader: DataLoader[int, Music] = DataLoader(self._load_music, name="music", generation=lambda music_id: self.generation)
+        # 曲库快照上 filter / count 的结果缓存，快照替换时清空
+        self.result_cache = ResultCache()
+
+    def _connect(self):
+        # 从连接池借出连接，用法：async with self._connect() as db
+        return self.api.connection()
+
+    async def _load_music(self, music_ids: List[int]) -> Dict[int, Music]:
+        async with self._connect() as db:
+            return await Music.by_ids(db, music_ids)
 
     async def _from_rows(self, rows: List[aiosqlite.Row]) -> Tuple[List[Music], List[MusicChart]]:
         # 按 music_id 分组，把符合条件的 chart 列表化
         # 先生成 music_chart 列表
-        music_charts = []
-        for row in rows:
-            music_chart = MusicChart(
-                music_id=row["music_id"],
-                diff_index=row["diff_index"],
-                ds=row["ds"],
-                level=row["level"],
-                notes=row["notes"],
-                tap=row["tap"],
-                hold=row["hold"],
-                slide=row["slide"],
-                touch=row["touch"],
-                brk=row["break"],
-                charter=row["charter"],
-                id=row["music_id"],
-                title=row["title"],
-                type=row["type"],
-                artist=row["artist"],
-                genre=row["genre"],
-                bpm=row["bpm"],
-                release_date=row["release_date"],
-                version=row["version"],
-                is_new=bool(row["is_new"]),
-                version_id=row["version_id"],
-                cn_version=cn_version_list[row["version_id"]] if 0 <= row["version_id"] < len(cn_version_list) else "未知版本",
-                stats=None  # stats 会在后续处理
-            )
-            music_charts.append(music_chart)
+        music_charts = [MusicChart.from_row(row) for row in rows]  # stats 会在后续处理
 
         # 获取所有 charts 的 stats
 
-        db = await self._connect()
-        try:
+        async with self._connect() as db:
             stats_map = await Stats.by_charts(db, music_charts)
-        finally:
-            await db.close()
 
         # 将 stats 填充到 music_charts 中
         for music_chart in music_charts:
             diff_index = music_chart.diff_index
             music_chart.stats = stats_map.get((music_chart.music_id, diff_index), None)
 
+        return self._group_music(music_charts), music_charts
+
+    @staticmethod
+    def _group_music(music_charts: List[MusicChart]) -> List[Music]:
         # 按 music_id 分组，构造 Music 对象
         music_map = {}
         for music_chart in music_charts:
@@ -700,32 +772,202 @@ class MusicList:
             )
             result.append(music)
 
-        return result, music_charts
+        return result
 
+    @staticmethod
+    def _music_chart_from_catalog(catalog: MusicCatalog, i: int) -> MusicChart:
+        # 每次都构造新对象，调用方可以放心修改；stats 为快照内共享的只读对象
+        c = catalog.chart_rows[i]
+        m = catalog.music_rows[catalog.chart_music[i]]
+        return MusicChart(
+            music_id=c["music_id"],
+            diff_index=c["diff_index"],
+            ds=c["ds"],
+            level=c["level"],
+            notes=c["notes"],
+            tap=c["tap"],
+            hold=c["hold"],
+            slide=c["slide"],
+            touch=c["touch"],
+            brk=c["break"],
+            charter=c["charter"],
+            id=m["id"],
+            title=m["title"],
+            type=m["type"],
+            artist=m["artist"],
+            genre=m["genre"],
+            bpm=m["bpm"],
+            release_date=m["release_date"],
+            version=m["version"],
+            is_new=bool(m["is_new"]),
+            version_id=m["version_id"],
+            cn_version=cn_version_list[m["version_id"]] if 0 <= m["version_id"] < len(cn_version_list) else "未知版本",
+            stats=catalog.stats.get((c["music_id"], c["diff_index"]))
+        )
 
-    async def by_id(self, music_id: int) -> Optional[Music]:
-        db = await self._connect()
-        try:
-            return await Music.from_db(db, music_id)
-        finally:
-            await db.close()
-        
-    async def by_title(self, title: str) -> Optional[Music]:
+    @staticmethod
+    def _music_from_catalog(catalog: MusicCatalog, music_id: int) -> Optional[Music]:
+        # 与 Music.from_db 的结果一致：没有谱面的曲目也会返回，charts 为空
+        row_index = catalog.music_index.get(music_id)
+        if row_index is None:
+            return None
+        row = catalog.music_rows[row_index]
+        charts: List[Chart] = []
+        for i in catalog.charts_of.get(music_id, []):
+            chart = Chart.from_row(catalog.chart_rows[i])
+            chart.stats = catalog.stats.get((chart.music_id, chart.diff_index))
+            charts.append(chart)
+        return Music(
+            id=row["id"],
+            title=row["title"],
+            type=row["type"],
+            artist=row["artist"],
+            genre=row["genre"],
+            bpm=row["bpm"],
+            release_date=row["release_date"],
+            version=row["version"],
+            is_new=bool(row["is_new"]),
+            version_id=row["version_id"],
+            charts=charts,
+            statss=[c.stats for c in charts],
+            diff=[int(c.diff_index) for c in charts],
+            dss=[c.ds for c in charts],
+            levels=[c.level for c in charts],
+            cn_version=cn_version_list[row["version_id"]] if 0 <= row["version_id"] < len(cn_version_list) else "未知版本"
+        )
+
+    def current_catalog(self) -> Optional[MusicCatalog]:
         """
-        根据标题模糊搜索曲目
+        当前查询使用的快照：在 pinned() 内为固定的快照，否则为最新发布的快照
         """
-        title = opencc_converter.convert_cn2jp(title.lower())
+        pinned = _pinned_catalog.get()
+        if pinned is not None and pinned[0] == id(self):
+            return pinned[1]
+        return self.catalog
 
-        sql = "SELECT id FROM music WHERE title LIKE '%' || ? || '%'"
-        db = await self._connect()
-        try:
-            cursor = await db.execute(sql, (title,))
-            row = await cursor.fetchone()
-            if not row:
-                return None
-            return await Music.from_db(db, row["id"])
-        finally:
-            await db.close()
+    @property
+    def generation(self) -> int:
+        """
+        当前快照的曲库代数，未加载快照时为 0
+        """
+        catalog = self.current_catalog()
+        return catalog.generation if catalog is not None else 0
+
+    @contextmanager
+    def pinned(self) -> Iterator[Optional[MusicCatalog]]:
+        """
+        在一次命令处理内固定使用进入时的快照，期间发布的新快照不影响本次处理
+
+        用法：
+            with total_list.pinned():
+                res = await total_list.filter(...)
+                music = await total_list.by_id(...)
+        """
+        catalog = self.current_catalog()
+        token = _pinned_catalog.set((id(self), catalog) if catalog is not None else None)
+        try:
+            yield catalog
+        finally:
+            _pinned_catalog.reset(token)
+
+    async def load_catalog(self, use_snapshot: bool = True) -> MusicCatalog:
+        """
+        重新加载曲库快照（启动时与每次曲库 / 统计同步后调用）
+
+        曲库、统计与曲库代数在同一个读事务中读取，新快照在旁边构建完成后一次性替换；
+        只会发布代数不低于当前快照的结果，并发加载时旧快照不会覆盖新快照。
+
+        设置了 snapshot_file 时：尚未加载过（冷启动）先读取快照文件，曲库代数、结构版本与别名文件均一致才使用；
+        否则从数据库构建，并把结果写回快照文件供下次启动使用。
+        """
+        start = time.perf_counter()
+        source = alias_source()
+        snapshot: Optional[CatalogSnapshot] = None
+        async with self._connect() as db, read_snapshot(db):
+            generation = await catalog_generation(db)
+            current = self.catalog
+            if current is not None and current.generation == generation:
+                return current
+            schema_version = await current_version(db)
+            if use_snapshot and current is None and self.snapshot_file is not None:
+                snapshot = CatalogSnapshot.load(self.snapshot_file)
+                if snapshot is not None and not snapshot.is_current(generation, schema_version, source):
+                    print(f"[Info] 冷启动快照已过期（第 {snapshot.generation} 代，结构版本 {snapshot.schema_version}），从数据库重建")
+                    snapshot = None
+            if snapshot is None:
+                catalog = await MusicCatalog.load(db)
+                catalog.stats = await Stats.by_keys(db, catalog.chart_keys())
+                catalog.generation = generation
+
+        if snapshot is not None:
+            catalog = snapshot.to_catalog()
+            catalog.stats = StatsColumns(snapshot.stats_columns())
+            aliases = snapshot.aliases
+        else:
+            aliases = load_alias_table()
+
+        # 统计立方体随快照一起构建，发布后的统计查询不再扫描谱面
+        catalog.cube()
+
+        current = self.catalog
+        if current is not None and current.generation > catalog.generation:
+            return current
+        self.catalog = catalog
+        self.aliases = aliases
+        self.result_cache.clear()
+        print(f"[Info] 曲库快照已加载{'（冷启动快照）' if snapshot is not None else ''}：第 {generation} 代，"
+              f"{len(catalog.music_rows)} 首曲目，{len(catalog)} 张谱面，用时 {time.perf_counter() - start:.3f}s")
+
+        if snapshot is None and self.snapshot_file is not None:
+            await self._save_snapshot(catalog, schema_version, source, aliases)
+        return catalog
+
+    async def _save_snapshot(
+        self,
+        catalog: MusicCatalog,
+        schema_version: int,
+        source: Optional[List[int]],
+        aliases: Dict[int, List[str]]
+    ) -> None:
+        # 串行写入，且只写仍是当前发布的快照，并发加载时文件不会被旧代数覆盖；写文件在线程池中执行
+        if self._snapshot_lock is None:
+            self._snapshot_lock = asyncio.Lock()
+        async with self._snapshot_lock:
+            if self.catalog is not catalog:
+                return
+            snapshot = CatalogSnapshot.from_catalog(catalog, Stats.to_columns(catalog.stats), schema_version, source, aliases)
+            try:
+                size = await asyncio.get_running_loop().run_in_executor(None, snapshot.save, self.snapshot_file)
+            except OSError as e:
+                print(f"[Warning] 冷启动快照写入失败：{e!r}")
+            else:
+                print(f"[Info] 冷启动快照已写入：第 {catalog.generation} 代，{size / 1024:.0f}KiB")
+
+    async def by_id(self, music_id: int) -> Optional[Music]:
+        catalog = self.current_catalog()
+        if catalog is not None:
+            try:
+                return self._music_from_catalog(catalog, int(music_id))
+            except (TypeError, ValueError):
+                return None
+        try:
+            music_id = int(music_id)
+        except (TypeError, ValueError):
+            return None
+        return await self.loader.load(music_id)
+        
+    async def by_title(self, title: str) -> Optional[Music]:
+        """
+        根据标题模糊搜索曲目
+        """
+        key = search_key(title)
+        sql = f"SELECT m.id FROM music AS m WHERE {substring_condition('m', 'music_fts', 'title_norm', key)} ORDER BY m.id LIMIT 1"
+        async with self._connect() as db:
+            cursor = await db.execute(sql, (key,))
+            row = await cursor.fetchone()
+            if not row:
+                return None
+            return await Music.from_db(db, row["id"])
 
     async def filter(
         self,
@@ -741,63 +983,243 @@ class MusicList:
         charter:      Optional[str]            = None,
         artist:       Optional[str]            = None,
         is_new:       Optional[bool]           = None,
-        version_indices:   Optional[Union[int, List[int]]] = None
+        version_indices:   Optional[Union[int, List[int]]] = None,
+        fields:       Optional[Union[str, List[str]]]      = None,
+        cursor:       Optional[str]            = None
     ) -> Dict[str, Union[int, List[Music]]]:
         """
         按照以下条件筛选 Chart：
           - levels:      chart.level 匹配列表
           - ds_range:    chart.ds 在 [min,max] 之间
-          - title_search: music.title 包含子串（不区分大小写）
+          - title_search: music.title 包含子串（不区分大小写与简繁日字形）
           - genres:      music.genre 在列表中
           - bpm_range:   music.bpm 在 [min,max] 之间
           - types:       music.type ('SD'/'DX') 在列表中
           - diff_indices: chart.diff_index 在列表中
-          - charter:     chart.charter 包含子串（不区分大小写）
-          - artist:      music.artist 包含子串（不区分大小写）
+          - charter:     chart.charter 包含子串（同上）
+          - artist:      music.artist 包含子串（同上）
           - is_new:      music.is_new 是否为 True
           - version_indices: music.version_id 在列表中
         pagination: 可选，(offset, limit) 元组，指定结果的分页
         order: 可选，指定排序顺序，格式为 ['(+/-)term1', '(+/-)term2', ...]
+        fields: 可选，投影字段列表（如 ['music_id', 'title']），指定时只返回轻量元组 rows，
+                不构造 Music / MusicChart，也不读取 stats；
+                fields 只含曲目级字段时每首曲目一行，否则每张谱面一行
+        cursor: 可选，上一页结果中的 next_cursor，从该位置之后继续取（keyset 分页，不随页数变慢）；
+                必须与上一页使用相同的筛选条件与 order
 
-        返回一个字典：
+        指定 pagination 或 cursor 时，order 末尾会自动补上 music_id、diff_index，保证分页顺序确定。
+
+        返回一个字典（FilterResult）：
         {
-            music_count: int,  # 符合条件的曲目数量
-            chart_count: int,  # 符合条件的 chart 数量
-            music_list: List[Music]  # 符合条件的曲目列表
-            music_charts: List[MusicChart]  # 符合条件的 music_chart 列表
+            music_count: int,  # 本页的曲目数量
+            chart_count: int,  # 本页的 chart 数量
+            music_list: List[Music]  # 符合条件的曲目列表（未指定 fields 时，首次访问时构造）
+            music_charts: List[MusicChart]  # 符合条件的 music_chart 列表（同上）
+            rows: List[tuple]  # 指定 fields 时，按 fields 顺序的原始列值
+            position: int  # 本页第一条之前的条数
+            next_cursor: Optional[str]  # 还有下一页时的游标，否则为 None
         }
+        满足条件的总数请用 count()。
+
+        曲库快照已加载时，相同条件的结果由 result_cache 缓存（曲库快照替换时清空），
+        music_list / music_charts 中的对象仍是每次调用新构造的，可以放心修改。
         """
-        # 基础查询，选出所有符合条件的 chart
-        sql = """
-        SELECT
-          m.id      AS music_id,
-          m.title   AS title,
-          m.type    AS type,
-          m.artist  AS artist,
-          m.genre   AS genre,
-          m.bpm     AS bpm,
-          m.release_date AS release_date,
-          m.version AS version,
-          m.is_new AS is_new,
-          m.version_id AS version_id,
-          c.diff_index,
-          c.ds,
-          c.level,
-          c.notes,
-          c.tap,
-          c.hold,
-          c.slide,
-          c.touch,
-          c.break,
-          c.charter
-        FROM music     AS m
-        JOIN chart     AS c
-          ON m.id = c.music_id
-        WHERE 1=1
+        filters = self._normalize_filters(
+            levels=levels,
+            ds_range=ds_range,
+            title_search=title_search,
+            genres=genres,
+            bpm_range=bpm_range,
+            types=types,
+            diff_indices=diff_indices,
+            charter=charter,
+            artist=artist,
+            is_new=is_new,
+            version_indices=version_indices
+        )
+        order = self._normalize_order(order)
+        pagination = self._normalize_pagination(pagination)
+        fields = self._normalize_fields(fields)
+
+        after, position = None, 0
+        if pagination or cursor:
+            order = self._keyset_order(order)
+        if cursor:
+            after, position = self._decode_cursor(cursor, order)
+        # 多取一条，用来判断是否还有下一页
+        limit = pagination[1] if pagination and pagination[1] >= 0 else None
+        fetch = (pagination[0], limit + 1) if limit is not None else pagination
+        position += max(pagination[0], 0) if pagination else 0
+
+        catalog = self.current_catalog()
+        if catalog is not None:
+            # 曲库快照已加载：筛选、排序、分页都在内存中完成，对象按需构造
+            # 相同条件的筛选结果（只读的行号与投影行）从缓存取，每次调用仍各自构造对象
+            cache_key = (catalog.generation, "filter", self._filters_key(filters), freeze(order), fetch, freeze(after), position, freeze(fields))
+            cached = self.result_cache.get(cache_key)
+            if cached is None:
+                idx = catalog.select(filters, order, fetch, after)
+                next_cursor = None
+                if limit is not None and len(idx) > limit:
+                    idx = idx[:limit]
+                    next_cursor = self._encode_cursor(order, catalog.order_values(idx[-1], order), position + limit) if limit else None
+                idx.setflags(write=False)
+                rows = tuple(catalog.rows(idx, fields)) if fields else None
+                cached = (catalog.music_count(idx), idx, rows, next_cursor)
+                self.result_cache.put(cache_key, cached, max(len(idx), 1))
+            music_count, idx, rows, next_cursor = cached
+            page = {"position": position, "next_cursor": next_cursor}
+            if fields:
+                return FilterResult(music_count, len(idx), rows=list(rows), **page)
+            return FilterResult(
+                music_count, len(idx),
+                build_charts=lambda: [self._music_chart_from_catalog(catalog, i) for i in idx],
+                **page
+            )
+
+        # 执行查询并聚合
+        sql, params = self._filter_sql(filters, order, fetch, after)
+        async with self._connect() as db:
+            db_cursor = await db.execute(sql, params)
+            rows = await db_cursor.fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self._encode_cursor(order, [rows[-1][column] for column, _ in order], position + limit) if limit else None
+        page = {"position": position, "next_cursor": next_cursor}
+        music_count = len({row["music_id"] for row in rows})  # 唯一曲目数量
+        if fields:
+            return FilterResult(music_count, len(rows), rows=self._project_rows(rows, fields), **page)
+        # 数据库路径需要异步读取 stats，无法延迟到访问时，直接构造
+        result, music_charts = await self._from_rows(rows)
+        return FilterResult(music_count, len(music_charts), music_list=result, music_charts=music_charts, **page)
+
+    async def iter_filter(
+        self,
+        pagination: Optional[Tuple[int, int]] = None,
+        order: Optional[Union[str, List[str]]] = None,
+        fields: Optional[Union[str, List[str]]] = None,
+        chunk_size: int = ITER_CHUNK_SIZE,
+        **filters
+    ) -> AsyncIterator[Union[MusicChart, tuple]]:
         """
-        params: List = []
+        filter 的流式版本：筛选条件、pagination、order、fields 与 filter 相同（不支持 cursor），
+        按 chunk_size 分批取出，依次产出与 filter 结果 music_charts（或指定 fields 时的 rows）相同的元素，
+        对象边取边构造，内存占用与结果总数无关。
+
+        提前结束时请关闭生成器（见 streaming 模块），数据库路径下迭代期间会占用一条连接。
+        """
+        filters = self._normalize_filters(**filters)
+        order = self._normalize_order(order)
+        pagination = self._normalize_pagination(pagination)
+        fields = self._normalize_fields(fields)
+        # fields 只含曲目级字段时每首曲目一行，跨批次去重
+        music_only = fields is not None and all(f in MUSIC_FIELDS for f in fields)
+        seen = set()
+
+        catalog = self.current_catalog()
+        if catalog is not None:
+            idx = catalog.select(filters, order, pagination)
+            for start in range(0, len(idx), chunk_size):
+                chunk = idx[start:start + chunk_size]
+                if fields:
+                    if music_only:
+                        music_idx = catalog.chart_music[chunk].tolist()
+                        chunk = chunk[[j for j, m in enumerate(music_idx) if m not in seen]]
+                        seen.update(music_idx)
+                    for row in catalog.rows(chunk, fields):
+                        yield row
+                else:
+                    for i in chunk.tolist():
+                        yield self._music_chart_from_catalog(catalog, i)
+            return
+
+        sql, params = self._filter_sql(filters, order, pagination)
+        async with self._connect() as db:
+            db_cursor = await db.execute(sql, params)
+            try:
+                while True:
+                    rows = await db_cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    if fields:
+                        for row in rows:
+                            if music_only:
+                                if row["music_id"] in seen:
+                                    continue
+                                seen.add(row["music_id"])
+                            yield tuple(row[f] for f in fields)
+                        continue
+                    # 每批只读取本批谱面的 stats
+                    music_charts = [MusicChart.from_row(row) for row in rows]
+                    stats_map = await Stats.by_charts(db, music_charts)
+                    for music_chart in music_charts:
+                        music_chart.stats = stats_map.get((music_chart.music_id, music_chart.diff_index), None)
+                        yield music_chart
+            finally:
+                await db_cursor.close()
+
+    async def count(self, **filters) -> Dict[str, int]:
+        """
+        统计满足条件的曲目数与谱面数，参数与 filter 的筛选条件相同；不排序、不分页、不构造任何对象
+
+        返回一个字典：{music_count: int, chart_count: int}
+        """
+        filters = self._normalize_filters(**filters)
+        catalog = self.current_catalog()
+        if catalog is not None:
+            cache_key = (catalog.generation, "count", self._filters_key(filters))
+            counts = self.result_cache.get(cache_key)
+            if counts is None:
+                counts = catalog.count(filters)
+                self.result_cache.put(cache_key, counts)
+            music_count, chart_count = counts
+            return {"music_count": music_count, "chart_count": chart_count}
+
+        where, params = self._where_sql(filters)
+        sql = "SELECT COUNT(DISTINCT m.id) AS music_count, COUNT(*) AS chart_count FROM music AS m JOIN chart AS c ON m.id = c.music_id" + where
+        async with self._connect() as db:
+            cursor = await db.execute(sql, params)
+            row = await cursor.fetchone()
+        return {"music_count": row["music_count"], "chart_count": row["chart_count"]}
+
+    async def cube(self) -> CatalogCube:
+        """
+        当前快照的统计立方体（版本 × 等级 × 难度 × 类型 × 是否新曲），尚未加载快照时先加载
+
+        用法：
+            cube = await total_list.cube()
+            cube.stats(is_new=True).chart_count
+            cube.music_count(version_indices=[20, 21])
+            cube.group_by("levels", diff_indices=[3])
+        """
+        catalog = self.current_catalog()
+        if catalog is None:
+            catalog = await self.load_catalog()
+        return catalog.cube()
+
+    @staticmethod
+    def _filters_key(filters: Dict[str, Any]) -> tuple:
+        """
+        规范化后的筛选条件转为缓存键，集合类参数排序去重
+        """
+        return tuple(
+            (name, tuple(sorted(set(value), key=str)) if name in SET_FILTERS else freeze(value))
+            for name, value in sorted(filters.items())
+        )
+
+    @staticmethod
+    def _normalize_filters(
+        levels=None, ds_range=None, title_search=None, genres=None, bpm_range=None, types=None,
+        diff_indices=None, charter=None, artist=None, is_new=None, version_indices=None
+    ) -> Dict[str, Any]:
+        """
+        校验并规范化 filter 的筛选参数，只保留生效的条件：
+        列表类参数统一为 list，区间类参数统一为 (min, max)，子串类参数已经过 search_key 规范化
+        """
+        filters: Dict[str, Any] = {}
 
-        # 动态拼接 WHERE
         if levels:
             # 确保 levels 是一个列表
             if isinstance(levels, str):
@@ -806,9 +1228,7 @@ class MusicList:
                 levels = list(levels)
             else:
                 raise ValueError("levels must be a list or string.")
-            placeholders = ",".join("?" for _ in levels)
-            sql += f" AND c.level IN ({placeholders})"
-            params += levels
+            filters["levels"] = levels
 
         if ds_range:
             # 确保 ds_range 是一个包含两个元素的元组
@@ -822,18 +1242,13 @@ class MusicList:
                 ds_range = (ds_range[0], ds_range[0])
             elif len(ds_range) > 2:
                 ds_range = (ds_range[0], ds_range[1])
-
-            sql += " AND c.ds BETWEEN ? AND ?"
-            params.extend(ds_range)
+            filters["ds_range"] = ds_range
 
         if title_search:
             # 确保 title_search 是一个字符串
             if not isinstance(title_search, str):
                 raise ValueError("title_search must be a string.")
-            title_search = opencc_converter.convert_cn2jp(title_search.lower())
-
-            sql += " AND LOWER(m.title) LIKE '%' || LOWER(?) || '%'"
-            params.append(title_search)
+            filters["title_search"] = search_key(title_search)
 
         if genres:
             # 确保 genres 是一个列表
@@ -843,10 +1258,7 @@ class MusicList:
                 genres = list(genres)
             else:
                 raise ValueError("genres must be a list or string.")
-            
-            placeholders = ",".join("?" for _ in genres)
-            sql += f" AND m.genre IN ({placeholders})"
-            params += genres
+            filters["genres"] = genres
 
         if bpm_range:
             # 确保 bpm_range 是一个包含两个元素的元组
@@ -860,9 +1272,7 @@ class MusicList:
                 bpm_range = (bpm_range[0], bpm_range[0])
             elif len(bpm_range) > 2:
                 bpm_range = (bpm_range[0], bpm_range[1])
-
-            sql += " AND m.bpm BETWEEN ? AND ?"
-            params.extend(bpm_range)
+            filters["bpm_range"] = bpm_range
 
         if types:
             # 确保 types 是一个列表
@@ -872,10 +1282,7 @@ class MusicList:
                 types = list(types)
             else:
                 raise ValueError("types must be a list or string.")
-            
-            placeholders = ",".join("?" for _ in types)
-            sql += f" AND m.type IN ({placeholders})"
-            params += types
+            filters["types"] = types
 
         if diff_indices is not None:
             # 确保 diff_indices 是一个列表
@@ -885,35 +1292,25 @@ class MusicList:
                 diff_indices = list(diff_indices)
             else:
                 raise ValueError("diff_indices must be a list or integer.")
-
-            placeholders = ",".join("?" for _ in diff_indices)
-            sql += f" AND c.diff_index IN ({placeholders})"
-            params += diff_indices
+            filters["diff_indices"] = diff_indices
 
         if charter:
             # 确保 charter 是一个字符串
             if not isinstance(charter, str):
                 raise ValueError("charter must be a string.")
-            charter = opencc_converter.convert_cn2jp(charter.lower().strip())
-
-            sql += " AND LOWER(c.charter) LIKE '%' || LOWER(?) || '%'"
-            params.append(charter)
+            filters["charter"] = search_key(charter.strip())
 
         if artist:
             # 确保 artist 是一个字符串
             if not isinstance(artist, str):
                 raise ValueError("artist must be a string.")
-            artist = opencc_converter.convert_cn2jp(artist.lower().strip())
-
-            sql += " AND LOWER(m.artist) LIKE '%' || LOWER(?) || '%'"
-            params.append(artist)
+            filters["artist"] = search_key(artist.strip())
 
         if is_new is not None:
             # 确保 is_new 是一个布尔值
             if not isinstance(is_new, bool):
                 raise ValueError("is_new must be a boolean.")
-            sql += " AND m.is_new = ?"
-            params.append(1 if is_new else 0)
+            filters["is_new"] = is_new
 
         if version_indices is not None:
             # 确保 version_indices 是一个列表
@@ -923,62 +1320,199 @@ class MusicList:
                 version_indices = list(version_indices)
             else:
                 raise ValueError("version_indices must be a list or integer.")
+            filters["version_indices"] = version_indices
 
-            placeholders = ",".join("?" for _ in version_indices)
+        return filters
+
+    @staticmethod
+    def _normalize_fields(fields) -> Optional[List[str]]:
+        """
+        校验投影字段，返回字段列表；未指定时返回 None
+        """
+        if not fields:
+            return None
+        if isinstance(fields, str):
+            fields = [fields]
+        elif isinstance(fields, (list, tuple)):
+            fields = list(fields)
+        else:
+            raise ValueError("fields must be a list or string.")
+        for f in fields:
+            if f not in MUSIC_FIELDS and f not in CHART_FIELDS:
+                raise ValueError(f"Invalid field: {f}. Must be one of {MUSIC_FIELDS + CHART_FIELDS}.")
+        return fields
+
+    @staticmethod
+    def _project_rows(rows: List[aiosqlite.Row], fields: List[str]) -> List[tuple]:
+        # 与 MusicCatalog.rows 相同的投影规则，用于数据库路径
+        if all(f in MUSIC_FIELDS for f in fields):
+            seen = {}
+            for row in rows:
+                if row["music_id"] not in seen:
+                    seen[row["music_id"]] = tuple(row[f] for f in fields)
+            return list(seen.values())
+        return [tuple(row[f] for f in fields) for row in rows]
+
+    @staticmethod
+    def _normalize_order(order) -> List[Tuple[str, bool]]:
+        """
+        把 ['(+/-)term', ...] 转为 [(列名, 是否降序), ...]
+        """
+        if not order:
+            return []
+        if not isinstance(order, (str, list, tuple, set)):
+            raise ValueError("order must be a string or a list.")
+        if isinstance(order, str):
+            order = [order]
+        supported_columns = ["title", "music_id", "version_id", "ds", "diff_index",
+                             "-title", "-music_id", "-version_id", "-ds", "-diff_index",
+                             "+title", "+music_id", "+version_id", "+ds", "+diff_index"]
+        terms = []
+        for term in order:
+            if not term in supported_columns:
+                raise ValueError("Unsupported column name.")
+            terms.append((term.lstrip("+-"), term.startswith("-")))
+        return terms
+
+    @staticmethod
+    def _keyset_order(order: List[Tuple[str, bool]]) -> List[Tuple[str, bool]]:
+        # 补上 (music_id, diff_index) 使排序成为全序，keyset 分页才不会漏行或重复
+        columns = [column for column, _ in order]
+        return order + [(column, False) for column in ("music_id", "diff_index") if column not in columns]
+
+    @staticmethod
+    def _encode_cursor(order: List[Tuple[str, bool]], values: List[Any], position: int) -> str:
+        """
+        分页游标：排序方式、上一页最后一行的排序列取值与已翻过的条数，编码为 URL 安全的 base64 字符串
+        """
+        spec = ",".join(("-" if descending else "+") + column for column, descending in order)
+        payload = json.dumps([spec, values, position], ensure_ascii=False, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def _decode_cursor(token: str, order: List[Tuple[str, bool]]) -> Tuple[List[Any], int]:
+        """
+        解析分页游标，返回 (排序列取值, 已翻过的条数)；游标无效或与 order 不一致时抛出 ValueError
+        """
+        try:
+            payload = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            spec, values, position = json.loads(payload.decode("utf-8"))
+        except (ValueError, TypeError):
+            raise ValueError("Invalid cursor.")
+        expected = ",".join(("-" if descending else "+") + column for column, descending in order)
+        if spec != expected or not isinstance(values, list) or len(values) != len(order) or not isinstance(position, int):
+            raise ValueError("Cursor does not match the current order.")
+        return values, position
+
+    @staticmethod
+    def _normalize_pagination(pagination) -> Optional[Tuple[int, int]]:
+        if not pagination:
+            return None
+        if not isinstance(pagination, tuple) or len(pagination) != 2:
+            raise ValueError("pagination must be a tuple of (offset, limit).")
+        offset, limit = pagination
+        if not isinstance(offset, int) or not isinstance(limit, int):
+            raise ValueError("Both offset and limit must be integers.")
+        return offset, limit
+
+    @staticmethod
+    def _where_sql(filters: Dict[str, Any]) -> Tuple[str, List]:
+        """
+        由规范化后的筛选条件拼出 WHERE 子句（music AS m JOIN chart AS c）
+        """
+        sql = """
+        WHERE 1=1
+        """
+        params: List = []
+
+        # 动态拼接 WHERE
+        if "levels" in filters:
+            placeholders = ",".join("?" for _ in filters["levels"])
+            sql += f" AND c.level IN ({placeholders})"
+            params += filters["levels"]
+
+        if "ds_range" in filters:
+            sql += " AND c.ds BETWEEN ? AND ?"
+            params.extend(filters["ds_range"])
+
+        # 子串条件见 substring_condition，参数已经过 search_key 规范化
+        if "title_search" in filters:
+            sql += " AND " + substring_condition("m", "music_fts", "title_norm", filters["title_search"])
+            params.append(filters["title_search"])
+
+        if "genres" in filters:
+            placeholders = ",".join("?" for _ in filters["genres"])
+            sql += f" AND m.genre IN ({placeholders})"
+            params += filters["genres"]
+
+        if "bpm_range" in filters:
+            sql += " AND m.bpm BETWEEN ? AND ?"
+            params.extend(filters["bpm_range"])
+
+        if "types" in filters:
+            placeholders = ",".join("?" for _ in filters["types"])
+            sql += f" AND m.type IN ({placeholders})"
+            params += filters["types"]
+
+        if "diff_indices" in filters:
+            placeholders = ",".join("?" for _ in filters["diff_indices"])
+            sql += f" AND c.diff_index IN ({placeholders})"
+            params += filters["diff_indices"]
+
+        if "charter" in filters:
+            sql += " AND " + substring_condition("c", "chart_fts", "charter_norm", filters["charter"])
+            params.append(filters["charter"])
+
+        if "artist" in filters:
+            sql += " AND " + substring_condition("m", "music_fts", "artist_norm", filters["artist"])
+            params.append(filters["artist"])
+
+        if "is_new" in filters:
+            sql += " AND m.is_new = ?"
+            params.append(1 if filters["is_new"] else 0)
+
+        if "version_indices" in filters:
+            placeholders = ",".join("?" for _ in filters["version_indices"])
             sql += f" AND m.version_id IN ({placeholders})"
-            params += version_indices
-            
+            params += filters["version_indices"]
+
+        return sql, params
+
+    @staticmethod
+    def _filter_sql(
+        filters: Dict[str, Any],
+        order: List[Tuple[str, bool]],
+        pagination: Optional[Tuple[int, int]],
+        after: Optional[List[Any]] = None
+    ) -> Tuple[str, List]:
+        """
+        由规范化后的参数拼出 filter 的 SQL，选出所有符合条件的 chart
+        """
+        where, params = MusicList._where_sql(filters)
+        sql = MUSIC_CHART_SELECT + where
+
+        # keyset 分页：(c1 > v1) OR (c1 = v1 AND c2 > v2) OR ...，降序列的比较方向相反
+        if after is not None:
+            clauses = []
+            for i, ((column, descending), value) in enumerate(zip(order, after)):
+                terms = [f"{ORDER_COLUMN_SQL[c]} = ?" for c, _ in order[:i]]
+                terms.append(f"{ORDER_COLUMN_SQL[column]} {'<' if descending else '>'} ?")
+                clauses.append("(" + " AND ".join(terms) + ")")
+                params.extend(after[:i])
+                params.append(value)
+            sql += " AND (" + " OR ".join(clauses) + ")"
+
         # 添加排序
         if order:
-            if not isinstance(order, (str, list, tuple, set)):
-                raise ValueError("order must be a string or a list.")
-            if isinstance(order, str):
-                order = [order]
-            supported_columns = ["title", "music_id", "version_id", "ds", "diff_index",
-                                 "-title", "-music_id", "-version_id", "-ds", "-diff_index",
-                                 "+title", "+music_id", "+version_id", "+ds", "+diff_index"]
-            s = " ORDER BY"
-            for term in order:
-                if not term in supported_columns:
-                    raise ValueError("Unsupported column name.")
-                if '-' in term:
-                    s += f" {term[1:]} DESC,"
-                elif '+' in term:
-                    s += f" {term[1:]} ASC,"
-                else:
-                    s += f" {term} ASC,"
-            s = s[:-1]
-            sql += s
+            sql += " ORDER BY " + ", ".join(f"{column} {'DESC' if descending else 'ASC'}" for column, descending in order)
 
         # 添加分页支持
         if pagination:
-            if not isinstance(pagination, tuple) or len(pagination) != 2:
-                raise ValueError("pagination must be a tuple of (offset, limit).")
             offset, limit = pagination
-            if not isinstance(offset, int) or not isinstance(limit, int):
-                raise ValueError("Both offset and limit must be integers.")
             sql += " LIMIT ? OFFSET ?"
             params.extend([limit, offset])
 
-        # 执行查询并聚合
-        db = await self._connect()
-        try:
-            cursor = await db.execute(sql, params)
-            rows = await cursor.fetchall()
-        finally:
-            await db.close()
-
-        # 统计符合条件的曲目和 chart 数量
-        music_count = len(set(row["music_id"] for row in rows))  # 唯一曲目数量
-        chart_count = len(rows)  # 总 chart 数量
-        result, music_charts = await self._from_rows(rows)
-
-        return {
-            "music_count": music_count,
-            "chart_count": chart_count,
-            "music_list": result,
-            "music_charts": music_charts
-        }
+        return sql, params
 
     async def filt_by_name(self, title_search: str) -> Music:
         key = title_search.lower().strip()
@@ -988,12 +1522,11 @@ class MusicList:
         if sdflag or dxflag:
             key = key.replace("标", "").replace("sd","").replace("dx", "").strip()
 
-        db = await self._connect()
-        try:
+        async with self._connect() as db:
             # 1) 曲名完全匹配
-            # 这里匹配两种字形
-            sql1 = "SELECT id FROM music WHERE LOWER(title) IN (?, ?)"
-            params1 = [key, opencc_converter.convert_cn2jp(key)]
+            # 规范化后比较，简繁日字形都能匹配
+            sql1 = "SELECT id FROM music WHERE title_norm = ?"
+            params1 = [search_key(key)]
             if sdflag or dxflag:
                 sql1 += " AND id " + ("< 10000" if sdflag else ">= 10000")
             cur = await db.execute(sql1, params1)
@@ -1007,7 +1540,7 @@ class MusicList:
             FROM alias a
             WHERE LOWER(a.alias_text) IN (?, ?)
             """
-            params2 = [key, opencc_converter.convert_cn2jp(key)]
+            params2 = [key, get_opencc_converter().convert_cn2jp(key)]
             if sdflag or dxflag:
                 sql2 += " AND a.music_id " + ("< 10000" if sdflag else ">= 10000")
             cur = await db.execute(sql2, params2)
@@ -1040,8 +1573,6 @@ class MusicList:
 
             # 回退：返回空
             return None
-        finally:
-            await db.close()
 
     async def random(self, n: int = 1) -> Optional[List[Music]]:
         """
@@ -1049,8 +1580,13 @@ class MusicList:
         """
         sql = "SELECT id FROM music ORDER BY RANDOM() LIMIT ?"
         n = 1 if n < 1 else n  # 确保 n 至少为 1
-        db = await self._connect()
-        try:
+        catalog = self.current_catalog()
+        if catalog is not None:
+            if not len(catalog.music_ids):
+                return None
+            picked = random.sample(range(len(catalog.music_ids)), min(n, len(catalog.music_ids)))
+            return [self._music_from_catalog(catalog, int(catalog.music_ids[i])) for i in picked]
+        async with self._connect() as db:
             cursor = await db.execute(sql, (n,))
             rows = await cursor.fetchall()
             if not rows:
@@ -1061,8 +1597,6 @@ class MusicList:
                 if music:
                     result.append(music)
             return result
-        finally:
-            await db.close()
 
     async def random_by_seed(self, seed: int) -> Optional[Music]:
         """
@@ -1071,9 +1605,15 @@ class MusicList:
           2. idx = seed % count
           3. 用 LIMIT 1 OFFSET idx 查询对应的 id
           4. 调用 Music.from_db 构造并返回 Music 对象
+        曲库快照已加载时直接按下标取，结果与上述步骤相同
         """
-        db = await self._connect()
-        try:
+        catalog = self.current_catalog()
+        if catalog is not None:
+            if not len(catalog.music_ids):
+                return None
+            return self._music_from_catalog(catalog, int(catalog.music_ids[seed % len(catalog.music_ids)]))
+
+        async with self._connect() as db:
             # 1) 查询总数
             count_row = await (await db.execute("SELECT COUNT(*) AS cnt FROM music")).fetchone()
             count = count_row["cnt"]
@@ -1095,60 +1635,94 @@ class MusicList:
 
             # 4) 返回完整 Music 对象（假设已有 Music.from_db 方法）
             return await Music.from_db(db, music_id)
-        finally:
-            await db.close()
         
     async def get_revived_music_list(self) -> List[int]:
         """
         获取 revived_music 表的所有 id
         """
-        db = await self._connect()
-        try:
+        async with self._connect() as db:
             sql = "SELECT id FROM revived_music ORDER BY id"
             cursor = await db.execute(sql)
             rows = await cursor.fetchall()
             res = [r["id"] for r in rows]
             return res
-        finally:
-            db.close()
 
 class MusicChartList:
-    async def _connect(self):
-        conn = await database_api.get_database_connection()
-        conn.row_factory = aiosqlite.Row
-        await conn.execute("PRAGMA foreign_keys = ON;")
-        return conn
+    def __init__(self, api: DatabaseAPI = database_api):
+        self.api = api
+        # 同一轮事件循环内的 by_id 合并为一次查询
+        self.loader: DataLoader[Tuple[int, int], MusicChart] = DataLoader(self._load_charts, name="music_chart")
+
+    def _connect(self):
+        # 从连接池借出连接，用法：async with self._connect() as db
+        return self.api.connection()
+
+    async def _load_charts(self, keys: List[Tuple[int, int]]) -> Dict[Tuple[int, int], MusicChart]:
+        async with self._connect() as db:
+            return await MusicChart.by_keys(db, keys)
 
     async def by_id(self, music_id: int, diff_index: int) -> Optional[MusicChart]:
         """
         根据曲目 ID 和难度索引获取 MusicChart
         """
-        db = await self._connect()
-        try:
-            return await MusicChart.from_db(db, music_id, diff_index)
-        finally:
-            await db.close()
+        return await self.loader.load((int(music_id), int(diff_index)))
+
+    async def by_ids(self, keys: List[Tuple[int, int]]) -> List[Optional[MusicChart]]:
+        """
+        批量获取 MusicChart，结果与 keys 一一对应
+        """
+        return await self.loader.load_many([(int(music_id), int(diff_index)) for music_id, diff_index in keys])
 
 
 class BestRecordList:
-    async def _connect(self):
-        conn = await database_api.get_database_connection()
-        conn.row_factory = aiosqlite.Row
-        await conn.execute("PRAGMA foreign_keys = ON;")
-        return conn
+    def __init__(self, api: DatabaseAPI = database_api):
+        self.api = api
+        # 同一轮事件循环内的 by_user_and_music 合并为每个用户一次查询
+        # 请求缓存按玩家成绩版本区分，同步成绩之后不会再拿到旧的记录
+        self.loader: DataLoader[Tuple[str, int, int], BestRecord] = DataLoader(
+            self._load_records, name="best_record", generation=lambda key: self._user_version(key[0])
+        )
+
+    def _connect(self):
+        # 从连接池借出连接，用法：async with self._connect() as db
+        return self.api.connection()
+
+    def _ensure_hot(self, user_id: str):
+        # 读取某位玩家的成绩前调用：已归档的玩家先从冷存储恢复
+        return self.api.ensure_hot(user_id)
+
+    def _user_version(self, user_id: str) -> int:
+        # 玩家成绩的版本号，每次 sync_user_records 写入后加一
+        return self.api.user_version(user_id)
+
+    async def _load_records(self, keys: List[Tuple[str, int, int]]) -> Dict[Tuple[str, int, int], BestRecord]:
+        by_user: Dict[str, List[Tuple[int, int]]] = {}
+        for user_id, music_id, diff_index in keys:
+            by_user.setdefault(user_id, []).append((music_id, diff_index))
+        for user_id in by_user:
+            await self._ensure_hot(user_id)
+        result: Dict[Tuple[str, int, int], BestRecord] = {}
+        async with self._connect() as db:
+            for user_id, chart_keys in by_user.items():
+                record_map = await BestRecord.by_keys(db, user_id, chart_keys)
+                for (music_id, diff_index), record in record_map.items():
+                    result[(user_id, music_id, diff_index)] = record
+        return result
 
     async def by_user_and_music(self, user_id: str, music_id: int, diff_index: int) -> Optional[BestRecord]:
         """
         根据用户 ID、曲目 ID 和难度索引获取最佳记录
         """
-        db = await self._connect()
-        try:
-            return await BestRecord.from_db(db, user_id, music_id, diff_index)
-        finally:
-            await db.close()
+        return await self.loader.load((str(user_id), int(music_id), int(diff_index)))
 
-    async def filter(
-        self,
+    async def by_user_and_musics(self, user_id: str, keys: List[Tuple[int, int]]) -> List[Optional[BestRecord]]:
+        """
+        批量获取某位玩家在 (music_id, diff_index) 列表上的最佳记录，结果与 keys 一一对应
+        """
+        return await self.loader.load_many([(str(user_id), int(music_id), int(diff_index)) for music_id, diff_index in keys])
+
+    @staticmethod
+    def _filter_sql(
         user_id: Optional[str],
         pagination: Optional[Tuple[int, int]] = None,
         order: Optional[Union[str, List[str]]] = None,
@@ -1163,28 +1737,9 @@ class BestRecordList:
         diff_indices: Optional[Union[int, List[int]]] = None,
         ds_range: Optional[Union[float, List[float], Tuple[float, float]]] = None,
         levels: Optional[Union[str, List[str]]] = None
-    ) -> Dict[str, Union[int, List[BestRecord]]]:
+    ) -> Tuple[str, List[Any]]:
         """
-        根据以下条件筛选最佳记录：
-          - user_id: 用户 ID
-          - pagination: 可选，(offset, limit) 元组，指定结果的分页
-          - order: 可选，指定排序顺序，格式为 ['(+/-)term1', '(+/-)term2', ...]
-          - chart_list: 可选，[(music_id, diff_index), ...] 列表，指定要查询的曲目和难度索引
-          - achievements_range: 可选，(min, max) 元组，指定成就值范围
-          - ra_range: 可选，(min, max) 元组，指定 RA 范围
-          - fc_indices: 可选，FC ID 列表
-          - fs_indices: 可选，FS ID 列表
-          - dxscore_range: 可选，(min, max) 元组，指定 DX 分数范围
-          - is_new: 可选，是否只查询新曲目
-          - version_indices: 可选，版本索引列表
-          - diff_indices: 可选，难度索引列表
-          - ds_range: 可选，(min, max) 元组，指定 DS
-          - levels: 可选，chart.level 在列表中
-        返回一个字典：
-        {
-            record_count: int,  # 符合条件的记录数量
-            record_list: List[BestRecord]  # 符合条件的最佳记录列表
-        }
+        由 filter / iter_filter 的参数拼出查询最佳记录的 SQL
         """
         sql = """
         SELECT 
@@ -1197,6 +1752,9 @@ class BestRecordList:
             br.fc_id,
             br.fs_id,
             br.dxscore,
+            br.ra_b50,
+            br.ra_b40,
+            br.ra_stats,
             c.ds AS ds,
             cs.fit_diff AS fit_diff
         FROM best_record AS br
@@ -1214,9 +1772,8 @@ class BestRecordList:
         if chart_list:
             if not isinstance(chart_list, list):
                 raise ValueError("chart_list must be a list of (music_id, diff_index) tuples.")
-            placeholders = ",".join("(?, ?)" for _ in chart_list)
-            sql += f" AND (br.music_id, br.diff_index) IN ({placeholders})"
-            params.extend([item for sublist in chart_list for item in sublist])
+            sql += f" AND (br.music_id, br.diff_index) IN ({CHART_KEYS_SQL})"
+            params.append(chart_keys_param(chart_list))
 
         if achievements_range:
             if not isinstance(achievements_range, tuple) or len(achievements_range) != 2:
@@ -1310,9 +1867,9 @@ class BestRecordList:
                 raise ValueError("order must be a string or a list.")
             if isinstance(order, str):
                 order = [order]
-            supported_columns = ["music_id", "diff_index", "achievements", "ra", "fc_id", "fs_id", "dxscore", "ds",
-                                 "-music_id", "-diff_index", "-achievements", "-ra", "-fc_id", "-fs_id", "-dxscore", "-ds",
-                                 "+music_id", "+diff_index", "+achievements", "+ra", "+fc_id", "+fs_id", "+dxscore", "+ds"]
+            supported_columns = ["music_id", "diff_index", "achievements", "ra", "fc_id", "fs_id", "dxscore", "ds", "ra_b50", "ra_b40", "ra_stats",
+                                 "-music_id", "-diff_index", "-achievements", "-ra", "-fc_id", "-fs_id", "-dxscore", "-ds", "-ra_b50", "-ra_b40", "-ra_stats",
+                                 "+music_id", "+diff_index", "+achievements", "+ra", "+fc_id", "+fs_id", "+dxscore", "+ds", "+ra_b50", "+ra_b40", "+ra_stats"]
             s = " ORDER BY"
             for term in order:
                 if not term in supported_columns:
@@ -1336,68 +1893,111 @@ class BestRecordList:
             sql += " LIMIT ? OFFSET ?"
             params.extend([limit, offset])
 
+        return sql, params
+
+    async def filter(
+        self,
+        user_id: Optional[str],
+        pagination: Optional[Tuple[int, int]] = None,
+        order: Optional[Union[str, List[str]]] = None,
+        chart_list: Optional[List[Tuple[int, int]]] = None, # [(music_id, diff_index), ...] or None if no filter
+        achievements_range: Optional[Tuple[float, float]] = None,
+        ra_range: Optional[Tuple[int, int]] = None,
+        fc_indices: Optional[List[int]] = None,
+        fs_indices: Optional[List[int]] = None,
+        dxscore_range: Optional[Tuple[int, int]] = None,
+        is_new: Optional[bool] = None,
+        version_indices: Optional[Union[int, List[int]]] = None,
+        diff_indices: Optional[Union[int, List[int]]] = None,
+        ds_range: Optional[Union[float, List[float], Tuple[float, float]]] = None,
+        levels: Optional[Union[str, List[str]]] = None
+    ) -> Dict[str, Union[int, List[BestRecord]]]:
+        """
+        根据以下条件筛选最佳记录：
+          - user_id: 用户 ID
+          - pagination: 可选，(offset, limit) 元组，指定结果的分页
+          - order: 可选，指定排序顺序，格式为 ['(+/-)term1', '(+/-)term2', ...]
+          - chart_list: 可选，[(music_id, diff_index), ...] 列表，指定要查询的曲目和难度索引
+          - achievements_range: 可选，(min, max) 元组，指定成就值范围
+          - ra_range: 可选，(min, max) 元组，指定 RA 范围
+          - fc_indices: 可选，FC ID 列表
+          - fs_indices: 可选，FS ID 列表
+          - dxscore_range: 可选，(min, max) 元组，指定 DX 分数范围
+          - is_new: 可选，是否只查询新曲目
+          - version_indices: 可选，版本索引列表
+          - diff_indices: 可选，难度索引列表
+          - ds_range: 可选，(min, max) 元组，指定 DS
+          - levels: 可选，chart.level 在列表中
+        返回一个字典：
+        {
+            record_count: int,  # 符合条件的记录数量
+            record_list: List[BestRecord]  # 符合条件的最佳记录列表
+        }
+        """
+        if user_id:
+            await self._ensure_hot(user_id)
+        sql, params = self._filter_sql(
+            user_id, pagination=pagination, order=order, chart_list=chart_list,
+            achievements_range=achievements_range, ra_range=ra_range, fc_indices=fc_indices, fs_indices=fs_indices,
+            dxscore_range=dxscore_range, is_new=is_new, version_indices=version_indices, diff_indices=diff_indices,
+            ds_range=ds_range, levels=levels
+        )
+
         # 执行查询并获取结果
-        db = await self._connect()
-        try:
+        async with self._connect() as db:
             cursor = await db.execute(sql, params)
             rows = await cursor.fetchall()
-        finally:
-            await db.close()
-
-        # 统计符合条件的记录数量
-        record_count = len(rows)
 
         # 构造 BestRecord 对象列表
-        record_list = []
-        for row in rows:
-            record = BestRecord(
-                user_id=row["user_id"],
-                music_id=row["music_id"],
-                diff_index=row["diff_index"],
-                achievements=row["achievements"],
-                ra=None,  # 留空
-                rank_id=row["rank_id"],
-                fc_id=row["fc_id"],
-                fs_id=row["fs_id"],
-                dxscore=row["dxscore"],
-                ra_b50=BestRecord.calc_ra(row["ds"], row["achievements"], b50=True),
-                ra_b40=BestRecord.calc_ra(row["ds"], row["achievements"], b50=False),
-                ra_stats=BestRecord.calc_ra(row["fit_diff"] if row["fit_diff"] is not None else row["ds"], row["achievements"], b50=True),
-            )
-            record_list.append(record)
+        record_list = [BestRecord.from_row(row) for row in rows]
 
         return {
-            "record_count": record_count,
+            "record_count": len(record_list),  # 符合条件的记录数量
             "record_list": record_list
         }
+
+    async def iter_filter(self, user_id: Optional[str], chunk_size: int = ITER_CHUNK_SIZE, **kwargs) -> AsyncIterator[BestRecord]:
+        """
+        filter 的流式版本：参数相同，按 chunk_size 分批从数据库读取，逐条产出 BestRecord，
+        内存占用与结果总数无关。迭代期间占用一条连接，提前结束时请关闭生成器（见 streaming 模块）。
+        """
+        if user_id:
+            await self._ensure_hot(user_id)
+        sql, params = self._filter_sql(user_id, **kwargs)
+        async with self._connect() as db:
+            cursor = await db.execute(sql, params)
+            try:
+                while True:
+                    rows = await cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield BestRecord.from_row(row)
+            finally:
+                await cursor.close()
     
 class UserList:
-    async def _connect(self):
-        conn = await database_api.get_database_connection()
-        conn.row_factory = aiosqlite.Row
-        await conn.execute("PRAGMA foreign_keys = ON;")
-        return conn
+    def __init__(self, api: DatabaseAPI = database_api):
+        self.api = api
+
+    def _connect(self):
+        # 从连接池借出连接，用法：async with self._connect() as db
+        return self.api.connection()
 
     async def by_id(self, user_id: str) -> Optional[User]:
         """
         根据用户 ID 获取 User 对象
         """
-        db = await self._connect()
-        try:
+        async with self._connect() as db:
             return await User.from_db(db, user_id)
-        finally:
-            await db.close()
 
 class maiAliasMatcher(HybridStringMatcher):
-    ALIAS_FILE = "src/static/all_alias_temp.json"
-
-    def alias_build_index(self):
-        with open(self.ALIAS_FILE, "r", encoding="utf-8") as aliasfile:
-            alias_data_raw = json.load(aliasfile)
-
-        alias_data: Dict[int, List[str]] = {}
-        for music_id, music_alias in alias_data_raw.items():
-            alias_data[int(music_id)] = music_alias.get("Alias", [])
-
+    def alias_build_index(self, alias_data: Optional[Dict[int, List[str]]] = None):
+        """
+        alias_data 为 {music_id: [别名, ...]}，一般传入 total_list.aliases（随冷启动快照加载）；
+        未给出时读取别名文件
+        """
+        if alias_data is None:
+            alias_data = load_alias_table()
         self.build_index(alias_data)
         
\ No newline at end of file
@@ -10,7 +10,8 @@ import time
 
 # from src.libraries.maimai.maimai_type import Music, Chart, Stats, MusicList
 from src.libraries.maimai.maimai_type import Music, Chart, MusicChart, Stats, BestRecord, MusicList, BestRecordList, MusicChartList, UserList, maiAliasMatcher
-from src.libraries.maimai.database import database_api
+from src.libraries.maimai.database import database_api, RecordDiff
+from src.libraries.maimai.catalog_snapshot import snapshot_path
 from src.libraries.query import query_user
 from src.libraries.maimai.maimai_network import mai_api
 from src.libraries.tool_range import fetch
@@ -70,15 +71,17 @@ def delete_utage(data:json)->json:
             res["records"].append(record)
     return res
 
-async def refresh_player_full_data(username: str) -> None:
+async def refresh_player_full_data(username: str) -> Optional[RecordDiff]:
     """
     Refresh player full data from the API and sync it to the database.
     Args:
         username: The username to fetch data for.
+    Returns:
+        The record diff of this sync (new PBs, removed charts, ...).
     """
     full_data = await mai_api.get_player_records(username=username)
     full_data = delete_utage(full_data)
-    await database_api.sync_user_records(full_data)
+    return await database_api.sync_user_records(full_data)
         
 
     
@@ -87,17 +90,18 @@ async def refresh_player_full_data(username: str) -> None:
 
 
 async def refresh_music_data() -> None:
+    # 先取回曲库与统计，再在同一个事务中写入，读者不会看到新谱面配旧统计
     resp = await mai_api.get_music_data()
-    data = resp["data"]
-    await database_api.sync_musiclist(data)
-
-    print("music data refreshed successfully.")
-    
+    music_data = resp["data"]
     resp = await mai_api.get_chart_stats()
-    data = resp["charts"]
-    await database_api.sync_stats(data)
+    stats_data = resp["charts"]
+
+    generation = await database_api.sync_catalog(music_data, stats_data)
+
+    print(f"music data and chart stats refreshed successfully (generation {generation}).")
 
-    print("chart stats refreshed successfully.")
+    # 新快照构建完成后整体替换，进行中的查询继续使用旧快照
+    await total_list.load_catalog()
 
 
 
@@ -129,7 +133,7 @@ async def refresh_music_data() -> None:
 # refresh_alias_temp()
 
 
-total_list: MusicList = MusicList()
+total_list: MusicList = MusicList(snapshot_file=snapshot_path)
 best_record_list: BestRecordList = BestRecordList()
 music_chart_list: MusicChartList = MusicChartList()
 user_list: UserList = UserList()
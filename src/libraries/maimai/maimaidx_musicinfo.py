@@ -5,6 +5,7 @@ from src.libraries.april_fool import is_April_1st, kun_jin_kao
 from src.libraries.maimai.static_lists_and_dicts import version_icon_path, genre_icon_path, level_index_to_file, info_to_file_dict
 from src.libraries.maimai.maimaidx_music import compute_ra
 from src.libraries.maimai.maimai_network import mai_api
+from src.libraries.maimai.community_stats import community_stats
 from PIL import Image, ImageDraw, ImageFont
 
 assets_path = "src/static/mai/newinfo/"
@@ -20,6 +21,12 @@ async def chart_MessageSegment(chart: Chart, title: str) -> MessageSegment:
         f"\n平均达成率：{stats.avg:.4f}%\n"
         f"拟合定数：{stats.fit_diff:.2f}\n"
     )
+    # 本群玩家成绩得到的社区统计，样本不足时只显示人数与平均达成率
+    local = await community_stats.get(chart.music_id, chart.diff_index)
+    if local is not None:
+        diff_info += f"本地平均达成率：{local.avg:.4f}%（{local.cnt} 人）\n"
+        if local.fit_diff is not None:
+            diff_info += f"社区拟合定数：{local.fit_diff:.2f}\n"
 
     # 7. 生成谱面详情文本
     note_lines = (f"TAP: {chart.tap}  \n"
@@ -206,19 +213,14 @@ async def draw_music_info(music: Music) -> Image.Image:
         
         # statistic
         stats = chart.stats
-        if stats is None:
+        if stats is None or not stats.rank_dist.sum() or not stats.fc_dist.sum():
             text_list = ["--.--%"] * 8
         else:
-            dist = stats.rank_dist
-            sssp = (dist[-1]) /sum(dist)
-            sss = (dist[-1] + dist[-2]) /sum(dist)
-            ss = (dist[-1] + dist[-2] + dist[-3] + dist[-4]) /sum(dist)
-            s = (dist[-1] + dist[-2] + dist[-3] + dist[-4] + dist[-5] + dist[-6]) /sum(dist)
-            fc_dist = stats.fc_dist
-            app = (fc_dist[-1]) /sum(fc_dist)
-            ap = (fc_dist[-1] + fc_dist[-2]) /sum(fc_dist)
-            fcp = (fc_dist[-1] + fc_dist[-2] + fc_dist[-3]) /sum(fc_dist)
-            fc = (fc_dist[-1] + fc_dist[-2] + fc_dist[-3] + fc_dist[-4]) /sum(fc_dist)
+            # 从高到低累加：rank_tail[k] 为最高 k+1 档的人数，fc_tail 同理
+            rank_tail = stats.rank_dist[::-1].cumsum() / stats.rank_dist.sum()
+            sssp, sss, ss, s = rank_tail[0], rank_tail[1], rank_tail[3], rank_tail[5]
+            fc_tail = stats.fc_dist[::-1].cumsum() / stats.fc_dist.sum()
+            app, ap, fcp, fc = fc_tail[0], fc_tail[1], fc_tail[2], fc_tail[3]
 
             text_list = [f"{sssp:06.2%}",f"{sss:06.2%}",f"{ss:06.2%}",f"{s:06.2%}",f"{app:06.2%}",f"{ap:06.2%}",f"{fcp:06.2%}",f"{fc:06.2%}"]
 
@@ -0,0 +1,276 @@
+"""
+maimai.db 定期维护
+
+- 每隔 OPTIMIZE_INTERVAL 执行一次 PRAGMA optimize（从未 ANALYZE 过时执行 ANALYZE），
+  analysis_limit 限制每个索引扫描的行数，耗时与表大小无关
+- 每天低峰时段：把长期不活跃玩家的成绩移入冷存储（DatabaseAPI.archive_inactive_users），
+  再分多个小写事务做增量 VACUUM，回收成绩 upsert 与归档留下的空闲页；
+  随后在只读连接上做完整性检查，不占用写入任务
+- 每项维护前后的页数与用时都会打印出来
+
+增量 VACUUM 要求数据库的 auto_vacuum 为 INCREMENTAL。已有数据库需要停机执行一次完整 VACUUM 来切换，
+在项目根目录运行：
+    python -m src.libraries.maimai.maintenance [--analyze] [--archive] [--vacuum] [--integrity] [--full-vacuum] [数据库路径]
+"""
+
+import asyncio
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, date
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import aiosqlite
+
+from src.libraries.maimai.database import DatabaseAPI, database_api, database_path
+
+
+# 调度器多久检查一次是否有到期的维护（秒）
+CHECK_INTERVAL = 600
+# PRAGMA optimize 的间隔（秒）
+OPTIMIZE_INTERVAL = 6 * 3600
+# 低峰时段（本地时间的小时，左闭右开），增量 VACUUM 与完整性检查只在这段时间内执行，每天一次
+LOW_TRAFFIC_HOURS = (4, 6)
+# ANALYZE 时每个索引最多扫描的行数（PRAGMA analysis_limit），0 表示不限
+ANALYSIS_LIMIT = 1000
+# 增量 VACUUM 每个写事务回收的页数，以及一轮回收的总用时上限（秒）
+VACUUM_STEP_PAGES = 256
+VACUUM_TIME_BUDGET = 30.0
+# 完整性检查最多报告的问题条数
+INTEGRITY_MAX_ERRORS = 20
+
+# PRAGMA auto_vacuum 的取值
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+@dataclass
+class PageStats:
+    page_count: int
+    freelist_count: int
+    page_size: int
+
+    @property
+    def size_mib(self) -> float:
+        return self.page_count * self.page_size / 1024 / 1024
+
+    def __str__(self) -> str:
+        return f"{self.page_count} 页（空闲 {self.freelist_count} 页，{self.size_mib:.1f}MiB）"
+
+
+async def page_stats(db: aiosqlite.Connection) -> PageStats:
+    values = []
+    for pragma in ("page_count", "freelist_count", "page_size"):
+        cursor = await db.execute(f"PRAGMA {pragma}")
+        values.append((await cursor.fetchone())[0])
+    return PageStats(*values)
+
+
+async def optimize(api: DatabaseAPI = database_api) -> float:
+    """
+    在一个写事务中更新查询规划器的统计信息，返回用时（秒）
+    """
+    async def _optimize(db: aiosqlite.Connection) -> Tuple[PageStats, bool]:
+        await db.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+        analyzed = await cursor.fetchone() is not None
+        # optimize 只重新分析统计信息已过期的表；从未分析过时先完整 ANALYZE 一次
+        await db.execute("PRAGMA optimize" if analyzed else "ANALYZE")
+        return await page_stats(db), analyzed
+
+    start = time.perf_counter()
+    stats, analyzed = await api.write(_optimize)
+    elapsed = time.perf_counter() - start
+    print(f"[Info] 数据库维护：{'PRAGMA optimize' if analyzed else 'ANALYZE'} 完成，{stats}，用时 {elapsed:.3f}s")
+    return elapsed
+
+
+async def incremental_vacuum(
+    api: DatabaseAPI = database_api,
+    step_pages: int = VACUUM_STEP_PAGES,
+    time_budget: float = VACUUM_TIME_BUDGET
+) -> int:
+    """
+    回收空闲页，返回回收的页数
+
+    每个写事务只回收 step_pages 页，写入任务在两步之间照常处理其他写入；
+    超过 time_budget 后停止，剩下的留到下一次。auto_vacuum 不是 INCREMENTAL 时不做任何事。
+    """
+    async with api.connection() as db:
+        cursor = await db.execute("PRAGMA auto_vacuum")
+        mode = (await cursor.fetchone())[0]
+        before = await page_stats(db)
+    if mode != AUTO_VACUUM_INCREMENTAL:
+        if before.freelist_count:
+            print(f"[Info] 数据库维护：auto_vacuum 未设为 INCREMENTAL，跳过增量 VACUUM（{before}）；"
+                  f"可停机后运行 python -m src.libraries.maimai.maintenance --full-vacuum 切换")
+        return 0
+
+    async def _step(db: aiosqlite.Connection) -> PageStats:
+        # incremental_vacuum 每执行一步回收一页，而 sqlite3 模块对不返回列的语句只执行一步，
+        # 所以 PRAGMA incremental_vacuum(N) 实际只回收一页，这里逐页执行
+        for _ in range(step_pages):
+            await db.execute("PRAGMA incremental_vacuum(1)")
+        return await page_stats(db)
+
+    start = time.perf_counter()
+    after, steps = before, 0
+    while after.freelist_count > 0 and time.perf_counter() - start < time_budget:
+        after = await api.write(_step)
+        steps += 1
+    freed = before.page_count - after.page_count
+    print(f"[Info] 数据库维护：增量 VACUUM {steps} 步，{before} -> {after}，"
+          f"回收 {freed} 页，用时 {time.perf_counter() - start:.3f}s")
+    return freed
+
+
+async def integrity_check(api: DatabaseAPI = database_api, max_errors: int = INTEGRITY_MAX_ERRORS) -> List[str]:
+    """
+    在只读连接上检查数据库完整性，返回发现的问题（无问题时为空列表）
+    WAL 模式下读连接看到的是开始时的快照，检查期间写入不受影响
+    """
+    start = time.perf_counter()
+    async with api.connection() as db:
+        cursor = await db.execute(f"PRAGMA integrity_check({max_errors})")
+        rows = [row[0] for row in await cursor.fetchall()]
+        stats = await page_stats(db)
+    problems = [] if rows == ["ok"] else rows
+    elapsed = time.perf_counter() - start
+    if problems:
+        print(f"[Warning] 数据库维护：完整性检查发现 {len(problems)} 个问题，{stats}，用时 {elapsed:.3f}s")
+        for problem in problems:
+            print(f"[Warning]   {problem}")
+    else:
+        print(f"[Info] 数据库维护：完整性检查通过，{stats}，用时 {elapsed:.3f}s")
+    return problems
+
+
+async def full_vacuum(path: Path = database_path) -> None:
+    """
+    把 auto_vacuum 切换为 INCREMENTAL 并重建整个数据库
+
+    VACUUM 不能在事务中执行，且期间独占数据库，只应在 bot 停止时通过命令行执行
+    """
+    async with aiosqlite.connect(path, isolation_level=None) as db:
+        before = await page_stats(db)
+        start = time.perf_counter()
+        await db.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+        await db.execute("VACUUM")
+        after = await page_stats(db)
+    print(f"[Info] 数据库维护：完整 VACUUM 完成，{before} -> {after}，用时 {time.perf_counter() - start:.3f}s")
+
+
+class MaintenanceScheduler:
+    """
+    在 bot 运行期间按计划执行维护，由 driver 的 on_startup / on_shutdown 启停
+
+    每 check_interval 秒检查一次：距上次 optimize 超过 optimize_interval 时执行 optimize；
+    处于低峰时段且当天尚未执行时，依次执行冷存储归档、增量 VACUUM 与完整性检查。单项维护出错只打印，不影响后续调度。
+    """
+
+    def __init__(
+        self,
+        api: DatabaseAPI = database_api,
+        check_interval: float = CHECK_INTERVAL,
+        optimize_interval: float = OPTIMIZE_INTERVAL,
+        low_traffic_hours: Tuple[int, int] = LOW_TRAFFIC_HOURS
+    ):
+        self.api = api
+        self.check_interval = check_interval
+        self.optimize_interval = optimize_interval
+        self.low_traffic_hours = low_traffic_hours
+        self._task: Optional[asyncio.Task] = None
+        self._last_optimize: Optional[float] = None
+        self._last_nightly: Optional[date] = None
+
+        self.metrics: Dict[str, float] = {
+            "optimize_runs": 0,
+            "users_archived": 0,
+            "vacuum_runs": 0,
+            "pages_freed": 0,
+            "integrity_runs": 0,
+            "integrity_problems": 0,  # 最近一次完整性检查发现的问题数
+            "failures": 0,
+        }
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def in_low_traffic(self, now: datetime) -> bool:
+        start_hour, end_hour = self.low_traffic_hours
+        return start_hour <= now.hour < end_hour
+
+    async def run_once(self, now: Optional[datetime] = None) -> None:
+        """
+        执行当前到期的维护
+        """
+        now = now or datetime.now()
+        if self._last_optimize is None or time.monotonic() - self._last_optimize >= self.optimize_interval:
+            self._last_optimize = time.monotonic()
+            if await self._guarded(optimize(self.api)) is not None:
+                self.metrics["optimize_runs"] += 1
+
+        if self.in_low_traffic(now) and self._last_nightly != now.date():
+            self._last_nightly = now.date()
+            # 先把不活跃玩家的成绩移入冷存储，腾出的页随后由增量 VACUUM 回收
+            archived = await self._guarded(self.api.archive_inactive_users())
+            if archived is not None:
+                self.metrics["users_archived"] += archived
+            freed = await self._guarded(incremental_vacuum(self.api))
+            if freed is not None:
+                self.metrics["vacuum_runs"] += 1
+                self.metrics["pages_freed"] += freed
+            problems = await self._guarded(integrity_check(self.api))
+            if problems is not None:
+                self.metrics["integrity_runs"] += 1
+                self.metrics["integrity_problems"] = len(problems)
+
+    async def _guarded(self, coro):
+        try:
+            return await coro
+        except Exception as e:
+            self.metrics["failures"] += 1
+            print(f"[Warning] 数据库维护失败：{e!r}")
+            return None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.run_once()
+
+
+maintenance_scheduler = MaintenanceScheduler()
+
+
+async def main(args: List[str]) -> None:
+    paths = [a for a in args if not a.startswith("--")]
+    path = Path(paths[0]) if paths else database_path
+    if "--full-vacuum" in args:
+        await full_vacuum(path)
+    api = DatabaseAPI(path=path)
+    await api.start()
+    try:
+        if "--analyze" in args:
+            await optimize(api)
+        if "--archive" in args:
+            await api.archive_inactive_users()
+        if "--vacuum" in args:
+            await incremental_vacuum(api, time_budget=float("inf"))
+        if "--integrity" in args:
+            await integrity_check(api)
+    finally:
+        await api.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,535 @@
+"""
+maimai.db 结构迁移
+
+每个迁移有一个递增的版本号，已执行的版本记录在 schema_version 表中。
+启动时按顺序执行所有未执行的迁移，每个迁移与其版本记录在同一个写事务中提交；
+迁移本身也写成幂等的（IF NOT EXISTS / 先检查列是否存在），重复执行不会出错。
+
+在项目根目录运行：
+    python -m src.libraries.maimai.migrations [--dry-run] [--verify] [数据库路径]
+"""
+
+import asyncio
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Callable, Awaitable, Tuple
+
+import aiosqlite
+
+from src.libraries.maimai.database import DatabaseAPI, database_path, RATING_UPDATE_SQL, RANK_DIST_SIZE, FC_DIST_SIZE, pack_dist, \
+    ARCHIVE_COLUMNS, unpack_records, RunningStats, COMMUNITY_STATS_UPSERT_SQL, community_stats_params, \
+    BEST_RECORD_BY_KEYS_SQL
+
+
+SCHEMA_VERSION_SQL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+  version    INTEGER PRIMARY KEY,
+  name       TEXT NOT NULL,
+  applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    statements: List[str] = field(default_factory=list)
+    # 需要判断现有结构时使用，在 statements 之后执行
+    apply: Optional[Callable[[aiosqlite.Connection], Awaitable[None]]] = None
+
+    async def run(self, db: aiosqlite.Connection) -> None:
+        for sql in self.statements:
+            await db.execute(sql)
+        if self.apply is not None:
+            await self.apply(db)
+
+
+async def has_column(db: aiosqlite.Connection, table: str, column: str) -> bool:
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    return any(row[1] == column for row in await cursor.fetchall())
+
+
+# 与 src/db/maimai_schema.txt 一致的初始结构，已有数据库上执行不会有任何改动
+BASELINE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS user (
+      id        TEXT NOT NULL PRIMARY KEY,
+      additional_rating INTEGER,
+      nickname  TEXT,
+      plate     TEXT,
+      rating    INTEGER,
+      ts        DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS music (
+      id          INTEGER PRIMARY KEY,
+      title       TEXT NOT NULL,
+      type        TEXT NOT NULL,
+      artist      TEXT,
+      genre       TEXT,
+      bpm         INTEGER,
+      release_date TEXT,
+      version     TEXT,
+      is_new      INTEGER,
+      version_id  INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS chart (
+      id          INTEGER PRIMARY KEY AUTOINCREMENT,
+      music_id    INTEGER NOT NULL REFERENCES music(id),
+      diff_index  INTEGER NOT NULL,
+      ds          REAL NOT NULL,
+      level       TEXT,
+      notes       INTEGER,
+      tap         INTEGER,
+      hold        INTEGER,
+      slide       INTEGER,
+      touch       INTEGER,
+      break       INTEGER,
+      charter     TEXT,
+      UNIQUE(music_id, diff_index)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS best_record (
+      user_id     TEXT    NOT NULL REFERENCES user(id),
+      music_id    INTEGER NOT NULL,
+      diff_index  INTEGER NOT NULL,
+      achievements REAL   NOT NULL,
+      ra          INTEGER NOT NULL,
+      rank_id     INTEGER,
+      fc_id       INTEGER,
+      fs_id       INTEGER,
+      dxscore     INTEGER,
+      ts          DATETIME DEFAULT CURRENT_TIMESTAMP,
+      PRIMARY KEY (user_id, music_id, diff_index),
+      FOREIGN KEY (music_id, diff_index)
+        REFERENCES chart (music_id, diff_index)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS alias (
+      music_id   INTEGER NOT NULL,
+      alias_text TEXT    NOT NULL,
+      PRIMARY KEY(music_id, alias_text)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_alias_music ON alias(music_id)",
+    "CREATE INDEX IF NOT EXISTS idx_alias_text  ON alias(alias_text)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS alias_fts USING fts5(alias_text, music_id UNINDEXED)",
+    """
+    CREATE TABLE IF NOT EXISTS revived_music (
+      id    INTEGER NOT NULL REFERENCES music(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS chart_stats (
+      music_id   INTEGER    NOT NULL,
+      diff_index INTEGER    NOT NULL,
+      level      TEXT       NOT NULL,
+      cnt        INTEGER    NOT NULL,
+      fit_diff   REAL       NOT NULL,
+      avg        REAL       NOT NULL,
+      avg_dx     REAL       NOT NULL,
+      std_dev    REAL       NOT NULL,
+      PRIMARY KEY (music_id, diff_index),
+      FOREIGN KEY (music_id, diff_index) REFERENCES chart(music_id, diff_index)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS chart_rating_dist (
+      music_id     INTEGER    NOT NULL,
+      diff_index   INTEGER    NOT NULL,
+      rating_index INTEGER    NOT NULL,
+      count        INTEGER    NOT NULL,
+      PRIMARY KEY (music_id, diff_index, rating_index),
+      FOREIGN KEY (music_id, diff_index) REFERENCES chart_stats(music_id, diff_index)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS chart_fc_dist (
+      music_id   INTEGER    NOT NULL,
+      diff_index INTEGER    NOT NULL,
+      fc_index   INTEGER    NOT NULL,
+      count      INTEGER    NOT NULL,
+      PRIMARY KEY (music_id, diff_index, fc_index),
+      FOREIGN KEY (music_id, diff_index) REFERENCES chart_stats(music_id, diff_index)
+    )
+    """,
+]
+
+
+async def _add_rating_columns(db: aiosqlite.Connection) -> None:
+    # 预计算的 rating 列，由同步流程维护；加列后立即回填已有成绩
+    for column in ("ra_b50", "ra_b40", "ra_stats"):
+        if not await has_column(db, "best_record", column):
+            await db.execute(f"ALTER TABLE best_record ADD COLUMN {column} INTEGER")
+    await db.execute(RATING_UPDATE_SQL)
+
+
+async def _pack_chart_dist(db: aiosqlite.Connection) -> None:
+    # 分布改为 chart_stats 上的定长 BLOB 列：把两张逐桶一行的表转换过来后删除
+    for column in ("rank_dist", "fc_dist"):
+        if not await has_column(db, "chart_stats", column):
+            await db.execute(f"ALTER TABLE chart_stats ADD COLUMN {column} BLOB")
+
+    for table, index_column, column, size in (
+        ("chart_rating_dist", "rating_index", "rank_dist", RANK_DIST_SIZE),
+        ("chart_fc_dist", "fc_index", "fc_dist", FC_DIST_SIZE),
+    ):
+        cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        if not await cursor.fetchone():
+            continue
+        dists: Dict[Tuple[int, int], List[int]] = {}
+        cursor = await db.execute(f"SELECT music_id, diff_index, {index_column}, count FROM {table}")
+        for music_id, diff_index, i, count in await cursor.fetchall():
+            if 0 <= i < size:
+                dists.setdefault((music_id, diff_index), [0] * size)[i] = count
+        await db.executemany(
+            f"UPDATE chart_stats SET {column} = ? WHERE music_id = ? AND diff_index = ?",
+            [(pack_dist(counts, size), music_id, diff_index) for (music_id, diff_index), counts in dists.items()]
+        )
+        await db.execute(f"DROP TABLE {table}")
+
+
+# 外部内容 FTS5 表：只保存 trigram 索引，内容取自 music / chart 的 *_norm 列；
+# 触发器在规范化列实际变化时同步索引，曲库全量 upsert 时未变化的行不会改动索引
+SEARCH_FTS_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS music_fts USING fts5("
+    "title_norm, artist_norm, content='music', content_rowid='id', tokenize='trigram')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chart_fts USING fts5("
+    "charter_norm, content='chart', content_rowid='id', tokenize='trigram')",
+    """
+    CREATE TRIGGER IF NOT EXISTS music_fts_ai AFTER INSERT ON music BEGIN
+      INSERT INTO music_fts(rowid, title_norm, artist_norm) VALUES (new.id, new.title_norm, new.artist_norm);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS music_fts_ad AFTER DELETE ON music BEGIN
+      INSERT INTO music_fts(music_fts, rowid, title_norm, artist_norm) VALUES ('delete', old.id, old.title_norm, old.artist_norm);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS music_fts_au AFTER UPDATE OF title_norm, artist_norm ON music
+    WHEN old.title_norm IS NOT new.title_norm OR old.artist_norm IS NOT new.artist_norm BEGIN
+      INSERT INTO music_fts(music_fts, rowid, title_norm, artist_norm) VALUES ('delete', old.id, old.title_norm, old.artist_norm);
+      INSERT INTO music_fts(rowid, title_norm, artist_norm) VALUES (new.id, new.title_norm, new.artist_norm);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chart_fts_ai AFTER INSERT ON chart BEGIN
+      INSERT INTO chart_fts(rowid, charter_norm) VALUES (new.id, new.charter_norm);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chart_fts_ad AFTER DELETE ON chart BEGIN
+      INSERT INTO chart_fts(chart_fts, rowid, charter_norm) VALUES ('delete', old.id, old.charter_norm);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chart_fts_au AFTER UPDATE OF charter_norm ON chart
+    WHEN old.charter_norm IS NOT new.charter_norm BEGIN
+      INSERT INTO chart_fts(chart_fts, rowid, charter_norm) VALUES ('delete', old.id, old.charter_norm);
+      INSERT INTO chart_fts(rowid, charter_norm) VALUES (new.id, new.charter_norm);
+    END
+    """,
+]
+
+
+async def _add_search_columns(db: aiosqlite.Connection) -> None:
+    # 规范化列由同步流程写入；加列后立即回填，再建立 FTS 表并整体重建索引
+    from src.libraries.text_normalize import search_key
+
+    for table, column in (("music", "title_norm"), ("music", "artist_norm"), ("chart", "charter_norm")):
+        if not await has_column(db, table, column):
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT")
+
+    cursor = await db.execute("SELECT id, title, artist FROM music")
+    await db.executemany(
+        "UPDATE music SET title_norm = ?, artist_norm = ? WHERE id = ?",
+        [(search_key(title), search_key(artist), music_id) for music_id, title, artist in await cursor.fetchall()]
+    )
+    cursor = await db.execute("SELECT id, charter FROM chart")
+    await db.executemany(
+        "UPDATE chart SET charter_norm = ? WHERE id = ?",
+        [(search_key(charter), chart_id) for chart_id, charter in await cursor.fetchall()]
+    )
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_music_title_norm ON music(title_norm)")
+
+    for sql in SEARCH_FTS_SCHEMA:
+        await db.execute(sql)
+    await db.execute("INSERT INTO music_fts(music_fts) VALUES ('rebuild')")
+    await db.execute("INSERT INTO chart_fts(chart_fts) VALUES ('rebuild')")
+
+
+async def _seed_community_stats(db: aiosqlite.Connection) -> None:
+    # 只在表为空时从现有成绩（含冷存储中的成绩）统计一次，之后由 sync_user_records 增量更新
+    cursor = await db.execute("SELECT 1 FROM community_stats LIMIT 1")
+    if await cursor.fetchone():
+        return
+    aggregates: Dict[Tuple[int, int], RunningStats] = {}
+    cursor = await db.execute("SELECT music_id, diff_index, achievements, rank_id FROM best_record WHERE achievements IS NOT NULL")
+    for music_id, diff_index, achievements, rank_id in await cursor.fetchall():
+        aggregates.setdefault((music_id, diff_index), RunningStats()).add(achievements, rank_id)
+    columns = [ARCHIVE_COLUMNS.index(c) for c in ("music_id", "diff_index", "achievements", "rank_id")]
+    cursor = await db.execute("SELECT payload FROM best_record_archive")
+    for (payload,) in await cursor.fetchall():
+        for record in unpack_records(payload):
+            music_id, diff_index, achievements, rank_id = (record[i] for i in columns)
+            if achievements is not None:
+                aggregates.setdefault((music_id, diff_index), RunningStats()).add(achievements, rank_id)
+    await db.executemany(COMMUNITY_STATS_UPSERT_SQL, community_stats_params(aggregates))
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline", BASELINE_SCHEMA),
+    # b50 / b40：按玩家取成绩并按 ra 排序，索引覆盖 BestRecordList.filter 用到的 best_record 所有列
+    Migration(2, "best_record_user_ra_index", [
+        "CREATE INDEX IF NOT EXISTS idx_best_record_user_ra "
+        "ON best_record(user_id, ra DESC, music_id, diff_index, achievements, rank_id, fc_id, fs_id, dxscore)",
+    ]),
+    # 定数表 / 完成表：按 level（再按 ds）取谱面；牌子：按 version_id 取曲目
+    Migration(3, "level_and_version_indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_chart_level ON chart(level, ds, music_id, diff_index)",
+        "CREATE INDEX IF NOT EXISTS idx_music_version ON music(version_id, is_new)",
+    ]),
+    Migration(4, "best_record_rating_columns", apply=_add_rating_columns),
+    # b50 / b40 / 拟合 b50 的前 k 名直接按预计算列走索引；定数变化时按谱面重算需要 (music_id, diff_index) 索引。
+    # b50 不再按 ra 排序，002 的索引随之删除
+    Migration(5, "best_record_rating_indexes", [
+        "DROP INDEX IF EXISTS idx_best_record_user_ra",
+        "CREATE INDEX IF NOT EXISTS idx_best_record_user_b50 ON best_record(user_id, ra_b50 DESC, music_id)",
+        "CREATE INDEX IF NOT EXISTS idx_best_record_user_b40 ON best_record(user_id, ra_b40 DESC, music_id)",
+        "CREATE INDEX IF NOT EXISTS idx_best_record_user_stats ON best_record(user_id, ra_stats DESC, music_id)",
+        "CREATE INDEX IF NOT EXISTS idx_best_record_chart ON best_record(music_id, diff_index)",
+    ]),
+    # 曲库代数：曲库 / 统计每次同步都在同一个写事务中加一，曲库快照与缓存以此区分新旧
+    Migration(6, "catalog_generation", [
+        """
+        CREATE TABLE IF NOT EXISTS catalog_generation (
+          id         INTEGER PRIMARY KEY CHECK (id = 0),
+          generation INTEGER NOT NULL,
+          updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "INSERT OR IGNORE INTO catalog_generation(id, generation) VALUES (0, 0)",
+    ]),
+    # 评级 / FC 分布从逐桶一行的 chart_rating_dist / chart_fc_dist 改为 chart_stats 上的定长 int32 BLOB，
+    # 全量统计同步每谱面只写一行，读取时直接解码为 NumPy 数组
+    Migration(7, "packed_chart_dist", apply=_pack_chart_dist),
+    # 冷存储：长期不活跃玩家的成绩整体压缩为一行，移出 best_record（见 DatabaseAPI.archive_inactive_users）
+    Migration(8, "best_record_archive", [
+        """
+        CREATE TABLE IF NOT EXISTS best_record_archive (
+          user_id      TEXT    NOT NULL PRIMARY KEY REFERENCES user(id),
+          record_count INTEGER NOT NULL,
+          payload      BLOB    NOT NULL,
+          archived_at  DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    # 查歌 / 谱师查歌 / 曲师查歌：标题、艺术家、谱师的规范化列（NFKC、小写、简繁日字形折叠）与 trigram 索引，
+    # 子串搜索不再逐行 LOWER(...) LIKE；按规范化标题精确匹配走普通索引
+    Migration(9, "search_columns", apply=_add_search_columns),
+    # 本地玩家成绩的在线统计（见 RunningStats），每次同步成绩时按变更集增量更新，用于社区拟合定数
+    Migration(10, "community_stats", [
+        """
+        CREATE TABLE IF NOT EXISTS community_stats (
+          music_id   INTEGER NOT NULL,
+          diff_index INTEGER NOT NULL,
+          cnt        INTEGER NOT NULL,
+          mean       REAL    NOT NULL,
+          m2         REAL    NOT NULL,
+          rank_dist  BLOB,
+          PRIMARY KEY (music_id, diff_index)
+        )
+        """,
+    ], apply=_seed_community_stats),
+    # 成绩历史：每次同步追加一行（见 pack_history），按 (user_id, ts) 范围查询 rating 趋势
+    Migration(11, "score_history", [
+        """
+        CREATE TABLE IF NOT EXISTS score_history (
+          user_id      TEXT    NOT NULL,
+          ts           INTEGER NOT NULL,
+          rating       INTEGER,
+          record_count INTEGER NOT NULL,
+          payload      BLOB    NOT NULL,
+          PRIMARY KEY (user_id, ts)
+        )
+        """,
+    ]),
+]
+
+
+async def current_version(db: aiosqlite.Connection) -> int:
+    cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'")
+    if not await cursor.fetchone():
+        return 0
+    cursor = await db.execute("SELECT MAX(version) FROM schema_version")
+    row = await cursor.fetchone()
+    return row[0] or 0
+
+
+async def pending_migrations(path: Path) -> List[Migration]:
+    """
+    以只读方式打开数据库，返回尚未执行的迁移；文件不存在时全部待执行，不会创建文件
+    """
+    if not path.exists():
+        return list(MIGRATIONS)
+    async with aiosqlite.connect(path.resolve().as_uri() + "?mode=ro", uri=True) as db:
+        version = await current_version(db)
+    return [m for m in MIGRATIONS if m.version > version]
+
+
+async def migrate(api: DatabaseAPI, dry_run: bool = False) -> List[Migration]:
+    """
+    执行所有未执行的迁移，返回本次执行（dry_run 时为将要执行）的迁移列表
+
+    dry_run 时只读打开数据库文件，不经过连接池与写任务，数据库不会有任何改动
+    """
+    if dry_run:
+        pending = await pending_migrations(api.pool.path)
+        for m in pending:
+            print(f"[Info] 待执行迁移 {m.version:03d}_{m.name}")
+            for sql in m.statements:
+                print(" ".join(sql.split()))
+            if m.apply is not None:
+                print(f"-- {m.apply.__name__}()")
+        return pending
+
+    async with api.connection() as db:
+        version = await current_version(db)
+    pending = [m for m in MIGRATIONS if m.version > version]
+    for m in pending:
+        async def _apply(db, m=m):
+            await db.execute(SCHEMA_VERSION_SQL)
+            # 其他进程可能已经执行过同一个迁移
+            cursor = await db.execute("SELECT 1 FROM schema_version WHERE version = ?", (m.version,))
+            if await cursor.fetchone():
+                return
+            await m.run(db)
+            await db.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (m.version, m.name))
+
+        start = time.perf_counter()
+        await api.write(_apply)
+        print(f"[Info] 迁移 {m.version:03d}_{m.name} 已执行，用时 {time.perf_counter() - start:.3f}s")
+    return pending
+
+
+# —— 查询计划校验 —— #
+
+_BEST_RECORD_SELECT = """
+SELECT br.user_id AS user_id, br.music_id AS music_id, br.diff_index AS diff_index,
+       br.achievements, br.ra, br.rank_id, br.fc_id, br.fs_id, br.dxscore,
+       br.ra_b50, br.ra_b40, br.ra_stats,
+       c.ds AS ds, cs.fit_diff AS fit_diff
+FROM best_record AS br
+JOIN music AS m ON br.music_id = m.id
+JOIN chart AS c ON br.music_id = c.music_id AND br.diff_index = c.diff_index
+LEFT JOIN chart_stats AS cs ON br.music_id = cs.music_id AND br.diff_index = cs.diff_index
+WHERE 1=1
+"""
+
+# (名称, 与线上查询同构的 SQL, 计划中必须出现的片段, 计划中不能出现的片段)
+PLAN_CHECKS: List[Tuple[str, str, List[str], List[str]]] = [
+    (
+        "b50",
+        _BEST_RECORD_SELECT + " AND br.user_id = ? AND m.is_new = ? ORDER BY ra_b50 DESC, music_id ASC LIMIT ? OFFSET ?",
+        ["INDEX idx_best_record_user_b50 (user_id=?)"],
+        ["TEMP B-TREE"],
+    ),
+    (
+        "b40",
+        _BEST_RECORD_SELECT + " AND br.user_id = ? AND m.is_new = ? ORDER BY ra_b40 DESC, music_id ASC LIMIT ? OFFSET ?",
+        ["INDEX idx_best_record_user_b40 (user_id=?)"],
+        ["TEMP B-TREE"],
+    ),
+    (
+        "stats_b50",
+        _BEST_RECORD_SELECT + " AND br.user_id = ? AND m.is_new = ? ORDER BY ra_stats DESC, music_id ASC LIMIT ? OFFSET ?",
+        ["INDEX idx_best_record_user_stats (user_id=?)"],
+        ["TEMP B-TREE"],
+    ),
+    (
+        "rating_recompute",
+        RATING_UPDATE_SQL + " AND best_record.music_id = ? AND best_record.diff_index = ?",
+        ["idx_best_record_chart (music_id=? AND diff_index=?)"],
+        ["SCAN"],
+    ),
+    (
+        "level",
+        _BEST_RECORD_SELECT + " AND br.user_id = ? AND c.level IN (?) ORDER BY ds DESC",
+        ["COVERING INDEX idx_chart_level (level=?)", "sqlite_autoindex_best_record_1 (user_id=? AND music_id=? AND diff_index=?)"],
+        ["SCAN"],
+    ),
+    (
+        "plate",
+        "SELECT m.id AS music_id, c.diff_index FROM music AS m JOIN chart AS c ON m.id = c.music_id "
+        "WHERE 1=1 AND m.version_id IN (?, ?) AND c.diff_index IN (?, ?) ORDER BY c.ds DESC, m.id",
+        ["idx_music_version (version_id=?)"],
+        ["SCAN"],
+    ),
+    (
+        "rating_history",
+        "SELECT ts, rating FROM score_history WHERE user_id = ? AND ts >= ? AND ts <= ? ORDER BY ts",
+        ["sqlite_autoindex_score_history_1 (user_id=? AND ts>? AND ts<?)"],
+        ["TEMP B-TREE"],
+    ),
+    (
+        "level_progress",
+        BEST_RECORD_BY_KEYS_SQL,
+        ["sqlite_autoindex_best_record_1 (user_id=? AND music_id=? AND diff_index=?)"],
+        ["SCAN br"],
+    ),
+]
+
+
+async def explain(db: aiosqlite.Connection, sql: str) -> List[str]:
+    params = [1] * sql.count("?")
+    cursor = await db.execute("EXPLAIN QUERY PLAN " + sql, params)
+    return [row[3] for row in await cursor.fetchall()]
+
+
+async def verify(api: DatabaseAPI) -> List[str]:
+    """
+    用 EXPLAIN QUERY PLAN 确认热点查询命中了迁移建立的索引，不符合时抛出 AssertionError
+    """
+    lines = []
+    async with api.connection() as db:
+        for name, sql, expected, forbidden in PLAN_CHECKS:
+            plan = await explain(db, sql)
+            text = "\n".join(plan)
+            for fragment in expected:
+                assert fragment in text, f"{name}: 查询计划中缺少 {fragment!r}:\n{text}"
+            for fragment in forbidden:
+                assert fragment not in text, f"{name}: 查询计划中出现了 {fragment!r}:\n{text}"
+            lines.append(f"{name}: " + " | ".join(plan))
+    return lines
+
+
+async def main(args: List[str]) -> None:
+    dry_run = "--dry-run" in args
+    check = "--verify" in args
+    paths = [a for a in args if not a.startswith("--")]
+    api = DatabaseAPI(path=Path(paths[0]) if paths else database_path)
+    if not dry_run:
+        # 启动写任务会把数据库切换到 WAL 模式（持久化到文件中），dry_run 时不启动
+        await api.start()
+    try:
+        pending = await migrate(api, dry_run=dry_run)
+        if not pending:
+            print("[Info] 数据库结构已是最新")
+        if check and not dry_run:
+            for line in await verify(api):
+                print(line)
+    finally:
+        await api.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
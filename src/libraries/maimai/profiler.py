@@ -0,0 +1,244 @@
+"""
+SQL 查询分析
+
+连接池与写入任务建立的连接都经过 ProfiledConnection 包装：每条语句按指纹（去掉字面量、
+合并空白与 IN 列表后的 SQL）统计耗时。耗时从 execute 开始，到第一次取结果结束
+（不返回结果的语句在 execute 返回时结束）；流式读取时后续批次的等待时间不计入。
+
+超过 SLOW_QUERY_MS 的语句打印到日志，并附上 EXPLAIN QUERY PLAN（同一指纹在
+EXPLAIN_COOLDOWN 秒内只取一次）。每个指纹保留最近 WINDOW_SIZE 次耗时，用于计算 p50 / p95 / p99。
+"""
+
+import re
+import time
+from collections import deque
+from functools import lru_cache
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+import aiosqlite
+
+# 是否统计语句耗时
+PROFILE_QUERIES = True
+# 慢查询阈值（毫秒）
+SLOW_QUERY_MS = 100.0
+# 每个指纹保留的最近耗时个数
+WINDOW_SIZE = 512
+# 同一指纹两次 EXPLAIN 之间的最短间隔（秒）
+EXPLAIN_COOLDOWN = 600.0
+
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql: str) -> str:
+    """
+    把 SQL 规范化为指纹：字面量替换为 ?，IN (?, ?, ...) 合并为 (?+)，空白合并为一个空格
+    绝大多数语句是固定的字符串，结果按原 SQL 缓存
+    """
+    sql = _COMMENT_RE.sub(" ", sql)
+    sql = _STRING_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("(?+)", sql)
+    return _SPACE_RE.sub(" ", sql).strip().rstrip(";")
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """
+    最近秩法的百分位数，values 为空时为 0；性能测试（db_benchmark）也使用这个函数
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+@dataclass
+class QueryStats:
+    fingerprint: str
+    count: int = 0
+    total: float = 0.0       # 累计耗时（秒）
+    max: float = 0.0
+    slow: int = 0            # 超过阈值的次数
+    recent: Deque[float] = field(default_factory=lambda: deque(maxlen=WINDOW_SIZE))
+    plan: Optional[List[str]] = None
+    explained_at: float = 0.0
+
+    def percentile(self, p: float) -> float:
+        return percentile(self.recent, p)
+
+    def summary(self) -> str:
+        ms = [x * 1000 for x in self.recent]
+        return (f"n={self.count} total={self.total * 1000:.0f}ms "
+                f"p50={percentile(ms, 50):.2f}ms p95={percentile(ms, 95):.2f}ms p99={percentile(ms, 99):.2f}ms "
+                f"max={self.max * 1000:.2f}ms slow={self.slow}")
+
+
+class QueryProfiler:
+    def __init__(self, slow_query_ms: float = SLOW_QUERY_MS, explain_cooldown: float = EXPLAIN_COOLDOWN):
+        self.slow_query_ms = slow_query_ms
+        self.explain_cooldown = explain_cooldown
+        self.stats: Dict[str, QueryStats] = {}
+
+    async def record(self, db: aiosqlite.Connection, sql: str, params: Any, elapsed: float) -> None:
+        key = fingerprint(sql)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = QueryStats(key)
+        stats.count += 1
+        stats.total += elapsed
+        stats.max = max(stats.max, elapsed)
+        stats.recent.append(elapsed)
+        if elapsed * 1000 < self.slow_query_ms:
+            return
+
+        stats.slow += 1
+        now = time.monotonic()
+        if stats.plan is None or now - stats.explained_at >= self.explain_cooldown:
+            stats.explained_at = now
+            stats.plan = await self.explain(db, sql, params)
+        print(f"[Info] 慢查询 {elapsed * 1000:.1f}ms：{key}")
+        for line in stats.plan or []:
+            print(f"[Info]   {line}")
+
+    @staticmethod
+    async def explain(db: aiosqlite.Connection, sql: str, params: Any) -> Optional[List[str]]:
+        """
+        用原语句与参数取 EXPLAIN QUERY PLAN；语句不能 EXPLAIN（如 PRAGMA、BEGIN）时返回 None
+        """
+        if not sql.lstrip().upper().startswith(("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")):
+            return None
+        try:
+            cursor = await db.execute("EXPLAIN QUERY PLAN " + sql, params if params is not None else ())
+            rows = await cursor.fetchall()
+            await cursor.close()
+        except Exception as e:
+            return [f"EXPLAIN 失败：{e!r}"]
+        return [row[3] for row in rows]
+
+    def report(self, top: int = 10, sort: str = "total") -> List[str]:
+        """
+        按累计耗时（sort="total"）、p95（"p95"）或慢查询次数（"slow"）取前 top 个指纹
+        """
+        keys = {
+            "total": lambda s: s.total,
+            "p95": lambda s: s.percentile(95),
+            "slow": lambda s: s.slow,
+        }
+        if sort not in keys:
+            raise ValueError(f"sort must be one of {list(keys)}.")
+        ranked = sorted(self.stats.values(), key=keys[sort], reverse=True)[:top]
+        lines = []
+        for i, stats in enumerate(ranked, 1):
+            lines.append(f"{i}. {stats.summary()}")
+            lines.append(f"   {stats.fingerprint[:300]}")
+            if stats.plan:
+                lines.append("   " + " | ".join(stats.plan))
+        return lines
+
+    def reset(self) -> None:
+        self.stats.clear()
+
+
+query_profiler = QueryProfiler()
+
+
+class ProfiledCursor:
+    """
+    包装 aiosqlite.Cursor：第一次取结果时记录本条语句的耗时，其余行为与原游标相同
+    """
+
+    def __init__(self, cursor: aiosqlite.Cursor, db: aiosqlite.Connection, profiler: QueryProfiler,
+                 sql: str, params: Any, start: float):
+        self._cursor = cursor
+        self._db = db
+        self._profiler = profiler
+        self._sql = sql
+        self._params = params
+        self._start: Optional[float] = start
+
+    async def _fetched(self) -> None:
+        if self._start is not None:
+            elapsed = time.perf_counter() - self._start
+            self._start = None
+            await self._profiler.record(self._db, self._sql, self._params, elapsed)
+
+    async def fetchone(self):
+        row = await self._cursor.fetchone()
+        await self._fetched()
+        return row
+
+    async def fetchmany(self, size: Optional[int] = None):
+        rows = await (self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany())
+        await self._fetched()
+        return rows
+
+    async def fetchall(self):
+        rows = await self._cursor.fetchall()
+        await self._fetched()
+        return rows
+
+    async def close(self) -> None:
+        await self._fetched()
+        await self._cursor.close()
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        while True:
+            rows = await self.fetchmany(self._cursor.arraysize)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+
+    def __getattr__(self, name: str):
+        return getattr(self._cursor, name)
+
+
+class ProfiledConnection:
+    """
+    包装 aiosqlite.Connection，统计 execute / executemany 的耗时；其余属性与方法原样转发
+    """
+
+    def __init__(self, conn: aiosqlite.Connection, profiler: QueryProfiler = query_profiler):
+        self._conn = conn
+        self._profiler = profiler
+
+    async def execute(self, sql: str, parameters: Any = None):
+        start = time.perf_counter()
+        cursor = await (self._conn.execute(sql, parameters) if parameters is not None else self._conn.execute(sql))
+        if cursor.description is None:
+            # 不返回结果的语句（写入、DDL、大部分 PRAGMA）在 execute 时已执行完
+            await self._profiler.record(self._conn, sql, parameters, time.perf_counter() - start)
+            return cursor
+        return ProfiledCursor(cursor, self._conn, self._profiler, sql, parameters, start)
+
+    async def executemany(self, sql: str, parameters):
+        parameters = parameters if isinstance(parameters, (list, tuple)) else list(parameters)
+        start = time.perf_counter()
+        cursor = await self._conn.executemany(sql, parameters)
+        await self._profiler.record(self._conn, sql, parameters[0] if parameters else None, time.perf_counter() - start)
+        return cursor
+
+    def __getattr__(self, name: str):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name in ("_conn", "_profiler"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+
+def profiled(conn: aiosqlite.Connection) -> aiosqlite.Connection:
+    """
+    PROFILE_QUERIES 开启时返回包装后的连接，否则原样返回
+    """
+    return ProfiledConnection(conn) if PROFILE_QUERIES else conn
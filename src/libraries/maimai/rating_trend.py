@@ -0,0 +1,69 @@
+"""
+rating 趋势图
+
+数据来自 score_history（每次同步一个 rating 快照）。matplotlib 绘图是同步的 CPU 操作，
+放到线程池中执行，不阻塞事件循环；使用 Figure 对象而不是 pyplot，多线程绘图互不影响。
+图片按 (玩家, 最后一个快照的时间) 缓存，玩家没有新的同步时直接返回缓存的图片。
+"""
+
+import asyncio
+import io
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from matplotlib.dates import AutoDateLocator, ConciseDateFormatter
+from matplotlib.figure import Figure
+from PIL import Image
+
+from src.libraries.maimai.database import DatabaseAPI, database_api
+from src.libraries.maimai.result_cache import ResultCache
+
+# 最多缓存的趋势图张数
+TREND_CACHE_SIZE = 64
+
+trend_cache = ResultCache(max_size=TREND_CACHE_SIZE, max_weight=TREND_CACHE_SIZE)
+
+
+def render_trend(points: List[Tuple[datetime, int]], title: str = "") -> Image.Image:
+    """
+    把 (时间, rating) 序列画成折线图
+    """
+    times = [ts for ts, _ in points]
+    ratings = [rating for _, rating in points]
+
+    fig = Figure(figsize=(8, 4), dpi=120)
+    ax = fig.add_subplot()
+    ax.step(times, ratings, where="post", color="#3b7dd8", linewidth=2)
+    ax.scatter(times, ratings, color="#3b7dd8", s=12, zorder=3)
+    ax.annotate(str(ratings[-1]), (times[-1], ratings[-1]), textcoords="offset points", xytext=(0, 8), ha="center")
+    locator = AutoDateLocator()
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(ConciseDateFormatter(locator))
+    ax.set_ylabel("DX Rating")
+    if title:
+        ax.set_title(title)
+    ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    buf.seek(0)
+    img = Image.open(buf)
+    # 在线程池中完成解码，回到事件循环后不再有耗时操作
+    img.load()
+    return img
+
+
+async def rating_trend(user_id: str, since: Optional[datetime] = None, api: DatabaseAPI = database_api) -> Optional[Image.Image]:
+    """
+    返回玩家的 rating 趋势图，快照少于两个时返回 None
+    """
+    points = await api.rating_history(user_id, since=since)
+    if len(points) < 2:
+        return None
+    key = (user_id.lower(), since, points[-1][0])
+    img = trend_cache.get(key)
+    if img is None:
+        img = await asyncio.get_running_loop().run_in_executor(None, render_trend, points, user_id)
+        trend_cache.put(key, img)
+    return img.copy()
@@ -0,0 +1,89 @@
+"""
+查询结果缓存
+
+MusicList.filter / count 的结果按规范化后的参数与曲库代数缓存。缓存的是筛选结果本身
+（谱面行号、计数、投影行），均为只读；Music / MusicChart 对象仍由每个调用方各自构造，
+调用方修改拿到的对象不会影响缓存，也不会影响其他调用方。
+
+缓存同时按条目数与总权重（缓存的谱面行数）限制大小，超出时淘汰最久未使用的条目；
+曲库快照替换时整体清空。
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# 最多缓存的条目数
+RESULT_CACHE_SIZE = 256
+# 所有条目的权重（谱面行数）之和上限
+RESULT_CACHE_WEIGHT = 200_000
+
+
+def freeze(value: Any) -> Hashable:
+    """
+    把参数转为可哈希的规范形式：list / tuple 转为 tuple，dict 按键排序
+    """
+    if isinstance(value, dict):
+        return tuple((k, freeze(v)) for k, v in sorted(value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+class ResultCache:
+    """
+    按条目数与权重限制大小的 LRU 缓存
+
+    - get(key) 未命中时返回 None，命中时把条目移到最近使用的一端
+    - put(key, value, weight) 写入后淘汰最久未使用的条目，直到满足两个上限；
+      单个条目的权重超过上限时不缓存
+    - clear() 清空全部条目（曲库快照替换时调用）
+    """
+
+    def __init__(self, max_size: int = RESULT_CACHE_SIZE, max_weight: int = RESULT_CACHE_WEIGHT):
+        self.max_size = max_size
+        self.max_weight = max_weight
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self.weight = 0
+
+        self.metrics: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,       # 因超出上限被淘汰的条目数
+            "invalidations": 0,   # clear 的次数
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.metrics["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.metrics["hits"] += 1
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any, weight: int = 1) -> None:
+        if weight > self.max_weight:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.weight -= old[1]
+        self._entries[key] = (value, weight)
+        self.weight += weight
+        while len(self._entries) > self.max_size or self.weight > self.max_weight:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.weight -= evicted
+            self.metrics["evictions"] += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.weight = 0
+        self.metrics["invalidations"] += 1
+
+    def summary(self) -> str:
+        lookups = self.metrics["hits"] + self.metrics["misses"]
+        rate = self.metrics["hits"] / lookups * 100 if lookups else 0.0
+        return (f"{len(self)} 条（{self.weight} 行），命中 {self.metrics['hits']} / 未命中 {self.metrics['misses']}"
+                f"（{rate:.1f}%），淘汰 {self.metrics['evictions']}，清空 {self.metrics['invalidations']}")
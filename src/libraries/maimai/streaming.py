@@ -0,0 +1,100 @@
+"""
+iter_filter 流的常用消费方式
+
+这些函数都只保留所需的少量元素，不把整个结果读入内存；
+返回前（包括提前结束或出错时）会关闭传入的异步生成器，及时归还其占用的数据库连接。
+"""
+
+import heapq
+import random
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+async def _close(stream: AsyncIterator[Any]) -> None:
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+async def take(stream: AsyncIterator[T], n: int) -> List[T]:
+    """
+    取前 n 个元素，取满后立即停止读取
+    """
+    result: List[T] = []
+    try:
+        if n <= 0:
+            return result
+        async for item in stream:
+            result.append(item)
+            if len(result) >= n:
+                break
+        return result
+    finally:
+        await _close(stream)
+
+
+async def count(stream: AsyncIterator[Any], limit: Optional[int] = None) -> int:
+    """
+    统计元素个数；指定 limit 时数到 limit 即停止（用于“是否超过 limit 条”的判断）
+    """
+    n = 0
+    try:
+        async for _ in stream:
+            n += 1
+            if limit is not None and n >= limit:
+                break
+        return n
+    finally:
+        await _close(stream)
+
+
+async def top_k(stream: AsyncIterator[T], k: int, key: Callable[[T], Any]) -> List[T]:
+    """
+    按 key 从大到小取前 k 个元素，只在堆中保留 k 个；key 相同时先出现的排在前面
+    """
+    heap: List[Tuple[Any, int, T]] = []
+    try:
+        if k <= 0:
+            return []
+        async for i, item in _enumerate(stream):
+            entry = (key(item), -i, item)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+        return [item for _, _, item in sorted(heap, key=lambda e: e[:2], reverse=True)]
+    finally:
+        await _close(stream)
+
+
+async def sample(stream: AsyncIterator[T], n: int, rng: Optional[random.Random] = None) -> Tuple[List[T], int]:
+    """
+    蓄水池抽样：从流中等概率地不放回抽取至多 n 个元素
+    返回 (抽到的元素, 流中的元素总数)
+    """
+    rng = rng or random
+    reservoir: List[T] = []
+    seen = 0
+    try:
+        async for item in stream:
+            seen += 1
+            if len(reservoir) < n:
+                reservoir.append(item)
+            else:
+                j = rng.randrange(seen)
+                if j < n:
+                    reservoir[j] = item
+        # 打乱顺序，与 random.sample 的返回一致
+        rng.shuffle(reservoir)
+        return reservoir, seen
+    finally:
+        await _close(stream)
+
+
+async def _enumerate(stream: AsyncIterator[T]) -> AsyncIterator[Tuple[int, T]]:
+    i = 0
+    async for item in stream:
+        yield i, item
+        i += 1
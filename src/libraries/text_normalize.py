@@ -0,0 +1,91 @@
+"""
+搜索用的文本规范化
+
+只依赖标准库，OpenCC 在第一次做字形转换时才导入；
+数据库层、迁移与曲库查询都从这里取 search_key，不必加载 tool_range 中的其余工具。
+"""
+
+import unicodedata
+from functools import lru_cache
+from typing import Optional
+
+
+class OpenCCConverter:
+    """
+    OpenCC 转换器，用于简体中文、繁体中文和日语汉字之间的转换。
+    """
+
+    def __init__(self):
+        from opencc import OpenCC
+
+        self.converter_s2t = OpenCC('s2t')
+        self.converter_t2s = OpenCC('t2s')
+        self.converter_t2jp = OpenCC('t2jp')
+        self.converter_jp2t = OpenCC('jp2t')
+
+    def convert_cn2jp(self, text: str) -> str:
+        """
+            将简体中文转换为日语汉字（常用汉字）。
+            使用 OpenCC 进行转换。
+        """
+
+        # unicode 规范化
+        text = unicodedata.normalize("NFC", text)
+
+        # openCC 转换
+
+        text = self.converter_s2t.convert(text)
+        text = self.converter_t2jp.convert(text)
+
+        return text
+
+    def convert_jp2cn(self, text: str) -> str:
+        """
+            将日语汉字转换为简体中文。
+            使用 OpenCC 进行转换。
+        """
+
+        # unicode 规范化
+        text = unicodedata.normalize("NFC", text)
+
+        text = self.converter_jp2t.convert(text)
+        text = self.converter_t2s.convert(text)
+
+        return text
+
+    def is_equal_kanji(self, text1: str, text2: str) -> bool:
+        """
+        判断两个字符串是否为相同的日语汉字。
+        使用 Unicode 规范化和 OpenCC 转换。
+        """
+        # 规范化
+        text1 = unicodedata.normalize("NFC", text1)
+        text2 = unicodedata.normalize("NFC", text2)
+
+        # 转换为简体中文
+        text1_cn = self.convert_jp2cn(text1)
+        text2_cn = self.convert_jp2cn(text2)
+
+        return text1_cn == text2_cn
+
+
+@lru_cache(maxsize=None)
+def get_opencc_converter() -> OpenCCConverter:
+    """
+    进程内共用的转换器，第一次调用时创建
+    """
+    return OpenCCConverter()
+
+
+@lru_cache(maxsize=8192)
+def search_key(text: Optional[str]) -> str:
+    """
+    搜索用的规范形式：NFKC 规范化、转小写，再把简体 / 繁体 / 日语汉字折叠为同一字形
+    （先转为日语汉字再转回简体）。
+    曲库同步时写入 *_norm 列与查询时使用同一函数，两侧的字形差异都会被抹平。
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text).lower()
+    converter = get_opencc_converter()
+    return converter.convert_jp2cn(converter.convert_cn2jp(text))
@@ -6,10 +6,11 @@ import asyncio
 import pickle
 import unicodedata
 import heapq
-from opencc import OpenCC
 from pathlib import Path
 from typing import Union, List, Tuple, Optional, Any
 
+from src.libraries.text_normalize import OpenCCConverter, get_opencc_converter, search_key
+
 def hash(qq) -> int:
     s = datetime.datetime.now().strftime("%y%m%d")+str(qq)
     return int(hashlib.sha256(s.encode()).hexdigest(),16)
@@ -181,63 +182,7 @@ async def offlineinit() -> tuple[bool, str]:
     overall_success = success_count == len(urls)
     return overall_success, message
 
-class OpenCCConverter:
-    """
-    OpenCC 转换器，用于简体中文、繁体中文和日语汉字之间的转换。
-    """
-    
-    def __init__(self):
-        self.converter_s2t = OpenCC('s2t')
-        self.converter_t2s = OpenCC('t2s')
-        self.converter_t2jp = OpenCC('t2jp')
-        self.converter_jp2t = OpenCC('jp2t')
-
-    def convert_cn2jp(self, text: str) -> str:
-        """
-            将简体中文转换为日语汉字（常用汉字）。
-            使用 OpenCC 进行转换。
-        """
-        
-        # unicode 规范化
-        text = unicodedata.normalize("NFC", text)
-
-        # openCC 转换
-
-        text = self.converter_s2t.convert(text)
-        text = self.converter_t2jp.convert(text)
-
-        return text
-
-    def convert_jp2cn(self, text: str) -> str:
-        """
-            将日语汉字转换为简体中文。
-            使用 OpenCC 进行转换。
-        """
-        
-        # unicode 规范化
-        text = unicodedata.normalize("NFC", text)
-
-        text = self.converter_jp2t.convert(text)
-        text = self.converter_t2s.convert(text)
-
-        return text
-
-    def is_equal_kanji(self, text1: str, text2: str) -> bool:
-        """
-        判断两个字符串是否为相同的日语汉字。
-        使用 Unicode 规范化和 OpenCC 转换。
-        """
-        # 规范化
-        text1 = unicodedata.normalize("NFC", text1)
-        text2 = unicodedata.normalize("NFC", text2)
-
-        # 转换为简体中文
-        text1_cn = self.convert_jp2cn(text1)
-        text2_cn = self.convert_jp2cn(text2)
-
-        return text1_cn == text2_cn
-    
-opencc_converter = OpenCCConverter()
+opencc_converter = get_opencc_converter()
 
 
 def get_nickname_from_event(event_str: str) -> str:
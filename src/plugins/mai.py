@@ -4,12 +4,29 @@ from nonebot import on_command, on_regex, logger, get_driver
 from nonebot.adapters.qq import Event, Bot, Message, MessageSegment
 from nonebot.params import CommandArg, Arg
 
-from src.libraries.maimai.maimaidx_music import matcher
+from src.libraries.maimai.maimaidx_music import matcher, total_list
+from src.libraries.maimai.database import database_api
+from src.libraries.maimai.migrations import migrate
+from src.libraries.maimai.maintenance import maintenance_scheduler
 
 driver = get_driver()
 
 @driver.on_startup
 async def _():
+    await database_api.start()
+    logger.info('maimai数据库写入任务已启动')
+    applied = await migrate(database_api)
+    logger.info(f'maimai数据库结构迁移完成，本次执行 {len(applied)} 个迁移')
+    await total_list.load_catalog()
+    logger.info('maimai曲库快照加载完成')
+    maintenance_scheduler.start()
+    logger.info('maimai数据库定期维护已启动')
     # logger.info('正在加载maimai别名匹配器...')
     # matcher.alias_build_index()
-    logger.info('maimai别名匹配器加载完成')
\ No newline at end of file
+    logger.info('maimai别名匹配器加载完成')
+
+@driver.on_shutdown
+async def _():
+    await maintenance_scheduler.stop()
+    await database_api.close()
+    logger.info('maimai数据库连接池已关闭')
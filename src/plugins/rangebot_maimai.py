@@ -3,6 +3,7 @@ from nonebot.params import CommandArg, Arg, RegexStr, ArgPlainText, RegexGroup
 from nonebot.adapters.qq import Bot, Event, Message, MessageSegment, C2CMessageCreateEvent, GroupAtMessageCreateEvent
 from nonebot.matcher import Matcher
 from nonebot.rule import to_me
+from nonebot.permission import SUPERUSER
 from nonebot.exception import FinishedException
 
 from src.libraries.tool_range import offlineinit, opencc_converter
@@ -16,13 +17,18 @@ from src.libraries.maimai.maimai_info import draw_new_infos
 from src.libraries.maimai.maimaidx_musicinfo import song_MessageSegment2, song_MessageSegment, chart_MessageSegment
 from src.libraries.maimai.static_lists_and_dicts import pnconvert, platename_to_file, level_index_to_file, ptv, version_list, version_abbr_list, version_abbr_str
 from src.libraries.maimai.find_cover import find_cover_id
+from src.libraries.maimai import streaming
+from src.libraries.maimai.profiler import query_profiler
+from src.libraries.maimai.rating_trend import rating_trend
+from src.libraries.maimai.level_progress import level_progress, level_ds_range, level_records
+from src.libraries.maimai.dataloader import request_scope
 
 from src.libraries.sendpics import pic_to_message_segment
 from src.libraries.query import query_user
 from src.libraries.april_fool import is_April_1st, kun_jin_kao
 
 from PIL import Image, ImageDraw, ImageFont
-import re,random,os,json
+import re,random,os,json,asyncio
 from pathlib import Path
 from typing import List, Dict, Union, Optional, Tuple
 
@@ -92,24 +98,26 @@ async def _(event: Event, regex_res: Tuple = RegexGroup()):
     name = regex_res[0].strip()
     if name == "":
         return
-    res = await total_list.filter(title_search=name, pagination=(0, 50), order=["+music_id"])
+    # 同一次处理内的多次查询使用同一代曲库快照
+    with total_list.pinned():
+        res = await total_list.filter(title_search=name, pagination=(0, 50), order=["+music_id"])
     
-    if res["music_count"] == 0:
-        alias_music = await total_list.filt_by_name(name)
-        if alias_music is None:
-            await search_music.finish("没有找到这样的乐曲")
+        if res["music_count"] == 0:
+            alias_music = await total_list.filt_by_name(name)
+            if alias_music is None:
+                await search_music.finish("没有找到这样的乐曲")
+            else:
+                await search_music.finish(MessageSegment.text("您要找的是不是：\n") + await song_MessageSegment2(alias_music))
+        elif res["music_count"] == 1:
+            # 只有一首歌
+            music = res["music_list"][0]
+            await search_music.finish(await song_MessageSegment2(music))
         else:
-            await search_music.finish(MessageSegment.text("您要找的是不是：\n") + await song_MessageSegment2(alias_music))
-    elif res["music_count"] == 1:
-        # 只有一首歌
-        music = res["music_list"][0]
-        await search_music.finish(await song_MessageSegment2(music))
-    else:
-        music_list = res["music_list"]
-        s = "找到以下乐曲（最多50首）：\n"
-        for music in music_list:
-            s += f"{music.id}. {music.title}\n"
-        await search_music.finish(pic_to_message_segment(text_to_image(s), args={"fool": False, "shift_row": 0}))
+            music_list = res["music_list"]
+            s = "找到以下乐曲（最多50首）：\n"
+            for music in music_list:
+                s += f"{music.id}. {music.title}\n"
+            await search_music.finish(pic_to_message_segment(text_to_image(s), args={"fool": False, "shift_row": 0}))
 
 
 query_chart = on_regex(
@@ -253,6 +261,27 @@ async def _(event: Event, message: Message = CommandArg()):
     else:
         await update_music_data.finish("更新成功")
 
+query_stats = on_command("慢查询", rule=to_me(), permission=SUPERUSER, priority = DEFAULT_PRIORITY, block = True)
+@query_stats.handle()
+async def _(event: Event, message: Message = CommandArg()):
+    """
+        输入格式:
+        慢查询 <排序(可选): total / p95 / slow>
+        慢查询 重置
+    """
+    arg = str(message).strip()
+    if arg == "重置":
+        query_profiler.reset()
+        await query_stats.finish("SQL 统计已清空")
+    sort = arg or "total"
+    if sort not in ("total", "p95", "slow"):
+        await query_stats.finish("排序方式只能是 total、p95 或 slow")
+    lines = query_profiler.report(sort=sort)
+    if not lines:
+        await query_stats.finish("暂无 SQL 统计")
+    lines.insert(0, f"曲库查询缓存：{total_list.result_cache.summary()}")
+    await query_stats.finish(pic_to_message_segment(text_to_image("\n".join(lines)), args={"fool": False, "shift_row": 0}))
+
 """-----------谱师查歌&曲师查歌&新歌列表&BPM查歌&版本查歌-----------"""
 hardlist = ['Basic','Advance','Expert','Master','Re:Master']
 
@@ -262,6 +291,7 @@ async def _(event: Event, message: Message = CommandArg()):
     """
         输入格式:
         谱师查歌 <谱师名> <分页(可选)>    
+        分页可以是页码，也可以是上一页末尾给出的翻页码
     """
 
     args = str(message).strip().split(" ")
@@ -269,18 +299,14 @@ async def _(event: Event, message: Message = CommandArg()):
         await charter_search.finish("请输入谱师名。")
     charter = args[0].strip()
     page = 1  # 默认分页为1
-    pagination = (0, 100)  # 默认分页参数，假设每页100条数据
+    cursor = None  # 翻页码（keyset 分页游标）
     if len(args) > 1:
         if args[1].isdigit():
             page = int(args[1])
-            if page < 0:
-                await charter_search.finish("分页数不能为负数。")
-            else:
-                # 计算分页参数
-                start = (page - 1) * 100
-                pagination = (start, 100)  # 每页100条数据
+            if page < 1:
+                await charter_search.finish("分页数必须为正整数。")
         else:
-            await charter_search.finish("分页参数必须为数字。")
+            cursor = args[1].strip()
 
     # 定义难度映射
     temp_dict = {
@@ -289,9 +315,8 @@ async def _(event: Event, message: Message = CommandArg()):
         4:"白"
     }
 
-    # 先查询所有符合谱师名的 chart 数量
-    complete_data = await total_list.filter(charter=charter, diff_indices=[2, 3, 4])
-    complete_count = complete_data['chart_count']
+    # 先统计符合谱师名的 chart 数量（不构造对象）
+    complete_count = (await total_list.count(charter=charter, diff_indices=[2, 3, 4]))['chart_count']
     if complete_count == 0:
         await charter_search.finish("没有找到结果，请检查搜索条件。")
 
@@ -299,18 +324,24 @@ async def _(event: Event, message: Message = CommandArg()):
     total_pages = (complete_count + 99) // 100  # 每页100条数据
     if page > total_pages:
         page = total_pages  # 如果请求的页数超过总页数，则返回最后一页
+    pagination = (0, 100) if cursor else ((page - 1) * 100, 100)  # 每页100条数据
 
     # 分页查询
-    pagination_data = await total_list.filter(charter=charter, pagination=pagination, diff_indices=[2, 3, 4])
-    pagination_list = pagination_data['music_list']
+    try:
+        pagination_data = await total_list.filter(charter=charter, pagination=pagination, diff_indices=[2, 3, 4],
+                                                  cursor=cursor, fields=["music_id", "title", "diff_index", "charter"])
+    except ValueError:
+        await charter_search.finish("翻页码无效，请重新查询。")
 
     # 处理分页查询结果
+    k = pagination_data['position'] + 1  # 当前页的起始编号
+    page = pagination_data['position'] // 100 + 1
     s = f"\n结果如下: (第 {page}/{total_pages} 页)\n"
-    k = page * 100 - 99  # 计算当前页的起始编号
-    for music in pagination_list:
-        for chart in music.charts:
-            s += f"No.{k:03d} {chart.charter} [{music.id}][{temp_dict[chart.diff_index]}]{music.title}\n"
-            k += 1
+    for music_id, title, diff_index, chart_charter in pagination_data['rows']:
+        s += f"No.{k:03d} {chart_charter} [{music_id}][{temp_dict[diff_index]}]{title}\n"
+        k += 1
+    if pagination_data['next_cursor']:
+        s += f"\n下一页：谱师查歌 {charter} {pagination_data['next_cursor']}\n"
 
     await charter_search.finish(pic_to_message_segment(text_to_image(s), args={"fool": False, "shift_row": 0}))
 
@@ -328,18 +359,18 @@ async def _(event: Event, message: Message = CommandArg()):
         await artist_search.finish("请输入曲师名。")
 
     # 直接查询
-    complete_data = await total_list.filter(artist=artist)
+    complete_data = await total_list.filter(artist=artist, fields=["music_id", "title", "artist"])
     complete_count = complete_data['music_count']
     if complete_count == 0:
         await artist_search.finish("没有找到结果，请检查搜索条件。")
     elif complete_count > 100:
         await artist_search.finish(f"结果过多（{complete_count} 条），请缩小搜索范围。")
-    complete_list = complete_data['music_list']
+    complete_list = complete_data['rows']
 
     s = f"\n结果如下: \n"
     k = 1
-    for music in complete_list:
-        s += f"No.{k:03d} {music.artist} [{music.id}]{music.title}\n"
+    for music_id, title, music_artist in complete_list:
+        s += f"No.{k:03d} {music_artist} [{music_id}]{title}\n"
         k += 1
 
     await artist_search.finish(pic_to_message_segment(text_to_image(s), args={"fool": False, "shift_row": 0}))
@@ -353,11 +384,15 @@ async def _(event: Event, message: Message = CommandArg()):
         新歌列表
     """
 
-    new_data = await total_list.filter(is_new=True)
-    new_list = new_data['music_list']
-    s = "\n结果如下：\n"
-    for i, music in enumerate(new_list):
-        s += f"No.{i+1:02d} [{music.id}] {music.title}\n"
+    new_data = await total_list.filter(is_new=True, fields=["music_id", "title"])
+    new_list = new_data['rows']
+    new_stats = (await total_list.cube()).stats(is_new=True)
+    s = f"\n共 {new_data['music_count']} 首新曲，{new_stats.chart_count} 张谱面"
+    if new_stats.chart_count:
+        s += f"，定数 {new_stats.ds_min}~{new_stats.ds_max}，平均 {new_stats.ds_mean:.2f}"
+    s += "\n结果如下：\n"
+    for i, (music_id, title) in enumerate(new_list):
+        s += f"No.{i+1:02d} [{music_id}] {title}\n"
     await new_search.finish(pic_to_message_segment(text_to_image(s), args={"fool": False, "shift_row": 0}))
 
 
@@ -391,17 +426,17 @@ async def _(event: Event, message: Message = CommandArg()):
         await bpm_search.finish("bpm值必须是数字。")
 
     # 查询符合条件的曲目
-    complete_data = await total_list.filter(bpm_range=bpm_range)
+    complete_data = await total_list.filter(bpm_range=bpm_range, fields=["music_id", "title", "bpm"])
     complete_count = complete_data['music_count']
     if complete_count == 0:
         await bpm_search.finish("没有找到符合条件的曲目。")
     elif complete_count > 100:
         await bpm_search.finish(f"结果过多（{complete_count} 条），请缩小搜索范围。")
     
-    complete_list = complete_data['music_list']
+    complete_list = complete_data['rows']
     s = f"\n结果如下: \n"
-    for i, music in enumerate(complete_list):
-        s += f"No.{i+1:03d} [{music.id}] {music.title} - BPM: {music.bpm}\n"
+    for i, (music_id, title, bpm) in enumerate(complete_list):
+        s += f"No.{i+1:03d} [{music_id}] {title} - BPM: {bpm}\n"
 
     await bpm_search.finish(pic_to_message_segment(text_to_image(s), args={"fool": False, "shift_row": 0}))
 
@@ -429,18 +464,24 @@ async def _(event: Event, message: Message = CommandArg()):
     if not search_list:
         await version_search.finish("版本缩写输入错误，请检查输入。")
 
+    # 先由统计立方体得到曲目数，结果过多时不必筛选
+    complete_count = (await total_list.cube()).music_count(version_indices=list(search_list))
+    if complete_count > 200:
+        await version_search.finish(f"结果过多（{complete_count} 条），请缩小搜索范围。")
+
     # 查询符合条件的曲目
-    complete_data = await total_list.filter(version_indices=list(search_list))
-    complete_count = complete_data['music_count']
-    if complete_count == 0:
+    complete_data = await total_list.filter(version_indices=list(search_list), fields=["music_id", "title", "type", "ds"])
+    if complete_data['music_count'] == 0:
         await version_search.finish("没有找到符合条件的曲目。")
-    elif complete_count > 200:
-        await version_search.finish(f"结果过多（{complete_count} 条），请缩小搜索范围。")
-    complete_list = complete_data['music_list']
+
+    # 每张谱面一行，按曲目合并定数
+    complete_list: Dict[int, Tuple[str, str, List[float]]] = {}
+    for music_id, title, music_type, ds in complete_data['rows']:
+        complete_list.setdefault(music_id, (title, music_type, []))[2].append(ds)
     
     s = "\n结果如下：\n"
-    for music in complete_list:
-        s += f"[{music.id:05d}] {music.title} ({music.type}) {'/'.join(str(ds) for ds in music.ds)}\n"    
+    for music_id, (title, music_type, dss) in complete_list.items():
+        s += f"[{music_id:05d}] {title} ({music_type}) {'/'.join(str(ds) for ds in dss)}\n"    
 
     await version_search.finish(pic_to_message_segment(text_to_image(s), args={"fool": False, "shift_row": 0}))
 
@@ -476,22 +517,17 @@ async def _(event: Event, message: Message = CommandArg()):
         await ds_search.finish("定数必须是数字。")
 
     page = 1  # 默认分页为1
-    pagination = (0, 100)  # 默认分页参数，假设每页100条数据
+    cursor = None  # 翻页码（keyset 分页游标）
     if len(args) > 1:
         if args[1].isdigit():
             page = int(args[1])
-            if page < 0:
-                await ds_search.finish("分页数不能为负数。")
-            else:
-                # 计算分页参数
-                start = (page - 1) * 100
-                pagination = (start, 100)  # 每页100条数据
+            if page < 1:
+                await ds_search.finish("分页数必须为正整数。")
         else:
-            await ds_search.finish("分页参数必须为数字。")
+            cursor = args[1].strip()
 
-    # 先查询所有符合定数范围的 chart 数量
-    complete_data = await total_list.filter(ds_range=ds_range, order=['+ds', '+music_id'])
-    complete_count = complete_data['chart_count']
+    # 先统计符合定数范围的 chart 数量（不构造对象）
+    complete_count = (await total_list.count(ds_range=ds_range))['chart_count']
     if complete_count == 0:
         await ds_search.finish("没有找到结果，请检查搜索条件。")
 
@@ -499,18 +535,24 @@ async def _(event: Event, message: Message = CommandArg()):
     total_pages = (complete_count + 99) // 100  # 每页100条数据
     if page > total_pages:
         page = total_pages  # 如果请求的页数超过总页数，则返回最后一页
+    pagination = (0, 100) if cursor else ((page - 1) * 100, 100)  # 每页100条数据
 
     # 分页查询
-    pagination_data = await total_list.filter(ds_range=ds_range, order=['+ds', '+music_id'], pagination=pagination)
-    pagination_list = pagination_data['music_list']
+    try:
+        pagination_data = await total_list.filter(ds_range=ds_range, order=['+ds', '+music_id'], pagination=pagination,
+                                                  cursor=cursor, fields=["music_id", "diff_index", "type", "title", "ds"])
+    except ValueError:
+        await ds_search.finish("翻页码无效，请重新查询。")
 
     # 处理分页查询结果
+    k = pagination_data['position'] + 1  # 当前页的起始编号
+    page = pagination_data['position'] // 100 + 1
     s = f"\n结果如下: (第 {page}/{total_pages} 页)\n"
-    k = page * 100 - 99  # 计算当前页的起始编号
-    for music in pagination_list:
-        for chart in music.charts:
-            s += f"No.{k:03d} [{music.id:>5}] [{DIFF_LIST[chart.diff_index]}] ({music.type}) {music.title} Lv. {chart.ds}\n"
-            k += 1   
+    for music_id, diff_index, music_type, title, ds in pagination_data['rows']:
+        s += f"No.{k:03d} [{music_id:>5}] [{DIFF_LIST[diff_index]}] ({music_type}) {title} Lv. {ds}\n"
+        k += 1   
+    if pagination_data['next_cursor']:
+        s += f"\n下一页：定数查歌 {args[0]} {pagination_data['next_cursor']}\n"
 
     await ds_search.finish(pic_to_message_segment(text_to_image(s), args={"fool": False, "shift_row": 0}))
 
@@ -522,8 +564,9 @@ async def _(event: Event, message: Message = CommandArg()):
 revived_query = on_command('复活曲列表', rule=to_me(), priority = DEFAULT_PRIORITY, block = True)
 @revived_query.handle()
 async def _(event: Event, message: Message = CommandArg()):
-    id_list = await total_list.get_revived_music_list()
-    music_list = [await total_list.by_id(id) for id in id_list]
+    with request_scope():
+        id_list = await total_list.get_revived_music_list()
+        music_list = await asyncio.gather(*(total_list.by_id(id) for id in id_list))
     s = "\n结果如下：\n"
     for music in music_list:
         s += f"[{music.id:05d}] {music.title} ({music.type}) from: <{music.cn_version}>\n"    
@@ -774,59 +817,23 @@ async def _levelquery(event: Event):
         await levelquery.finish("蓝的盆")
     
     userid = str(event.get_user_id())
-    if str(event.get_message().extract_plain_text()).endswith("定数表"):
-        player_data = {
-            'records':[]
-        }
-    else:
-        if not_exist_data(userid):
+    username = None
+    if not str(event.get_message().extract_plain_text()).endswith("定数表"):
+        username = query_user(userid)
+        if not username:
+            await levelquery.finish("未找到此玩家，请先使用 /bind <用户名> 绑定您的用户名。")
+        if await database_api.check_user_outdated(username):
             await levelquery.send("每天第一次查询自动刷新成绩，可能需要较长时间。若需手动刷新请发送 刷新成绩")
-        player_data,success = await read_full_data(userid)
-        if success == 400:
-            await levelquery.finish("未找到此玩家，请确登陆diving-fish 录入分数，并正确填写用户名与QQ号。")
-    
-    plus = res.group(2)
-    records = {}
-    if plus != "":
-        for suffix in [".6",".7",".8",".9"]:
-            records[str(level)+suffix] = []
-    else:
-        for suffix in [".0",".1",".2",".3",".4",".5"]:
-            records[str(level)+suffix] = []
-    
-    record_selected = {}
-    for rec in player_data['records']:
-        if str(rec['ds']) in records:
-            tmp = {
-                "id":rec['song_id'],
-                "level_index": rec['level_index'],
-                "ds": rec['ds']
-                }
-            if rec['fc'][:2] == 'ap':
-                tmp['cover'] = rec['fc']
-            else:
-                tmp['cover'] = rec['rate']
-            if rec['achievements']>=100:
-                tmp['finished'] = True
-            else:
-                tmp['finished'] = False
-            record_selected[f"{rec['song_id']}_{rec['level_index']}"] = tmp
-            
-    for music in music_data:
-        if int(music["id"]) >= 100000:
-            continue
-        for i,ds in enumerate(music['ds']):
-            if str(ds) in records:
-                if f"{music['id']}_{i}" in record_selected:
-                    records[str(ds)].append(record_selected[f"{music['id']}_{i}"])
-                else:
-                    records[str(ds)].append({
-                    "id": music['id'],
-                    "level_index": i,
-                    "ds": ds,
-                    "cover": "",
-                    "finished": False
-                    })
+            status, message = await refresh(username)
+            if status == 2:
+                await levelquery.finish(message)
+            elif status == 1:
+                await levelquery.send(message)
+
+    plus = res.group(2) != ""
+    # 该等级的全部谱面与玩家成绩（定数表不查成绩），按定数从高到低
+    progress = await level_progress.progress(username, ds_range=level_ds_range(level, plus))
+    records = level_records(progress, level, plus)
 
     plate_file_path = "other_plate/" + random.choice(os.listdir(plate_path + "other_plate"))
 
@@ -845,8 +852,12 @@ async def _levelquery(event: Event):
     else:
         b64 = pic_to_message_segment(img,format="PNG")
 
+    summary = ""
+    if username:
+        summary = (f"\n已游玩 {progress.played}/{progress.total}，"
+                   f"SSS {progress.achieved_count('sss')}，AP {progress.achieved_count('ap')}，FDX {progress.achieved_count('fsd')}\n")
     await levelquery.finish(
-        MessageSegment.text("您的" + event.get_message().extract_plain_text().strip('/') + "为：") + \
+        MessageSegment.text("您的" + event.get_message().extract_plain_text().strip('/') + "为：" + summary) + \
         b64
     )
     
@@ -893,7 +904,8 @@ async def _(event: Event, message: Message = CommandArg()):
     if record_result['record_count'] == 0:
         await singlequery.finish(f"您查询的是{music.title}\n没有查到成绩。")
 
-    final_img = await draw_new_infos(record_result['record_list'])
+    with request_scope():
+        final_img = await draw_new_infos(record_result['record_list'])
     await singlequery.finish(pic_to_message_segment(final_img))
 
 
@@ -935,37 +947,31 @@ async def _random_niubi(event: Event, regex_res: Tuple = RegexGroup()):
     if msg.isdigit():
         n = int(msg) if 0 < int(msg) <= 10 else 1
         
-    music_result = await total_list.filter(diff_indices=[3, 4])
-    music_list = music_result['music_list']
-    chart_tuple_list = [(music.id, diff) for music in music_list for diff in music.diff]
-    # 一次 sqlite 查询最多 900 条数据，将查询结果分批次获取
-    record_list = []
-    for i in range(0, len(chart_tuple_list), 900):
-        chart_batch = chart_tuple_list[i:i + 900]
-        if choice == "牛逼":
-            # 随机牛逼，获取最好的成绩
-            achievements_range = (100.8, 101.1)
-            record_result = await best_record_list.filter(user_id=username, chart_list=chart_batch, achievements_range=achievements_range)
-        elif choice == "菜逼":
-            # 随机菜逼，获取最差的成绩
-            achievements_range = (0, 97.0)
-            record_result = await best_record_list.filter(user_id=username, chart_list=chart_batch, achievements_range=achievements_range)
-        elif choice == "ap":
-            # 随机AP，获取AP成绩
-            record_result = await best_record_list.filter(user_id=username, chart_list=chart_batch, fc_indices=[3, 4])
-        elif choice == "fdx":
-            # 随机FDX，获取FDX成绩
-            record_result = await best_record_list.filter(user_id=username, chart_list=chart_batch, fs_indices=[4, 5])
-        record_list.extend(record_result['record_list'])
-
-    if len(record_list) == 0:
+    music_result = await total_list.filter(diff_indices=[3, 4], fields=["music_id", "diff_index"])
+    chart_tuple_list = music_result['rows']
+    # chart_list 以单个 JSON 参数传入，不限数量，一次查询完成
+    if choice == "牛逼":
+        # 随机牛逼，获取最好的成绩
+        criteria = {"achievements_range": (100.8, 101.1)}
+    elif choice == "菜逼":
+        # 随机菜逼，获取最差的成绩
+        criteria = {"achievements_range": (0, 97.0)}
+    elif choice == "ap":
+        # 随机AP，获取AP成绩
+        criteria = {"fc_indices": [3, 4]}
+    elif choice == "fdx":
+        # 随机FDX，获取FDX成绩
+        criteria = {"fs_indices": [4, 5]}
+    # 流式读取成绩并用蓄水池抽样，不把全部符合条件的成绩读入内存
+    records, record_count = await streaming.sample(
+        best_record_list.iter_filter(username, chart_list=chart_tuple_list, **criteria), n
+    )
+
+    if record_count == 0:
         await random_niubi.finish(f"您没有{choice}的成绩，无法随机{choice}。")
-    if len(record_list) > n:
-        records = random.sample(record_list, n)
-    else:
-        records = record_list
 
-    final_img = await draw_new_infos(records)
+    with request_scope():
+        final_img = await draw_new_infos(records)
     
     await random_niubi.finish(pic_to_message_segment(final_img))
 
@@ -1036,37 +1042,39 @@ async def _rand_n(event: Event, regex_res: Tuple = RegexGroup()):
                             version_pickup.discard(index)
 
     
-    result = await total_list.filter(
-        types=ctype if ctype else ["SD", "DX"],
-        diff_indices=[diff] if diff is not None else [0, 1, 2, 3, 4],
-        levels=level,
-        version_indices=list(version_pickup),
-        order=['+music_id']
-    )
+    # 同一次处理内的多次查询使用同一代曲库快照
+    with total_list.pinned():
+        result = await total_list.filter(
+            types=ctype if ctype else ["SD", "DX"],
+            diff_indices=[diff] if diff is not None else [0, 1, 2, 3, 4],
+            levels=level,
+            version_indices=list(version_pickup),
+            order=['+music_id']
+        )
     
-    music_list = result['music_list']
-    music_count = result['music_count']
-
-    s = ""
-    if music_count == 0:
-        await rand_n.finish("没有这样的乐曲哦。\n")
-    elif music_count < n:
-        s += f"满足条件的谱面只有 {music_count} 个，结果如下：\n"
-    else:
-        s += f"结果如下：\n"
-        music_list = random.sample(music_list, n)
+        music_list = result['music_list']
+        music_count = result['music_count']
+
+        s = ""
+        if music_count == 0:
+            await rand_n.finish("没有这样的乐曲哦。\n")
+        elif music_count < n:
+            s += f"满足条件的谱面只有 {music_count} 个，结果如下：\n"
+        else:
+            s += f"结果如下：\n"
+            music_list = random.sample(music_list, n)
     
-    if len(music_list) > 1:
-        s += "\n"
-        for i, music in enumerate(music_list):
-            s += f"No.{i+1:>2} 【{music.id}】{music.title}\n"
-        msg = pic_to_message_segment(text_to_image(s))
-    else:
-        # 注意：这里 music_list 中的歌曲 chart 不全，需要通过 music.id 获取完整的歌曲信息 
-        music = await total_list.by_id(music_list[0].id)
-        msg = MessageSegment.text(s) + await song_MessageSegment2(music)
+        if len(music_list) > 1:
+            s += "\n"
+            for i, music in enumerate(music_list):
+                s += f"No.{i+1:>2} 【{music.id}】{music.title}\n"
+            msg = pic_to_message_segment(text_to_image(s))
+        else:
+            # 注意：这里 music_list 中的歌曲 chart 不全，需要通过 music.id 获取完整的歌曲信息 
+            music = await total_list.by_id(music_list[0].id)
+            msg = MessageSegment.text(s) + await song_MessageSegment2(music)
 
-    await rand_n.finish(msg)
+        await rand_n.finish(msg)
 
         
 
@@ -1239,9 +1247,10 @@ async def _(event: Event, message: Message = CommandArg()):
         elif status == 1:
             await best_40_pic.send(message)
 
-    best_table = await BestTableGenerator.table_b40(username)
-    draw_best.update_settings(userid, best_table)
-    img = await draw_best.draw(b50=False)
+    with request_scope():
+        best_table = await BestTableGenerator.table_b40(username)
+        draw_best.update_settings(userid, best_table)
+        img = await draw_best.draw(b50=False)
     await best_40_pic.finish(MessageSegment.text("旧版b40已停止维护，对结果不负责")+pic_to_message_segment(img, args={"shift_row": 0}))
 
 """-----------------b50----------------"""
@@ -1269,11 +1278,41 @@ async def _(event: Event, message: Message = CommandArg()):
         elif status == 1:
             await best_50_pic.send(message)
 
-    best_table = await BestTableGenerator.table_b50(username)
-    draw_best.update_settings(userid, best_table)
-    img = await draw_best.draw()
+    with request_scope():
+        best_table = await BestTableGenerator.table_b50(username)
+        draw_best.update_settings(userid, best_table)
+        img = await draw_best.draw()
     await best_50_pic.finish(pic_to_message_segment(img, args={"shift_row": 0}))
 
+"""-----------------rating趋势----------------"""
+rating_trend_pic = on_command('rating趋势', rule=to_me(), aliases={"Rating趋势", "分数趋势"}, priority = DEFAULT_PRIORITY, block = True)
+@rating_trend_pic.handle()
+async def _(event: Event, message: Message = CommandArg()):
+    """
+        输入格式:
+        rating趋势 <用户名(可选)>
+    """
+    username = str(message).strip()
+    if not username:
+        userid = str(event.get_user_id())
+        username = query_user(userid)
+
+    if not username:
+        await rating_trend_pic.finish("未找到此玩家，请先使用 /bind <用户名> 绑定您的用户名。")
+
+    if await database_api.check_user_outdated(username):
+        await rating_trend_pic.send("每天第一次查询自动刷新成绩，可能需要较长时间。若需手动刷新请发送 刷新成绩")
+        status, message = await refresh(username)
+        if status == 2:
+            await rating_trend_pic.finish(message)
+        elif status == 1:
+            await rating_trend_pic.send(message)
+
+    img = await rating_trend(username)
+    if img is None:
+        await rating_trend_pic.finish("rating 记录不足两次，多刷新几天成绩后再来看看吧。")
+    await rating_trend_pic.finish(pic_to_message_segment(img, args={"shift_row": 0}))
+
 """-----------------apb50----------------"""
 apb50 = on_command("apb50", rule=to_me(), aliases = {"ap50"}, priority = DEFAULT_PRIORITY, block = True)
 @apb50.handle()
@@ -1297,9 +1336,10 @@ async def _(event: Event, message: Message = CommandArg()):
         elif status == 1:
             await apb50.send(message)
 
-    best_table = await BestTableGenerator.table_b50(username, fc_indices=[3, 4])
-    draw_best.update_settings(userid, best_table)
-    img = await draw_best.draw()
+    with request_scope():
+        best_table = await BestTableGenerator.table_b50(username, fc_indices=[3, 4])
+        draw_best.update_settings(userid, best_table)
+        img = await draw_best.draw()
     await apb50.finish(pic_to_message_segment(img, args={"shift_row": 0}))
 
 """-----------------fdxb50----------------"""
@@ -1325,9 +1365,10 @@ async def _(event: Event, message: Message = CommandArg()):
         elif status == 1:
             await fdxb50.send(message)
 
-    best_table = await BestTableGenerator.table_b50(username, fs_indices=[4, 5])
-    draw_best.update_settings(userid, best_table)
-    img = await draw_best.draw()
+    with request_scope():
+        best_table = await BestTableGenerator.table_b50(username, fs_indices=[4, 5])
+        draw_best.update_settings(userid, best_table)
+        img = await draw_best.draw()
     await fdxb50.finish(pic_to_message_segment(img, args={"shift_row": 0}))
 
 """-----------------b50娱乐版----------------"""
@@ -1353,9 +1394,10 @@ async def _(event: Event, message: Message = CommandArg()):
         elif status == 1:
             await b50_yuleban.send(message)
 
-    best_table = await BestTableGenerator.table_stats(username)
-    draw_best.update_settings(userid, best_table)
-    img = await draw_best.draw()
+    with request_scope():
+        best_table = await BestTableGenerator.table_stats(username)
+        draw_best.update_settings(userid, best_table)
+        img = await draw_best.draw()
     msg = "\n"
     msg += "本功能根据拟合定数进行计算，仅供娱乐，不具有任何参考价值，请勿上纲上线！\n下图为您b50的娱乐版\n"
     await b50_yuleban.finish(MessageSegment.text(msg) + pic_to_message_segment(img, args={"shift_row": 0}))
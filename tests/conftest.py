@@ -0,0 +1,152 @@
+import asyncio
+import random
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import pytest
+
+from src.libraries.maimai.database import DatabaseAPI, WAL_MODE, MUSIC_UPSERT_SQL, CHART_UPSERT_SQL, bump_catalog_generation
+from src.libraries.maimai.migrations import migrate
+from src.libraries.maimai.static_lists_and_dicts import version_list
+
+# 没有谱面的曲目，其版本也不出现在任何谱面上
+CHARTLESS_MUSIC_ID = 9999
+CHARTLESS_VERSION_ID = 30
+
+
+@pytest.fixture
+def db_path(tmp_path: Path) -> Path:
+    return tmp_path / "maimai.db"
+
+
+@pytest.fixture
+def run_db(db_path: Path):
+    """
+    run_db(body) 在临时数据库上启动 DatabaseAPI（默认先执行全部迁移），运行 await body(api) 后关闭
+    """
+    def run(body, migrated: bool = True, wal: bool = WAL_MODE, **kwargs):
+        async def _run():
+            api = DatabaseAPI(path=db_path, wal=wal, **kwargs)
+            await api.start()
+            try:
+                if migrated:
+                    await migrate(api)
+                return await body(api)
+            finally:
+                await api.close()
+        return asyncio.run(_run())
+    return run
+
+
+def fake_catalog(n_music: int = 60, seed: int = 7) -> Tuple[List[Dict], List[Dict]]:
+    """
+    确定性的小曲库，返回 MUSIC_UPSERT_SQL / CHART_UPSERT_SQL 的参数；规范化列直接取小写
+    """
+    rnd = random.Random(seed)
+    music, charts = [], []
+    for i in range(n_music):
+        music_id = i + 1 if i % 2 == 0 else 10000 + i
+        title = f"Song {i:02d}" if i % 7 else f"桜 Song {i:02d}"
+        artist = f"Artist {i % 11}"
+        music.append({
+            "id": music_id, "title": title, "type": "DX" if music_id >= 10000 else "SD",
+            "artist": artist, "genre": rnd.choice(["pops", "niconico", "game"]), "bpm": 120 + i % 80,
+            "release_date": "", "version": f"v{i % 6}", "is_new": int(i % 10 == 0), "version_id": i % 6,
+            "title_norm": title.lower(), "artist_norm": artist.lower(),
+        })
+        for diff_index in range(4 + (i % 3 == 0)):
+            ds = round(rnd.uniform(1, 15), 1)
+            charter = f"Charter {rnd.randrange(7)}"
+            charts.append({
+                "music_id": music_id, "diff_index": diff_index, "ds": ds,
+                "level": f"{int(ds)}{'+' if ds - int(ds) >= 0.55 else ''}",
+                "notes": 500 + i, "tap": 300, "hold": 50, "slide": 100, "touch": i % 30, "brk": 20,
+                "charter": charter, "charter_norm": charter.lower(),
+            })
+    music.append({
+        "id": CHARTLESS_MUSIC_ID, "title": "No Charts", "type": "UTAGE", "artist": "", "genre": "",
+        "bpm": None, "release_date": "", "version": "", "is_new": 1, "version_id": CHARTLESS_VERSION_ID,
+        "title_norm": "no charts", "artist_norm": "",
+    })
+    return music, charts
+
+
+def api_payload(music: List[Dict], charts: List[Dict]) -> Tuple[List[Dict], Dict[str, List[Dict]]]:
+    """
+    把 fake_catalog 的行还原为 diving-fish 接口的 (music_data, chart_stats)，即 sync_catalog 的参数
+    """
+    by_music: Dict[int, List[Dict]] = {}
+    for chart in charts:
+        by_music.setdefault(chart["music_id"], []).append(chart)
+    music_data, stats = [], {}
+    for m in music:
+        rows = sorted(by_music.get(m["id"], []), key=lambda c: c["diff_index"])
+        music_data.append({
+            "id": str(m["id"]), "title": m["title"], "type": m["type"],
+            "ds": [c["ds"] for c in rows], "level": [c["level"] for c in rows], "cids": [],
+            "charts": [{"notes": [c["tap"], c["hold"], c["slide"], c["touch"], c["brk"]], "charter": c["charter"]} for c in rows],
+            "basic_info": {
+                "title": m["title"], "artist": m["artist"], "genre": m["genre"], "bpm": m["bpm"] or 0,
+                "release_date": m["release_date"], "from": version_list[m["version_id"] % len(version_list)],
+                "is_new": bool(m["is_new"]),
+            },
+        })
+        stats[str(m["id"])] = [
+            {"cnt": 10 + c["diff_index"], "diff": c["level"], "fit_diff": c["ds"] + 0.1, "avg": 98.5, "avg_dx": 1500.0,
+             "std_dev": 2.0, "dist": list(range(14)), "fc_dist": [5, 4, 3, 2, 1]}
+            for c in rows
+        ]
+    return music_data, stats
+
+
+def user_json(username: str, records: List[Tuple], rating: int = 10000) -> Dict:
+    """
+    sync_user_records 的参数；records 为 (music_id, diff_index, achievements, rate, fc, fs)
+    """
+    return {
+        "username": username, "additional_rating": 0, "nickname": username.lower(), "plate": "", "rating": rating,
+        "records": [
+            {"song_id": music_id, "level_index": diff_index, "achievements": achievements, "ra": int(achievements * 3),
+             "dxScore": int(achievements * 10), "rate": rate, "fc": fc, "fs": fs}
+            for music_id, diff_index, achievements, rate, fc, fs in records
+        ],
+    }
+
+
+@pytest.fixture
+def catalog_rows() -> Tuple[List[Dict], List[Dict]]:
+    return fake_catalog()
+
+
+@pytest.fixture
+def seed_catalog(catalog_rows):
+    """
+    await seed_catalog(api) 把 catalog_rows 写入曲库并把曲库代数加一
+    """
+    async def seed(api: DatabaseAPI):
+        music, charts = catalog_rows
+
+        async def insert(db):
+            await db.executemany(MUSIC_UPSERT_SQL, music)
+            await db.executemany(CHART_UPSERT_SQL, charts)
+            await bump_catalog_generation(db)
+        await api.write(insert)
+        return catalog_rows
+    return seed
+
+
+@pytest.fixture
+def with_lists(run_db, seed_catalog):
+    """
+    with_lists(check) 运行 await check(catalog_list, sql_list)：前者已加载曲库快照，后者每次查询都走数据库
+    """
+    maimai_type = pytest.importorskip("src.libraries.maimai.maimai_type")
+
+    def run(check):
+        async def body(api):
+            await seed_catalog(api)
+            catalog_list, sql_list = maimai_type.MusicList(api=api), maimai_type.MusicList(api=api)
+            await catalog_list.load_catalog(use_snapshot=False)
+            return await check(catalog_list, sql_list)
+        return run_db(body)
+    return run
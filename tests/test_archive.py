@@ -0,0 +1,108 @@
+"""
+冷存储：不活跃玩家的成绩压缩归档，查询或同步时恢复，恢复后与归档前完全一致
+"""
+
+import pytest
+
+from conftest import user_json
+from src.libraries.maimai.database import ARCHIVE_COLUMNS, pack_records, unpack_records
+
+BEST_RECORD_SQL = ("SELECT music_id, diff_index, achievements, ra, dxscore, rank_id, fc_id, fs_id, ts, ra_b50, ra_b40, ra_stats "
+                   "FROM best_record WHERE user_id = ? ORDER BY music_id, diff_index")
+
+
+def records_for(charts, offset):
+    return [(c["music_id"], c["diff_index"], 95 + (i + offset) % 6, "ss", "", "") for i, c in enumerate(charts[offset:offset + 8])]
+
+
+async def best_records(api, user_id):
+    async with api.connection() as db:
+        cursor = await db.execute(BEST_RECORD_SQL, (user_id,))
+        return [tuple(row) for row in await cursor.fetchall()]
+
+
+async def make_inactive(api, user_id, days=200):
+    async def write(db):
+        await db.execute("UPDATE user SET ts = datetime('now', ?) WHERE id = ?", (f"-{days} days", user_id))
+    await api.write(write)
+
+
+def test_pack_records_round_trip():
+    rows = [(1, 0, 100.5, 300, 2000, 13, 3, 4, "2024-01-01 00:00:00"), (10001, 4, 97.25, 250, None, 10, 0, 0, "2024-02-01 12:00:00")]
+    assert len(ARCHIVE_COLUMNS) == len(rows[0])
+    assert unpack_records(pack_records(rows)) == [list(row) for row in rows]
+    assert unpack_records(pack_records([])) == []
+
+
+@pytest.fixture
+def synced_users(run_db, seed_catalog, catalog_rows):
+    _, charts = catalog_rows
+
+    def run(body):
+        async def _body(api):
+            await seed_catalog(api)
+            await api.sync_user_records(user_json("Alice", records_for(charts, 0)))
+            await api.sync_user_records(user_json("Bob", records_for(charts, 4)))
+            await make_inactive(api, "alice")
+            return await body(api)
+        return run_db(_body)
+    return run
+
+
+def test_archive_and_rehydrate_restore_identical_rows(synced_users):
+    async def body(api):
+        before = await best_records(api, "alice")
+        bob = await best_records(api, "bob")
+        archived = await api.archive_inactive_users(max_age_days=90)
+        stats = await api.hot_table_stats()
+        hot_after_archive = await best_records(api, "alice")
+        restored = await api.ensure_hot("alice")
+        again = await api.ensure_hot("alice")
+        return before, bob, archived, stats, hot_after_archive, restored, again, await best_records(api, "alice"), \
+            await best_records(api, "bob"), await api.hot_table_stats(), api.archive_metrics
+
+    before, bob, archived, stats, hot_after_archive, restored, again, after, bob_after, final_stats, metrics = synced_users(body)
+    assert archived == 1
+    assert stats["hot_users"] == 1 and stats["hot_records"] == len(bob)
+    assert stats["archived_users"] == 1 and stats["archived_records"] == len(before) and stats["archive_bytes"] > 0
+    assert hot_after_archive == []
+    assert (restored, again) == (len(before), 0)
+    assert after == before
+    assert bob_after == bob
+    assert final_stats["archived_users"] == 0 and final_stats["hot_records"] == len(before) + len(bob)
+    assert metrics["archived_users"] == 1 and metrics["rehydrated_users"] == 1
+
+
+def test_sync_of_an_archived_user_merges_with_the_archive(synced_users, catalog_rows):
+    _, charts = catalog_rows
+    records = records_for(charts, 0)
+    changed = [(*records[0][:2], 100.7, "sssp", "ap", "")]
+
+    async def body(api):
+        before = await best_records(api, "alice")
+        await api.archive_inactive_users(max_age_days=90)
+        diff = await api.sync_user_records(user_json("Alice", changed + records[1:]))
+        return before, diff, await best_records(api, "alice"), await api.hot_table_stats()
+
+    before, diff, after, stats = synced_users(body)
+    assert diff.inserted == [] and diff.updated == [records[0][:2]] and diff.unchanged == len(records) - 1
+    assert [row[:2] for row in after] == [row[:2] for row in before]
+    assert after[0][2] == 100.7
+    assert after[1:] == before[1:]
+    assert stats["archived_users"] == 0
+
+
+def test_best_record_queries_rehydrate_transparently(synced_users):
+    maimai_type = pytest.importorskip("src.libraries.maimai.maimai_type")
+
+    async def body(api):
+        best_record_list = maimai_type.BestRecordList(api=api)
+        before = await best_record_list.filter("alice", order=["+music_id", "+diff_index"])
+        await api.archive_inactive_users(max_age_days=90)
+        after = await best_record_list.filter("alice", order=["+music_id", "+diff_index"])
+        return before, after
+
+    before, after = synced_users(body)
+    assert before["record_count"] == after["record_count"] == 8
+    assert [(r.music_id, r.diff_index, r.achievements) for r in after["record_list"]] == \
+        [(r.music_id, r.diff_index, r.achievements) for r in before["record_list"]]
@@ -0,0 +1,111 @@
+"""
+统计立方体：与 MusicCatalog.count 的掩码路径、以及直接的 SQL 计数逐一对比
+"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from conftest import CHARTLESS_VERSION_ID
+from src.libraries.maimai.maimai_catalog import MusicCatalog, NOTE_COLUMNS
+
+FILTER_VALUES = {
+    "version_indices": [[0], [1, 4], [CHARTLESS_VERSION_ID], [2, CHARTLESS_VERSION_ID]],
+    "levels": [["13"], ["12+", "13+"], ["99"]],
+    "diff_indices": [[3], [0, 4]],
+    "types": [["SD"], ["DX"], ["UTAGE"]],
+    "is_new": [True, False],
+}
+
+SQL_COLUMNS = {
+    "version_indices": "m.version_id",
+    "levels": "c.level",
+    "diff_indices": "c.diff_index",
+    "types": "m.type",
+}
+
+
+def filter_cases(dims):
+    for combo in itertools.product(*(FILTER_VALUES[dim] for dim in dims)):
+        yield dict(zip(dims, combo))
+
+
+async def sql_count(db, filters):
+    where, params = [], []
+    for dim, value in filters.items():
+        if dim == "is_new":
+            where.append("m.is_new = ?")
+            params.append(int(value))
+        else:
+            where.append(f"{SQL_COLUMNS[dim]} IN ({', '.join('?' * len(value))})")
+            params += value
+    cursor = await db.execute(
+        "SELECT COUNT(DISTINCT m.id), COUNT(*) FROM chart AS c JOIN music AS m ON m.id = c.music_id WHERE "
+        + (" AND ".join(where) or "1=1"),
+        params,
+    )
+    return tuple(await cursor.fetchone())
+
+
+@pytest.fixture
+def catalog_and_sql(run_db, seed_catalog):
+    cases = [filters for r in range(3) for dims in itertools.combinations(FILTER_VALUES, r) for filters in filter_cases(dims)]
+
+    async def body(api):
+        await seed_catalog(api)
+        async with api.connection() as db:
+            catalog = await MusicCatalog.load(db)
+            return catalog, [(filters, await sql_count(db, filters)) for filters in cases]
+
+    return run_db(body)
+
+
+def test_chart_counts_match_mask_and_sql(catalog_and_sql):
+    catalog, cases = catalog_and_sql
+    cube = catalog.cube()
+    for filters, (_, sql_charts) in cases:
+        assert cube.stats(**filters).chart_count == catalog.count(filters)[1] == sql_charts, filters
+
+
+def test_music_counts_match_mask_and_sql(catalog_and_sql):
+    catalog, cases = catalog_and_sql
+    cube = catalog.cube()
+    for filters, (sql_music, _) in cases:
+        if set(filters) - {"version_indices", "types", "is_new"}:
+            continue
+        assert cube.music_count(**filters) == catalog.count(filters)[0] == sql_music, filters
+
+
+def test_stats_match_selected_charts(catalog_and_sql):
+    catalog, _ = catalog_and_sql
+    cube = catalog.cube()
+    for filters in filter_cases(["diff_indices", "types"]):
+        mask = catalog.mask(filters)
+        stats = cube.stats(**filters)
+        if not mask.any():
+            assert stats.chart_count == 0 and stats.ds_min is None
+            continue
+        assert stats.ds_min == catalog.ds[mask].min()
+        assert stats.ds_max == catalog.ds[mask].max()
+        assert stats.ds_mean == pytest.approx(catalog.ds[mask].mean())
+        selected = [catalog.chart_rows[i] for i in np.flatnonzero(mask)]
+        for column in NOTE_COLUMNS:
+            assert stats.notes[column] == sum(row[column] for row in selected)
+
+
+def test_group_by_levels_matches_mask(catalog_and_sql):
+    catalog, _ = catalog_and_sql
+    groups = catalog.cube().group_by("levels", diff_indices=[3])
+    expected = {level: catalog.count({"levels": [level], "diff_indices": [3]})[1] for level in set(catalog.level.tolist())}
+    assert {level: stats.chart_count for level, stats in groups.items()} == {k: v for k, v in expected.items() if v}
+
+
+def test_music_without_charts_has_its_own_cell(catalog_and_sql):
+    catalog, _ = catalog_and_sql
+    cube = catalog.cube()
+    assert CHARTLESS_VERSION_ID in cube.axes["version_indices"].tolist()
+    assert "UTAGE" in cube.axes["types"].tolist()
+    assert cube.music_count(version_indices=[CHARTLESS_VERSION_ID]) == 0
+    assert cube.music_count(types=["UTAGE"]) == 0
+    assert cube.music_count() == catalog.count({})[0]
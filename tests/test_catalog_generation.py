@@ -0,0 +1,120 @@
+"""
+曲库代数：曲库、谱面、统计与代数在一个事务中提交；读快照内只看到一个代数；MusicList 按代数发布与固定快照
+"""
+
+import pytest
+
+from conftest import api_payload
+from src.libraries.maimai.database import DatabaseAPI, MUSIC_UPSERT_SQL, bump_catalog_generation, catalog_generation, read_snapshot
+from src.libraries.maimai.maimai_catalog import MusicCatalog
+
+COUNT_SQL = "SELECT (SELECT COUNT(*) FROM music), (SELECT COUNT(*) FROM chart), (SELECT COUNT(*) FROM chart_stats)"
+
+
+async def counts(api):
+    async with api.connection() as db:
+        cursor = await db.execute(COUNT_SQL)
+        music, charts, stats = await cursor.fetchone()
+        return music, charts, stats, await catalog_generation(db)
+
+
+def extra_music(music_id: int):
+    return {"id": music_id, "title": f"New {music_id}", "type": "SD", "artist": "", "genre": "", "bpm": 150,
+            "release_date": "", "version": "", "is_new": 1, "version_id": 0, "title_norm": "new", "artist_norm": ""}
+
+
+async def publish_extra_music(api, music_id: int):
+    async def write(db):
+        await db.execute(MUSIC_UPSERT_SQL, extra_music(music_id))
+        await bump_catalog_generation(db)
+    await api.write(write)
+
+
+def test_sync_catalog_publishes_one_generation_per_refresh(run_db, catalog_rows):
+    pytest.importorskip("opencc")
+    music_data, stats = api_payload(*catalog_rows)
+
+    async def body(api):
+        first = await api.sync_catalog(music_data, stats)
+        after_first = await counts(api)
+        second = await api.sync_catalog(music_data, stats)
+        return first, after_first, second, await counts(api)
+
+    first, after_first, second, after_second = run_db(body)
+    music, charts = catalog_rows
+    assert (first, second) == (1, 2)
+    assert after_first == (len(music), len(charts), len(charts), 1)
+    assert after_second == (len(music), len(charts), len(charts), 2)
+
+
+def test_failed_sync_catalog_leaves_the_old_generation(run_db, catalog_rows, monkeypatch):
+    pytest.importorskip("opencc")
+    music_data, stats = api_payload(*catalog_rows)
+
+    async def failing_write_stats(db, stats_params):
+        raise RuntimeError("stats write failed")
+
+    async def body(api):
+        await api.sync_catalog(music_data[:10], {m["id"]: stats[m["id"]] for m in music_data[:10]})
+        before = await counts(api)
+        # 曲库已写入、统计写入失败：整个刷新回滚
+        monkeypatch.setattr(DatabaseAPI, "_write_stats", staticmethod(failing_write_stats))
+        with pytest.raises(RuntimeError):
+            await api.sync_catalog(music_data, stats)
+        return before, await counts(api)
+
+    before, after = run_db(body)
+    assert after == before
+    assert before[3] == 1
+
+
+def test_read_snapshot_sees_a_single_generation(run_db, seed_catalog):
+    async def body(api):
+        await seed_catalog(api)
+        async with api.connection() as db, read_snapshot(db):
+            generation = await catalog_generation(db)
+            cursor = await db.execute("SELECT COUNT(*) FROM music")
+            music = (await cursor.fetchone())[0]
+            # 快照打开期间发布新的代数（WAL 模式下写入不被读事务阻塞）
+            await publish_extra_music(api, 50000)
+            inside = await catalog_generation(db)
+            cursor = await db.execute("SELECT COUNT(*) FROM music")
+            music_inside = (await cursor.fetchone())[0]
+        after = await counts(api)
+        return generation, music, inside, music_inside, after
+
+    generation, music, inside, music_inside, after = run_db(body)
+    assert (inside, music_inside) == (generation, music)
+    assert after[0] == music + 1 and after[3] == generation + 1
+
+
+def test_music_list_publishes_by_generation(run_db, seed_catalog):
+    maimai_type = pytest.importorskip("src.libraries.maimai.maimai_type")
+
+    async def body(api):
+        await seed_catalog(api)
+        music_list = maimai_type.MusicList(api=api)
+        first = await music_list.load_catalog()
+        unchanged = await music_list.load_catalog()
+
+        with music_list.pinned() as pinned:
+            await publish_extra_music(api, 50000)
+            second = await music_list.load_catalog()
+            # 固定的快照不受新发布影响
+            inside = (music_list.generation, await music_list.by_id(50000))
+        outside = (music_list.generation, await music_list.by_id(50000))
+
+        # 代数更高的快照已发布时，较旧的加载结果不会替换它
+        newer = MusicCatalog(second.music_rows, second.chart_rows, second.columns())
+        newer.generation = second.generation + 10
+        music_list.catalog = newer
+        await publish_extra_music(api, 50001)
+        kept = await music_list.load_catalog()
+        return first, unchanged, pinned, second, inside, outside, newer, kept
+
+    first, unchanged, pinned, second, inside, outside, newer, kept = run_db(body)
+    assert unchanged is first and pinned is first
+    assert second.generation == first.generation + 1
+    assert inside == (first.generation, None)
+    assert outside[0] == second.generation and outside[1].id == 50000
+    assert kept is newer
@@ -0,0 +1,112 @@
+"""
+冷启动快照：写入后读回与原曲库一致；格式不符或损坏时忽略；曲库代数、结构版本或别名文件变化后视为过期
+"""
+
+import numpy as np
+import pytest
+
+from src.libraries.maimai.catalog_snapshot import CatalogSnapshot
+from src.libraries.maimai.database import bump_catalog_generation
+from src.libraries.maimai.maimai_catalog import MusicCatalog, COLUMN_NAMES
+from src.libraries.maimai.migrations import MIGRATIONS
+
+ALIASES = {1: ["一号", "one"], 10001: ["別名"]}
+
+
+@pytest.fixture
+def catalog(run_db, seed_catalog):
+    async def body(api):
+        await seed_catalog(api)
+        async with api.connection() as db:
+            catalog = await MusicCatalog.load(db)
+        catalog.generation = 1
+        return catalog
+
+    return run_db(body)
+
+
+def make_snapshot(catalog: MusicCatalog) -> CatalogSnapshot:
+    # 最后一个数组为空（chart_stats 尚无数据时即是如此）
+    stats_columns = {"cnt": np.arange(len(catalog), dtype=np.int64), "fit_diff": catalog.ds + 0.5, "empty": np.zeros(0)}
+    return CatalogSnapshot.from_catalog(catalog, stats_columns, MIGRATIONS[-1].version, [123, 456], ALIASES)
+
+
+def test_round_trip(catalog, tmp_path):
+    path = tmp_path / "catalog_snapshot.bin"
+    snapshot = make_snapshot(catalog)
+    assert snapshot.save(path) == path.stat().st_size
+
+    loaded = CatalogSnapshot.load(path)
+    assert (loaded.generation, loaded.schema_version, loaded.alias_source) == (1, MIGRATIONS[-1].version, [123, 456])
+    assert loaded.music_rows == snapshot.music_rows
+    assert loaded.chart_rows == snapshot.chart_rows
+    assert loaded.aliases == ALIASES
+    assert loaded.arrays.keys() == snapshot.arrays.keys()
+    for name, array in snapshot.arrays.items():
+        assert loaded.arrays[name].dtype == array.dtype
+        np.testing.assert_array_equal(loaded.arrays[name], array)
+        assert not loaded.arrays[name].flags.writeable
+    np.testing.assert_array_equal(loaded.stats_columns()["fit_diff"], catalog.ds + 0.5)
+    assert loaded.stats_columns()["empty"].shape == (0,)
+
+    restored = loaded.to_catalog()
+    assert restored.generation == 1
+    for name in COLUMN_NAMES:
+        np.testing.assert_array_equal(getattr(restored, name), getattr(catalog, name))
+    for filters in ({}, {"levels": ["13", "13+"]}, {"types": ["DX"], "diff_indices": [3]}, {"title_search": "song 1"}):
+        assert restored.count(filters) == catalog.count(filters)
+        np.testing.assert_array_equal(restored.select(filters, order=[("ds", True)]), catalog.select(filters, order=[("ds", True)]))
+
+
+def test_is_current(catalog):
+    snapshot = make_snapshot(catalog)
+    version = MIGRATIONS[-1].version
+    assert snapshot.is_current(1, version, [123, 456])
+    assert not snapshot.is_current(2, version, [123, 456])
+    assert not snapshot.is_current(1, version + 1, [123, 456])
+    assert not snapshot.is_current(1, version, [123, 457])
+    assert not snapshot.is_current(1, version, None)
+
+
+def test_missing_foreign_or_damaged_file_is_ignored(catalog, tmp_path):
+    path = tmp_path / "catalog_snapshot.bin"
+    assert CatalogSnapshot.load(path) is None
+
+    make_snapshot(catalog).save(path)
+    data = path.read_bytes()
+
+    path.write_bytes(b"NOTASNAP" + data[8:])
+    assert CatalogSnapshot.load(path) is None
+
+    path.write_bytes(data[:40])
+    assert CatalogSnapshot.load(path) is None
+
+    path.write_bytes(data[:len(data) // 2])
+    assert CatalogSnapshot.load(path) is None
+
+
+def test_music_list_uses_snapshot_until_it_goes_stale(run_db, seed_catalog, tmp_path, capsys):
+    maimai_type = pytest.importorskip("src.libraries.maimai.maimai_type")
+    path = tmp_path / "catalog_snapshot.bin"
+
+    async def body(api):
+        await seed_catalog(api)
+        built = await maimai_type.MusicList(snapshot_file=path, api=api).load_catalog()
+        assert path.exists()
+        capsys.readouterr()
+
+        # 冷启动：读取快照，不从数据库重建
+        cold = await maimai_type.MusicList(snapshot_file=path, api=api).load_catalog()
+        assert "冷启动快照）" in capsys.readouterr().out
+        assert cold.generation == built.generation
+        assert cold.count({}) == built.count({})
+
+        # 曲库同步后快照过期：从数据库重建并写回新的快照
+        await api.write(bump_catalog_generation)
+        rebuilt = await maimai_type.MusicList(snapshot_file=path, api=api).load_catalog()
+        out = capsys.readouterr().out
+        assert "已过期" in out and "（冷启动快照）" not in out
+        assert rebuilt.generation == built.generation + 1
+        assert CatalogSnapshot.load(path).generation == rebuilt.generation
+
+    run_db(body)
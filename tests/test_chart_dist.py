@@ -0,0 +1,92 @@
+"""
+谱面分布的定长 BLOB：pack_dist / unpack_dist 往返，迁移 007 从逐桶一行的旧表转换
+"""
+
+import numpy as np
+import pytest
+
+from src.libraries.maimai.database import DIST_DTYPE, FC_DIST_SIZE, RANK_DIST_SIZE, pack_dist, unpack_dist
+from src.libraries.maimai.migrations import MIGRATIONS
+
+
+@pytest.mark.parametrize("counts, size", [
+    (list(range(RANK_DIST_SIZE)), RANK_DIST_SIZE),
+    ([7, 0, 3], FC_DIST_SIZE),
+    ([2**31 - 1, -5, 0, 1, 2, 3], FC_DIST_SIZE),
+    (np.arange(RANK_DIST_SIZE, dtype=np.int64) * 1000, RANK_DIST_SIZE),
+    ([], RANK_DIST_SIZE),
+    (None, FC_DIST_SIZE),
+])
+def test_round_trip(counts, size):
+    blob = pack_dist(counts, size)
+    assert len(blob) == size * DIST_DTYPE.itemsize
+    dist = unpack_dist(blob, size)
+    expected = (list(counts) if counts is not None else [])[:size]
+    expected += [0] * (size - len(expected))
+    assert dist.dtype == DIST_DTYPE and dist.shape == (size,)
+    assert dist.tolist() == expected
+    assert not dist.flags.writeable
+
+
+def test_unpack_references_the_blob():
+    blob = pack_dist([1, 2, 3, 4, 5], FC_DIST_SIZE)
+    dist = unpack_dist(blob, FC_DIST_SIZE)
+    assert dist.base is blob
+
+
+@pytest.mark.parametrize("blob", [None, b""])
+def test_missing_blob_is_all_zero(blob):
+    dist = unpack_dist(blob, RANK_DIST_SIZE)
+    assert dist.tolist() == [0] * RANK_DIST_SIZE and not dist.flags.writeable
+
+
+def test_migration_packs_bucket_rows(run_db):
+    keys = [(1, 0), (1, 3), (10001, 2)]
+
+    async def body(api):
+        async def apply(db):
+            for m in MIGRATIONS[:6]:
+                await m.run(db)
+            await db.executemany("INSERT INTO music (id, title, type) VALUES (?, ?, 'SD')", [(1, "a"), (10001, "b")])
+            await db.executemany("INSERT INTO chart (music_id, diff_index, ds) VALUES (?, ?, 13.0)", keys)
+            await db.executemany(
+                "INSERT INTO chart_stats VALUES (?, ?, '13', 10, 13.0, 99.0, 1000.0, 1.0)", keys
+            )
+            # (1, 0) 有完整分布，(1, 3) 只有部分桶，(10001, 2) 没有分布；越界的桶被忽略
+            await db.executemany("INSERT INTO chart_rating_dist VALUES (1, 0, ?, ?)", [(i, i * 10) for i in range(RANK_DIST_SIZE)])
+            await db.executemany("INSERT INTO chart_rating_dist VALUES (1, 3, ?, ?)", [(2, 5), (13, 1), (20, 99)])
+            await db.executemany("INSERT INTO chart_fc_dist VALUES (1, 0, ?, ?)", [(i, 5 - i) for i in range(FC_DIST_SIZE)])
+            await MIGRATIONS[6].run(db)
+        await api.write(apply)
+
+        async with api.connection() as db:
+            cursor = await db.execute("SELECT music_id, diff_index, rank_dist, fc_dist FROM chart_stats ORDER BY music_id, diff_index")
+            rows = await cursor.fetchall()
+            cursor = await db.execute("SELECT name FROM sqlite_master WHERE name IN ('chart_rating_dist', 'chart_fc_dist')")
+            old_tables = await cursor.fetchall()
+        return rows, old_tables
+
+    rows, old_tables = run_db(body, migrated=False)
+    dists = {(m, d): (unpack_dist(rank, RANK_DIST_SIZE).tolist(), unpack_dist(fc, FC_DIST_SIZE).tolist()) for m, d, rank, fc in rows}
+    assert dists[1, 0] == ([i * 10 for i in range(RANK_DIST_SIZE)], [5, 4, 3, 2, 1])
+    assert dists[1, 3] == ([0, 0, 5] + [0] * 10 + [1], [0] * FC_DIST_SIZE)
+    assert dists[10001, 2] == ([0] * RANK_DIST_SIZE, [0] * FC_DIST_SIZE)
+    assert rows[0]["fc_dist"] is not None and rows[2]["rank_dist"] is None
+    assert old_tables == []
+
+
+def test_stats_read_packed_dists(run_db, catalog_rows):
+    pytest.importorskip("opencc")
+    maimai_type = pytest.importorskip("src.libraries.maimai.maimai_type")
+    from conftest import api_payload
+    music_data, stats = api_payload(*catalog_rows)
+
+    async def body(api):
+        await api.sync_catalog(music_data, stats)
+        chart = catalog_rows[1][0]
+        async with api.connection() as db:
+            return await maimai_type.Stats.from_db(db, chart["music_id"], chart["diff_index"])
+
+    result = run_db(body)
+    assert result.rank_dist.tolist() == list(range(RANK_DIST_SIZE))
+    assert result.fc_dist.tolist() == [5, 4, 3, 2, 1]
@@ -0,0 +1,85 @@
+"""
+谱面列表条件：(music_id, diff_index) 列表作为一个 json_each 参数传入，任意长度都只执行一次查询
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from conftest import user_json
+from src.libraries.maimai.database import CHART_KEYS_SQL, BEST_RECORD_BY_KEYS_SQL, STATS_UPSERT_SQL, chart_keys_param
+
+# 超过 SQLite 默认的绑定参数上限（32766），逐对展开占位符时无法执行
+N_FAKE_KEYS = 40000
+
+
+def fake_keys(n: int = N_FAKE_KEYS):
+    return [(200000 + i, i % 5) for i in range(n)]
+
+
+def played_records(charts):
+    return [(c["music_id"], c["diff_index"], 90 + i, "aaa", "", "") for i, c in enumerate(charts[:12:2])]
+
+
+def test_chart_keys_param_encoding():
+    keys = [(np.int64(11), np.int32(3)), (10001, 0)]
+    assert chart_keys_param(keys) == "[[11,3],[10001,0]]"
+    assert chart_keys_param(zip([1, 2], [0, 4])) == "[[1,0],[2,4]]"
+    assert json.loads(chart_keys_param([])) == []
+
+
+def test_large_key_list_runs_as_one_query(run_db, seed_catalog, catalog_rows):
+    _, charts = catalog_rows
+    chart_keys = [(c["music_id"], c["diff_index"]) for c in charts]
+    records = played_records(charts)
+
+    async def body(api):
+        await seed_catalog(api)
+        await api.sync_user_records(user_json("Alice", records))
+        keys = fake_keys() + chart_keys[::-1]
+        async with api.connection() as db:
+            cursor = await db.execute(
+                f"SELECT music_id, diff_index FROM chart WHERE (music_id, diff_index) IN ({CHART_KEYS_SQL})",
+                (chart_keys_param(keys),)
+            )
+            matched = await cursor.fetchall()
+            cursor = await db.execute(BEST_RECORD_BY_KEYS_SQL, (chart_keys_param(keys), "alice"))
+            best = await cursor.fetchall()
+        return matched, best
+
+    matched, best = run_db(body)
+    assert sorted(tuple(row) for row in matched) == sorted(chart_keys)
+    assert sorted((row[0], row[1], row[2]) for row in best) == sorted((m, d, a) for m, d, a, *_ in records)
+
+
+def test_best_record_filter_and_stats_by_keys_accept_any_size(run_db, seed_catalog, catalog_rows):
+    maimai_type = pytest.importorskip("src.libraries.maimai.maimai_type")
+    _, charts = catalog_rows
+    records = played_records(charts)
+    wanted = [(m, d) for m, d, *_ in records[::2]]
+
+    async def body(api):
+        await seed_catalog(api)
+        await api.sync_user_records(user_json("Alice", records))
+
+        async def insert_stats(db):
+            await db.executemany(STATS_UPSERT_SQL, [
+                {"music_id": c["music_id"], "diff_index": c["diff_index"], "level": c["level"], "cnt": i + 1,
+                 "fit_diff": c["ds"], "avg": 99.0, "avg_dx": 1000.0, "std_dev": 1.0, "rank_dist": None, "fc_dist": None}
+                for i, c in enumerate(charts)
+            ])
+        await api.write(insert_stats)
+
+        best_record_list = maimai_type.BestRecordList(api=api)
+        result = await best_record_list.filter("alice", chart_list=fake_keys() + wanted, order=["+music_id", "+diff_index"])
+        streamed = [r async for r in best_record_list.iter_filter("alice", chart_list=fake_keys() + wanted, order=["+music_id", "+diff_index"])]
+        async with api.connection() as db:
+            stats = await maimai_type.Stats.by_keys(db, fake_keys() + [(c["music_id"], c["diff_index"]) for c in charts])
+        return result, streamed, stats
+
+    result, streamed, stats = run_db(body)
+    assert result["record_count"] == len(wanted)
+    assert [(r.music_id, r.diff_index) for r in result["record_list"]] == sorted(wanted)
+    assert [(r.music_id, r.diff_index) for r in streamed] == sorted(wanted)
+    assert {key: s.cnt for key, s in stats.items()} == {(c["music_id"], c["diff_index"]): i + 1 for i, c in enumerate(charts)}
@@ -0,0 +1,132 @@
+"""
+社区统计：RunningStats 的 add / remove 与整体重新计算一致，sync_user_records 增量维护的 community_stats
+与从 best_record 重新统计的结果一致，迁移 010 从已有成绩初始化
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from conftest import user_json
+from src.libraries.maimai.database import RANK_DIST_SIZE, RunningStats
+from src.libraries.maimai.community_stats import CommunityStatsEngine
+from src.libraries.maimai.migrations import MIGRATIONS
+
+RATES = ["d", "c", "b", "bb", "bbb", "a", "aa", "aaa", "s", "sp", "ss", "ssp", "sss", "sssp"]
+
+
+def assert_matches(stats: RunningStats, values, ranks):
+    assert stats.cnt == len(values)
+    if values:
+        assert stats.mean == pytest.approx(np.mean(values), abs=1e-9)
+        assert stats.std_dev == pytest.approx(np.std(values), abs=1e-6)
+    else:
+        assert (stats.mean, stats.m2, stats.std_dev) == (0.0, 0.0, 0.0)
+    assert stats.rank_dist.tolist() == np.bincount(ranks, minlength=RANK_DIST_SIZE).tolist()
+
+
+def test_add_remove_matches_recomputation():
+    rnd = random.Random(3)
+    stats, live = RunningStats(), []
+    for step in range(2000):
+        if live and rnd.random() < 0.4:
+            achievements, rank_id = live.pop(rnd.randrange(len(live)))
+            stats.remove(achievements, rank_id)
+        else:
+            item = (round(rnd.uniform(80, 101), 4), rnd.randrange(RANK_DIST_SIZE))
+            live.append(item)
+            stats.add(*item)
+        if step % 250 == 0:
+            assert_matches(stats, [a for a, _ in live], [r for _, r in live])
+    assert_matches(stats, [a for a, _ in live], [r for _, r in live])
+
+    for item in list(live):
+        stats.remove(*item)
+    assert_matches(stats, [], [])
+
+
+def test_fit_interpolates_on_the_curve():
+    curve = (np.array([12.0, 13.0, 14.0]), np.array([100.0, 98.0, 95.0]))
+    assert CommunityStatsEngine.fit(curve, 96.5) == pytest.approx(13.5)
+    assert CommunityStatsEngine.fit(curve, 101.0) == 12.0
+    assert CommunityStatsEngine.fit((curve[0][:1], curve[1][:1]), 99.0) is None
+
+
+async def table_and_expected(api):
+    async with api.connection() as db:
+        cursor = await db.execute("SELECT music_id, diff_index, cnt, mean, m2 FROM community_stats WHERE cnt > 0")
+        table = {(row[0], row[1]): (row[2], row[3], row[4]) for row in await cursor.fetchall()}
+        cursor = await db.execute("SELECT music_id, diff_index, achievements FROM best_record WHERE achievements IS NOT NULL")
+        values = {}
+        for music_id, diff_index, achievements in await cursor.fetchall():
+            values.setdefault((music_id, diff_index), []).append(achievements)
+    return table, values
+
+
+def assert_table_matches(table, values):
+    assert table.keys() == values.keys()
+    for key, (cnt, mean, m2) in table.items():
+        assert cnt == len(values[key])
+        assert mean == pytest.approx(np.mean(values[key]), abs=1e-9)
+        assert m2 == pytest.approx(np.var(values[key]) * cnt, abs=1e-6)
+
+
+def user_records(charts, rnd):
+    return [(c["music_id"], c["diff_index"], round(rnd.uniform(90, 101), 4), rnd.choice(RATES), "", "")
+            for c in rnd.sample(charts[:20], 12)]
+
+
+def test_incremental_updates_match_best_record(run_db, seed_catalog, catalog_rows):
+    _, charts = catalog_rows
+    rnd = random.Random(11)
+    users = {f"user{i}": user_records(charts, rnd) for i in range(6)}
+
+    async def body(api):
+        await seed_catalog(api)
+        for name, records in users.items():
+            await api.sync_user_records(user_json(name, records))
+        # 成绩提升、新增谱面、同一份数据重复同步
+        for name in ("user0", "user3"):
+            changed = [(m, d, min(a + 0.5, 101.0), "sssp", fc, fs) for m, d, a, _, fc, fs in users[name][:5]]
+            await api.sync_user_records(user_json(name, changed + users[name][5:] + user_records(charts, rnd)[:2]))
+        await api.sync_user_records(user_json("user1", users["user1"]))
+        table, values = await table_and_expected(api)
+        engine = CommunityStatsEngine(api=api, min_count=1)
+        return table, values, await engine.by_keys(list(values))
+
+    table, values, engine_stats = run_db(body)
+    assert_table_matches(table, values)
+    for key, stats in engine_stats.items():
+        assert (stats.cnt, stats.avg) == (table[key][0], pytest.approx(table[key][1]))
+        assert int(stats.rank_dist.sum()) == stats.cnt
+    assert engine_stats.keys() == values.keys()
+
+
+def test_migration_seeds_from_existing_records(run_db, seed_catalog, catalog_rows):
+    _, charts = catalog_rows
+    rnd = random.Random(5)
+
+    async def body(api):
+        await seed_catalog(api)
+        for i in range(4):
+            await api.sync_user_records(user_json(f"user{i}", user_records(charts, rnd)))
+        # 一部分玩家的成绩在冷存储中，也要计入
+        async def make_inactive(db):
+            await db.execute("UPDATE user SET ts = datetime('now', '-200 days') WHERE id IN ('user1', 'user2')")
+        await api.write(make_inactive)
+        assert await api.archive_inactive_users(max_age_days=90) == 2
+        await api.sync_user_records(user_json("user0", user_records(charts, rnd)))
+
+        # 清空后重新执行迁移 010，从 best_record 与冷存储统计
+        async def reseed(db):
+            await db.execute("DELETE FROM community_stats")
+            await MIGRATIONS[9].run(db)
+        await api.write(reseed)
+        table, _ = await table_and_expected(api)
+        for i in range(4):
+            await api.ensure_hot(f"user{i}")
+        return table, (await table_and_expected(api))[1]
+
+    table, values = run_db(body)
+    assert_table_matches(table, values)
@@ -0,0 +1,147 @@
+"""
+ConnectionPool：连接复用、上限与等待、归还时回滚、损坏连接的替换
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from src.libraries.maimai.database import ConnectionPool
+
+
+async def create_table(pool: ConnectionPool) -> None:
+    async with pool.acquire() as db:
+        await db.execute("CREATE TABLE t (x INTEGER)")
+        await db.commit()
+
+
+def test_connections_are_reused(db_path):
+    async def body():
+        pool = ConnectionPool(db_path, size=4)
+        ids = []
+        for _ in range(5):
+            async with pool.acquire() as db:
+                ids.append(id(db))
+        await pool.close()
+        return ids, pool.stats()
+
+    ids, stats = asyncio.run(body())
+    assert len(set(ids)) == 1
+    assert stats["created"] == 1 and stats["acquired"] == 5
+
+
+def test_pool_never_exceeds_size(db_path):
+    async def body():
+        pool = ConnectionPool(db_path, size=2)
+        in_use, peak = 0, 0
+
+        async def worker():
+            nonlocal in_use, peak
+            async with pool.acquire():
+                in_use += 1
+                peak = max(peak, in_use)
+                await asyncio.sleep(0.01)
+                in_use -= 1
+
+        await asyncio.gather(*(worker() for _ in range(6)))
+        stats = pool.stats()
+        await pool.close()
+        return peak, stats
+
+    peak, stats = asyncio.run(body())
+    assert peak == 2
+    assert stats["created"] == 2 and stats["waits"] >= 1 and stats["in_use"] == 0
+
+
+def test_checkin_rolls_back_open_transaction(db_path):
+    async def body():
+        pool = ConnectionPool(db_path, size=1)
+        await create_table(pool)
+        async with pool.acquire() as db:
+            await db.execute("INSERT INTO t VALUES (1)")
+        async with pool.acquire() as db:
+            cursor = await db.execute("SELECT COUNT(*) FROM t")
+            count = (await cursor.fetchone())[0]
+        await pool.close()
+        return count
+
+    assert asyncio.run(body()) == 0
+
+
+def test_acquire_times_out_when_pool_is_exhausted(db_path):
+    async def body():
+        pool = ConnectionPool(db_path, size=1, acquire_timeout=0.05)
+        try:
+            async with pool.acquire():
+                with pytest.raises(asyncio.TimeoutError):
+                    async with pool.acquire():
+                        pass
+        finally:
+            await pool.close()
+
+    asyncio.run(body())
+
+
+def test_discarded_connection_wakes_a_waiter(db_path):
+    async def body():
+        pool = ConnectionPool(db_path, size=1, acquire_timeout=5)
+        await create_table(pool)
+        waited = None
+
+        async def waiter():
+            nonlocal waited
+            start = time.perf_counter()
+            async with pool.acquire() as db:
+                waited = time.perf_counter() - start
+                cursor = await db.execute("SELECT COUNT(*) FROM t")
+                return (await cursor.fetchone())[0]
+
+        async with pool.acquire() as db:
+            task = asyncio.ensure_future(waiter())
+            await asyncio.sleep(0.01)
+            await db.execute("INSERT INTO t VALUES (1)")
+            # 连接在使用中损坏：归还时回滚失败，被丢弃
+            await db.close()
+        count = await task
+        stats = pool.stats()
+        await pool.close()
+        return count, waited, stats
+
+    count, waited, stats = asyncio.run(body())
+    assert count == 0
+    assert waited < 1
+    assert stats["created"] == 2 and stats["opened"] == 1 and stats["idle"] == 1
+
+
+def test_unhealthy_idle_connection_is_recycled(db_path):
+    async def body():
+        pool = ConnectionPool(db_path, size=1, health_check_interval=0)
+        async with pool.acquire() as db:
+            first = db
+        await first.close()
+        async with pool.acquire() as db:
+            cursor = await db.execute("SELECT 1")
+            value = (await cursor.fetchone())[0]
+            replaced = db is not first
+        stats = pool.stats()
+        await pool.close()
+        return value, replaced, stats
+
+    value, replaced, stats = asyncio.run(body())
+    assert value == 1 and replaced
+    assert stats["recycled"] == 1 and stats["opened"] == 1
+
+
+def test_closed_pool_refuses_checkout(db_path):
+    async def body():
+        pool = ConnectionPool(db_path, size=1)
+        async with pool.acquire():
+            pass
+        await pool.close()
+        with pytest.raises(RuntimeError):
+            async with pool.acquire():
+                pass
+        return pool.stats()
+
+    assert asyncio.run(body())["opened"] == 0
@@ -0,0 +1,116 @@
+"""
+DatabaseWriter：写入按提交顺序串行执行；出错回滚且不影响后续写入；写任务被取消时回滚并结束所有等待
+"""
+
+import asyncio
+
+import aiosqlite
+import pytest
+
+from src.libraries.maimai.database import DatabaseWriter
+
+
+class Abort(BaseException):
+    pass
+
+
+async def create_table(writer: DatabaseWriter) -> None:
+    async def create(db):
+        await db.execute("CREATE TABLE t (x INTEGER)")
+    await writer.submit(create)
+
+
+def insert(value, delay: float = 0):
+    async def func(db):
+        await db.execute("INSERT INTO t VALUES (?)", (value,))
+        await asyncio.sleep(delay)
+        cursor = await db.execute("SELECT COUNT(*) FROM t")
+        return (await cursor.fetchone())[0]
+    return func
+
+
+async def committed(db_path):
+    async with aiosqlite.connect(db_path) as db:
+        cursor = await db.execute("SELECT x FROM t ORDER BY rowid")
+        return [row[0] for row in await cursor.fetchall()]
+
+
+def test_writes_run_in_submission_order(db_path):
+    async def body():
+        writer = DatabaseWriter(db_path)
+        await create_table(writer)
+        counts = await asyncio.gather(*(writer.submit(insert(i, delay=0.001 * (5 - i))) for i in range(5)))
+        await writer.close()
+        async with aiosqlite.connect(db_path) as db:
+            cursor = await db.execute("PRAGMA journal_mode")
+            mode = (await cursor.fetchone())[0]
+        return counts, await committed(db_path), mode, writer.metrics
+
+    counts, rows, mode, metrics = asyncio.run(body())
+    assert counts == [1, 2, 3, 4, 5]
+    assert rows == [0, 1, 2, 3, 4]
+    assert mode == "wal"
+    assert metrics["submitted"] == metrics["completed"] == 6 and metrics["failed"] == 0
+
+
+def test_failed_write_rolls_back_and_writer_keeps_going(db_path):
+    async def failing(db):
+        await db.execute("INSERT INTO t VALUES (99)")
+        raise ValueError("boom")
+
+    async def body():
+        writer = DatabaseWriter(db_path)
+        await create_table(writer)
+        with pytest.raises(ValueError):
+            await writer.submit(failing)
+        count = await writer.submit(insert(1))
+        await writer.close()
+        return count, await committed(db_path), writer.metrics
+
+    count, rows, metrics = asyncio.run(body())
+    assert count == 1 and rows == [1]
+    assert metrics["failed"] == 1
+
+
+def test_cancelled_writer_rolls_back_and_releases_every_caller(db_path):
+    async def body():
+        writer = DatabaseWriter(db_path)
+        await create_table(writer)
+        running = asyncio.ensure_future(writer.submit(insert(1, delay=10)))
+        queued = asyncio.ensure_future(writer.submit(insert(2)))
+        await asyncio.sleep(0.05)
+        writer._task.cancel()
+        results = await asyncio.gather(running, queued, return_exceptions=True)
+        task_cancelled = writer._task.cancelled()
+        await writer.close()
+        return results, task_cancelled, await committed(db_path)
+
+    results, task_cancelled, rows = asyncio.run(body())
+    assert all(isinstance(r, asyncio.CancelledError) for r in results)
+    assert task_cancelled
+    assert rows == []
+
+
+def test_base_exception_reaches_caller_and_stops_the_writer(db_path):
+    async def aborting(db):
+        await db.execute("INSERT INTO t VALUES (99)")
+        raise Abort()
+
+    async def body():
+        writer = DatabaseWriter(db_path)
+        await create_table(writer)
+        first = writer._conn
+        with pytest.raises(Abort):
+            await writer.submit(aborting)
+        await asyncio.sleep(0)
+        with pytest.raises(Abort):
+            writer._task.result()
+        # 下一次提交会重新启动写任务
+        count = await writer.submit(insert(1))
+        # 原来的写连接已关闭
+        with pytest.raises(ValueError):
+            await first.execute("SELECT 1")
+        await writer.close()
+        return count, await committed(db_path)
+
+    assert asyncio.run(body()) == (1, [1])
@@ -0,0 +1,165 @@
+"""
+DataLoader：同一轮事件循环内合并点查询、请求缓存、按代数失效、结果隔离
+"""
+
+import asyncio
+
+import pytest
+
+from conftest import user_json
+from src.libraries.maimai.dataloader import DataLoader, request_scope
+
+
+class Source:
+    """
+    记录每次 batch_fn 调用的数据源；values 中没有的 key 视为不存在
+    """
+
+    def __init__(self, values):
+        self.values = values
+        self.batches = []
+
+    async def batch_fn(self, keys):
+        self.batches.append(sorted(keys))
+        await asyncio.sleep(0)
+        return {key: self.values[key] for key in keys if key in self.values}
+
+
+def test_loads_in_one_tick_are_batched_and_deduplicated():
+    source = Source({1: "a", 2: "b", 3: "c"})
+    loader = DataLoader(source.batch_fn)
+
+    async def body():
+        return await asyncio.gather(loader.load(1), loader.load(2), loader.load(1), loader.load(4))
+
+    assert asyncio.run(body()) == ["a", "b", "a", None]
+    assert source.batches == [[1, 2, 4]]
+    assert loader.metrics["batches"] == 1 and loader.metrics["keys"] == 3
+
+
+def test_load_many_keeps_order():
+    source = Source({1: "a", 2: "b"})
+    loader = DataLoader(source.batch_fn)
+    assert asyncio.run(loader.load_many([2, 5, 1])) == ["b", None, "a"]
+    assert source.batches == [[1, 2, 5]]
+
+
+def test_request_scope_caches_until_the_scope_ends():
+    source = Source({1: "a"})
+    loader = DataLoader(source.batch_fn)
+
+    async def body():
+        with request_scope():
+            await loader.load(1)
+            await loader.load(1)
+        await loader.load(1)
+
+    asyncio.run(body())
+    assert len(source.batches) == 2
+    assert loader.metrics["cache_hits"] == 1
+
+
+def test_request_cache_is_keyed_by_generation_of_each_key():
+    source = Source({("alice", 1): 1, ("bob", 1): 2})
+    versions = {"alice": 0, "bob": 0}
+    loader = DataLoader(source.batch_fn, generation=lambda key: versions[key[0]])
+
+    async def body():
+        with request_scope():
+            await loader.load_many([("alice", 1), ("bob", 1)])
+            # alice 同步了成绩：她的记录重新查询，bob 的仍命中缓存
+            versions["alice"] += 1
+            source.values[("alice", 1)] = 10
+            return await loader.load_many([("alice", 1), ("bob", 1)])
+
+    assert asyncio.run(body()) == [10, 2]
+    assert source.batches == [[("alice", 1), ("bob", 1)], [("alice", 1)]]
+
+
+def test_callers_get_independent_deep_copies():
+    source = Source({1: {"charts": [{"ds": 13.7}]}})
+    loader = DataLoader(source.batch_fn)
+
+    async def body():
+        with request_scope():
+            first, second = await asyncio.gather(loader.load(1), loader.load(1))
+            first["charts"][0]["ds"] = 0
+            first["charts"].append(None)
+            return second, await loader.load(1)
+
+    second, cached = asyncio.run(body())
+    assert second == cached == {"charts": [{"ds": 13.7}]}
+    assert source.values[1] == {"charts": [{"ds": 13.7}]}
+
+
+def test_batch_error_reaches_every_caller():
+    async def failing(keys):
+        raise KeyError("boom")
+
+    loader = DataLoader(failing)
+
+    async def body():
+        return await asyncio.gather(loader.load(1), loader.load(2), return_exceptions=True)
+
+    results = asyncio.run(body())
+    assert all(isinstance(r, KeyError) for r in results)
+
+
+def test_cancelled_caller_does_not_cancel_the_batch():
+    source = Source({1: "a"})
+    loader = DataLoader(source.batch_fn)
+
+    async def body():
+        first = asyncio.ensure_future(loader.load(1))
+        second = asyncio.ensure_future(loader.load(1))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(body()) == ("a", True)
+
+
+def test_running_batches_are_referenced_until_done():
+    async def body():
+        gate = asyncio.Event()
+
+        async def slow(keys):
+            await gate.wait()
+            return {key: key for key in keys}
+
+        loader = DataLoader(slow)
+        pending = asyncio.ensure_future(loader.load(1))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        running = len(loader._tasks)
+        gate.set()
+        value = await pending
+        await asyncio.sleep(0)
+        return running, value, len(loader._tasks)
+
+    assert asyncio.run(body()) == (1, 1, 0)
+
+
+def test_best_record_list_reloads_after_a_sync(run_db, seed_catalog, catalog_rows):
+    maimai_type = pytest.importorskip("src.libraries.maimai.maimai_type")
+    chart = catalog_rows[1][0]
+    key = (chart["music_id"], chart["diff_index"])
+
+    async def body(api):
+        await seed_catalog(api)
+        await api.sync_user_records(user_json("Alice", [(*key, 99.0, "sp", "", "")]))
+        best_record_list = maimai_type.BestRecordList(api=api)
+        with request_scope():
+            before = await best_record_list.by_user_and_music("alice", *key)
+            cached = await best_record_list.by_user_and_music("alice", *key)
+            # 同一请求内玩家刷新了成绩：旧记录不再命中缓存
+            await api.sync_user_records(user_json("Alice", [(*key, 100.5, "sssp", "ap", "")]))
+            after = await best_record_list.by_user_and_music("alice", *key)
+            missing = await best_record_list.by_user_and_music("bob", *key)
+        return before, cached, after, missing, best_record_list.loader.metrics
+
+    before, cached, after, missing, metrics = run_db(body)
+    assert before.achievements == cached.achievements == 99.0
+    assert after.achievements == 100.5 and after.fc_id == 3
+    assert missing is None
+    assert metrics["cache_hits"] == 1
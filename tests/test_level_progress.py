@@ -0,0 +1,105 @@
+"""
+等级完成表：LevelProgressEngine 的谱面、成绩与计数，以及 level_records 分桶后交给绘图的结构
+"""
+
+import pytest
+
+level_progress = pytest.importorskip("src.libraries.maimai.level_progress")
+maimai_type = pytest.importorskip("src.libraries.maimai.maimai_type")
+
+LEVEL = 13
+
+
+def level_charts(charts, plus):
+    low, high = level_progress.level_ds_range(LEVEL, plus)
+    selected = [c for c in charts if low <= c["ds"] <= high]
+    return sorted(selected, key=lambda c: (-c["ds"], c["music_id"], c["diff_index"]))
+
+
+def user_json(played):
+    ap, sp = played
+    return {
+        "username": "Alice", "additional_rating": 0, "nickname": "alice", "plate": "", "rating": 12345,
+        "records": [
+            {"song_id": ap["music_id"], "level_index": ap["diff_index"], "achievements": 100.6, "ra": 300,
+             "dxScore": 1000, "rate": "sssp", "fc": "ap", "fs": "fsd"},
+            {"song_id": sp["music_id"], "level_index": sp["diff_index"], "achievements": 99.1, "ra": 250,
+             "dxScore": 900, "rate": "sp", "fc": "fc", "fs": ""},
+        ],
+    }
+
+
+@pytest.fixture
+def progress_results(run_db, seed_catalog, catalog_rows):
+    _, charts = catalog_rows
+    played = level_charts(charts, plus=False)[:2]
+
+    async def body(api):
+        await seed_catalog(api)
+        await api.sync_user_records(user_json(played))
+        results = {}
+        # 未加载曲库快照时谱面走 SQL，加载后走曲库快照的投影，两者结果应一致
+        music_list = maimai_type.MusicList(api=api)
+        engine = level_progress.LevelProgressEngine(music_list, api)
+        for plus in (False, True):
+            results["sql", plus] = await engine.progress("Alice", ds_range=level_progress.level_ds_range(LEVEL, plus))
+        await music_list.load_catalog(use_snapshot=False)
+        for plus in (False, True):
+            results["catalog", plus] = await engine.progress("Alice", ds_range=level_progress.level_ds_range(LEVEL, plus))
+        results["table"] = await engine.progress(None, ds_range=level_progress.level_ds_range(LEVEL, False))
+        results["cached"] = await engine.progress("alice", ds_range=level_progress.level_ds_range(LEVEL, False))
+        await api.sync_user_records(user_json(played[::-1]))
+        results["resynced"] = await engine.progress("alice", ds_range=level_progress.level_ds_range(LEVEL, False))
+        return results
+
+    return run_db(body), charts, played
+
+
+@pytest.mark.parametrize("path", ["sql", "catalog"])
+@pytest.mark.parametrize("plus", [False, True])
+def test_records_are_bucketed_by_ds(progress_results, path, plus):
+    results, charts, played = progress_results
+    expected = level_charts(charts, plus)
+    assert expected
+
+    records = level_progress.level_records(results[path, plus], LEVEL, plus)
+    suffixes = [".6", ".7", ".8", ".9"] if plus else [".0", ".1", ".2", ".3", ".4", ".5"]
+    assert list(records) == [f"{LEVEL}{suffix}" for suffix in suffixes]
+
+    covers = {} if plus else {(played[0]["music_id"], played[0]["diff_index"]): ("ap", True),
+                              (played[1]["music_id"], played[1]["diff_index"]): ("sp", False)}
+    for key, bucket in records.items():
+        in_bucket = [c for c in expected if str(c["ds"]) == key]
+        assert bucket == [
+            {"id": c["music_id"], "level_index": c["diff_index"], "ds": c["ds"],
+             "cover": covers.get((c["music_id"], c["diff_index"]), ("", False))[0],
+             "finished": covers.get((c["music_id"], c["diff_index"]), ("", False))[1]}
+            for c in in_bucket
+        ], key
+
+
+def test_counts(progress_results):
+    results, _, _ = progress_results
+    progress = results["catalog", False]
+    assert progress.played == 2
+    assert progress.achieved_count("sss") == 1 and progress.achieved_count("sp") == 2
+    assert progress.achieved_count("ap") == 1 and progress.achieved_count("fc") == 2
+    assert progress.achieved_count("fsd") == 1
+    assert progress.achieved("ap").sum() == 1
+
+
+def test_table_without_user_has_no_records(progress_results):
+    results, _, _ = progress_results
+    table = results["table"]
+    assert table.played == 0 and table.total == results["catalog", False].total
+    for bucket in level_progress.level_records(table, LEVEL, False).values():
+        assert all(chart["cover"] == "" and not chart["finished"] for chart in bucket)
+
+
+def test_cache_is_invalidated_by_a_sync(progress_results):
+    results, _, played = progress_results
+    assert results["cached"] is results["catalog", False]
+    resynced = level_progress.level_records(results["resynced"], LEVEL, False)
+    covers = {(chart["id"], chart["level_index"]): chart["cover"] for bucket in resynced.values() for chart in bucket}
+    assert covers[played[0]["music_id"], played[0]["diff_index"]] == "sp"
+    assert covers[played[1]["music_id"], played[1]["diff_index"]] == "ap"
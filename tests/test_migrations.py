@@ -0,0 +1,123 @@
+"""
+maimai.db 结构迁移：在临时数据库上执行全部迁移，校验热点查询计划、重复执行与 --dry-run
+"""
+
+import asyncio
+import sqlite3
+
+import pytest
+
+from src.libraries.maimai.database import DatabaseAPI
+from src.libraries.maimai.migrations import MIGRATIONS, PLAN_CHECKS, current_version, explain, main, migrate, verify
+
+
+async def schema_versions(api: DatabaseAPI):
+    async with api.connection() as db:
+        if await current_version(db) == 0:
+            return []
+        cursor = await db.execute("SELECT version, name FROM schema_version ORDER BY version")
+        return [tuple(row) for row in await cursor.fetchall()]
+
+
+async def schema_objects(api: DatabaseAPI):
+    async with api.connection() as db:
+        cursor = await db.execute("SELECT type, name, sql FROM sqlite_master ORDER BY type, name")
+        return [tuple(row) for row in await cursor.fetchall()]
+
+
+def journal_mode(path) -> str:
+    db = sqlite3.connect(path.resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        return db.execute("PRAGMA journal_mode").fetchone()[0]
+    finally:
+        db.close()
+
+
+def test_migrate_applies_every_migration(run_db):
+    async def body(api):
+        applied = await migrate(api)
+        return applied, await schema_versions(api)
+
+    applied, versions = run_db(body, migrated=False)
+    assert [m.version for m in applied] == [m.version for m in MIGRATIONS]
+    assert versions == [(m.version, m.name) for m in MIGRATIONS]
+
+
+@pytest.mark.parametrize("name", ["b50", "plate", "level"])
+def test_query_plan_uses_index(run_db, name):
+    _, sql, expected, forbidden = next(check for check in PLAN_CHECKS if check[0] == name)
+
+    async def body(api):
+        async with api.connection() as db:
+            return "\n".join(await explain(db, sql))
+
+    plan = run_db(body)
+    for fragment in expected:
+        assert fragment in plan
+    for fragment in forbidden:
+        assert fragment not in plan
+
+
+def test_verify_passes_after_migrate(run_db):
+    lines = run_db(verify)
+    assert [line.split(":")[0] for line in lines] == [check[0] for check in PLAN_CHECKS]
+
+
+def test_migrate_twice_is_noop(run_db):
+    async def body(api):
+        before = await schema_versions(api), await schema_objects(api)
+        applied = await migrate(api)
+        after = await schema_versions(api), await schema_objects(api)
+        return applied, before, after
+
+    applied, before, after = run_db(body)
+    assert applied == []
+    assert after == before
+
+
+def test_dry_run_leaves_schema_version_unchanged(run_db):
+    async def fresh(api):
+        pending = await migrate(api, dry_run=True)
+        async with api.connection() as db:
+            version = await current_version(db)
+        return pending, version, await schema_objects(api)
+
+    pending, version, objects = run_db(fresh, migrated=False)
+    assert [m.version for m in pending] == [m.version for m in MIGRATIONS]
+    assert version == 0
+    assert not any(name == "schema_version" for _, name, _ in objects)
+
+    async def migrated(api):
+        before = await schema_versions(api)
+        pending = await migrate(api, dry_run=True)
+        return pending, before, await schema_versions(api)
+
+    pending, before, after = run_db(migrated)
+    assert pending == []
+    assert after == before
+
+
+def test_dry_run_does_not_create_database(db_path):
+    asyncio.run(main([str(db_path), "--dry-run"]))
+    assert not db_path.exists()
+
+
+def test_dry_run_keeps_journal_mode_and_file(run_db, db_path):
+    # 先用回滚日志模式建好数据库，并只执行前几个迁移
+    async def partial(api):
+        async def apply(db):
+            await db.execute("CREATE TABLE schema_version (version INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+            for m in MIGRATIONS[:3]:
+                await m.run(db)
+                await db.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (m.version, m.name))
+        await api.write(apply)
+
+    run_db(partial, migrated=False, wal=False)
+    before = journal_mode(db_path), db_path.read_bytes(), sorted(p.name for p in db_path.parent.iterdir())
+
+    pending = asyncio.run(migrate(DatabaseAPI(path=db_path), dry_run=True))
+    asyncio.run(main([str(db_path), "--dry-run"]))
+
+    assert [m.version for m in pending] == [m.version for m in MIGRATIONS[3:]]
+    assert journal_mode(db_path) == "delete"
+    assert (journal_mode(db_path), db_path.read_bytes(), sorted(p.name for p in db_path.parent.iterdir())) == before
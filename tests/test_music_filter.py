@@ -0,0 +1,74 @@
+"""
+MusicList.filter 的投影与延迟构造：曲库快照路径与 SQL 路径结果一致，未访问时不构造 Music 对象
+"""
+
+import pytest
+
+CASES = [
+    {},
+    {"levels": ["13", "13+"]},
+    {"ds_range": (12.0, 13.5), "diff_indices": [3, 4]},
+    {"types": ["DX"], "is_new": False},
+    {"version_indices": [1, 2], "bpm_range": (130, 170)},
+    {"genres": ["game"], "levels": "12"},
+]
+ORDERS = [["-ds"], ["+title", "-diff_index"], ["+version_id", "-ds"]]
+
+
+def chart_keys(music_charts):
+    return [(mc.music_id, mc.diff_index, mc.ds) for mc in music_charts]
+
+
+def test_projected_rows_match_sql(with_lists):
+    async def check(catalog_list, sql_list):
+        for filters in CASES:
+            for order in ORDERS:
+                order = order + ["+music_id", "+diff_index"]
+                for fields in (["music_id", "diff_index", "ds", "title"], ["music_id", "title", "version_id"]):
+                    expected = await sql_list.filter(order=order, fields=fields, **filters)
+                    actual = await catalog_list.filter(order=order, fields=fields, **filters)
+                    assert actual["rows"] == expected["rows"], (filters, order, fields)
+                    assert (actual["music_count"], actual["chart_count"]) == (expected["music_count"], expected["chart_count"])
+                    streamed = [row async for row in catalog_list.iter_filter(order=order, fields=fields, chunk_size=5, **filters)]
+                    assert streamed == expected["rows"]
+
+    with_lists(check)
+
+
+def test_music_only_fields_give_one_row_per_music(with_lists):
+    async def check(catalog_list, sql_list):
+        for music_list in (catalog_list, sql_list):
+            result = await music_list.filter(levels=["12", "12+", "13"], order=["+music_id"], fields=["music_id", "title"])
+            ids = [row[0] for row in result["rows"]]
+            assert ids == sorted(set(ids))
+            assert len(ids) == result["music_count"]
+
+    with_lists(check)
+
+
+def test_music_objects_are_built_on_first_access(with_lists):
+    async def check(catalog_list, sql_list):
+        order = ["-ds", "+music_id", "+diff_index"]
+        expected = await sql_list.filter(order=order, diff_indices=[3])
+        result = await catalog_list.filter(order=order, diff_indices=[3])
+        assert "music_charts" not in result and "music_list" not in result
+        assert result["chart_count"] == expected["chart_count"]
+
+        assert chart_keys(result["music_charts"]) == chart_keys(expected["music_charts"])
+        assert "music_list" in result
+        assert sorted(m.id for m in result["music_list"]) == sorted(m.id for m in expected["music_list"])
+        # 每次调用各自构造对象，修改不影响缓存的结果
+        result["music_charts"][0].ds = -1
+        again = await catalog_list.filter(order=order, diff_indices=[3])
+        assert chart_keys(again["music_charts"]) == chart_keys(expected["music_charts"])
+
+    with_lists(check)
+
+
+def test_invalid_field_is_rejected(with_lists):
+    async def check(catalog_list, sql_list):
+        for music_list in (catalog_list, sql_list):
+            with pytest.raises(ValueError):
+                await music_list.filter(fields=["title_norm"])
+
+    with_lists(check)
@@ -0,0 +1,82 @@
+"""
+MusicList.count 与游标分页：计数与完整结果一致；逐页翻到底不漏行、不重复，且与 OFFSET 分页一致
+"""
+
+import pytest
+
+CASES = [
+    {},
+    {"levels": ["13", "13+", "14"]},
+    {"types": ["SD"], "diff_indices": [2, 3]},
+    {"version_indices": [3], "is_new": False},
+    {"levels": ["99"]},
+]
+ORDERS = [["-ds"], ["+title"], ["+version_id", "-ds"], ["-diff_index", "+ds"]]
+FIELDS = ["music_id", "diff_index", "ds", "title", "version_id"]
+PAGE = 7
+
+
+async def all_pages(music_list, order, **filters):
+    rows, cursor, positions = [], None, []
+    while True:
+        result = await music_list.filter(pagination=(0, PAGE), order=order, fields=FIELDS, cursor=cursor, **filters)
+        positions.append(result["position"])
+        rows.extend(result["rows"])
+        cursor = result["next_cursor"]
+        if cursor is None:
+            return rows, positions
+        assert len(result["rows"]) == PAGE
+
+
+def test_count_matches_filter(with_lists):
+    async def check(catalog_list, sql_list):
+        for filters in CASES:
+            full = await sql_list.filter(**filters)
+            expected = {"music_count": full["music_count"], "chart_count": full["chart_count"]}
+            assert await sql_list.count(**filters) == expected, filters
+            assert await catalog_list.count(**filters) == expected, filters
+
+    with_lists(check)
+
+
+def test_cursor_pages_cover_the_full_result(with_lists):
+    async def check(catalog_list, sql_list):
+        for filters in CASES:
+            for order in ORDERS:
+                full = await sql_list.filter(order=order + ["+music_id", "+diff_index"], fields=FIELDS, **filters)
+                for music_list in (catalog_list, sql_list):
+                    rows, positions = await all_pages(music_list, order, **filters)
+                    assert rows == full["rows"], (filters, order)
+                    assert positions == [PAGE * i for i in range(len(positions))]
+
+    with_lists(check)
+
+
+def test_cursor_continues_where_offset_pages_end(with_lists):
+    async def check(catalog_list, sql_list):
+        order = ["-ds"]
+        for music_list in (catalog_list, sql_list):
+            first = await music_list.filter(pagination=(0, PAGE), order=order, fields=FIELDS)
+            by_cursor = await music_list.filter(pagination=(0, PAGE), order=order, fields=FIELDS, cursor=first["next_cursor"])
+            by_offset = await music_list.filter(pagination=(PAGE, PAGE), order=order, fields=FIELDS)
+            assert by_cursor["rows"] == by_offset["rows"]
+            assert by_cursor["position"] == by_offset["position"] == PAGE
+        # 两条路径生成的游标可以互换使用
+        first = await catalog_list.filter(pagination=(0, PAGE), order=order, fields=FIELDS)
+        from_sql = await sql_list.filter(pagination=(0, PAGE), order=order, fields=FIELDS, cursor=first["next_cursor"])
+        from_catalog = await catalog_list.filter(pagination=(0, PAGE), order=order, fields=FIELDS, cursor=first["next_cursor"])
+        assert from_sql["rows"] == from_catalog["rows"]
+
+    with_lists(check)
+
+
+def test_cursor_must_match_the_order(with_lists):
+    async def check(catalog_list, sql_list):
+        first = await catalog_list.filter(pagination=(0, PAGE), order=["-ds"], fields=FIELDS)
+        for music_list in (catalog_list, sql_list):
+            with pytest.raises(ValueError):
+                await music_list.filter(pagination=(0, PAGE), order=["+title"], cursor=first["next_cursor"])
+            with pytest.raises(ValueError):
+                await music_list.filter(pagination=(0, PAGE), order=["-ds"], cursor="not a cursor")
+
+    with_lists(check)
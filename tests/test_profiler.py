@@ -0,0 +1,83 @@
+"""
+查询分析：SQL 指纹的规范化、百分位数，以及 ProfiledConnection 按指纹的计数与慢查询 EXPLAIN
+"""
+
+import asyncio
+
+import aiosqlite
+import pytest
+
+from src.libraries.maimai.profiler import ProfiledConnection, QueryProfiler, fingerprint, percentile
+
+
+@pytest.mark.parametrize("a, b", [
+    ("SELECT * FROM chart WHERE ds >= 13.5 AND level = '13+'", "SELECT * FROM chart WHERE ds >= 7 AND level = 'it''s'"),
+    ("SELECT * FROM t WHERE id IN (?, ?, ?)", "SELECT * FROM t WHERE id IN (?,?)"),
+    ("SELECT  a,\n  b FROM t -- comment\n WHERE x = -1;", "SELECT a, b FROM t /* other */ WHERE x = 42"),
+])
+def test_equivalent_statements_share_a_fingerprint(a, b):
+    assert fingerprint(a) == fingerprint(b)
+
+
+def test_fingerprint_keeps_identifiers_and_placeholders():
+    assert fingerprint("SELECT ra_b50, t1.x FROM best_record AS t1 WHERE user_id = ? LIMIT 50") == \
+        "SELECT ra_b50, t1.x FROM best_record AS t1 WHERE user_id = ? LIMIT ?"
+    assert fingerprint("SELECT * FROM t WHERE id IN (?)") == "SELECT * FROM t WHERE id IN (?)"
+    assert fingerprint("SELECT * FROM t WHERE id IN (1, 2, 3)") == "SELECT * FROM t WHERE id IN (?+)"
+
+
+def test_percentile():
+    assert percentile([], 95) == 0.0
+    values = list(range(1, 101))
+    assert percentile(values, 0) == 1
+    assert percentile(values, 50) == 51
+    assert percentile(values, 100) == 100
+    assert percentile([3.0, 1.0, 2.0], 50) == 2.0
+
+
+def run_profiled(body, **kwargs):
+    async def _run():
+        profiler = QueryProfiler(**kwargs)
+        async with aiosqlite.connect(":memory:") as conn:
+            db = ProfiledConnection(conn, profiler)
+            await db.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT)")
+            await db.executemany("INSERT INTO t VALUES (?, ?)", [(i, f"n{i}") for i in range(20)])
+            await body(db)
+        return profiler
+    return asyncio.run(_run())
+
+
+def test_statements_are_counted_by_fingerprint():
+    async def body(db):
+        for i in range(5):
+            cursor = await db.execute(f"SELECT name FROM t WHERE id = {i}")
+            await cursor.fetchone()
+            await cursor.fetchall()
+        cursor = await db.execute("SELECT id FROM t WHERE id IN (?, ?)", (1, 2))
+        assert [row async for row in cursor] == [(1,), (2,)]
+
+    profiler = run_profiled(body)
+    assert profiler.stats["SELECT name FROM t WHERE id = ?"].count == 5
+    assert profiler.stats["SELECT id FROM t WHERE id IN (?+)"].count == 1
+    assert profiler.stats["INSERT INTO t VALUES (?+)"].count == 1
+    assert all(stats.slow == 0 and stats.plan is None for stats in profiler.stats.values())
+
+
+def test_slow_queries_are_explained_once_per_cooldown(capsys):
+    async def body(db):
+        for i in range(3):
+            cursor = await db.execute("SELECT name FROM t WHERE id = ?", (i,))
+            await cursor.fetchall()
+        await db.execute("PRAGMA user_version = 1")
+
+    profiler = run_profiled(body, slow_query_ms=0, explain_cooldown=600)
+    stats = profiler.stats["SELECT name FROM t WHERE id = ?"]
+    assert stats.slow == 3
+    assert any("USING INTEGER PRIMARY KEY" in line for line in stats.plan)
+    assert profiler.stats["PRAGMA user_version = ?"].plan is None
+    assert capsys.readouterr().out.count("慢查询") == 6
+
+    lines = profiler.report(top=1, sort="slow")
+    assert lines[1].strip() == "SELECT name FROM t WHERE id = ?"
+    with pytest.raises(ValueError):
+        profiler.report(sort="mean")
@@ -0,0 +1,86 @@
+"""
+玩家成绩同步：增量模式的变更集，以及增量与全量两种模式写入结果一致
+"""
+
+import asyncio
+
+import pytest
+
+from conftest import user_json
+
+BEST_RECORD_COLUMNS = "music_id, diff_index, achievements, ra, rank_id, fc_id, fs_id, dxscore, ra_b50, ra_b40, ra_stats"
+
+
+def sync_rounds(charts):
+    """
+    三次同步：首次同步、原样再同步、有提升 / 下降 / 仅 FC 变化 / 缺失 / 新增的同步
+    """
+    keys = [(c["music_id"], c["diff_index"]) for c in charts[:6]]
+    first = [(*keys[0], 98.0, "s", "", ""), (*keys[1], 99.5, "ssp", "", ""), (*keys[2], 100.2, "sss", "", "sync"),
+             (*keys[3], 97.0, "aaa", "", ""), (*keys[4], 100.8, "sssp", "ap", "fsd")]
+    third = [(*keys[0], 99.1, "sp", "fc", ""), (*keys[1], 99.0, "sp", "", ""), (*keys[2], 100.2, "sss", "fc", "sync"),
+             first[4], (*keys[5], 95.0, "aa", "", "")]
+    return keys, [first, first, third]
+
+
+async def run_rounds(api, username, rounds, incremental):
+    diffs = []
+    for i, records in enumerate(rounds):
+        # score_history 以毫秒时间戳为主键，两次同步之间留出间隔
+        await asyncio.sleep(0.002)
+        diffs.append(await api.sync_user_records(user_json(username, records, rating=10000 + 100 * (i == 2)), incremental=incremental))
+    async with api.connection() as db:
+        cursor = await db.execute(f"SELECT {BEST_RECORD_COLUMNS} FROM best_record WHERE user_id = ? ORDER BY music_id, diff_index",
+                                  (username.lower(),))
+        rows = [tuple(row) for row in await cursor.fetchall()]
+    history = [(entry.rating, sorted(entry.records)) for entry in await api.score_history(username)]
+    return diffs, rows, history
+
+
+@pytest.fixture
+def synced(run_db, seed_catalog, catalog_rows):
+    keys, rounds = sync_rounds(catalog_rows[1])
+
+    async def body(api):
+        await seed_catalog(api)
+        return (await run_rounds(api, "Alice", rounds, incremental=True),
+                await run_rounds(api, "Bob", rounds, incremental=False))
+
+    return keys, run_db(body)
+
+
+def test_incremental_diff(synced):
+    keys, ((diffs, _, _), _) = synced
+    first, again, third = diffs
+    assert first.inserted == first.new_pbs == keys[:5] and first.unchanged == 0
+    assert again.changed == [] and again.new_pbs == [] and again.removed == [] and again.unchanged == 5
+    assert third.inserted == [keys[5]]
+    assert third.updated == [keys[0], keys[1], keys[2]]
+    assert third.new_pbs == [keys[0], keys[5]]
+    assert third.removed == [keys[3]]
+    assert third.unchanged == 1
+
+
+def test_incremental_and_full_sync_write_the_same_rows(synced):
+    keys, ((_, alice_rows, alice_history), (bob_diffs, bob_rows, bob_history)) = synced
+    assert bob_diffs == [None, None, None]
+    assert alice_rows == bob_rows
+    # 缺失的谱面不删除
+    assert [row[:2] for row in alice_rows] == sorted(keys)
+    assert all(row[8] is not None for row in alice_rows)
+    assert alice_history == bob_history
+    # 原样再同步不追加历史；第三次只记录变化的 4 张谱面
+    assert [(rating, len(records)) for rating, records in alice_history] == [(10000, 5), (10100, 4)]
+
+
+def test_user_version_counts_syncs(run_db, seed_catalog, catalog_rows):
+    _, rounds = sync_rounds(catalog_rows[1])
+
+    async def body(api):
+        await seed_catalog(api)
+        before = api.user_version("alice")
+        for records in rounds:
+            await api.sync_user_records(user_json("Alice", records))
+        return before, api.user_version("ALICE")
+
+    assert run_db(body) == (0, 3)
@@ -0,0 +1,78 @@
+"""
+查询结果缓存：LRU 按条目数与权重淘汰；MusicList.filter / count 的缓存结果与数据库一致，
+等价参数命中同一条目，调用方修改结果不影响缓存，曲库快照替换后失效
+"""
+
+from src.libraries.maimai.database import bump_catalog_generation
+from src.libraries.maimai.result_cache import ResultCache, freeze
+
+
+def test_freeze_is_hashable_and_canonical():
+    assert freeze({"b": [1, (2, 3)], "a": {"y": 1, "x": [0]}}) == freeze({"a": {"x": (0,), "y": 1}, "b": ((1, [2, 3]))})
+    hash(freeze({"levels": ["13", "13+"], "range": (1.0, 2.0)}))
+
+
+def test_lru_eviction_by_size():
+    cache = ResultCache(max_size=2, max_weight=100)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # a 变为最近使用
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c"), len(cache)) == (1, 3, 2)
+    assert cache.metrics["evictions"] == 1
+    assert (cache.metrics["hits"], cache.metrics["misses"]) == (3, 1)
+
+
+def test_eviction_by_weight():
+    cache = ResultCache(max_size=10, max_weight=10)
+    cache.put("a", "a", weight=4)
+    cache.put("b", "b", weight=4)
+    cache.put("a", "a2", weight=2)  # 覆盖旧条目时扣除旧权重
+    assert cache.weight == 6
+    cache.put("c", "c", weight=5)
+    assert cache.get("b") is None and cache.get("a") == "a2" and cache.get("c") == "c"
+    assert cache.weight == 7
+    cache.put("big", "big", weight=11)
+    assert cache.get("big") is None and len(cache) == 2
+
+    cache.clear()
+    assert (len(cache), cache.weight, cache.metrics["invalidations"]) == (0, 0, 1)
+    assert "命中" in cache.summary()
+
+
+def test_filter_results_are_cached_per_generation(with_lists):
+    order = ["-ds", "+music_id", "+diff_index"]
+    fields = ["music_id", "diff_index", "ds"]
+
+    async def check(catalog_list, sql_list):
+        cache = catalog_list.result_cache
+        expected = await sql_list.filter(levels=["13", "13+"], diff_indices=[3, 2], order=order, fields=fields)
+        first = await catalog_list.filter(levels=["13", "13+"], diff_indices=[3, 2], order=order, fields=fields)
+        # 集合类参数的顺序与重复不影响缓存键
+        second = await catalog_list.filter(levels=("13+", "13", "13"), diff_indices=[2, 3], order=order, fields=fields)
+        assert first["rows"] == second["rows"] == expected["rows"]
+        assert (cache.metrics["misses"], cache.metrics["hits"]) == (1, 1)
+
+        # 调用方修改结果不影响缓存
+        second["rows"].clear()
+        charts = (await catalog_list.filter(diff_indices=[3], order=order))["music_charts"]
+        charts[0].ds = -1
+        assert (await catalog_list.filter(levels=["13", "13+"], diff_indices=[2, 3], order=order, fields=fields))["rows"] == expected["rows"]
+        assert [mc.ds for mc in (await catalog_list.filter(diff_indices=[3], order=order))["music_charts"]][0] != -1
+
+        counts = await catalog_list.count(diff_indices=[3])
+        assert await catalog_list.count(diff_indices=[3]) == counts == await sql_list.count(diff_indices=[3])
+
+        # 曲库更新后重新加载快照，缓存清空，结果反映新数据
+        async def write(db):
+            await db.execute("UPDATE chart SET ds = 15.0, level = '15' WHERE diff_index = 3")
+            await bump_catalog_generation(db)
+        await sql_list.api.write(write)
+        await catalog_list.load_catalog(use_snapshot=False)
+        assert len(cache) == 0 and cache.metrics["invalidations"] >= 1
+        updated = await catalog_list.filter(diff_indices=[3], order=order, fields=fields)
+        assert {row[2] for row in updated["rows"]} == {15.0}
+        assert updated["rows"] == (await sql_list.filter(diff_indices=[3], order=order, fields=fields))["rows"]
+
+    with_lists(check)
@@ -0,0 +1,60 @@
+"""
+成绩历史：pack_history / unpack_history 往返，每次同步只追加变化的成绩，按时间范围查询
+"""
+
+import random
+import time
+
+from conftest import user_json
+from src.libraries.maimai.database import HISTORY_COLUMNS, pack_history, unpack_history
+
+
+def test_pack_history_round_trip():
+    rnd = random.Random(2)
+    rows = [(rnd.choice([1, 799, 10001, 11500]) + i * 3, rnd.randrange(5), round(rnd.uniform(0, 101), 4),
+             rnd.randrange(3000), rnd.randrange(14), rnd.randrange(5), rnd.randrange(5)) for i in range(300)]
+    assert len(HISTORY_COLUMNS) == len(rows[0])
+    unpacked = unpack_history(pack_history(rows))
+    assert unpacked == sorted({(r[0], r[1]): r for r in rows}.values())
+    assert unpack_history(pack_history([])) == []
+
+
+def test_pack_history_keeps_the_last_row_and_fills_missing_values():
+    rows = [(5, 2, 99.5, 100, 12, 1, 0), (1, 0, None, None, None, None, None), (5, 2, 100.25, 200, 13, 3, 4)]
+    assert unpack_history(pack_history(rows)) == [(1, 0, 0.0, 0, 0, 0, 0), (5, 2, 100.25, 200, 13, 3, 4)]
+
+
+def test_history_entries_and_ranges(run_db, seed_catalog, catalog_rows):
+    _, charts = catalog_rows
+    records = [(c["music_id"], c["diff_index"], 97.0 + i / 8, "s", "", "") for i, c in enumerate(charts[:8])]
+    improved = [(*records[2][:2], 100.6, "sssp", "fc", "")] + records[3:]
+
+    async def body(api):
+        await seed_catalog(api)
+        syncs = [user_json("Carol", records), user_json("Carol", records[:2] + improved),
+                 user_json("Carol", records[:2] + improved), user_json("Carol", records[:2] + improved, rating=12000)]
+        for payload in syncs:
+            await api.sync_user_records(payload)
+            # score_history 以毫秒时间戳为主键，两次同步之间留出间隔
+            time.sleep(0.002)
+        entries = await api.score_history("Carol")
+        since = await api.score_history("carol", since=entries[1].ts)
+        until = await api.rating_history("carol", until=entries[1].ts)
+        async with api.connection() as db:
+            cursor = await db.execute("SELECT music_id, diff_index, achievements FROM best_record WHERE user_id = 'carol'")
+            best = sorted(tuple(row) for row in await cursor.fetchall())
+        return entries, since, until, best
+
+    entries, since, until, best = run_db(body)
+    # 重复同步同一份数据不写入；只有 rating 变化时写入一条不含成绩的记录
+    assert [len(e.records) for e in entries] == [len(records), 1, 0]
+    assert [e.rating for e in entries] == [10000, 10000, 12000]
+    assert entries[1].records[0][:3] == (*records[2][:2], 100.6)
+    assert [e.ts for e in since] == [e.ts for e in entries[1:]]
+    assert until == [(e.ts, e.rating) for e in entries[:2]]
+
+    # 依次重放历史得到当前的最佳成绩
+    replayed = {}
+    for entry in entries:
+        replayed.update({(r[0], r[1]): r[2] for r in entry.records})
+    assert sorted((*key, achievements) for key, achievements in replayed.items()) == best
@@ -0,0 +1,78 @@
+"""
+搜索规范化与 trigram 索引：search_key 的折叠规则，text_normalize 不依赖 OpenCC 即可导入，
+标题 / 谱师 / 艺术家子串搜索在 SQL（FTS）与曲库快照两条路径上结果一致
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+from conftest import api_payload
+
+
+def test_modules_import_without_opencc():
+    code = ("import sys; sys.modules['opencc'] = None; "
+            "import src.libraries.text_normalize, src.libraries.maimai.database, src.libraries.maimai.migrations")
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_search_key_folds_width_case_and_glyphs():
+    pytest.importorskip("opencc")
+    from src.libraries.text_normalize import search_key
+    assert search_key(None) == search_key("") == ""
+    assert search_key("ＳＯＮＧ　０１") == search_key("Song 01") == "song 01"
+    assert search_key("桜") == search_key("樱") == search_key("櫻")
+    assert search_key("天国と地獄") == search_key("天国と地狱")
+
+
+@pytest.fixture
+def search_results(run_db, catalog_rows):
+    pytest.importorskip("opencc")
+    maimai_type = pytest.importorskip("src.libraries.maimai.maimai_type")
+    music_data, stats = api_payload(*catalog_rows)
+    queries = [{"title_search": "櫻"}, {"title_search": "ＳＯＮＧ 1"}, {"charter": "charter 3"},
+               {"artist": "ARTIST 1"}, {"title_search": "song", "charter": "Charter 0"}, {"title_search": "no such"}]
+
+    async def body(api):
+        await api.sync_catalog(music_data, stats)
+        catalog_list, sql_list = maimai_type.MusicList(api=api), maimai_type.MusicList(api=api)
+        await catalog_list.load_catalog(use_snapshot=False)
+        results = []
+        for query in queries:
+            fields = ["music_id", "diff_index"]
+            order = ["+music_id", "+diff_index"]
+            results.append((query, (await sql_list.filter(fields=fields, order=order, **query))["rows"],
+                            (await catalog_list.filter(fields=fields, order=order, **query))["rows"]))
+        by_title = await sql_list.by_title("ＳＯＮＧ 0")
+
+        # 改名后索引随触发器更新
+        renamed = [dict(m, title="Renamed 桜") if m["id"] == "1" else m for m in music_data]
+        await api.sync_catalog(renamed, stats)
+        after_rename = (await sql_list.filter(title_search="renamed", fields=["music_id"]))["rows"]
+        return results, by_title, after_rename
+
+    return run_db(body)
+
+
+def test_sql_and_catalog_searches_agree(search_results, catalog_rows):
+    music, charts = catalog_rows
+    titles = {m["id"]: m["title"] for m in music}
+    results, _, _ = search_results
+    for query, sql_rows, catalog_rows_ in results:
+        assert sql_rows == catalog_rows_, query
+
+    expected = {
+        "櫻": [(c["music_id"], c["diff_index"]) for c in charts if "桜" in titles[c["music_id"]]],
+        "charter 3": [(c["music_id"], c["diff_index"]) for c in charts if c["charter"] == "Charter 3"],
+    }
+    by_query = {next(iter(query.values())): rows for query, rows, _ in results if len(query) == 1}
+    assert by_query["櫻"] == sorted(expected["櫻"]) and expected["櫻"]
+    assert by_query["charter 3"] == sorted(expected["charter 3"]) and expected["charter 3"]
+    assert by_query["no such"] == []
+
+
+def test_by_title_and_reindex_after_rename(search_results):
+    _, by_title, after_rename = search_results
+    assert by_title is not None and by_title.title.startswith("桜 Song 0")
+    assert after_rename == [(1,)]